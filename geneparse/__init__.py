@@ -26,9 +26,12 @@
 
 
 import re
+import importlib
+from collections.abc import Mapping
 
-from . import plink, impute2
-from .core import Genotypes, Variant, ImputedVariant, SplitChromosomeReader
+from .core import (Genotypes, LazyGenotypes, Variant, ImputedVariant,
+                   SplitChromosomeReader, MergedSamplesReader)
+from .filters import VariantFilter
 
 try:
     from .version import geneparse_version as __version__
@@ -45,11 +48,78 @@ __email__ = "louis-philippe.lemieux.perreault@statgen.org"
 __status__ = "Development"
 
 
+# The submodules of the backends (imported when first accessed)
+_BACKENDS = {"plink", "impute2", "native", "bgen", "pgen", "vcf", "npy"}
+
+
+def __getattr__(name):
+    if name in _BACKENDS:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name,
+    ))
+
+
+def _import_object(spec):
+    """Imports an object from its 'module:attribute' specification."""
+    module, attribute = spec.split(":")
+    return getattr(importlib.import_module(module, __name__), attribute)
+
+
+class _LazyRegistry(Mapping):
+    def __init__(self, entries):
+        """Registry of readers (or writers) imported when first requested.
+
+        Args:
+            entries (dict): The objects, either as 'module:attribute'
+                            specifications (e.g. '.plink:PlinkReader') or as
+                            objects.
+
+        Only the requested backend is imported, so that a missing optional
+        dependency (e.g. PyPlink) only breaks the backends requiring it.
+
+        """
+        self._entries = dict(entries)
+
+    def __getitem__(self, name):
+        entry = self._entries[name]
+        if isinstance(entry, str):
+            entry = _import_object(entry)
+            self._entries[name] = entry
+        return entry
+
+    def __contains__(self, name):
+        # Without importing the entry
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__,
+                                ", ".join(self._entries))
+
+    def register(self, name, entry):
+        """Adds (or replaces) an entry.
+
+        Args:
+            name (str): The name of the entry (e.g. 'vcf').
+            entry: The object, or its 'module:attribute' specification (it
+                   is then imported when first requested).
+
+        """
+        self._entries[name] = entry
+
+
 # TODO:
 # 1. Warn and show last exception if no reader correctly initialized.
 # 2. Could also make it async to load faster.
 class _SplitChromosomeReaderFactory(object):
     def __init__(self, reader_class):
+        # The class, or its 'module:attribute' specification
         self.reader_class = reader_class
 
     def __call__(self, pattern, *args, **kwargs):
@@ -57,6 +127,9 @@ class _SplitChromosomeReaderFactory(object):
             raise ValueError("Expected '{chrom}' as a placeholder in the "
                              "pattern.")
 
+        if isinstance(self.reader_class, str):
+            self.reader_class = _import_object(self.reader_class)
+
         # Explode the path for every possible chromosome.
         chrom_to_reader = {}
         for chrom in list(range(1, 23)) + ["X", "Y", "XY", "MT"]:
@@ -73,11 +146,26 @@ class _SplitChromosomeReaderFactory(object):
         return SplitChromosomeReader(chrom_to_reader)
 
 
-parsers = {
-    "plink": plink.PlinkReader,
-    "chrom-split-plink": _SplitChromosomeReaderFactory(plink.PlinkReader),
-    "impute2": impute2.Impute2Reader,
+parsers = _LazyRegistry({
+    "plink": ".plink:PlinkReader",
+    "chrom-split-plink": _SplitChromosomeReaderFactory(".plink:PlinkReader"),
+    "impute2": ".impute2:Impute2Reader",
     "chrom-split-impute2": _SplitChromosomeReaderFactory(
-        impute2.Impute2Reader
+        ".impute2:Impute2Reader"
     ),
-}
+    "native": ".native:NativeReader",
+    "bgen": ".bgen:BgenReader",
+    "chrom-split-bgen": _SplitChromosomeReaderFactory(".bgen:BgenReader"),
+    "pgen": ".pgen:PgenReader",
+    "chrom-split-pgen": _SplitChromosomeReaderFactory(".pgen:PgenReader"),
+    "vcf": ".vcf:VCFReader",
+    "npy": ".npy:NumpyReader",
+})
+
+
+writers = _LazyRegistry({
+    "plink": ".plink:PlinkWriter",
+    "impute2": ".impute2:Impute2Writer",
+    "vcf": ".vcf:VCFWriter",
+    "native": ".native:NativeWriter",
+})
@@ -0,0 +1,266 @@
+"""
+Command line interface.
+
+Usage:
+
+    python -m geneparse convert plink prefix=path/to/prefix -t vcf -o out
+    python -m geneparse simulate out --samples 1000 --variants 100000
+
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import ast
+import sys
+import logging
+import argparse
+
+from . import parsers, writers, simulate
+from .convert import convert
+
+
+logger = logging.getLogger("geneparse")
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s %(levelname)s] %(message)s",
+    )
+
+    if args.command == "convert":
+        run_convert(args)
+
+    elif args.command == "simulate":
+        run_simulate(args)
+
+
+def run_convert(args):
+    """Converts genotypes (see 'convert.convert')."""
+    samples = None
+    if args.keep is not None:
+        with open(args.keep) as f:
+            samples = [line.strip() for line in f if line.strip()]
+
+    split = "{chrom}" in args.output
+
+    def open_writer(samples, chrom):
+        prefix = args.output
+        if chrom is not None:
+            prefix = prefix.replace("{chrom}", chrom)
+
+            # The prefix of each chromosome is only known once expanded
+            if args.output_format == "native" and os.path.exists(prefix):
+                raise ValueError("{}: already exists".format(prefix))
+
+        return _open_writer(args, prefix, samples)
+
+    with parsers[args.format](**_parse_reader_args(args.reader_args)) as r:
+        convert(
+            r, open_writer, block_size=args.block_size, threads=args.threads,
+            max_pending=args.max_pending, read_ahead=args.read_ahead,
+            samples=samples, split_chromosomes=split,
+            report_interval=args.report_interval,
+        )
+
+
+def run_simulate(args):
+    """Writes a random dataset (see 'simulate.simulate')."""
+    result = simulate.simulate(
+        args.output, args.samples, args.variants, formats=args.formats,
+        compression_level=args.compression_level, seed=args.seed,
+        block_size=args.block_size, multiallelic_rate=args.multiallelic_rate,
+        duplicated_rate=args.duplicated_rate,
+        missing_rate=args.missing_rate,
+    )
+    logger.info("Simulated %d samples x %d variants", result["nb_samples"],
+                result["nb_variants"])
+    for filename in result["files"]:
+        logger.info("Wrote %s", filename)
+
+
+def _open_writer(args, prefix, samples):
+    """Creates the writer for an output prefix."""
+    buffer_size = args.buffer_size * 1024 ** 2
+
+    if args.output_format == "plink":
+        return writers["plink"](prefix, samples, buffer_size=buffer_size)
+
+    if args.output_format == "impute2":
+        return writers["impute2"](
+            prefix + ".impute2.gz", prefix + ".sample", samples,
+            compression_level=args.compression_level, buffer_size=buffer_size,
+        )
+
+    if args.output_format == "vcf":
+        return writers["vcf"](
+            prefix + ".vcf.gz", samples, dosage=args.dosage,
+            compression_level=args.compression_level, buffer_size=buffer_size,
+        )
+
+    # The native format is compressed by chunks of blocks
+    return writers["native"](
+        prefix, samples, chunk_size=args.block_size,
+        compression_level=args.compression_level,
+    )
+
+
+def _parse_reader_args(reader_args):
+    """Parses the KEY=VALUE arguments of the reader (literals if possible)."""
+    kwargs = {}
+    for arg in reader_args:
+        if "=" not in arg:
+            raise ValueError("{}: invalid reader argument (expected "
+                             "KEY=VALUE)".format(arg))
+        key, value = arg.split("=", 1)
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+        kwargs[key] = value
+
+    return kwargs
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m geneparse",
+        description="Genotype file utilities.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+
+    p = subparsers.add_parser(
+        "convert", help="Convert genotypes to another format.",
+        description="Convert genotypes (streamed by blocks, which are encoded "
+                    "by a pool of threads and written in order).",
+    )
+    p.add_argument("format", choices=sorted(parsers.keys()),
+                   help="The format of the genotype file.")
+    p.add_argument("reader_args", nargs="+", metavar="KEY=VALUE",
+                   help="The arguments used to create the reader (e.g. "
+                        "prefix=path/to/prefix).")
+
+    group = p.add_argument_group("Output")
+    group.add_argument("--output-format", "-t", required=True,
+                       choices=["plink", "impute2", "vcf", "native"],
+                       help="The output format.")
+    group.add_argument("--output", "-o", required=True, metavar="PREFIX",
+                       help="The output prefix (the directory for the native "
+                            "format). Use '{chrom}' in the prefix to write "
+                            "one dataset per chromosome.")
+    group.add_argument("--keep", metavar="FILE",
+                       help="The samples to keep (one per line, in the "
+                            "output order).")
+    group.add_argument("--dosage", action="store_true",
+                       help="Write the dosage (VCF only).")
+    group.add_argument("--compression-level", type=int, default=6,
+                       metavar="LEVEL",
+                       help="The compression level. [%(default)d]")
+
+    group = p.add_argument_group("Performance")
+    group.add_argument("--threads", type=int, default=1,
+                       help="The number of threads encoding blocks. "
+                            "[%(default)d]")
+    group.add_argument("--block-size", type=int, default=1000, metavar="N",
+                       help="The number of variants per block. "
+                            "[%(default)d]")
+    group.add_argument("--read-ahead", type=int, default=4, metavar="N",
+                       help="The number of blocks read in advance. "
+                            "[%(default)d]")
+    group.add_argument("--max-pending", type=int, metavar="N",
+                       help="The number of blocks being encoded or waiting to "
+                            "be written. [2 x threads]")
+    group.add_argument("--buffer-size", type=int, default=4, metavar="MB",
+                       help="The size of the output file buffers. "
+                            "[%(default)d]")
+    group.add_argument("--report-interval", type=float, default=10,
+                       metavar="SECONDS",
+                       help="The interval between throughput reports. "
+                            "[%(default)g]")
+
+    p = subparsers.add_parser(
+        "simulate", help="Generate a random dataset.",
+        description="Generate a random (reproducible) dataset in multiple "
+                    "formats, including multiallelic and duplicated "
+                    "variants.",
+    )
+    p.add_argument("output", metavar="PREFIX", help="The output prefix.")
+    p.add_argument("--samples", type=int, default=1000, metavar="N",
+                   help="The number of samples. [%(default)d]")
+    p.add_argument("--variants", type=int, default=10000, metavar="N",
+                   help="The number of variants. [%(default)d]")
+    p.add_argument("--formats", nargs="+", default=["plink", "vcf"],
+                   choices=simulate.FORMATS,
+                   help="The output formats. [plink vcf]")
+    p.add_argument("--seed", type=int, default=42,
+                   help="The random seed. [%(default)d]")
+    p.add_argument("--multiallelic-rate", type=float, default=0.01,
+                   metavar="RATE",
+                   help="The proportion of triallelic loci. [%(default)g]")
+    p.add_argument("--duplicated-rate", type=float, default=0.001,
+                   metavar="RATE",
+                   help="The proportion of duplicated loci. [%(default)g]")
+    p.add_argument("--missing-rate", type=float, default=0.01,
+                   metavar="RATE",
+                   help="The proportion of missing genotypes. [%(default)g]")
+    p.add_argument("--compression-level", type=int, default=6,
+                   metavar="LEVEL",
+                   help="The compression level. [%(default)d]")
+    p.add_argument("--block-size", type=int, metavar="N",
+                   help="The number of variants generated at once. [about "
+                        "16M genotypes per block]")
+
+    args = parser.parse_args(args)
+
+    if args.command == "convert":
+        split = "{chrom}" in args.output
+        if args.threads < 1:
+            parser.error("--threads: should be a positive integer")
+        if args.block_size < 1:
+            parser.error("--block-size: should be a positive integer")
+        if args.max_pending is not None and args.max_pending < 1:
+            parser.error("--max-pending: should be a positive integer")
+        if (args.output_format == "native" and not split and
+                os.path.exists(args.output)):
+            parser.error("{}: already exists".format(args.output))
+
+    elif args.command == "simulate":
+        if args.samples < 1 or args.variants < 1:
+            parser.error("--samples and --variants: should be positive "
+                         "integers")
+        if args.block_size is not None and args.block_size < 1:
+            parser.error("--block-size: should be a positive integer")
+
+    return args
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
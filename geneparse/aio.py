@@ -0,0 +1,222 @@
+"""
+Asynchronous (asyncio) facade for genotype readers.
+"""
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncGenotypesReader(object):
+    def __init__(self, reader, max_workers=4, executor=None):
+        """Asynchronous wrapper around a GenotypesReader.
+
+        Args:
+            reader (GenotypesReader): The (thread-safe) reader to wrap.
+            max_workers (int): The number of threads used to query the reader.
+            executor (concurrent.futures.Executor): An executor to use instead
+                                                    of creating a new one.
+
+        Every API method of the reader is available as a coroutine, and
+        variants can be iterated over using 'async for'. The blocking calls are
+        run in a bounded thread pool, so that the event loop is never blocked.
+
+        Concurrent requests for the same variant (by locus or by name) are
+        coalesced: the reader is queried once, and every caller receives its
+        own copy of the resulting Genotypes.
+
+        Note
+        ====
+            Request coalescing assumes that an instance is used from a single
+            event loop.
+
+        """
+        self.reader = reader
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._executor = executor
+
+        # The requests currently being processed (key -> future)
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __aiter__(self):
+        return self.iter_genotypes()
+
+    def __repr__(self):
+        return "<{} for {!r}>".format(self.__class__.__name__, self.reader)
+
+    async def close(self):
+        """Closes the thread pool and the underlying reader.
+
+        The queries running in the thread pool are completed before the
+        reader is closed.
+
+        """
+        if self._own_executor:
+            # Waiting in the loop's default executor (the pool can't wait for
+            # its own shutdown)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, functools.partial(self._executor.shutdown, wait=True),
+            )
+        self.reader.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """Runs a blocking function in the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs),
+        )
+
+    async def _coalesced(self, key, func, *args):
+        """Runs a query, or waits for the identical one already in flight.
+
+        Args:
+            key (tuple): The key identifying the query.
+            func (callable): The blocking function to run.
+
+        Returns:
+            list: A list of (copied) Genotypes.
+
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(func, *args))
+            self._in_flight[key] = future
+            future.add_done_callback(
+                lambda _: self._in_flight.pop(key, None)
+            )
+
+        # Shielding, so that a cancelled caller does not cancel the request for
+        # the others
+        results = await asyncio.shield(future)
+        return [genotypes.copy() for genotypes in results]
+
+    async def _iter(self, iterator, batch_size):
+        """Asynchronously iterates over a blocking iterator (by batches)."""
+        iterator = iter(iterator)
+        while True:
+            batch = await self._run(_next_batch, iterator, batch_size)
+            if not batch:
+                return
+
+            for item in batch:
+                yield item
+
+    # API methods
+    async def iter_variants(self, batch_size=256):
+        """Asynchronously iterates over variants (see 'iter_variants')."""
+        async for variant in self._iter(self.reader.iter_variants(),
+                                        batch_size):
+            yield variant
+
+    async def iter_genotypes(self, batch_size=16):
+        """Asynchronously iterates over genotypes (see 'iter_genotypes')."""
+        async for genotypes in self._iter(self.reader.iter_genotypes(),
+                                          batch_size):
+            yield genotypes
+
+    async def get_variant_genotypes(self, variant):
+        """Get the genotypes for a given variant.
+
+        Args:
+            variant (Variant): A variant for which to retrieve genotypes.
+
+        Returns:
+            list: A list of Genotypes.
+
+        """
+        key = ("variant", variant.chrom, variant.pos, variant.alleles)
+        return await self._coalesced(
+            key, self.reader.get_variant_genotypes, variant,
+        )
+
+    async def get_variant_by_name(self, name):
+        """Get the genotypes for a given variant (by name).
+
+        Args:
+            name (str): The name of the variant to retrieve the genotypes.
+
+        Returns:
+            list: A list of Genotypes.
+
+        """
+        return await self._coalesced(
+            ("name", name), self.reader.get_variant_by_name, name,
+        )
+
+    async def get_variants_in_region(self, chrom, start, end):
+        """Get the variants in a region.
+
+        Args:
+            chrom (str): The chromosome (e.g. 'X' or '3').
+            start (int): The start position for the region.
+            end (int): The end position for the region.
+
+        Returns:
+            list: A list of Genotypes (the region is read completely).
+
+        """
+        return await self._run(
+            _to_list, self.reader.get_variants_in_region, chrom, start, end,
+        )
+
+    async def get_samples(self):
+        """Get an ordered collection of the samples."""
+        return await self._run(self.reader.get_samples)
+
+    async def get_number_samples(self):
+        """Return the number of samples."""
+        return await self._run(self.reader.get_number_samples)
+
+    async def get_number_variants(self):
+        """Return the number of variants in the file."""
+        return await self._run(self.reader.get_number_variants)
+
+
+def _next_batch(iterator, batch_size):
+    """Gets the next (at most) 'batch_size' elements of an iterator."""
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            break
+    return batch
+
+
+def _to_list(func, *args):
+    """Calls a function and consumes the resulting iterable."""
+    return list(func(*args))
@@ -0,0 +1,478 @@
+"""
+Benchmarks of the readers and access patterns.
+
+Usage:
+
+    python -m geneparse.bench --scales small medium -o results.json
+
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import __version__, plink, impute2, vcf, simulate
+from .dataframe import DataFrameReader
+
+
+logger = logging.getLogger("geneparse.bench")
+
+
+# The dataset scales (number of samples, number of variants)
+SCALES = {
+    "tiny": (10, 100),
+    "small": (100, 2000),
+    "medium": (1000, 20000),
+    "large": (10000, 200000),
+}
+
+FORMATS = ["plink", "impute2", "impute2-bgzip", "vcf", "dataframe"]
+
+BENCHMARKS = ["startup", "iter_genotypes", "iter_variants", "point_lookups",
+              "region_queries", "index_build"]
+
+
+class Dataset(object):
+    def __init__(self, path, nb_samples, nb_variants):
+        """A generated dataset, available in every benchmarked format.
+
+        Args:
+            path (str): The directory of the dataset.
+            nb_samples (int): The number of samples.
+            nb_variants (int): The number of variants.
+
+        """
+        self.path = path
+        self.nb_samples = nb_samples
+        self.nb_variants = nb_variants
+        self._dataframe = None
+
+    def filename(self, name):
+        return os.path.join(self.path, name)
+
+    def open_reader(self, fmt):
+        """Creates a reader of the dataset in a given format."""
+        if fmt == "plink":
+            return plink.PlinkReader(self.filename("data"))
+
+        if fmt == "impute2":
+            return impute2.Impute2Reader(self.filename("data.impute2"),
+                                         self.filename("data.sample"))
+
+        if fmt == "impute2-bgzip":
+            return impute2.Impute2Reader(self.filename("data.impute2.gz"),
+                                         self.filename("data.sample"))
+
+        if fmt == "vcf":
+            return vcf.VCFReader(self.filename("data.vcf.gz"))
+
+        if fmt == "dataframe":
+            if self._dataframe is None:
+                self._dataframe = _read_dataframe(self.filename("data"))
+            return DataFrameReader(*self._dataframe)
+
+        raise ValueError("{}: invalid format".format(fmt))
+
+
+def generate_dataset(path, nb_samples, nb_variants, seed=42):
+    """Generates a random dataset (if it does not already exist).
+
+    Args:
+        path (str): The directory of the dataset.
+        nb_samples (int): The number of samples.
+        nb_variants (int): The number of variants.
+        seed (int): The random seed.
+
+    Returns:
+        Dataset: The dataset (see 'simulate.simulate').
+
+    """
+    dataset = Dataset(path, nb_samples, nb_variants)
+    complete_fn = dataset.filename("COMPLETE")
+    if os.path.isfile(complete_fn):
+        return dataset
+
+    logger.info("Generating %d samples x %d variants in %s", nb_samples,
+                nb_variants, path)
+    os.makedirs(path, exist_ok=True)
+
+    simulate.simulate(dataset.filename("data"), nb_samples, nb_variants,
+                      formats=simulate.FORMATS, info=False, seed=seed)
+
+    with open(complete_fn, "w"):
+        pass
+
+    return dataset
+
+
+def _read_dataframe(prefix):
+    """Reads PLINK files as the arguments of a DataFrameReader."""
+    with plink.PlinkReader(prefix) as reader:
+        genotypes = list(reader.iter_genotypes())
+        samples = reader.get_samples()
+
+    dataframe = pd.DataFrame(
+        np.vstack([g.genotypes for g in genotypes]).T,
+        index=samples, columns=[g.variant.name for g in genotypes],
+    )
+    map_info = pd.DataFrame(
+        {"chrom": [g.variant.chrom for g in genotypes],
+         "pos": [g.variant.pos for g in genotypes],
+         "a1": [g.coded for g in genotypes],
+         "a2": [g.reference for g in genotypes]},
+        index=dataframe.columns,
+    )
+    return dataframe, map_info
+
+
+# The benchmarks (each returns the number of operations and a function to
+# time, or None if it does not apply to the format)
+def bench_startup(dataset, fmt, random, nb_queries):
+    def run():
+        dataset.open_reader(fmt).close()
+    return 1, run
+
+
+def bench_iter_genotypes(dataset, fmt, random, nb_queries):
+    def run():
+        with dataset.open_reader(fmt) as reader:
+            for _ in reader.iter_genotypes():
+                pass
+    return dataset.nb_variants, run
+
+
+def bench_iter_variants(dataset, fmt, random, nb_queries):
+    def run():
+        with dataset.open_reader(fmt) as reader:
+            for _ in reader.iter_variants():
+                pass
+    return dataset.nb_variants, run
+
+
+def bench_point_lookups(dataset, fmt, random, nb_queries):
+    with dataset.open_reader(fmt) as reader:
+        variants = list(reader.iter_variants())
+    variants = [variants[i] for i in
+                random.randint(0, len(variants), size=nb_queries)]
+
+    def run():
+        with dataset.open_reader(fmt) as reader:
+            for variant in variants:
+                reader.get_variant_genotypes(variant)
+    return nb_queries, run
+
+
+def bench_region_queries(dataset, fmt, random, nb_queries):
+    with dataset.open_reader(fmt) as reader:
+        loci = [(v.chrom, v.pos) for v in reader.iter_variants()]
+
+    # Regions containing about 1% of the variants
+    width = max(1, (loci[-1][1] - loci[0][1]) // 100)
+    regions = [(loci[i][0], loci[i][1], loci[i][1] + width)
+               for i in random.randint(0, len(loci), size=nb_queries)]
+
+    def run():
+        with dataset.open_reader(fmt) as reader:
+            for chrom, start, end in regions:
+                for _ in reader.get_variants_in_region(chrom, start, end):
+                    pass
+    return nb_queries, run
+
+
+def bench_index_build(dataset, fmt, random, nb_queries):
+    if not fmt.startswith("impute2"):
+        return None
+
+    filename = dataset.filename(
+        "data.impute2.gz" if fmt == "impute2-bgzip" else "data.impute2"
+    )
+
+    def run():
+        impute2.generate_index(filename, cols=[0, 1, 2],
+                               names=["chrom", "name", "pos"], sep=" ")
+    return dataset.nb_variants, run
+
+
+def time_benchmark(name, dataset, fmt, repeats=3, nb_queries=100, seed=42):
+    """Times a benchmark.
+
+    Args:
+        name (str): The benchmark (see 'BENCHMARKS').
+        dataset (Dataset): The dataset.
+        fmt (str): The format (see 'FORMATS').
+        repeats (int): The number of times the benchmark is run.
+        nb_queries (int): The number of queries (lookups and regions).
+        seed (int): The random seed (for the queries).
+
+    Returns:
+        dict: The results (None if the benchmark does not apply). The best
+        time is reported, along with the mean and the rate (operations per
+        second of the best time). Unsupported operations are reported as
+        errors.
+
+    """
+    result = {
+        "benchmark": name,
+        "format": fmt,
+        "nb_samples": dataset.nb_samples,
+        "nb_variants": dataset.nb_variants,
+    }
+
+    try:
+        # Opening the reader once, so that the first run is not penalized
+        # (e.g. by loading the DataFrame)
+        dataset.open_reader(fmt).close()
+
+        setup = globals()["bench_" + name](
+            dataset, fmt, np.random.RandomState(seed), nb_queries,
+        )
+        if setup is None:
+            return None
+        nb_operations, run = setup
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+    except (NotImplementedError, ValueError) as e:
+        result["error"] = ": ".join(
+            [type(e).__name__] + ([str(e)] if str(e) else [])
+        )
+        return result
+
+    best = min(times)
+    result.update({
+        "repeats": repeats,
+        "nb_operations": nb_operations,
+        "seconds": best,
+        "mean_seconds": sum(times) / len(times),
+        "rate": nb_operations / best if best > 0 else None,
+    })
+    return result
+
+
+def time_import(module="geneparse", repeats=3):
+    """Times the import of a module in a new interpreter.
+
+    Args:
+        module (str): The module to import.
+        repeats (int): The number of times the module is imported.
+
+    Returns:
+        dict: The results (see 'time_benchmark'). The startup time of the
+        interpreter is subtracted.
+
+    """
+    def _time(code):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            times.append(time.perf_counter() - start)
+        return times
+
+    interpreter = min(_time("pass"))
+    times = [max(t - interpreter, 0)
+             for t in _time("import " + module)]
+
+    return {
+        "benchmark": "import",
+        "format": module,
+        "scale": "-",
+        "repeats": repeats,
+        "nb_operations": 1,
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "rate": None,
+    }
+
+
+def run(formats=FORMATS, scales=("small", ), benchmarks=BENCHMARKS,
+        data_dir="geneparse_bench_data", repeats=3, nb_queries=100, seed=42,
+        import_time=True):
+    """Runs the benchmarks.
+
+    Returns:
+        dict: The environment and the results (see 'time_benchmark').
+
+    The time to import geneparse is also measured (unless 'import_time' is
+    False), so that backends do not slow down the startup of every script
+    and worker.
+
+    """
+    results = []
+    if import_time:
+        results.append(time_import(repeats=repeats))
+        _log_result(results[-1])
+
+    for scale in scales:
+        nb_samples, nb_variants = SCALES[scale]
+        dataset = generate_dataset(
+            os.path.join(data_dir, "{}_seed{}".format(scale, seed)),
+            nb_samples, nb_variants, seed=seed,
+        )
+
+        for fmt in formats:
+            for name in benchmarks:
+                result = time_benchmark(name, dataset, fmt, repeats,
+                                        nb_queries, seed)
+                if result is None:
+                    continue
+
+                result["scale"] = scale
+                results.append(result)
+                _log_result(result)
+
+    return {
+        "geneparse": __version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """Compares the results of two runs.
+
+    Returns:
+        pandas.DataFrame: The best time of each benchmark in both runs, and
+        the ratio (current / previous).
+
+    """
+    keys = ["scale", "format", "benchmark"]
+
+    def _table(report):
+        table = pd.DataFrame([r for r in report["results"]
+                              if "seconds" in r])
+        if table.shape[0] == 0:
+            return pd.DataFrame(columns=keys + ["seconds"]).set_index(keys)
+        return table.set_index(keys)[["seconds"]]
+
+    table = _table(previous).join(_table(current), how="inner",
+                                  lsuffix="_previous", rsuffix="_current")
+    table["ratio"] = table.seconds_current / table.seconds_previous
+    return table
+
+
+def _log_result(result):
+    if "error" in result:
+        logger.info("%-8s %-14s %-15s %s", result["scale"], result["format"],
+                    result["benchmark"], result["error"])
+        return
+
+    logger.info("%-8s %-14s %-15s %10.4f s %12s ops/s", result["scale"],
+                result["format"], result["benchmark"], result["seconds"],
+                "{:,.1f}".format(result["rate"] or 0))
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="[%(asctime)s %(levelname)s] %(message)s")
+
+    formats = args.formats
+    if "vcf" in formats and not vcf.HAS_CYVCF2:
+        logger.warning("Skipping VCF (cyvcf2 is not installed)")
+        formats = [fmt for fmt in formats if fmt != "vcf"]
+
+    report = run(formats=formats, scales=args.scales,
+                 benchmarks=args.benchmarks, data_dir=args.data_dir,
+                 repeats=args.repeats, nb_queries=args.nb_queries,
+                 seed=args.seed, import_time=not args.no_import_time)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("Results written to %s", args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        with pd.option_context("display.width", 120):
+            print(compare(previous, report).to_string(
+                float_format="{:.4f}".format,
+            ))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m geneparse.bench",
+        description="Benchmarks the readers on generated datasets.",
+    )
+    parser.add_argument("--formats", nargs="+", choices=FORMATS,
+                        default=FORMATS, metavar="FORMAT",
+                        help="The formats ({}).".format(", ".join(FORMATS)))
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES),
+                        default=["small"], metavar="SCALE",
+                        help="The dataset scales ({}). [small]".format(
+                            ", ".join(
+                                "{} {}x{}".format(name, *SCALES[name])
+                                for name in SCALES
+                            )))
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS,
+                        default=BENCHMARKS, metavar="BENCHMARK",
+                        help="The benchmarks ({}).".format(
+                            ", ".join(BENCHMARKS)))
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="The number of runs of each benchmark (the best "
+                             "time is reported). [%(default)d]")
+    parser.add_argument("--nb-queries", type=int, default=100,
+                        help="The number of point lookups and region "
+                             "queries. [%(default)d]")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="The random seed. [%(default)d]")
+    parser.add_argument("--no-import-time", action="store_true",
+                        help="Do not time the import of geneparse.")
+    parser.add_argument("--data-dir", default="geneparse_bench_data",
+                        help="The directory of the generated datasets (which "
+                             "are reused). [%(default)s]")
+    parser.add_argument("-o", "--output", default="bench.json",
+                        help="The JSON file of the results. [%(default)s]")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="The results of a previous run to compare to.")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,620 @@
+"""
+BGEN file reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import zlib
+import struct
+import sqlite3
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesReader, Variant, Genotypes, GenotypesBlock
+from .impute2 import read_samples, CHROM_STR_ENCODE
+from .utils import open_positional, pread, LocusIndex, index_names
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+logger = logging.getLogger(__name__)
+
+
+# The compression types (from the header flags)
+_COMPRESSION_NONE = 0
+_COMPRESSION_ZLIB = 1
+_COMPRESSION_ZSTD = 2
+
+
+class BgenReader(GenotypesReader):
+    def __init__(self, filename, sample_filename=None,
+                 probability_threshold=0.9, index_filename=None):
+        """BGEN file reader (layouts 1 and 2).
+
+        Args:
+            filename (str): The name of the BGEN file.
+            sample_filename (str): The name of the SAMPLE file (required if
+                                   the BGEN file contains no sample
+                                   identifiers).
+            probability_threshold (float): The probability threshold.
+            index_filename (str): The name of the bgenix index (defaults to
+                                  the '.bgi' file next to the BGEN file, if
+                                  it exists).
+
+        The variant offsets are read from the bgenix index if available.
+        Otherwise, the variant headers are scanned when the file is opened.
+        Point and region queries then use a sorted locus index.
+
+        The first allele of each variant is the reference, and the dosage is
+        the expected number of copies of the second (coded) allele. The
+        dosage is set to NaN if no genotype probability is higher than the
+        probability threshold.
+
+        Only bi-allelic variants are supported (other variants are ignored,
+        with a warning).
+
+        Note
+        ====
+            The BGEN file is read using positional reads, hence a single
+            instance can be used concurrently by multiple threads.
+
+        """
+        self.filename = filename
+        self.prob_t = probability_threshold
+
+        self._bgen_fd = open_positional(filename)
+        self._parse_header()
+
+        # The samples
+        if sample_filename is not None:
+            self.samples = list(read_samples(sample_filename).index)
+        elif self._sample_ids is not None:
+            self.samples = self._sample_ids
+        else:
+            raise ValueError("{}: no sample identifiers in the BGEN file "
+                             "(a sample file is required)".format(filename))
+
+        if len(self.samples) != self._nb_samples:
+            raise ValueError("{}: the number of samples differs from the "
+                             "sample file".format(filename))
+
+        # The variants (from the index, or by scanning the file)
+        if index_filename is None and os.path.isfile(filename + ".bgi"):
+            index_filename = filename + ".bgi"
+
+        if index_filename is not None:
+            variants = self._read_bgi(index_filename)
+        else:
+            variants = self._scan_variants()
+
+        # Ignoring the variants with more than two alleles
+        nb_alleles = variants.nb_alleles.values
+        if np.any(nb_alleles != 2):
+            logger.warning("{}: ignoring {:,d} variants with more than two "
+                           "alleles".format(filename, np.sum(nb_alleles != 2)))
+            variants = variants.loc[nb_alleles == 2, :]
+
+        variants = variants.reset_index(drop=True)
+        variants["chrom"] = [_normalize_chrom(c) for c in variants.chrom]
+        variants["multiallelic"] = variants.duplicated(["chrom", "pos"],
+                                                       keep=False)
+        self._variants = variants
+
+        # The locus and name indices
+        self._locus_index = LocusIndex.from_loci(variants.chrom.values,
+                                                 variants.pos.values)
+        self._name_index = index_names(variants.rsid.values)
+
+    def close(self):
+        if self._bgen_fd is not None:
+            os.close(self._bgen_fd)
+            self._bgen_fd = None
+
+    def _read(self, offset, size):
+        """Reads bytes from the BGEN file."""
+        data = pread(self._bgen_fd, size, offset)
+        if len(data) != size:
+            raise ValueError("{}: unexpected end of file".format(
+                self.filename,
+            ))
+        return data
+
+    def _parse_header(self):
+        """Parses the header block and the sample identifier block."""
+        offset, header_size, nb_variants, nb_samples, magic = struct.unpack(
+            "<IIII4s", self._read(0, 20),
+        )
+        if magic not in (b"bgen", b"\x00\x00\x00\x00"):
+            raise ValueError("{}: not a BGEN file".format(self.filename))
+
+        flags = struct.unpack("<I", self._read(header_size, 4))[0]
+
+        self._first_variant = offset + 4
+        self._nb_variants = nb_variants
+        self._nb_samples = nb_samples
+
+        # The compression
+        self._compression = flags & 3
+        if self._compression not in {_COMPRESSION_NONE, _COMPRESSION_ZLIB,
+                                     _COMPRESSION_ZSTD}:
+            raise ValueError("{}: invalid compression type".format(
+                self.filename,
+            ))
+
+        if self._compression == _COMPRESSION_ZSTD and not HAS_ZSTD:
+            raise ValueError("needs zstandard to read a zstd compressed BGEN "
+                             "file")
+
+        # The layout
+        self._layout = (flags >> 2) & 15
+        if self._layout not in {1, 2}:
+            raise ValueError("{}: unsupported layout {}".format(
+                self.filename, self._layout,
+            ))
+
+        # The sample identifiers
+        self._sample_ids = None
+        if flags >> 31:
+            block_size = struct.unpack("<I", self._read(header_size + 4, 4))[0]
+            data = self._read(header_size + 4, block_size)
+            pos = 8
+            self._sample_ids = []
+            for _ in range(nb_samples):
+                sample, pos = _unpack_str(data, pos, "<H")
+                self._sample_ids.append(sample)
+
+    def _parse_variant_id(self, data, pos):
+        """Parses the variant identifying data.
+
+        Args:
+            data (bytes): The data containing the variant block.
+            pos (int): The position of the variant block in the data.
+
+        Returns:
+            tuple: The variant information (varid, rsid, chrom, pos, number of
+            alleles and alleles), and the position of the genotype data.
+
+        """
+        if self._layout == 1:
+            pos += 4
+
+        varid, pos = _unpack_str(data, pos, "<H")
+        rsid, pos = _unpack_str(data, pos, "<H")
+        chrom, pos = _unpack_str(data, pos, "<H")
+        var_pos = struct.unpack_from("<I", data, pos)[0]
+        pos += 4
+
+        nb_alleles = 2
+        if self._layout == 2:
+            nb_alleles = struct.unpack_from("<H", data, pos)[0]
+            pos += 2
+
+        alleles = []
+        for _ in range(nb_alleles):
+            allele, pos = _unpack_str(data, pos, "<I")
+            alleles.append(allele)
+
+        return (varid, rsid, chrom, var_pos, nb_alleles, alleles), pos
+
+    def _get_genotype_block_size(self, data, pos):
+        """Gets the size of the genotype data block starting at 'pos'."""
+        if self._layout == 1 and self._compression == _COMPRESSION_NONE:
+            return 6 * self._nb_samples
+        return 4 + struct.unpack_from("<I", data, pos)[0]
+
+    def _read_variant_id(self, offset):
+        """Reads the variant identifying data of the variant at an offset.
+
+        Returns:
+            tuple: The variant information (see '_parse_variant_id'), and the
+            size of the variant block.
+
+        """
+        # Reading enough data for the variant identifying data
+        size = 4096
+        while True:
+            data = pread(self._bgen_fd, size, offset)
+            try:
+                info, pos = self._parse_variant_id(data, 0)
+                genotype_size = self._get_genotype_block_size(data, pos)
+                return info, pos + genotype_size
+            except struct.error:
+                if len(data) < size:
+                    raise ValueError("{}: unexpected end of file".format(
+                        self.filename,
+                    ))
+                size *= 2
+
+    def _scan_variants(self):
+        """Reads the variant information by scanning the BGEN file."""
+        variants = []
+        offset = self._first_variant
+        for _ in range(self._nb_variants):
+            info, length = self._read_variant_id(offset)
+            varid, rsid, chrom, pos, nb_alleles, alleles = info
+            variants.append((
+                chrom, pos, _variant_name(varid, rsid), nb_alleles,
+                alleles[0], alleles[1] if nb_alleles > 1 else "", offset,
+                length,
+            ))
+            offset += length
+
+        return pd.DataFrame(variants, columns=_VARIANT_COLUMNS)
+
+    def _read_bgi(self, index_filename):
+        """Reads the variant information from a bgenix index."""
+        conn = sqlite3.connect("file:{}?mode=ro".format(index_filename),
+                               uri=True)
+        try:
+            variants = pd.read_sql_query(
+                "SELECT chromosome, position, rsid, number_of_alleles, "
+                "       allele1, allele2, file_start_position, size_in_bytes "
+                "FROM Variant ORDER BY file_start_position",
+                conn,
+            )
+        finally:
+            conn.close()
+
+        variants.columns = _VARIANT_COLUMNS
+        variants["a2"] = variants.a2.fillna("")
+
+        # The index has no variant ID, which is read from the BGEN file for
+        # the variants without rsid (the names being the same as when the
+        # file is scanned)
+        rsid = variants.rsid.fillna("")
+        for i in np.flatnonzero(rsid.isin(["", "."]).values):
+            info, _ = self._read_variant_id(int(variants.offset.iat[i]))
+            variants.loc[i, "rsid"] = _variant_name(info[0], info[1])
+
+        return variants
+
+    def _decode(self, data, pos=0):
+        """Decodes the dosage of a variant block.
+
+        Args:
+            data (bytes): The data containing the variant block.
+            pos (int): The position of the variant block in the data.
+
+        Returns:
+            numpy.ndarray: The dosage of the second allele.
+
+        """
+        _, pos = self._parse_variant_id(data, pos)
+
+        # Getting the (decompressed) genotype data
+        if self._layout == 1 and self._compression == _COMPRESSION_NONE:
+            probs = data[pos:pos + 6 * self._nb_samples]
+        elif self._layout == 1:
+            size = struct.unpack_from("<I", data, pos)[0]
+            probs = zlib.decompress(data[pos + 4:pos + 4 + size])
+        else:
+            size = struct.unpack_from("<I", data, pos)[0]
+            if self._compression == _COMPRESSION_NONE:
+                probs = data[pos + 4:pos + 4 + size]
+            else:
+                uncompressed_size = struct.unpack_from("<I", data, pos + 4)[0]
+                probs = self._decompress(data[pos + 8:pos + 4 + size],
+                                         uncompressed_size)
+
+        if self._layout == 1:
+            return _layout_1_dosage(probs, self._nb_samples, self.prob_t)
+        return _layout_2_dosage(probs, self.prob_t)
+
+    def _decompress(self, data, uncompressed_size):
+        if self._compression == _COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        return zstandard.ZstdDecompressor().decompress(
+            data, max_output_size=uncompressed_size,
+        )
+
+    def _read_variant_genotypes(self, i):
+        """Reads and decodes the dosage of a variant (cached)."""
+        info = self._variants.iloc[i, :]
+        return self._cached(
+            i, lambda: self._decode(self._read(int(info.offset),
+                                               int(info.length))),
+        )
+
+    def _get_variant(self, info):
+        return Variant(info.rsid, info.chrom, info.pos, [info.a1, info.a2])
+
+    def _get_genotypes(self, i, variant=None):
+        info = self._variants.iloc[i, :]
+        if variant is None:
+            variant = self._get_variant(info)
+
+        return Genotypes(
+            variant,
+            self._read_variant_genotypes(i),
+            reference=info.a1,
+            coded=info.a2,
+            multiallelic=bool(info.multiallelic),
+        )
+
+    def iter_genotypes(self):
+        """Iterates on available markers.
+
+        Returns:
+            Genotypes instances.
+
+        """
+        for block in self.iter_blocks():
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_range(self, start, stop):
+        """Iterates on a range of variants (by index)."""
+        for block in self.iter_range_blocks(start, stop):
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates on blocks of consecutive variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the variants of a block are read at
+            once).
+
+        """
+        return self.iter_range_blocks(0, self.get_number_variants(),
+                                      block_size)
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterates on blocks of a range of variants.
+
+        Args:
+            start (int): The index of the first variant.
+            stop (int): The index after the last variant.
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the variants of a block are read at
+            once).
+
+        """
+        start, stop = self._check_range(start, stop)
+        for block_start in range(start, stop, block_size):
+            info = self._variants.iloc[
+                block_start:min(block_start + block_size, stop), :
+            ]
+
+            # Reading all the variant blocks at once
+            first = int(info.offset.iloc[0])
+            last = int(info.offset.iloc[-1] + info.length.iloc[-1])
+            data = self._read(first, last - first)
+
+            genotypes = np.empty((info.shape[0], self._nb_samples))
+            for i, offset in enumerate(info.offset.values):
+                genotypes[i] = self._decode(data, int(offset) - first)
+
+            yield GenotypesBlock(
+                variants=[self._get_variant(row) for row in
+                          info.itertuples(index=False)],
+                genotypes=genotypes,
+                reference=info.a1.tolist(),
+                coded=info.a2.tolist(),
+                multiallelic=info.multiallelic.tolist(),
+            )
+
+    def _get_loci(self):
+        return self._variants.chrom.values, self._variants.pos.values
+
+    def _get_names(self):
+        return self._variants.rsid.values
+
+    def iter_variants(self):
+        """Iterate over marker information."""
+        for info in self._variants.itertuples(index=False):
+            yield self._get_variant(info)
+
+    def get_variant_genotypes(self, variant):
+        """Get the genotypes from a well formed variant instance.
+
+        Args:
+            marker (Variant): A Variant instance.
+
+        Returns:
+            A list of Genotypes instance containing a pointer to the variant as
+            well as a vector of encoded genotypes.
+
+        """
+        indices = self._locus_index.get_indices(variant.chrom, variant.pos,
+                                                variant.pos)
+
+        if len(indices) == 0:
+            return []
+
+        elif len(indices) == 1:
+            info = self._variants.iloc[indices[0], :]
+            variant_alleles = variant._encode_alleles([info.a1, info.a2])
+            if variant_alleles != variant.alleles:
+                # Variant with requested alleles is unavailable.
+                return []
+            return [self._get_genotypes(indices[0], variant)]
+
+        out = []
+        for i in indices:
+            if variant.alleles is not None:
+                # Find the requested alleles.
+                info = self._variants.iloc[i, :]
+                row_alleles = set(Variant._encode_alleles((info.a1, info.a2)))
+                if not row_alleles.issubset(variant.alleles_set):
+                    continue
+            out.append(self._get_genotypes(i, variant))
+
+        return out
+
+    def get_variant_by_name(self, name):
+        """Get the genotype of a marker using it's name.
+
+        Args:
+            name (str): The name of the marker (rsid).
+
+        Returns:
+            list: A list of Genotypes (one per variant with this name).
+
+        """
+        indices = self._name_index.get(name)
+        if indices is None:
+            logger.warning("Variant {} was not found".format(name))
+            return []
+
+        return [self._get_genotypes(i) for i in indices]
+
+    def get_variants_in_region(self, chrom, start, end):
+        """Iterate over variants in a region."""
+        for i in self._locus_index.get_indices(chrom, start, end):
+            yield self._get_genotypes(i)
+
+    def get_samples(self):
+        return list(self.samples)
+
+    def get_number_samples(self):
+        return self._nb_samples
+
+    def get_number_variants(self):
+        return self._variants.shape[0]
+
+
+# The columns of the variant table
+_VARIANT_COLUMNS = ["chrom", "pos", "rsid", "nb_alleles", "a1", "a2",
+                    "offset", "length"]
+
+
+def _unpack_str(data, pos, length_fmt):
+    """Unpacks a string prefixed by its length."""
+    length = struct.unpack_from(length_fmt, data, pos)[0]
+    pos += struct.calcsize(length_fmt)
+    if pos + length > len(data):
+        raise struct.error("not enough data")
+    return data[pos:pos + length].decode(), pos + length
+
+
+def _normalize_chrom(chrom):
+    """Normalizes a BGEN chromosome (e.g. '01' or '23')."""
+    chrom = Variant._encode_chr(chrom)
+    if chrom.isdigit():
+        chrom = str(int(chrom))
+    return CHROM_STR_ENCODE.get(chrom, chrom)
+
+
+def _unpack_values(data, nb_bits, count):
+    """Unpacks probabilities stored using 'nb_bits' bits (little endian)."""
+    if nb_bits in {8, 16, 32}:
+        values = np.frombuffer(data, dtype="<u{}".format(nb_bits // 8),
+                               count=count)
+    else:
+        bits = np.unpackbits(
+            np.frombuffer(data, dtype=np.uint8), bitorder="little",
+        )[:count * nb_bits].reshape(count, nb_bits)
+        values = bits.dot(np.left_shift(1, np.arange(nb_bits),
+                                        dtype=np.int64))
+
+    return values / (2 ** nb_bits - 1)
+
+
+def _layout_1_dosage(data, nb_samples, prob_t):
+    """Computes the dosage from layout 1 probabilities."""
+    probs = np.frombuffer(data, dtype="<u2", count=3 * nb_samples)
+    probs = probs.reshape(nb_samples, 3) / 32768
+
+    dosage = 2 * probs[:, 2] + probs[:, 1]
+    if prob_t > 0:
+        dosage[~np.any(probs >= prob_t, axis=1)] = np.nan
+    dosage[np.all(probs == 0, axis=1)] = np.nan
+
+    return dosage
+
+
+def _variant_name(varid, rsid):
+    """The name of a variant (its rsid, or its ID if there is no rsid)."""
+    return rsid if rsid not in {"", "."} else varid
+
+
+def _layout_2_dosage(data, prob_t):
+    """Computes the dosage from layout 2 (bi-allelic) probabilities."""
+    nb_samples, nb_alleles, _, _ = struct.unpack_from("<IHBB", data, 0)
+    if nb_alleles != 2:
+        raise ValueError("only bi-allelic variants are supported")
+
+    pos = 8 + nb_samples
+    ploidy_missing = np.frombuffer(data, dtype=np.uint8, count=nb_samples,
+                                   offset=8)
+    phased, nb_bits = struct.unpack_from("<BB", data, pos)
+    missing = (ploidy_missing & 128) > 0
+    ploidy = (ploidy_missing & 63).astype(np.int64)
+
+    # For bi-allelic variants, there is one value per chromosome (phased and
+    # unphased data)
+    values = _unpack_values(data[pos + 2:], nb_bits, int(ploidy.sum()))
+
+    if np.all(ploidy == 2):
+        # Diploid samples only
+        values = values.reshape(nb_samples, 2)
+        if phased:
+            # The probability of the first allele for each haplotype
+            dosage = 2 - values.sum(axis=1)
+            certainty = np.prod(np.maximum(values, 1 - values), axis=1)
+        else:
+            # The probabilities of the first two genotypes
+            last = 1 - values.sum(axis=1)
+            dosage = values[:, 1] + 2 * last
+            certainty = np.maximum(values.max(axis=1), last)
+
+    else:
+        sample = np.repeat(np.arange(nb_samples), ploidy)
+        if phased:
+            dosage = ploidy - np.bincount(sample, weights=values,
+                                          minlength=nb_samples)
+            certainty = np.ones(nb_samples)
+            np.multiply.at(certainty, sample, np.maximum(values, 1 - values))
+        else:
+            # The number of copies of the second allele for each value
+            starts = np.repeat(np.cumsum(ploidy) - ploidy, ploidy)
+            copies = np.arange(values.shape[0]) - starts
+            last = 1 - np.bincount(sample, weights=values,
+                                   minlength=nb_samples)
+            dosage = np.bincount(sample, weights=values * copies,
+                                 minlength=nb_samples) + ploidy * last
+            certainty = last.copy()
+            np.maximum.at(certainty, sample, values)
+
+    if prob_t > 0:
+        dosage[certainty < prob_t] = np.nan
+    dosage[missing] = np.nan
+
+    return dosage
@@ -0,0 +1,205 @@
+"""
+Memory-budgeted cache of decoded genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .core import Genotypes
+
+
+# The approximate memory used by an entry, excluding the genotypes vector.
+_ENTRY_OVERHEAD = 256
+
+
+class GenotypesCache(object):
+    def __init__(self, max_bytes):
+        """LRU cache of decoded genotypes with a memory budget.
+
+        Args:
+            max_bytes (int): The maximal number of bytes used by the cached
+                             genotypes.
+
+        Values are either Genotypes instances or genotypes vectors. They are
+        stored with read-only genotypes vectors, so that they cannot be
+        modified by the callers (note that 'Genotypes.flip' creates a new
+        vector). Cached Genotypes are copied before being returned, so that
+        their alleles (or variant) can be changed freely.
+
+        When the budget is exceeded, the least recently used entries are
+        evicted. The cache can be used concurrently by multiple threads.
+
+        """
+        if max_bytes <= 0:
+            raise ValueError("'max_bytes' should be a positive integer")
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        # The statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "<GenotypesCache {:,d} entries; {:,d}/{:,d} bytes>".format(
+            len(self), self._nbytes, self.max_bytes,
+        )
+
+    def get(self, key):
+        """Gets a value from the cache.
+
+        Args:
+            key (hashable): The key of the value (e.g. the position of the
+                            variant in the file).
+
+        Returns:
+            The cached value (or None if the key is not in the cache).
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return _thaw(entry[0])
+
+    def put(self, key, value):
+        """Adds a value to the cache.
+
+        Args:
+            key (hashable): The key of the value.
+            value (Genotypes or numpy.ndarray): The value to cache.
+
+        Returns:
+            The (read-only) value to use instead of the original one.
+
+        """
+        value = _freeze(value)
+        nbytes = _get_nbytes(value)
+        if nbytes > self.max_bytes:
+            # Too large to be cached
+            return _thaw(value)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[1]
+
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+
+            # Evicting the least recently used entries
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+                self.evictions += 1
+
+        return _thaw(value)
+
+    def get_or_decode(self, key, decode):
+        """Gets a value from the cache, decoding and caching it if required.
+
+        Args:
+            key (hashable): The key of the value.
+            decode (callable): Function (without argument) returning the value.
+
+        Returns:
+            The (read-only) value.
+
+        """
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, decode())
+        return value
+
+    def clear(self):
+        """Removes all the entries (the statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self):
+        """Returns the cache statistics.
+
+        Returns:
+            dict: The number of hits, misses and evictions, as well as the
+            number of entries and the memory used.
+
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _read_only(a):
+    """Returns a read-only view of an array."""
+    a = np.asarray(a).view()
+    a.flags.writeable = False
+    return a
+
+
+def _freeze(value):
+    """Makes a value read-only before caching it."""
+    if isinstance(value, Genotypes):
+        value = value.copy()
+        value.genotypes = _read_only(value.genotypes)
+        return value
+    return _read_only(value)
+
+
+def _thaw(value):
+    """Returns a value taken from the cache to a caller."""
+    if isinstance(value, Genotypes):
+        return value.copy()
+    return value
+
+
+def _get_nbytes(value):
+    """Gets the approximate memory used by a value."""
+    if isinstance(value, Genotypes):
+        return value.genotypes.nbytes + _ENTRY_OVERHEAD
+    return value.nbytes + _ENTRY_OVERHEAD
@@ -0,0 +1,245 @@
+"""
+Streaming conversion between genotype formats.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import time
+import logging
+from collections import deque, OrderedDict
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import GenotypesBlock, _sample_indices
+from .prefetch import PrefetchingReader
+
+
+logger = logging.getLogger(__name__)
+
+
+def convert(reader, open_writer, block_size=1000, threads=1,
+            max_pending=None, read_ahead=4, samples=None,
+            split_chromosomes=False, report_interval=10):
+    """Converts genotypes using a streaming pipeline.
+
+    Args:
+        reader (GenotypesReader): The reader (streamed using 'iter_blocks').
+        open_writer (callable): Creates a GenotypesWriter from the list of
+                                samples and the chromosome (None, unless the
+                                output is split by chromosome).
+        block_size (int): The number of variants per encoded block.
+        threads (int): The number of threads encoding blocks.
+        max_pending (int): The maximal number of blocks being encoded (or
+                           waiting to be written), i.e. the output buffer.
+                           Defaults to twice the number of threads.
+        read_ahead (int): The number of blocks read in advance by a
+                          background thread (0 to read in the main thread).
+        samples (list): The samples to keep (in this order), or None for all
+                        of them.
+        split_chromosomes (bool): Use one writer per chromosome.
+        report_interval (float): The interval (in seconds) between throughput
+                                 reports (logged).
+
+    Returns:
+        dict: The number of variants, samples and blocks, and the elapsed time.
+
+    Blocks are read, encoded by a pool of threads (see
+    'GenotypesWriter.encode_block') and written in order. Each writer receives
+    blocks of 'block_size' variants (except the last one), whatever the size
+    of the blocks produced by the reader.
+
+    """
+    if max_pending is None:
+        max_pending = 2 * threads
+
+    # The samples to keep
+    sample_indices = None
+    out_samples = reader.get_samples()
+    if samples is not None:
+        sample_indices = _sample_indices(out_samples, samples)
+        out_samples = list(samples)
+
+    if read_ahead > 0:
+        blocks = PrefetchingReader(reader, read_ahead).iter_blocks(block_size)
+    else:
+        blocks = reader.iter_blocks(block_size)
+
+    stats = _Throughput(len(out_samples), report_interval)
+    with ExitStack() as stack, ThreadPoolExecutor(threads) as executor:
+        stack.callback(blocks.close)
+        writers = {}
+        pending = deque()
+
+        def _encode(writer, block):
+            if sample_indices is not None:
+                block = block.subset_samples(sample_indices)
+            return writer.encode_block(block)
+
+        def _write_next():
+            writer, future, nb_variants = pending.popleft()
+            writer.write_encoded(future.result())
+            stats.update(nb_variants)
+
+        def _submit(key, block):
+            writer = writers.get(key)
+            if writer is None:
+                writer = stack.enter_context(open_writer(out_samples, key))
+                writers[key] = writer
+
+            while len(pending) >= max_pending:
+                _write_next()
+            pending.append(
+                (writer, executor.submit(_encode, writer, block), len(block))
+            )
+
+        try:
+            batcher = _Batcher(block_size)
+            for block in blocks:
+                for key, piece in _split(block, split_chromosomes):
+                    for full_block in batcher.add(key, piece):
+                        _submit(key, full_block)
+
+            for key, block in batcher.flush():
+                _submit(key, block)
+
+            while pending:
+                _write_next()
+
+        except BaseException:
+            for _, future, _ in pending:
+                future.cancel()
+            raise
+
+    return stats.report(final=True)
+
+
+def rebatch_blocks(blocks, block_size):
+    """Regroups consecutive blocks into blocks of a fixed size.
+
+    Args:
+        blocks (iterable): The GenotypesBlock instances.
+        block_size (int): The number of variants per block.
+
+    Returns:
+        GenotypesBlock instances, all with 'block_size' variants (except the
+        last one).
+
+    """
+    batcher = _Batcher(block_size)
+    for block in blocks:
+        for full_block in batcher.add(None, block):
+            yield full_block
+
+    for _, block in batcher.flush():
+        yield block
+
+
+def _split(block, split_chromosomes):
+    """Splits a block in runs of variants on the same chromosome."""
+    if not split_chromosomes:
+        yield None, block
+        return
+
+    start = 0
+    chroms = [v.chrom for v in block.variants]
+    for i in range(1, len(chroms) + 1):
+        if i == len(chroms) or chroms[i] != chroms[start]:
+            yield chroms[start], block[start:i]
+            start = i
+
+
+class _Batcher(object):
+    def __init__(self, block_size):
+        """Regroups blocks (for each key) in blocks of a fixed size."""
+        self.block_size = block_size
+        self._pending = OrderedDict()
+
+    def add(self, key, block):
+        """Adds a block, and returns the complete blocks."""
+        pieces, nb_variants = self._pending.pop(key, ([], 0))
+        out = []
+
+        start = 0
+        while start < len(block):
+            n = min(self.block_size - nb_variants, len(block) - start)
+            pieces.append(block[start:start + n])
+            nb_variants += n
+            start += n
+
+            if nb_variants == self.block_size:
+                out.append(GenotypesBlock.concatenate(pieces))
+                pieces = []
+                nb_variants = 0
+
+        if pieces:
+            self._pending[key] = (pieces, nb_variants)
+
+        return out
+
+    def flush(self):
+        """Returns the incomplete blocks (key and block)."""
+        out = [(key, GenotypesBlock.concatenate(pieces))
+               for key, (pieces, _) in self._pending.items()]
+        self._pending.clear()
+        return out
+
+
+class _Throughput(object):
+    def __init__(self, nb_samples, report_interval):
+        """Tracks (and logs) the throughput of a conversion."""
+        self.nb_samples = nb_samples
+        self.report_interval = report_interval
+        self.nb_variants = 0
+        self.nb_blocks = 0
+        self._start = time.perf_counter()
+        self._last_report = self._start
+
+    def update(self, nb_variants):
+        self.nb_variants += nb_variants
+        self.nb_blocks += 1
+
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self._start
+        rate = self.nb_variants / elapsed if elapsed > 0 else 0
+        logger.info(
+            "{}{:,d} variants in {:,.1f}s ({:,.0f} variants/s, {:,.0f} "
+            "genotypes/s)".format(
+                "Converted " if final else "", self.nb_variants, elapsed,
+                rate, rate * self.nb_samples,
+            )
+        )
+        return {
+            "nb_variants": self.nb_variants,
+            "nb_samples": self.nb_samples,
+            "nb_blocks": self.nb_blocks,
+            "elapsed": elapsed,
+        }
@@ -27,9 +27,15 @@ Define the API for geneparse.
 # THE SOFTWARE.
 
 
+import logging
+from itertools import islice
+
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
+
 class Variant(object):
     # Subclasses should declare a __slots__ containing only the additional
     # slots.
@@ -42,6 +48,31 @@ class Variant(object):
 
         self.alleles = self._encode_alleles(alleles)
 
+    @classmethod
+    def _trusted(cls, name, chrom, pos, alleles):
+        """Creates a variant from normalized values (without any check).
+
+        Args:
+            name (str): The name of the variant.
+            chrom (str): The encoded chromosome (see '_encode_chr').
+            pos (int): The position.
+            alleles (tuple): The sorted, upper case alleles (or None).
+
+        Note
+        ====
+            This is meant for the readers' internals, whose metadata are
+            normalized once (when the file is opened). It is the caller's
+            responsibility to provide the exact values that the public
+            constructor would have stored.
+
+        """
+        variant = cls.__new__(cls)
+        variant.name = name
+        variant.chrom = chrom
+        variant.pos = pos
+        variant.alleles = alleles
+        return variant
+
     @staticmethod
     def _encode_chr(chrom):
         chrom = str(chrom).upper()
@@ -57,7 +88,13 @@ class Variant(object):
         return tuple(sorted(str(s).upper() for s in iterable))
 
     def copy(self):
-        return Variant(self.name, self.chrom, self.pos, self.alleles)
+        # Copying every slot, so that subclasses (e.g. ImputedVariant) keep
+        # their type and additional fields
+        other = self.__class__.__new__(self.__class__)
+        for cls in self.__class__.__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                setattr(other, slot, getattr(self, slot))
+        return other
 
     def __hash__(self):
         # Two variants will have the same hash if they have the same
@@ -114,7 +151,7 @@ class ImputedVariant(Variant):
         super().__init__(name, chrom, pos, alleles)
         self.quality = float(quality)
 
-        if 0 <= self.quality <= 1:
+        if not 0 <= self.quality <= 1:
             raise ValueError(
                 "The 'quality' field for ImputedVariant instances is expected "
                 "to be a float value between 0 and 1."
@@ -153,6 +190,32 @@ class Genotypes(object):
                 "({} not in {}).".format(self.coded, variant.alleles)
             )
 
+    @classmethod
+    def _trusted(cls, variant, genotypes, reference, coded, multiallelic):
+        """Creates an instance from normalized values (without any check).
+
+        The reference and coded alleles must be upper case and part of the
+        variant's alleles (see 'Variant._trusted').
+
+        """
+        genotypes_object = cls.__new__(cls)
+        genotypes_object.variant = variant
+        genotypes_object.genotypes = genotypes
+        genotypes_object.reference = reference
+        genotypes_object.coded = coded
+        genotypes_object.multiallelic = multiallelic
+        return genotypes_object
+
+    def copy(self):
+        """Returns a shallow copy of this instance.
+
+        The variant is copied, but the genotypes vector is shared between both
+        instances (note that 'flip' creates a new vector).
+
+        """
+        return self._trusted(self.variant.copy(), self.genotypes,
+                             self.reference, self.coded, self.multiallelic)
+
     def flip(self):
         """Flips the reference and coded alleles of this instance."""
         self.genotypes = 2 - self.genotypes
@@ -193,6 +256,225 @@ class Genotypes(object):
         )
 
 
+# The storage of the genotypes vector (used by LazyGenotypes).
+_GENOTYPES_SLOT = Genotypes.genotypes
+
+
+class LazyGenotypes(Genotypes):
+    __slots__ = ("_decode", )
+
+    def __init__(self, variant, decode, reference, coded, multiallelic):
+        """Genotypes whose vector is decoded when first accessed.
+
+        Args:
+            variant (Variant): The variant.
+            decode (callable): Function (without argument) returning the
+                               genotypes vector.
+            reference (str): The reference allele.
+            coded (str): The coded allele.
+            multiallelic (bool): The multiallelic status of the variant.
+
+        The variant and alleles are available without decoding anything, so
+        that records can be filtered before paying for the genotypes (see
+        'GenotypesReader.enable_lazy_decoding'). The vector is decoded once,
+        on the first access to 'genotypes'.
+
+        """
+        super().__init__(variant, None, reference, coded, multiallelic)
+        self._decode = decode
+
+    @classmethod
+    def _trusted(cls, variant, decode, reference, coded, multiallelic):
+        """Creates an instance from normalized values (without any check)."""
+        genotypes_object = super()._trusted(variant, None, reference, coded,
+                                            multiallelic)
+        genotypes_object._decode = decode
+        return genotypes_object
+
+    @property
+    def genotypes(self):
+        decode = self._decode
+        if decode is not None:
+            _GENOTYPES_SLOT.__set__(self, decode())
+            self._decode = None
+        return _GENOTYPES_SLOT.__get__(self, LazyGenotypes)
+
+    @genotypes.setter
+    def genotypes(self, genotypes):
+        self._decode = None
+        _GENOTYPES_SLOT.__set__(self, genotypes)
+
+    @property
+    def decoded(self):
+        """Whether the genotypes vector has been decoded."""
+        return self._decode is None
+
+    def copy(self):
+        """Returns a shallow copy of this instance.
+
+        The copy of an instance which is not decoded yet is also lazy (each
+        instance decodes its own vector).
+
+        """
+        decode = self._decode
+        if decode is None:
+            return Genotypes._trusted(self.variant.copy(), self.genotypes,
+                                      self.reference, self.coded,
+                                      self.multiallelic)
+
+        return LazyGenotypes._trusted(self.variant.copy(), decode,
+                                      self.reference, self.coded,
+                                      self.multiallelic)
+
+    def flip(self):
+        """Flips the reference and coded alleles (without decoding)."""
+        decode = self._decode
+        if decode is None:
+            super().flip()
+            return
+
+        self._decode = lambda: 2 - decode()
+        self.reference, self.coded = self.coded, self.reference
+
+    def __reduce__(self):
+        # Pickled as a regular (decoded) instance, since the decoding function
+        # usually refers to the reader
+        return (Genotypes, (self.variant, self.genotypes, self.reference,
+                            self.coded, self.multiallelic))
+
+
+class GenotypesBlock(object):
+    __slots__ = ("variants", "genotypes", "reference", "coded", "multiallelic",
+                 "_normalized")
+
+    def __init__(self, variants, genotypes, reference, coded, multiallelic):
+        """Class holding the genotypes of consecutive variants.
+
+        Args:
+            variants (list): The Variant instances.
+            genotypes (numpy.ndarray): A (variants x samples) array of
+                                       genotypes.
+            reference (list): The reference allele of each variant.
+            coded (list): The coded allele of each variant.
+            multiallelic (list): The multiallelic status of each variant.
+
+        Row 'i' of the genotypes array is the genotypes vector (coded allele
+        count) of variant 'i'.
+
+        """
+        self.variants = variants
+        self.genotypes = genotypes
+        self.reference = reference
+        self.coded = coded
+        self.multiallelic = multiallelic
+
+        # Are the alleles normalized (i.e. Genotypes can be created without
+        # any check)?
+        self._normalized = False
+
+    @classmethod
+    def _trusted(cls, variants, genotypes, reference, coded, multiallelic):
+        """Creates a block whose alleles are normalized.
+
+        The reference and coded alleles must be upper case and part of the
+        variant's alleles, so that 'iter_genotypes' skips the validation.
+
+        """
+        block = cls(variants, genotypes, reference, coded, multiallelic)
+        block._normalized = True
+        return block
+
+    def _derived(self, variants, genotypes, reference, coded, multiallelic):
+        """Creates a block from a subset of this one (keeping its status)."""
+        block = GenotypesBlock(variants, genotypes, reference, coded,
+                               multiallelic)
+        block._normalized = self._normalized
+        return block
+
+    @classmethod
+    def from_genotypes(cls, genotypes_list):
+        """Creates a block from a list of Genotypes instances."""
+        if len(genotypes_list) == 0:
+            raise ValueError("cannot create an empty block")
+
+        return cls(
+            variants=[g.variant for g in genotypes_list],
+            genotypes=np.vstack([g.genotypes for g in genotypes_list]),
+            reference=[g.reference for g in genotypes_list],
+            coded=[g.coded for g in genotypes_list],
+            multiallelic=[g.multiallelic for g in genotypes_list],
+        )
+
+    @classmethod
+    def concatenate(cls, blocks):
+        """Creates a block from consecutive blocks."""
+        if len(blocks) == 1:
+            return blocks[0]
+
+        block = cls(
+            variants=[v for block in blocks for v in block.variants],
+            genotypes=np.vstack([block.genotypes for block in blocks]),
+            reference=[a for block in blocks for a in block.reference],
+            coded=[a for block in blocks for a in block.coded],
+            multiallelic=[m for block in blocks for m in block.multiallelic],
+        )
+        block._normalized = all(b._normalized for b in blocks)
+        return block
+
+    def __len__(self):
+        return len(self.variants)
+
+    def __getitem__(self, key):
+        """Returns the block of a slice of variants (the array is a view)."""
+        if not isinstance(key, slice):
+            raise TypeError("blocks can only be sliced")
+
+        return self._derived(self.variants[key], self.genotypes[key],
+                             self.reference[key], self.coded[key],
+                             self.multiallelic[key])
+
+    def select(self, mask):
+        """Returns the block restricted to some variants.
+
+        Args:
+            mask (numpy.ndarray): The variants to keep (boolean).
+
+        """
+        indices = np.flatnonzero(mask)
+        return self._derived(
+            [self.variants[i] for i in indices], self.genotypes[indices],
+            [self.reference[i] for i in indices],
+            [self.coded[i] for i in indices],
+            [self.multiallelic[i] for i in indices],
+        )
+
+    def subset_samples(self, indices):
+        """Returns the block restricted to some samples.
+
+        Args:
+            indices (numpy.ndarray): The indices of the samples to keep.
+
+        """
+        return self._derived(self.variants, self.genotypes[:, indices],
+                             self.reference, self.coded, self.multiallelic)
+
+    def iter_genotypes(self):
+        """Iterates over the Genotypes of the block.
+
+        The genotypes vectors are views on the block's array.
+
+        """
+        make_genotypes = Genotypes._trusted if self._normalized else Genotypes
+        for i, variant in enumerate(self.variants):
+            yield make_genotypes(variant, self.genotypes[i], self.reference[i],
+                                 self.coded[i], self.multiallelic[i])
+
+    def __repr__(self):
+        return "<GenotypesBlock {:,d} variants; {:,d} samples>".format(
+            *self.genotypes.shape
+        )
+
+
 class SplitChromosomeReader(object):
     def __init__(self, chrom_to_reader):
         """Reader to handle genotype access using files split by chromosome.
@@ -222,6 +504,16 @@ class SplitChromosomeReader(object):
 
         self.samples = samples
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for reader in self.chrom_to_reader.values():
+            reader.close()
+
     @staticmethod
     def _unknown_chrom_message(chrom):
         return (
@@ -239,6 +531,93 @@ class SplitChromosomeReader(object):
             for g in reader.iter_genotypes():
                 yield g
 
+    def iter_blocks(self, block_size=1000):
+        for chrom, reader in self.chrom_to_reader.items():
+            for block in reader.iter_blocks(block_size):
+                yield block
+
+    def _iter_sub_ranges(self, start, stop):
+        """Maps a range of variants to ranges in the sub-readers."""
+        offset = 0
+        for chrom, reader in self.chrom_to_reader.items():
+            nb_variants = reader.get_number_variants()
+            if start < offset + nb_variants and stop > offset:
+                yield reader, max(start - offset, 0), min(stop - offset,
+                                                          nb_variants)
+            offset += nb_variants
+
+    def iter_range(self, start, stop):
+        """Iterate over the genotypes of a range of variants.
+
+        The variants are indexed across all chromosomes (in the order of the
+        sub-readers).
+
+        """
+        for reader, sub_start, sub_stop in self._iter_sub_ranges(start, stop):
+            for g in reader.iter_range(sub_start, sub_stop):
+                yield g
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterate over blocks of a range of variants (see 'iter_range')."""
+        for reader, sub_start, sub_stop in self._iter_sub_ranges(start, stop):
+            for block in reader.iter_range_blocks(sub_start, sub_stop,
+                                                  block_size):
+                yield block
+
+    def shard_range(self, k, n):
+        """Get the range of variants of a shard.
+
+        The shards are balanced by number of variants across the chromosomes
+        (see 'GenotypesReader.shard_range').
+
+        """
+        return _shard_bounds(self._get_loci(), k, n)
+
+    def shard(self, k, n):
+        """Get the k-th of n shards of the variants (see 'shard_range')."""
+        return ReaderShard(self, *self.shard_range(k, n))
+
+    def filter(self, variant_filter):
+        """Get a view of the variants matching a filter (see
+        'GenotypesReader.filter').
+        """
+        from .filters import FilteredReader
+        return FilteredReader(self, variant_filter)
+
+    def _get_names(self):
+        names = [reader._get_names()
+                 for reader in self.chrom_to_reader.values()]
+        return np.concatenate([np.asarray(n, dtype=object) for n in names]
+                              + [np.zeros(0, dtype=object)])
+
+    def _get_qualities(self):
+        qualities = [reader._get_qualities()
+                     for reader in self.chrom_to_reader.values()]
+        if not qualities or any(q is None for q in qualities):
+            return None
+        return np.concatenate(qualities)
+
+    def _get_alleles(self):
+        alleles = [reader._get_alleles()
+                   for reader in self.chrom_to_reader.values()]
+        if not alleles or any(a is None for a in alleles):
+            return None
+        return (
+            np.concatenate([np.asarray(a[0], dtype=object) for a in alleles]),
+            np.concatenate([np.asarray(a[1], dtype=object) for a in alleles]),
+        )
+
+    def _get_loci(self):
+        loci = [reader._get_loci() for reader in self.chrom_to_reader.values()]
+        if not loci:
+            return np.zeros(0, dtype=object), np.zeros(0, dtype=np.int64)
+
+        return (
+            np.concatenate([np.asarray(chrom, dtype=object)
+                            for chrom, _ in loci]),
+            np.concatenate([pos for _, pos in loci]),
+        )
+
     def get_variant_genotypes(self, variant):
         try:
             return self.chrom_to_reader[
@@ -260,6 +639,15 @@ class SplitChromosomeReader(object):
         except KeyError:
             raise ValueError(self._unknown_chrom_message(chrom))
 
+    def get_sample_genotypes(self, sample_ids):
+        blocks = [reader.get_sample_genotypes(sample_ids)
+                  for reader in self.chrom_to_reader.values()]
+        if not blocks:
+            _sample_indices(self.samples, sample_ids)
+            return GenotypesBlock([], np.zeros((0, len(sample_ids))), [], [],
+                                  [])
+        return GenotypesBlock.concatenate(blocks)
+
     def get_samples(self):
         return self.samples
 
@@ -271,6 +659,18 @@ class SplitChromosomeReader(object):
 
 
 class GenotypesReader(object):
+    # The (optional) cache of decoded genotypes (see 'enable_cache').
+    _cache = None
+
+    # The (optional) sample-major cache (see 'enable_transposed_cache').
+    _transposed = None
+
+    # The (optional) I/O and decoding statistics (see 'enable_stats').
+    _stats = None
+
+    # Return LazyGenotypes instances (see 'enable_lazy_decoding').
+    _lazy = False
+
     def __init__(self):
         """Abstract class to read genotypes data."""
         raise NotImplementedError()
@@ -284,6 +684,154 @@ class GenotypesReader(object):
     def close(self):
         pass
 
+    def enable_cache(self, max_bytes=256 * 1024 ** 2):
+        """Caches the decoded genotypes of the queried variants.
+
+        Args:
+            max_bytes (int): The maximal memory used by the cached genotypes.
+
+        Returns:
+            GenotypesCache: The cache (see 'GenotypesCache.stats').
+
+        Variants accessed repeatedly through 'get_variant_genotypes',
+        'get_variant_by_name' and 'get_variants_in_region' are then decoded
+        only once (as long as they are not evicted). The genotypes vectors
+        returned for cached variants are read-only. Sequential scans (e.g.
+        'iter_genotypes') do not use the cache.
+
+        """
+        from .cache import GenotypesCache
+        self._cache = GenotypesCache(max_bytes)
+        return self._cache
+
+    def disable_cache(self):
+        """Disables (and clears) the cache of decoded genotypes."""
+        self._cache = None
+
+    def get_cache_stats(self):
+        """Returns the cache statistics (None if the cache is disabled)."""
+        if self._cache is None:
+            return None
+        return self._cache.stats()
+
+    def enable_stats(self, callback=None):
+        """Counts the I/O and decoding operations of the reader.
+
+        Args:
+            callback (callable): A function called with the name of the
+                                 counter and the increment on every update
+                                 (e.g. to feed a metrics system).
+
+        Returns:
+            ReaderStats: The statistics (see 'stats').
+
+        The bytes read, seeks, BGZF blocks decompressed, lines parsed and
+        variants returned are counted, and the decompression, decoding,
+        parsing, index lookup and construction phases are timed (see
+        'ReaderStats'). When disabled (the default), the instrumentation
+        costs a single test per operation.
+
+        Note
+        ====
+            Readers which are not instrumented only report zeros.
+
+        """
+        from .stats import ReaderStats
+        self._stats = ReaderStats(callback)
+        return self._stats
+
+    def disable_stats(self):
+        """Stops counting the I/O and decoding operations."""
+        self._stats = None
+
+    def stats(self):
+        """Returns a snapshot of the statistics (None if disabled)."""
+        if self._stats is None:
+            return None
+        return self._stats.snapshot()
+
+    def enable_lazy_decoding(self):
+        """Defers the decoding of the genotypes until they are accessed.
+
+        'iter_genotypes', 'get_variant_genotypes', 'get_variant_by_name' and
+        'get_variants_in_region' then return LazyGenotypes instances, whose
+        variant and alleles are available right away. The genotypes vector is
+        decoded on the first access to 'genotypes', so that the records
+        discarded after looking at their variant are never decoded.
+
+        Note
+        ====
+            Only some readers support lazy decoding (e.g. plink and IMPUTE2),
+            the others keep returning decoded Genotypes. The block iterators
+            ('iter_blocks') always decode the genotypes. The genotypes must
+            be accessed before the reader is closed.
+
+        """
+        self._lazy = True
+
+    def disable_lazy_decoding(self):
+        """Decodes the genotypes when the records are created (default)."""
+        self._lazy = False
+
+    def enable_transposed_cache(self, path, rebuild=False, **kwargs):
+        """Uses a sample-major copy of the genotypes to get samples.
+
+        Args:
+            path (str): The directory of the cache.
+            rebuild (bool): Rebuild the cache even if it exists.
+            kwargs: The arguments used to build the cache (see
+                    'transpose.build').
+
+        Returns:
+            TransposedCache: The cache.
+
+        The cache is built from this reader (reading the file once) if it
+        does not exist, or if its samples or number of variants do not match
+        the reader's. It is then memory mapped, so that 'get_sample_genotypes'
+        reads the genotypes of each sample with a single contiguous read.
+
+        Note
+        ====
+            Changes to the genotypes which keep the same samples and variants
+            are not detected (use 'rebuild').
+
+        """
+        from .transpose import TransposedCache, build
+
+        cache = None
+        if not rebuild and TransposedCache.exists(path):
+            cache = TransposedCache(path)
+            if not cache.matches(self):
+                cache.close()
+                cache = None
+
+        if cache is None:
+            build(self, path, **kwargs)
+            cache = TransposedCache(path)
+
+        self._transposed = cache
+        return cache
+
+    def disable_transposed_cache(self):
+        """Stops using the sample-major cache (the files are kept)."""
+        if self._transposed is not None:
+            self._transposed.close()
+        self._transposed = None
+
+    def _cached(self, key, decode):
+        """Decodes a variant, using the cache if it is enabled.
+
+        Args:
+            key (hashable): The resolved location of the variant (e.g. its
+                            position in the file).
+            decode (callable): Function (without argument) decoding the
+                               variant.
+
+        """
+        if self._cache is None:
+            return decode()
+        return self._cache.get_or_decode(key, decode)
+
     def __repr__(self):
         return "<{} {:,d} samples; {:,d} variants>".format(
             self.__class__.__name__,
@@ -314,6 +862,166 @@ class GenotypesReader(object):
         """
         raise NotImplementedError()
 
+    def iter_blocks(self, block_size=1000):
+        """Iterate over blocks of consecutive variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        This method yields instances of GenotypesBlock. By default, blocks are
+        built from 'iter_genotypes', but readers can decode blocks directly.
+
+        """
+        return _group_blocks(self.iter_genotypes(), block_size)
+
+    def iter_range(self, start, stop):
+        """Iterate over the genotypes of a range of variants.
+
+        Args:
+            start (int): The index of the first variant (in file order).
+            stop (int): The index after the last variant (clipped to the
+                        number of variants).
+
+        This method yields instances of Genotypes. By default, the variants
+        before the range are skipped using 'iter_genotypes', but readers
+        with an index seek to the first variant directly.
+
+        """
+        start, stop = self._check_range(start, stop)
+        return islice(self.iter_genotypes(), start, stop)
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterate over blocks of a range of variants.
+
+        Args:
+            start (int): The index of the first variant (in file order).
+            stop (int): The index after the last variant.
+            block_size (int): The (maximal) number of variants per block.
+
+        This method yields instances of GenotypesBlock (see 'iter_range').
+
+        """
+        return _group_blocks(self.iter_range(start, stop), block_size)
+
+    def _iter_indices_blocks(self, indices, block_size=1000):
+        """Iterate over blocks of scattered variants.
+
+        Args:
+            indices (list): The indices of the variants (sorted, in file
+                            order).
+            block_size (int): The (maximal) number of variants per block.
+
+        This method yields instances of GenotypesBlock. By default, each run
+        of consecutive variants is read using 'iter_range_blocks', but
+        readers which open the file for each range should read the variants
+        using their positional reads.
+
+        """
+        i = 0
+        while i < len(indices):
+            j = i + 1
+            while j < len(indices) and indices[j] == indices[j - 1] + 1:
+                j += 1
+            for block in self.iter_range_blocks(indices[i],
+                                                indices[j - 1] + 1,
+                                                block_size):
+                yield block
+            i = j
+
+    def shard_range(self, k, n):
+        """Get the range of variants of a shard.
+
+        Args:
+            k (int): The index of the shard (from 0 to n - 1).
+            n (int): The number of shards.
+
+        Returns:
+            tuple: The start and stop indices of the shard's variants.
+
+        The variants are split in 'n' slices of (about) the same size, which
+        never split consecutive variants at the same locus (i.e. multiallelic
+        variants). The shards cover all the variants, without overlap.
+
+        """
+        return _shard_bounds(self._get_loci(), k, n)
+
+    def shard(self, k, n):
+        """Get the k-th of n shards of the variants (see 'shard_range').
+
+        Returns:
+            ReaderShard: A reader iterating over the variants of the shard.
+
+        """
+        return ReaderShard(self, *self.shard_range(k, n))
+
+    def filter(self, variant_filter):
+        """Get a view of the variants matching a filter.
+
+        Args:
+            variant_filter (filters.VariantFilter): The filter.
+
+        Returns:
+            filters.FilteredReader: A reader iterating over the variants
+            matching the filter.
+
+        The predicates on the variant information (e.g. regions, names or
+        quality) are evaluated using the reader's index, so that the
+        genotypes of the other variants are never read. The predicates on
+        the genotypes (e.g. MAF) are evaluated on whole blocks.
+
+        """
+        from .filters import FilteredReader
+        return FilteredReader(self, variant_filter)
+
+    def _get_loci(self):
+        """Get the chromosome and position of all variants (in file order).
+
+        Returns:
+            tuple: The chromosomes (as in Variant.chrom) and the positions
+            (numpy.ndarray).
+
+        By default, the loci are read using 'iter_variants', but readers
+        should use their index.
+
+        """
+        loci = [(v.chrom, v.pos) for v in self.iter_variants()]
+        chrom = np.array([locus[0] for locus in loci], dtype=object)
+        pos = np.array([locus[1] for locus in loci], dtype=np.int64)
+        return chrom, pos
+
+    def _get_names(self):
+        """Get the name of all variants (in file order, see '_get_loci')."""
+        return np.array([v.name for v in self.iter_variants()], dtype=object)
+
+    def _get_qualities(self):
+        """Get the quality of all variants (None if not in the index)."""
+        return None
+
+    def _get_alleles(self):
+        """Get the reference and coded alleles of all variants.
+
+        Returns:
+            tuple: The reference and coded alleles (numpy.ndarray), or None
+            if they are not in the index.
+
+        """
+        return None
+
+    def _check_range(self, start, stop):
+        """Checks a range of variants, clipping it to the number of variants.
+        """
+        if start < 0 or stop < 0:
+            raise ValueError("invalid range: {}-{}".format(start, stop))
+
+        try:
+            nb_variants = self.get_number_variants()
+        except NotImplementedError:
+            # The range is clipped by the iteration
+            nb_variants = None
+        if nb_variants is not None:
+            stop = min(stop, nb_variants)
+        return start, max(start, stop)
+
     def get_variant_genotypes(self, variant):
         """Get the genotypes for a given variant.
 
@@ -351,6 +1059,30 @@ class GenotypesReader(object):
         """
         raise NotImplementedError()
 
+    def get_sample_genotypes(self, sample_ids):
+        """Get the genotypes of some samples, for all the variants.
+
+        Args:
+            sample_ids (list): The samples (in the order of the columns).
+
+        Returns:
+            GenotypesBlock: The genotypes of all the variants (in file order)
+            for the samples (variants x samples).
+
+        Without a transposed cache (see 'enable_transposed_cache'), the whole
+        file is read.
+
+        """
+        if self._transposed is not None:
+            return self._transposed.get_sample_genotypes(sample_ids)
+
+        indices = _sample_indices(self.get_samples(), sample_ids)
+        blocks = [block.subset_samples(indices)
+                  for block in self.iter_blocks()]
+        if not blocks:
+            return GenotypesBlock([], np.zeros((0, len(indices))), [], [], [])
+        return GenotypesBlock.concatenate(blocks)
+
     def get_samples(self):
         """Get an ordered collection of the samples in the genotype container.
         """
@@ -365,6 +1097,542 @@ class GenotypesReader(object):
         raise NotImplementedError()
 
 
+class ReaderShard(GenotypesReader):
+    def __init__(self, reader, start, stop):
+        """Reader restricted to a range of consecutive variants.
+
+        Args:
+            reader (GenotypesReader): The reader.
+            start (int): The index of the first variant.
+            stop (int): The index after the last variant.
+
+        Shards are usually created using 'GenotypesReader.shard'. Only the
+        iteration methods are available (restricted to the range), and closing
+        a shard does not close the reader.
+
+        """
+        self.reader = reader
+        self.start = start
+        self.stop = stop
+
+    def __repr__(self):
+        return "<ReaderShard {:,d}-{:,d} of {!r}>".format(
+            self.start, self.stop, self.reader,
+        )
+
+    def iter_variants(self):
+        return islice(self.reader.iter_variants(), self.start, self.stop)
+
+    def iter_genotypes(self):
+        return self.reader.iter_range(self.start, self.stop)
+
+    def iter_blocks(self, block_size=1000):
+        return self.reader.iter_range_blocks(self.start, self.stop,
+                                             block_size)
+
+    def iter_range(self, start, stop):
+        start, stop = self._check_range(start, stop)
+        return self.reader.iter_range(self.start + start, self.start + stop)
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        start, stop = self._check_range(start, stop)
+        return self.reader.iter_range_blocks(self.start + start,
+                                             self.start + stop, block_size)
+
+    def _get_loci(self):
+        chrom, pos = self.reader._get_loci()
+        return chrom[self.start:self.stop], pos[self.start:self.stop]
+
+    def _get_names(self):
+        return self.reader._get_names()[self.start:self.stop]
+
+    def _get_qualities(self):
+        qualities = self.reader._get_qualities()
+        if qualities is None:
+            return None
+        return qualities[self.start:self.stop]
+
+    def _get_alleles(self):
+        alleles = self.reader._get_alleles()
+        if alleles is None:
+            return None
+        return tuple(a[self.start:self.stop] for a in alleles)
+
+    def get_samples(self):
+        return self.reader.get_samples()
+
+    def get_number_samples(self):
+        return self.reader.get_number_samples()
+
+    def get_number_variants(self):
+        return self.stop - self.start
+
+
+class MergedSamplesReader(GenotypesReader):
+    def __init__(self, readers, parallel=False, max_prefetch=4):
+        """Reader concatenating the samples of readers of the same variants.
+
+        Args:
+            readers (list): The GenotypesReader instances (e.g. one per batch
+                            of samples).
+            parallel (bool): Read and decode the sub-readers in background
+                             threads (one per sub-reader).
+            max_prefetch (int): The maximal number of blocks decoded in
+                                advance by each thread (when parallel).
+
+        The samples are those of the first sub-reader, followed by those of
+        the second one, etc. (the sample IDs must be unique).
+
+        The variants are matched by locus and alleles, advancing the
+        sub-readers in lockstep. Hence, the variants of every sub-reader must
+        be sorted by position, with the chromosomes in the same order (the
+        order in which they are found in the first sub-reader, so that no
+        index is needed). The chromosomes of the other sub-readers must also
+        be in the first one. The genotypes of a sub-reader whose reference
+        and coded alleles are swapped are flipped. Only the variants found in
+        all the sub-readers are returned (in the order of the first one),
+        using its variant information and alleles.
+
+        """
+        if len(readers) == 0:
+            raise ValueError("no reader to merge")
+
+        self.readers = list(readers)
+        self.parallel = parallel
+        self.max_prefetch = max_prefetch
+
+        # The samples (and their columns for each sub-reader)
+        self.samples = []
+        self._sample_slices = []
+        for reader in self.readers:
+            start = len(self.samples)
+            self.samples.extend(reader.get_samples())
+            self._sample_slices.append(slice(start, len(self.samples)))
+
+        if len(set(self.samples)) != len(self.samples):
+            raise ValueError("Some samples are in more than one sub-reader.")
+
+        # The number of merged variants (counted once, when needed)
+        self._nb_variants = None
+
+    def __repr__(self):
+        return "<MergedSamplesReader {:,d} samples; {:,d} readers>".format(
+            self.get_number_samples(), len(self.readers),
+        )
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+    def _iter_sub_blocks(self, reader, block_size):
+        """Iterates over the blocks of a sub-reader (in a thread if
+        parallel).
+        """
+        if not self.parallel:
+            return reader.iter_blocks(block_size)
+
+        from .prefetch import PrefetchingReader
+        return PrefetchingReader(reader, self.max_prefetch).iter_blocks(
+            block_size,
+        )
+
+    def _merge(self, streams):
+        """Matches the records of the sub-readers (sorted merge).
+
+        Args:
+            streams (list): The records of each sub-reader (see
+                            '_iter_block_records'), sorted by locus.
+
+        Returns:
+            A list of (record, flip) for each variant found in all the
+            sub-readers.
+
+        """
+        # The order of the chromosomes (as found in the first sub-reader)
+        chrom_rank = {}
+        cursors = [_MergeCursor(records, chrom_rank, primary=(i == 0))
+                   for i, records in enumerate(streams)]
+        nb_skipped = 0
+        while all(cursor.key is not None for cursor in cursors):
+            # Skipping the loci which are not in all the sub-readers
+            key = max(cursor.key for cursor in cursors)
+            for cursor in cursors:
+                nb_skipped += cursor.skip_to(key)
+            if any(cursor.key != key for cursor in cursors):
+                continue
+
+            groups = [cursor.take() for cursor in cursors]
+            for record in groups[0]:
+                matched = [(record, False)]
+                for group in groups[1:]:
+                    match = _match_record(record, group)
+                    if match is None:
+                        nb_skipped += 1
+                        break
+                    matched.append(match)
+                else:
+                    yield matched
+
+        if nb_skipped or any(cursor.key is not None for cursor in cursors):
+            logger.warning("Some variants are not in all the sub-readers "
+                           "(they were skipped).")
+
+    def _fill(self, matched, out):
+        """Concatenates the genotypes of matched records in a buffer."""
+        for (record, flip), samples in zip(matched, self._sample_slices):
+            if flip:
+                np.subtract(2, record[4], out=out[samples])
+            else:
+                out[samples] = record[4]
+
+    def _merge_genotypes(self, genotypes_lists):
+        """Merges the Genotypes of a query on each sub-reader."""
+        out = []
+        for matched in self._merge_lists(genotypes_lists):
+            genotypes = np.empty(len(self.samples))
+            self._fill(matched, genotypes)
+            variant, reference, coded, multiallelic, _ = matched[0][0]
+            out.append(Genotypes(variant, genotypes, reference, coded,
+                                 multiallelic))
+        return out
+
+    def _merge_lists(self, genotypes_lists):
+        """Matches the Genotypes of a query on each sub-reader."""
+        groups = [[_genotypes_record(g) for g in genotypes_list]
+                  for genotypes_list in genotypes_lists]
+        for record in groups[0]:
+            matched = [(record, False)]
+            for group in groups[1:]:
+                match = _match_record(record, group)
+                if match is None:
+                    break
+                matched.append(match)
+            else:
+                yield matched
+
+    def iter_variants(self):
+        streams = [
+            ((v, None, None, None, None) for v in reader.iter_variants())
+            for reader in self.readers
+        ]
+        for matched in self._merge(streams):
+            yield matched[0][0][0]
+
+    def iter_genotypes(self):
+        for block in self.iter_blocks():
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def _merge_blocks(self, block_size):
+        """Merges the blocks of the sub-readers (see 'iter_blocks')."""
+        streams = [
+            _iter_block_records(self._iter_sub_blocks(reader, block_size))
+            for reader in self.readers
+        ]
+
+        genotypes = np.empty((block_size, len(self.samples)))
+        records = []
+        for matched in self._merge(streams):
+            self._fill(matched, genotypes[len(records)])
+            records.append(matched[0][0])
+
+            if len(records) == block_size:
+                yield _records_block(records, genotypes)
+                genotypes = np.empty((block_size, len(self.samples)))
+                records = []
+
+        if records:
+            yield _records_block(records, genotypes[:len(records)])
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates over blocks of merged variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the genotypes of each block are
+            concatenated in a preallocated array).
+
+        """
+        for block in self._merge_blocks(block_size):
+            if self._stats is not None:
+                self._stats.count(variants=len(block))
+            yield block
+
+    def get_variant_genotypes(self, variant):
+        return self._merge_genotypes([
+            reader.get_variant_genotypes(variant) for reader in self.readers
+        ])
+
+    def get_variant_by_name(self, name):
+        return self._merge_genotypes([
+            reader.get_variant_by_name(name) for reader in self.readers
+        ])
+
+    def get_variants_in_region(self, chrom, start, end):
+        streams = [
+            (_genotypes_record(g)
+             for g in reader.get_variants_in_region(chrom, start, end))
+            for reader in self.readers
+        ]
+        for matched in self._merge(streams):
+            genotypes = np.empty(len(self.samples))
+            self._fill(matched, genotypes)
+            variant, reference, coded, multiallelic, _ = matched[0][0]
+            yield Genotypes(variant, genotypes, reference, coded,
+                            multiallelic)
+
+    def get_samples(self):
+        return self.samples
+
+    def get_number_samples(self):
+        return len(self.samples)
+
+    def get_number_variants(self):
+        """Returns the number of merged variants (counted on the first call).
+        """
+        if self._nb_variants is None:
+            self._nb_variants = sum(1 for _ in self.iter_variants())
+        return self._nb_variants
+
+
+class _MergeCursor(object):
+    def __init__(self, records, chrom_rank, primary=False):
+        """Iterates over sorted records, by locus (see 'MergedSamplesReader').
+
+        Args:
+            records (iterable): The records (the first element being the
+                                variant).
+            chrom_rank (dict): The rank of each chromosome (shared by the
+                               cursors of a merge).
+            primary (bool): Rank the chromosomes in the order in which they
+                            are found (i.e. the first sub-reader).
+
+        The records on a chromosome which is not ranked (yet) are before the
+        first locus of the next chromosome to be found by the primary cursor.
+
+        """
+        self._records = iter(records)
+        self._chrom_rank = chrom_rank
+        self._primary = primary
+        self.record = None
+        self._advance()
+
+    @property
+    def key(self):
+        """The (chromosome rank, position) of the record (None if done)."""
+        if self.record is None:
+            return None
+
+        variant = self.record[0]
+        rank = self._chrom_rank.get(variant.chrom)
+        if rank is None:
+            return (len(self._chrom_rank), -1)
+        return (rank, variant.pos)
+
+    def _advance(self):
+        """Moves to the next record."""
+        previous = self.key
+        if previous is not None and previous[1] < 0:
+            # The chromosome was not ranked (the order can't be checked)
+            previous = None
+
+        self.record = next(self._records, None)
+        if self.record is None:
+            return
+
+        if self._primary:
+            self._chrom_rank.setdefault(self.record[0].chrom,
+                                        len(self._chrom_rank))
+
+        key = self.key
+        if previous is not None and key[1] >= 0 and key < previous:
+            raise ValueError("The variants of a sub-reader are not "
+                             "sorted by position.")
+
+    def skip_to(self, key):
+        """Skips the records before a locus (returns their number)."""
+        nb_skipped = 0
+        while self.record is not None and self.key < key:
+            nb_skipped += 1
+            self._advance()
+        return nb_skipped
+
+    def take(self):
+        """Takes the records at the current locus."""
+        key = self.key
+        records = []
+        while self.record is not None and self.key == key:
+            records.append(self.record)
+            self._advance()
+        return records
+
+
+def _iter_block_records(blocks):
+    """Iterates over the records of blocks (variant, reference, coded,
+    multiallelic and genotypes).
+    """
+    for block in blocks:
+        for i, variant in enumerate(block.variants):
+            yield (variant, block.reference[i], block.coded[i],
+                   block.multiallelic[i], block.genotypes[i])
+
+
+def _genotypes_record(genotypes):
+    """Gets the record of a Genotypes instance (see '_iter_block_records')."""
+    return (genotypes.variant, genotypes.reference, genotypes.coded,
+            genotypes.multiallelic, genotypes.genotypes)
+
+
+def _match_record(record, records):
+    """Finds the record with the same alleles (at the same locus).
+
+    Returns:
+        tuple: The matching record, and whether its reference and coded
+        alleles are swapped (None if no record matches).
+
+    """
+    variant, reference, coded = record[:3]
+    for other in records:
+        if reference is None:
+            # Variants only
+            if other[0].alleles == variant.alleles:
+                return other, False
+
+        elif other[1] == reference and other[2] == coded:
+            return other, False
+
+        elif other[1] == coded and other[2] == reference:
+            return other, True
+
+    return None
+
+
+def _records_block(records, genotypes):
+    """Creates a block from merged records and their genotypes."""
+    return GenotypesBlock(
+        variants=[record[0] for record in records],
+        genotypes=genotypes,
+        reference=[record[1] for record in records],
+        coded=[record[2] for record in records],
+        multiallelic=[record[3] for record in records],
+    )
+
+
+def _sample_indices(samples, sample_ids):
+    """Finds the indices of samples (ValueError if some are missing)."""
+    positions = {s: i for i, s in enumerate(samples)}
+    missing = [s for s in sample_ids if s not in positions]
+    if missing:
+        raise ValueError("{:,d} samples are not in the dataset (e.g. "
+                         "{})".format(len(missing), missing[0]))
+    return np.array([positions[s] for s in sample_ids], dtype=np.int64)
+
+
+def _group_blocks(genotypes, block_size):
+    """Groups Genotypes instances into blocks."""
+    block = []
+    for g in genotypes:
+        block.append(g)
+        if len(block) >= block_size:
+            yield GenotypesBlock.from_genotypes(block)
+            block = []
+
+    if block:
+        yield GenotypesBlock.from_genotypes(block)
+
+
+def _shard_bounds(loci, k, n):
+    """Computes the range of variants of a shard (see 'shard_range').
+
+    Args:
+        loci (tuple): The chromosomes and positions of the variants.
+        k (int): The index of the shard.
+        n (int): The number of shards.
+
+    Returns:
+        tuple: The start and stop indices of the shard.
+
+    """
+    if n < 1 or not 0 <= k < n:
+        raise ValueError("invalid shard: {} of {}".format(k, n))
+
+    chrom, pos = loci
+    nb_variants = len(pos)
+
+    def _boundary(j):
+        # Moving the boundary after the variants at the same locus
+        b = j * nb_variants // n
+        while (0 < b < nb_variants and pos[b] == pos[b - 1] and
+               chrom[b] == chrom[b - 1]):
+            b += 1
+        return b
+
+    return _boundary(k), _boundary(k + 1)
+
+
+class GenotypesWriter(object):
+    def __init__(self):
+        """Abstract class to write genotypes data.
+
+        Writing is split in two steps: 'encode_block' converts a block to the
+        output format (it does not modify the writer, hence blocks can be
+        encoded concurrently), and 'write_encoded' writes encoded blocks (in
+        order). 'write_block' does both.
+
+        """
+        raise NotImplementedError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return "<{} {:,d} samples>".format(self.__class__.__name__,
+                                           len(self.samples))
+
+    # API methods
+    def write_genotypes(self, genotypes):
+        """Write the genotypes of a single variant.
+
+        Args:
+            genotypes (Genotypes): The genotypes to write.
+
+        """
+        self.write_block(GenotypesBlock.from_genotypes([genotypes]))
+
+    def write_block(self, block):
+        """Write a block of variants.
+
+        Args:
+            block (GenotypesBlock): The block to write.
+
+        """
+        self.write_encoded(self.encode_block(block))
+
+    def encode_block(self, block):
+        """Encode a block of variants to the output format.
+
+        Args:
+            block (GenotypesBlock): The block to encode.
+
+        Returns:
+            The encoded block (to be written using 'write_encoded').
+
+        """
+        raise NotImplementedError()
+
+    def write_encoded(self, encoded):
+        """Write an encoded block (see 'encode_block')."""
+        raise NotImplementedError()
+
+
 def _np_eq(a, b):
     nan_a = np.isnan(a)
     nan_b = np.isnan(b)
@@ -29,7 +29,11 @@ DataFrame file reader.
 
 import logging
 
-from .core import GenotypesReader, Genotypes, Variant
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesReader, Genotypes, GenotypesBlock, Variant
+from .utils import LocusIndex, index_names, normalize_alleles
 
 
 logger = logging.getLogger(__name__)
@@ -47,12 +51,87 @@ class DataFrameReader(GenotypesReader):
         ====
             The index of the dataframe should be the sample IDs. The index of
             the map_info should be the variant name, and there should be
-            columns named chrom and pos.
+            columns named chrom, pos, a1 (coded) and a2 (reference).
+
+        The genotypes are kept as a contiguous (variants x samples) array, so
+        that the genotypes of a variant (or of a block of variants) are views
+        on this array. It shares the dataframe's memory when the dataframe is
+        stored by column (e.g. a single dtype), and is copied once otherwise.
+
+        Point and region queries use a sorted locus index (i.e. O(log n)).
 
         """
         self.df = dataframe
         self.map_info = map_info
 
+        # The variant-major genotypes
+        self._genotypes = np.ascontiguousarray(dataframe.values.T)
+
+        # The information of each variant (in the order of the dataframe's
+        # columns)
+        info = map_info.loc[dataframe.columns, :]
+        self._index_variants(dataframe.columns, info.chrom.values,
+                             info.pos.values, info.a1.values, info.a2.values)
+
+    def _index_variants(self, names, chrom, pos, coded, reference):
+        """Normalizes and indexes the information of the variants.
+
+        Args:
+            names (list): The name of each variant.
+            chrom (numpy.ndarray): The chromosome of each variant.
+            pos (numpy.ndarray): The position of each variant.
+            coded (numpy.ndarray): The coded allele of each variant.
+            reference (numpy.ndarray): The reference allele of each variant.
+
+        """
+        self._names = np.array([str(name) for name in names], dtype=object)
+        codes, chromosomes = pd.factorize(chrom)
+        self._chrom = np.array(
+            [Variant._encode_chr(chrom) for chrom in chromosomes],
+            dtype=object,
+        )[codes]
+        self._pos = np.asarray(pos, dtype=np.int64)
+        self._reference = normalize_alleles(reference)
+        self._coded = normalize_alleles(coded)
+
+        # The locus and name indices
+        self._locus_index = LocusIndex.from_loci(self._chrom, self._pos)
+        self._name_index = index_names(self._names)
+
+        # The variants sharing their locus with another one
+        keys = self._locus_index.keys
+        same_locus = np.zeros(keys.shape[0], dtype=bool)
+        same_locus[1:] = keys[1:] == keys[:-1]
+        same_locus[:-1] |= same_locus[1:]
+        self._multiallelic = np.zeros(keys.shape[0], dtype=bool)
+        self._multiallelic[self._locus_index.order] = same_locus
+
+    def _get_variant(self, i):
+        """Creates the Variant instance for a given index."""
+        reference = self._reference[i]
+        coded = self._coded[i]
+        return Variant._trusted(
+            self._names[i], self._chrom[i], int(self._pos[i]),
+            (reference, coded) if reference <= coded else (coded, reference),
+        )
+
+    def _get_genotypes(self, i, variant=None):
+        """Creates the Genotypes instance for a given index.
+
+        The (requested) variant must contain the alleles of the index.
+
+        """
+        if variant is None:
+            variant = self._get_variant(i)
+
+        return Genotypes._trusted(
+            variant,
+            self._genotypes[i],
+            reference=self._reference[i],
+            coded=self._coded[i],
+            multiallelic=bool(self._multiallelic[i]),
+        )
+
     def iter_genotypes(self):
         """Iterates on available markers.
 
@@ -60,19 +139,106 @@ class DataFrameReader(GenotypesReader):
             Genotypes instances.
 
         """
-        # Parsing each column of the dataframe
-        for variant in self.df.columns:
-            genotypes = self.df.loc[:, variant].values
-            info = self.map_info.loc[variant, :]
-
-            yield Genotypes(
-                Variant(info.name, info.chrom, info.pos, [info.a1, info.a2]),
-                genotypes,
-                reference=info.a2,
-                coded=info.a1,
-                multiallelic=False,
+        for i in range(self.get_number_variants()):
+            yield self._get_genotypes(i)
+
+    def iter_range(self, start, stop):
+        """Iterates on a range of variants (by column index)."""
+        start, stop = self._check_range(start, stop)
+        for i in range(start, stop):
+            yield self._get_genotypes(i)
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates on blocks of consecutive variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the genotypes are views on the array).
+
+        """
+        return self.iter_range_blocks(0, self.get_number_variants(),
+                                      block_size)
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterates on blocks of a range of variants.
+
+        Args:
+            start (int): The index of the first variant.
+            stop (int): The index after the last variant.
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the genotypes are views on the array).
+
+        """
+        start, stop = self._check_range(start, stop)
+        for block_start in range(start, stop, block_size):
+            block_end = min(block_start + block_size, stop)
+            yield GenotypesBlock._trusted(
+                variants=[self._get_variant(i)
+                          for i in range(block_start, block_end)],
+                genotypes=self._genotypes[block_start:block_end],
+                reference=self._reference[block_start:block_end].tolist(),
+                coded=self._coded[block_start:block_end].tolist(),
+                multiallelic=self._multiallelic[
+                    block_start:block_end
+                ].tolist(),
             )
 
+    def _get_loci(self):
+        return self._chrom, self._pos
+
+    def _get_names(self):
+        return self._names
+
+    def _get_alleles(self):
+        return self._reference, self._coded
+
+    def iter_variants(self):
+        """Iterate over marker information."""
+        for i in range(self.get_number_variants()):
+            yield self._get_variant(i)
+
+    def get_variant_genotypes(self, variant):
+        """Get the genotypes from a well formed variant instance.
+
+        Args:
+            marker (Variant): A Variant instance.
+
+        Returns:
+            A list of Genotypes instance containing a pointer to the variant as
+            well as a vector of encoded genotypes.
+
+        """
+        indices = self._locus_index.get_indices(variant.chrom, variant.pos,
+                                                variant.pos)
+
+        if len(indices) == 0:
+            return []
+
+        elif len(indices) == 1:
+            i = indices[0]
+            variant_alleles = variant._encode_alleles([
+                self._reference[i], self._coded[i],
+            ])
+            if variant_alleles != variant.alleles:
+                # Variant with requested alleles is unavailable.
+                return []
+            return [self._get_genotypes(i, variant)]
+
+        out = []
+        for i in indices:
+            if variant.alleles is not None:
+                # Find the requested alleles.
+                row_alleles = {self._reference[i], self._coded[i]}
+                if not row_alleles.issubset(variant.alleles_set):
+                    continue
+            out.append(self._get_genotypes(i, variant))
+
+        return out
+
     def get_variant_by_name(self, name):
         """Get the genotypes for a given variant (by name).
 
@@ -84,24 +250,19 @@ class DataFrameReader(GenotypesReader):
             behaviour as the other functions.
 
         """
-        try:
-            geno = self.df.loc[:, name].values
-            info = self.map_info.loc[name, :]
-
-        except KeyError:
+        indices = self._name_index.get(name)
+        if indices is None:
             # The variant is not in the data, so we return an empty
             # list
             logger.warning("Variant {} was not found".format(name))
             return []
 
-        else:
-            return [Genotypes(
-                Variant(info.name, info.chrom, info.pos, [info.a1, info.a2]),
-                geno,
-                reference=info.a2,
-                coded=info.a1,
-                multiallelic=False,
-            )]
+        return [self._get_genotypes(i) for i in indices]
+
+    def get_variants_in_region(self, chrom, start, end):
+        """Iterate over variants in a region."""
+        for i in self._locus_index.get_indices(chrom, start, end):
+            yield self._get_genotypes(i)
 
     def get_samples(self):
         """Get an ordered collection of the samples in the genotype container.
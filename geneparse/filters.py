@@ -0,0 +1,358 @@
+"""
+Filters on the variants, evaluated by the readers.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import logging
+
+import numpy as np
+
+from .core import GenotypesReader, Variant
+from .utils import _DUP_NAME_RE
+
+
+logger = logging.getLogger(__name__)
+
+
+# The minimal number of consecutive selected variants read as a range (the
+# shorter runs are read together, see '_iter_indices_blocks').
+_MIN_RANGE_READ = 32
+
+
+class VariantFilter(object):
+    def __init__(self, regions=None, names=None, min_quality=None,
+                 min_maf=None, max_missing=None):
+        """Specification of the variants to keep.
+
+        Args:
+            regions (list): The regions to keep, as (chrom, start, end)
+                            tuples (inclusive positions).
+            names (list): The names of the variants to keep.
+            min_quality (float): The minimal imputation quality (INFO).
+            min_maf (float): The minimal minor allele frequency.
+            max_missing (float): The maximal proportion of missing genotypes.
+
+        A variant is kept if it satisfies all the predicates (a variant is
+        kept if it is in any of the regions). The predicates on the variant
+        information (regions, names and quality) are evaluated before reading
+        the genotypes (see 'variant_mask'), while the predicates on the
+        genotypes (MAF and missingness) are evaluated on whole blocks (see
+        'block_mask').
+
+        Note
+        ====
+            Variants without any called genotype never satisfy the MAF
+            predicate.
+
+        """
+        self.regions = None
+        if regions is not None:
+            self.regions = [(Variant._encode_chr(chrom), int(start), int(end))
+                            for chrom, start, end in regions]
+
+        self.names = None if names is None else set(names)
+        self.min_quality = min_quality
+        self.min_maf = min_maf
+        self.max_missing = max_missing
+
+    def __repr__(self):
+        predicates = [
+            "{}={!r}".format(name, value) for name, value in (
+                ("regions", self.regions), ("names", self.names),
+                ("min_quality", self.min_quality), ("min_maf", self.min_maf),
+                ("max_missing", self.max_missing),
+            ) if value is not None
+        ]
+        return "<VariantFilter {}>".format(", ".join(predicates))
+
+    @property
+    def needs_genotypes(self):
+        """True if some predicates are evaluated on the genotypes."""
+        return self.min_maf is not None or self.max_missing is not None
+
+    def variant_mask(self, reader):
+        """Evaluates the predicates on the variant information.
+
+        Args:
+            reader (GenotypesReader): The reader.
+
+        Returns:
+            numpy.ndarray: The variants satisfying the predicates (boolean,
+            in file order), or None if there is no predicate to evaluate.
+
+        The predicates are evaluated using the reader's index (see
+        '_get_loci', '_get_names' and '_get_qualities'). If the quality is
+        not part of the index, it is left to 'block_mask'.
+
+        """
+        masks = []
+
+        if self.regions is not None:
+            chrom, pos = reader._get_loci()
+            in_regions = np.zeros(len(pos), dtype=bool)
+            for region_chrom, start, end in self.regions:
+                in_regions |= (
+                    (chrom == region_chrom) & (pos >= start) & (pos <= end)
+                )
+            masks.append(in_regions)
+
+        if self.names is not None:
+            names = np.asarray(reader._get_names(), dtype=object)
+            masks.append(np.fromiter(
+                (name in self.names or
+                 _DUP_NAME_RE.sub("", name) in self.names for name in names),
+                dtype=bool, count=len(names),
+            ))
+
+        if self.min_quality is not None:
+            qualities = reader._get_qualities()
+            if qualities is not None:
+                masks.append(np.asarray(qualities) >= self.min_quality)
+
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def block_mask(self, block, quality_checked=False):
+        """Evaluates the predicates on a block of genotypes.
+
+        Args:
+            block (GenotypesBlock): The block.
+            quality_checked (bool): The quality was already evaluated (see
+                                    'variant_mask').
+
+        Returns:
+            numpy.ndarray: The variants satisfying the predicates (boolean).
+
+        """
+        mask = np.ones(len(block), dtype=bool)
+        genotypes = block.genotypes
+
+        if self.min_quality is not None and not quality_checked:
+            qualities = [getattr(v, "quality", None) for v in block.variants]
+            if any(quality is None for quality in qualities):
+                raise ValueError("the variant quality is not available")
+            mask &= np.array(qualities, dtype=float) >= self.min_quality
+
+        if not self.needs_genotypes or genotypes.shape[1] == 0:
+            return mask
+
+        called = ~np.isnan(genotypes)
+        nb_called = called.sum(axis=1)
+
+        if self.max_missing is not None:
+            missing = 1 - nb_called / genotypes.shape[1]
+            mask &= missing <= self.max_missing
+
+        if self.min_maf is not None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                freq = (np.where(called, genotypes, 0).sum(axis=1) /
+                        (2 * nb_called))
+            maf = np.minimum(freq, 1 - freq)
+            mask &= ~np.isnan(maf) & (maf >= self.min_maf)
+
+        return mask
+
+
+class FilteredReader(GenotypesReader):
+    def __init__(self, reader, variant_filter):
+        """Reader restricted to the variants matching a filter.
+
+        Args:
+            reader (GenotypesReader): The reader.
+            variant_filter (VariantFilter): The filter.
+
+        Filtered readers are usually created using 'GenotypesReader.filter'.
+        Only the iteration methods are available, and closing a filtered
+        reader does not close the reader.
+
+        The variants are selected using the index before reading any
+        genotypes. The long runs of consecutive selected variants are read
+        as ranges (see 'iter_range_blocks'), and the others are read
+        together (see '_iter_indices_blocks'), so that readers opening the
+        file for each range can use their positional reads instead. Readers
+        without random access are read sequentially.
+
+        """
+        self.reader = reader
+        self.variant_filter = variant_filter
+        self._quality_checked = (
+            variant_filter.min_quality is None or
+            reader._get_qualities() is not None
+        )
+
+        # The variants selected using the index (None if all of them)
+        self._indices = None
+        mask = variant_filter.variant_mask(reader)
+        if mask is not None:
+            self._indices = np.flatnonzero(mask)
+            logger.debug("%s: %d variants selected using the index", self,
+                         len(self._indices))
+
+    def __repr__(self):
+        return "<FilteredReader {!r} of {!r}>".format(self.variant_filter,
+                                                     self.reader)
+
+    @property
+    def _needs_block_mask(self):
+        return self.variant_filter.needs_genotypes or not self._quality_checked
+
+    def iter_variants(self):
+        if self._needs_block_mask:
+            for g in self.iter_genotypes():
+                yield g.variant
+            return
+
+        if self._indices is None:
+            yield from self.reader.iter_variants()
+            return
+
+        selected = _selection(self._indices)
+        for i, variant in enumerate(self.reader.iter_variants()):
+            if i >= len(selected):
+                return
+            if selected[i]:
+                yield variant
+
+    def iter_genotypes(self):
+        for block in self.iter_blocks(256):
+            yield from block.iter_genotypes()
+
+    def iter_blocks(self, block_size=1000):
+        for block in self._iter_selected_blocks(block_size):
+            if self._needs_block_mask:
+                block = block.select(self.variant_filter.block_mask(
+                    block, quality_checked=self._quality_checked,
+                ))
+            if len(block) > 0:
+                yield block
+
+    def _iter_selected_blocks(self, block_size):
+        """Reads the blocks of the variants selected using the index."""
+        if self._indices is None:
+            yield from self.reader.iter_blocks(block_size)
+            return
+
+        runs = _runs(self._indices)
+
+        if len(runs) > 1 and not _has_random_access(self.reader):
+            if _overrides(self.reader, "_iter_indices_blocks"):
+                # The reader skips the other variants itself
+                yield from self.reader._iter_indices_blocks(self._indices,
+                                                            block_size)
+                return
+
+            # Reading every range would read the file from the start each
+            # time, so the file is read once and the blocks are subset
+            selected = _selection(self._indices)
+            offset = 0
+            for block in self.reader.iter_range_blocks(0, len(selected),
+                                                       block_size):
+                mask = selected[offset:offset + len(block)]
+                offset += len(block)
+                yield block.select(mask)
+            return
+
+        # The variants of the short runs (read together)
+        scattered = []
+        for start, stop in runs:
+            if stop - start < _MIN_RANGE_READ:
+                scattered.extend(range(start, stop))
+                continue
+
+            if scattered:
+                yield from self.reader._iter_indices_blocks(scattered,
+                                                            block_size)
+                scattered = []
+            yield from self.reader.iter_range_blocks(start, stop, block_size)
+
+        if scattered:
+            yield from self.reader._iter_indices_blocks(scattered, block_size)
+
+    def _get_loci(self):
+        chrom, pos = self.reader._get_loci()
+        if self._indices is None:
+            return chrom, pos
+        return chrom[self._indices], pos[self._indices]
+
+    def _get_names(self):
+        names = self.reader._get_names()
+        if self._indices is None:
+            return names
+        return names[self._indices]
+
+    def get_samples(self):
+        return self.reader.get_samples()
+
+    def get_number_samples(self):
+        return self.reader.get_number_samples()
+
+    def get_number_variants(self):
+        if self._needs_block_mask:
+            return None
+        if self._indices is None:
+            return self.reader.get_number_variants()
+        return len(self._indices)
+
+
+def _runs(indices):
+    """Splits sorted indices into (start, stop) ranges of consecutive ones."""
+    if len(indices) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.concatenate([[0], breaks])]
+    stops = indices[np.concatenate([breaks - 1, [len(indices) - 1]])] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def _selection(indices):
+    """Boolean mask of the selected indices (up to the last one)."""
+    selected = np.zeros(indices[-1] + 1 if len(indices) > 0 else 0,
+                        dtype=bool)
+    selected[indices] = True
+    return selected
+
+
+def _overrides(reader, method):
+    """Checks if a reader overrides a method of GenotypesReader."""
+    return getattr(type(reader), method) is not getattr(GenotypesReader,
+                                                        method)
+
+
+def _has_random_access(reader):
+    """Checks if a reader can read a range without reading the previous
+    variants (i.e. if it overrides 'iter_range' and has an index).
+    """
+    if not _overrides(reader, "iter_range"):
+        return False
+
+    try:
+        return reader.get_number_variants() is not None
+    except NotImplementedError:
+        return False
@@ -0,0 +1,379 @@
+"""
+Vectorized harmonization of alleles against a reference panel.
+"""
+
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesBlock, Variant
+
+
+logger = logging.getLogger(__name__)
+
+
+# The decisions, in order of priority (the first four keep the variant)
+KEEP, SWAP, STRAND_FLIP, STRAND_FLIP_SWAP = 0, 1, 2, 3
+AMBIGUOUS, MISMATCH, MISSING = 4, 5, 6
+ACTIONS = ["keep", "swap", "strand_flip", "strand_flip_swap", "ambiguous",
+           "mismatch", "missing"]
+
+_COMPLEMENT = str.maketrans("ACGTN", "TGCAN")
+
+
+class Harmonization(object):
+    def __init__(self, action, reference_index, reference, coded, pos):
+        """The harmonization decisions for the variants of a dataset.
+
+        Args:
+            action (numpy.ndarray): The decision for each variant (see
+                                    'ACTIONS').
+            reference_index (numpy.ndarray): The matching variant of the
+                                             reference panel (-1 if none).
+            reference (numpy.ndarray): The harmonized reference alleles.
+            coded (numpy.ndarray): The harmonized coded alleles.
+            pos (numpy.ndarray): The positions of the variants (used to check
+                                 that the blocks are synced).
+
+        The decisions are applied to blocks of genotypes (see 'apply' and
+        'iter_blocks'): dropped variants are removed, and the genotypes of
+        the swapped variants are recoded as '2 - g', so that they count the
+        coded allele of the reference panel.
+
+        """
+        self.action = action
+        self.reference_index = reference_index
+        self.reference = reference
+        self.coded = coded
+        self._pos = pos
+
+    def __len__(self):
+        return len(self.action)
+
+    def __repr__(self):
+        return "<Harmonization {:,d} variants; {:,d} kept>".format(
+            len(self), int(self.keep.sum()),
+        )
+
+    @property
+    def keep(self):
+        """The variants which are kept (boolean mask)."""
+        return self.action <= STRAND_FLIP_SWAP
+
+    @property
+    def swap(self):
+        """The variants whose genotypes are recoded (boolean mask)."""
+        return (self.action == SWAP) | (self.action == STRAND_FLIP_SWAP)
+
+    def counts(self):
+        """Returns the number of variants for each decision (dict)."""
+        counts = np.bincount(self.action, minlength=len(ACTIONS))
+        return dict(zip(ACTIONS, counts.tolist()))
+
+    def table(self):
+        """Returns the decisions as a DataFrame (one row per variant)."""
+        return pd.DataFrame({
+            "action": pd.Categorical.from_codes(self.action, ACTIONS),
+            "reference_index": self.reference_index,
+            "reference": self.reference,
+            "coded": self.coded,
+        })
+
+    def apply(self, block, start):
+        """Harmonizes a block of genotypes.
+
+        Args:
+            block (GenotypesBlock): The block (consecutive variants of the
+                                    harmonized dataset).
+            start (int): The index of the first variant of the block.
+
+        Returns:
+            GenotypesBlock: The kept variants, with the alleles of the
+            reference panel (the genotypes are copied).
+
+        """
+        stop = start + len(block)
+        if stop > len(self):
+            raise ValueError("block outside of the harmonized variants")
+
+        pos = np.fromiter((v.pos for v in block.variants), dtype=np.int64,
+                          count=len(block))
+        if not np.array_equal(pos, self._pos[start:stop]):
+            raise ValueError("block not synced with the harmonized variants")
+
+        action = self.action[start:stop]
+        rows = np.flatnonzero(action <= STRAND_FLIP_SWAP)
+        action = action[rows]
+
+        genotypes = block.genotypes[rows]
+        swap = (action == SWAP) | (action == STRAND_FLIP_SWAP)
+        genotypes[swap] = 2 - genotypes[swap]
+
+        reference = self.reference[start:stop][rows].tolist()
+        coded = self.coded[start:stop][rows].tolist()
+
+        variants = [block.variants[i] for i in rows]
+        for i in np.flatnonzero(action >= STRAND_FLIP):
+            # The alleles are on the other strand
+            variants[i] = variants[i].copy()
+            variants[i].alleles = Variant._encode_alleles(
+                [reference[i], coded[i]],
+            )
+
+        return GenotypesBlock(
+            variants=variants,
+            genotypes=genotypes,
+            reference=reference,
+            coded=coded,
+            multiallelic=[block.multiallelic[i] for i in rows],
+        )
+
+    def iter_blocks(self, reader, block_size=1000):
+        """Iterates over the harmonized blocks of a reader.
+
+        Args:
+            reader (GenotypesReader): The reader of the harmonized dataset.
+            block_size (int): The (maximal) number of variants per block
+                              (before harmonization).
+
+        Returns:
+            GenotypesBlock instances (only the kept variants).
+
+        """
+        start = 0
+        for block in reader.iter_blocks(block_size):
+            harmonized = self.apply(block, start)
+            start += len(block)
+            if len(harmonized) > 0:
+                yield harmonized
+
+
+def variant_table(reader, block_size=10000):
+    """Gets the variants of a reader as a table.
+
+    Args:
+        reader (GenotypesReader): The reader.
+        block_size (int): The number of variants read at once (if the
+                          alleles are not in the reader's index).
+
+    Returns:
+        pandas.DataFrame: The name, chromosome, position, reference and coded
+        alleles of each variant (in file order).
+
+    The alleles are taken from the reader's index if possible (see
+    '_get_alleles'). Otherwise, the file is read once.
+
+    """
+    alleles = reader._get_alleles()
+    if alleles is not None:
+        chrom, pos = reader._get_loci()
+        return pd.DataFrame({
+            "name": reader._get_names(),
+            "chrom": chrom,
+            "pos": pos,
+            "reference": alleles[0],
+            "coded": alleles[1],
+        })
+
+    tables = []
+    for block in reader.iter_blocks(block_size):
+        tables.append(pd.DataFrame({
+            "name": [v.name for v in block.variants],
+            "chrom": [v.chrom for v in block.variants],
+            "pos": [v.pos for v in block.variants],
+            "reference": block.reference,
+            "coded": block.coded,
+        }))
+
+    if not tables:
+        return pd.DataFrame(columns=["name", "chrom", "pos", "reference",
+                                     "coded"])
+    return pd.concat(tables, ignore_index=True)
+
+
+def harmonize(target, reference, drop_ambiguous=True, strand_flips=True):
+    """Harmonizes the alleles of a dataset against a reference panel.
+
+    Args:
+        target: The variants to harmonize (a DataFrame with the 'chrom',
+                'pos', 'reference' and 'coded' columns, or a reader).
+        reference: The variants of the reference panel (same as 'target').
+        drop_ambiguous (bool): Drop the ambiguous variants (A/T and C/G, whose
+                               strand cannot be determined).
+        strand_flips (bool): Match the alleles on the other strand.
+
+    Returns:
+        Harmonization: The decision for each variant of the target (see
+        'Harmonization.apply').
+
+    The variants are matched by locus, and each variant of the target is
+    kept as is, swapped (the reference and coded alleles are inverted),
+    strand flipped (the alleles are complemented, with or without being
+    swapped), or dropped (ambiguous, mismatching alleles or missing from the
+    reference panel). For multiallelic loci, the first reference variant
+    with matching alleles is used.
+
+    The decisions are computed for all the variants at once (the alleles
+    are compared as integer codes).
+
+    """
+    if not isinstance(target, pd.DataFrame):
+        target = variant_table(target)
+    if not isinstance(reference, pd.DataFrame):
+        reference = variant_table(reference)
+
+    n = target.shape[0]
+    target_pos = target.pos.values.astype(np.int64)
+
+    # The loci (with the same chromosome codes in both tables)
+    chrom = _factorize(np.concatenate([target.chrom.values,
+                                       reference.chrom.values]),
+                       Variant._encode_chr)[0]
+    pairs = pd.merge(
+        pd.DataFrame({"chrom": chrom[:n], "pos": target_pos,
+                      "i": np.arange(n)}),
+        pd.DataFrame({"chrom": chrom[n:], "pos": reference.pos.values,
+                      "j": np.arange(reference.shape[0])}),
+        on=["chrom", "pos"], how="inner",
+    )
+    i = pairs.i.values
+    j = pairs.j.values
+
+    # The alleles (with their reverse complements)
+    alleles = [target.reference.values, target.coded.values,
+               reference.reference.values, reference.coded.values]
+    codes, uniques = _factorize(np.concatenate(alleles),
+                                lambda a: str(a).upper())
+    complement = _complement_codes(uniques)
+
+    bounds = np.cumsum([0] + [len(a) for a in alleles])
+    a = codes[bounds[0]:bounds[1]][i]
+    b = codes[bounds[1]:bounds[2]][i]
+    c = codes[bounds[2]:bounds[3]][j]
+    d = codes[bounds[3]:bounds[4]][j]
+    valid = (a >= 0) & (b >= 0) & (c >= 0) & (d >= 0)
+    flip_a, flip_b = complement[a], complement[b]
+
+    # The decision for each pair (in reverse order of priority)
+    action = np.full(len(i), MISMATCH, dtype=np.int8)
+    if strand_flips:
+        action[valid & (flip_a == d) & (flip_b == c)] = STRAND_FLIP_SWAP
+        action[valid & (flip_a == c) & (flip_b == d)] = STRAND_FLIP
+    action[valid & (a == d) & (b == c)] = SWAP
+    action[valid & (a == c) & (b == d)] = KEEP
+    if drop_ambiguous:
+        action[valid & (flip_a == b)] = AMBIGUOUS
+
+    # The best pair for each variant of the target
+    order = np.lexsort((action, i))
+    first = order[np.diff(i[order], prepend=-1) != 0]
+
+    result = np.full(n, MISSING, dtype=np.int8)
+    result[i[first]] = action[first]
+    reference_index = np.full(n, -1, dtype=np.int64)
+    reference_index[i[first]] = j[first]
+
+    # The alleles of the reference panel for the kept variants
+    keep = result <= STRAND_FLIP_SWAP
+    harmonized_reference = np.full(n, None, dtype=object)
+    harmonized_coded = np.full(n, None, dtype=object)
+    harmonized_reference[keep] = uniques[
+        codes[bounds[2]:bounds[3]][reference_index[keep]]
+    ]
+    harmonized_coded[keep] = uniques[
+        codes[bounds[3]:bounds[4]][reference_index[keep]]
+    ]
+
+    harmonization = Harmonization(result, reference_index,
+                                  harmonized_reference, harmonized_coded,
+                                  target_pos)
+    logger.info("Harmonized %d variants: %s", n, ", ".join(
+        "{} {}".format(count, name)
+        for name, count in harmonization.counts().items()
+    ))
+    return harmonization
+
+
+def is_ambiguous(reference, coded):
+    """Finds the ambiguous variants (vectorized 'Variant.alleles_ambiguous').
+
+    Args:
+        reference (numpy.ndarray): The reference alleles.
+        coded (numpy.ndarray): The coded alleles.
+
+    Returns:
+        numpy.ndarray: Whether the alleles are reverse complements of each
+        other (e.g. A/T and C/G).
+
+    """
+    reference = np.asarray(reference, dtype=object)
+    codes, uniques = _factorize(
+        np.concatenate([reference, np.asarray(coded, dtype=object)]),
+        lambda a: str(a).upper(),
+    )
+    complement = _complement_codes(uniques)
+    reference_codes = codes[:len(reference)]
+    coded_codes = codes[len(reference):]
+    return ((reference_codes >= 0) &
+            (complement[reference_codes] == coded_codes))
+
+
+def _factorize(values, normalize):
+    """Encodes values as integer codes (after normalizing the unique values).
+
+    Returns:
+        tuple: The codes (-1 for missing values) and the normalized unique
+        values (numpy.ndarray).
+
+    """
+    codes, uniques = pd.factorize(values)
+    normalized_codes, normalized = pd.factorize(
+        np.array([normalize(u) for u in uniques], dtype=object),
+    )
+    codes = np.where(codes >= 0, normalized_codes[codes], -1)
+    return codes, np.asarray(normalized, dtype=object)
+
+
+def _complement_codes(uniques):
+    """Gets the code of the reverse complement of each allele.
+
+    Returns:
+        numpy.ndarray: The code of the reverse complement of each allele (-2
+        if it is not a DNA sequence or if it is not one of the alleles). The
+        last element is -2, so that missing alleles (-1) are not matched.
+
+    """
+    lookup = {allele: code for code, allele in enumerate(uniques)}
+    complement = np.full(len(uniques) + 1, -2, dtype=np.int64)
+    for code, allele in enumerate(uniques):
+        if allele and not set(allele) - set("ACGTN"):
+            complement[code] = lookup.get(
+                allele.translate(_COMPLEMENT)[::-1], -2,
+            )
+    return complement
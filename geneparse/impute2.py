@@ -1,5 +1,5 @@
 """
-IMPUTE2 file reader.
+IMPUTE2 file reader and writer.
 """
 
 # This file is part of geneparse.
@@ -28,15 +28,24 @@ IMPUTE2 file reader.
 
 
 import io
+import os
+import sys
 import zlib
+import struct
 import logging
+import threading
 from os import path
+from time import perf_counter
+from functools import lru_cache, partial
 from collections import Counter
 
 import numpy as np
 import pandas as pd
 
-from .core import GenotypesReader, Variant, Genotypes
+from .core import (GenotypesReader, GenotypesWriter, Variant, ImputedVariant,
+                   Genotypes, LazyGenotypes, _group_blocks)
+from .utils import (open_positional, pread, pread_line, bgzf_compress,
+                    strip_dup_name, BGZF_BLOCK_SIZE, BGZF_EOF)
 
 
 logger = logging.getLogger(__name__)
@@ -55,46 +64,54 @@ CHROM_STR_DECODE = {v: k for k, v in CHROM_STR_ENCODE.items()}
 
 
 class Impute2Reader(GenotypesReader):
-    def __init__(self, filename, sample_filename, probability_threshold=0.9):
+    def __init__(self, filename, sample_filename, probability_threshold=0.9,
+                 info_filename=None):
         """IMPUTE2 file reader.
 
         Args:
             filename (str): The name of the IMPUTE2 file.
             sample_filename (str): The name of the SAMPLE file.
             probability_threshold (float): The probability threshold.
+            info_filename (str): The name of the IMPUTE2 info file (e.g.
+                                 '.impute2_info'), if any.
 
         Note
         ====
             If the sample IDs are not unique, the index is changed to be the
             sample family ID and individual ID (i.e. fid_iid).
 
+        Note
+        ====
+            If the info file is provided, the variants are ImputedVariant
+            instances (the quality being the INFO value, clipped to [0, 1]),
+            and the 'info', 'certainty' and 'exp_freq' values are added to the
+            index. The variants can then be filtered on their quality without
+            reading their genotypes (see 'GenotypesReader.filter').
+
+        Note
+        ====
+            A single instance can be used concurrently by multiple threads.
+            Uncompressed files are read using positional reads (no shared file
+            position), while bgzip files are read using one file handle per
+            thread. Iterating (using 'iter_genotypes') uses its own file
+            handle.
+
         """
         # Reading the samples
-        self.samples = pd.read_csv(sample_filename, sep=" ", skiprows=2,
-                                   names=["fid", "iid", "missing", "father",
-                                          "mother", "sex", "plink_geno"],
-                                   dtype=dict(fid=str, iid=str))
-
-        # We want to set the index for the samples
-        try:
-            self.samples = self.samples.set_index("iid", verify_integrity=True)
-
-        except ValueError:
-            logger.info(
-                "Setting the index as 'fid_iid' because the individual IDs "
-                "are not unique."
-            )
-
-            self.samples["fid_iid"] = [
-                "{fid}_{iid}".format(fid=fid, iid=iid)
-                for fid, iid in zip(self.samples.fid, self.samples.iid)
-            ]
-            self.samples = self.samples.set_index(
-                "fid_iid", verify_integrity=True,
-            )
+        self.samples = read_samples(sample_filename)
 
         # The IMPUTE2 file
-        self._impute2_file = get_open_func(filename)(filename, "r")
+        self._filename = filename
+        self._bgzip, self._open_func = get_open_func(filename, return_fmt=True)
+
+        # Uncompressed files are read using positional reads, and bgzip files
+        # using one file handle per thread
+        self._impute2_fd = None
+        if not self._bgzip:
+            self._impute2_fd = open_positional(filename)
+        self._thread_files = threading.local()
+        self._open_files = []
+        self._open_files_lock = threading.Lock()
 
         # If we have an index, we read it
         self.has_index = path.isfile(filename + ".idx")
@@ -167,6 +184,20 @@ class Impute2Reader(GenotypesReader):
                     "multiallelic"
                 ] = True
 
+        # The imputation information (one row per IMPUTE2 line)
+        self._impute2_info = None
+        if info_filename is not None:
+            self._impute2_info = read_info(info_filename)
+
+            if self.has_index:
+                if self._impute2_info.shape[0] != self._impute2_index.shape[0]:
+                    raise ValueError("{}: not synced with the IMPUTE2 file"
+                                     "".format(info_filename))
+                for column in self._impute2_info.columns:
+                    self._impute2_index[column] = (
+                        self._impute2_info[column].values
+                    )
+
         # Saving the probability threshold
         self.prob_t = probability_threshold
 
@@ -183,8 +214,88 @@ class Impute2Reader(GenotypesReader):
             return {}
 
     def close(self):
-        if self._impute2_file:
-            self._impute2_file.close()
+        if self._impute2_fd is not None:
+            os.close(self._impute2_fd)
+            self._impute2_fd = None
+
+        with self._open_files_lock:
+            for f in self._open_files:
+                f.close()
+            self._open_files = []
+
+    def _get_thread_file(self):
+        """Returns the bgzip file handle of the current thread."""
+        f = getattr(self._thread_files, "f", None)
+        if f is None:
+            f = self._open()
+            self._thread_files.f = f
+            with self._open_files_lock:
+                self._open_files.append(f)
+        return f
+
+    def _read_line(self, seek):
+        """Reads the IMPUTE2 line starting at a given position.
+
+        Args:
+            seek (int): The position of the line (virtual offset for bgzip
+                        files).
+
+        Returns:
+            str: The IMPUTE2 line.
+
+        """
+        if self._bgzip:
+            f = self._get_thread_file()
+            f.seek(seek)
+            return f.readline()
+
+        line = pread_line(self._impute2_fd, seek)
+        if self._stats is not None:
+            self._stats.count(seeks=1, bytes_read=len(line))
+        return line.decode()
+
+    def _read_genotypes(self, seek):
+        """Reads and parses the IMPUTE2 line at a given position (cached)."""
+        if self._stats is not None:
+            self._stats.count(variants=1)
+
+        if self._lazy:
+            # Only the dosage vector is cached
+            return self._parse_impute2_line(self._read_line(seek), lazy=True,
+                                            cache_key=("dosage", seek))
+
+        return self._cached(
+            seek, lambda: self._parse_impute2_line(self._read_line(seek)),
+        )
+
+    def _read_head(self, seek, size=1024):
+        """Reads the first characters of the IMPUTE2 line at a position."""
+        if self._bgzip:
+            f = self._get_thread_file()
+            f.seek(seek)
+            return f.read(size)
+
+        head = pread(self._impute2_fd, size, seek)
+        if self._stats is not None:
+            self._stats.count(seeks=1, bytes_read=len(head))
+        return head.decode()
+
+    def _open(self):
+        """Opens the IMPUTE2 file (with its own file handle)."""
+        if self._bgzip:
+            return _InstrumentedBgzfReader(self._filename, "r", self)
+        return open(self._filename, "r")
+
+    def _find_variants(self, mask):
+        """Selects variants from the index (timing the index lookup)."""
+        stats = self._stats
+        if stats is None:
+            return self._impute2_index.loc[mask]
+
+        start_time = perf_counter()
+        info = self._impute2_index.loc[mask]
+        stats.add_time("index", start_time)
+        return info
 
     def get_variant_genotypes(self, variant):
         """Get the genotypes from a well formed variant instance.
@@ -203,10 +314,10 @@ class Impute2Reader(GenotypesReader):
 
         # Find the variant in the index
         impute2_chrom = CHROM_STR_TO_INT[variant.chrom]
-        variant_info = self._impute2_index[
+        variant_info = self._find_variants(
             (self._impute2_index.chrom == impute2_chrom) &
             (self._impute2_index.pos == variant.pos)
-        ]
+        )
 
         if variant_info.shape[0] == 0:
             return []
@@ -222,9 +333,8 @@ class Impute2Reader(GenotypesReader):
         info = info.iloc[0, :]
         assert not info.multiallelic
 
-        # Seeking and parsing the file
-        self._impute2_file.seek(info.seek)
-        genotypes = self._parse_impute2_line(self._impute2_file.readline())
+        # Reading and parsing the line
+        genotypes = self._read_genotypes(info.seek)
 
         variant_alleles = variant._encode_alleles([
             genotypes.reference, genotypes.coded,
@@ -233,6 +343,8 @@ class Impute2Reader(GenotypesReader):
             # Variant with requested alleles is unavailable.
             return []
 
+        self._fix_genotypes_object(genotypes, info)
+
         return [genotypes]
 
     def _get_multialleic_variant(self, variant, info):
@@ -244,11 +356,8 @@ class Impute2Reader(GenotypesReader):
             for name, row in info.iterrows():
                 assert row.multiallelic
 
-                # Seeking and parsing the file
-                self._impute2_file.seek(row.seek)
-                genotypes = self._parse_impute2_line(
-                    self._impute2_file.readline(),
-                )
+                # Reading and parsing the line
+                genotypes = self._read_genotypes(row.seek)
 
                 # fixing
                 self._fix_genotypes_object(genotypes, row)
@@ -260,11 +369,8 @@ class Impute2Reader(GenotypesReader):
             for name, row in info.iterrows():
                 assert row.multiallelic
 
-                # Seeking and parsing the file
-                self._impute2_file.seek(row.seek)
-                genotypes = self._parse_impute2_line(
-                    self._impute2_file.readline(),
-                )
+                # Reading and parsing the line
+                genotypes = self._read_genotypes(row.seek)
 
                 # Checking the alleles
                 row_alleles = set(Variant._encode_alleles(
@@ -284,20 +390,158 @@ class Impute2Reader(GenotypesReader):
             Genotypes instances.
 
         """
-        # Seeking at the beginning of the file
-        self._impute2_file.seek(0)
+        # Iterating uses its own file handle, so that the other methods can be
+        # used during the iteration
+        stats = self._stats
+        names, multiallelic, qualities = self._get_variant_arrays()
+        with self._open() as f:
+            # Parsing each lines of the IMPUTE2 file
+            for i, line in enumerate(f):
+                if stats is not None:
+                    # The bytes of bgzip files are counted by block
+                    stats.count(variants=1,
+                                bytes_read=0 if self._bgzip else len(line))
+
+                genotypes = self._parse_impute2_line(line, lazy=self._lazy)
+
+                if (qualities is not None and not self.has_index and
+                        i >= qualities.shape[0]):
+                    raise ValueError("Info file not synced with IMPUTE2 "
+                                     "file")
+                self._fix_genotypes(
+                    genotypes,
+                    name=None if names is None else names[i],
+                    multiallelic=(None if multiallelic is None
+                                  else bool(multiallelic[i])),
+                    quality=None if qualities is None else qualities[i],
+                )
 
-        # Parsing each lines of the IMPUTE2 file
-        for i, line in enumerate(self._impute2_file):
-            genotypes = self._parse_impute2_line(line)
+                yield genotypes
 
-            variant_info = None
-            if self.has_index:
-                variant_info = self._impute2_index.iloc[i, :]
-            self._fix_genotypes_object(genotypes, variant_info)
+    def iter_range(self, start, stop):
+        """Iterates on a range of markers (by line in the IMPUTE2 file).
+
+        The first line of the range is found using the index (the lines
+        before the range are skipped otherwise).
+
+        """
+        if not self.has_index:
+            for genotypes in super().iter_range(start, stop):
+                yield genotypes
+            return
+
+        start, stop = self._check_range(start, stop)
+        if start == stop:
+            return
+
+        stats = self._stats
+        names, multiallelic, qualities = self._get_variant_arrays()
+        with self._open() as f:
+            f.seek(int(self._impute2_index.seek.iloc[start]))
+            if stats is not None and not self._bgzip:
+                stats.count(seeks=1)
+
+            for i in range(start, stop):
+                line = f.readline()
+                if stats is not None:
+                    stats.count(variants=1,
+                                bytes_read=0 if self._bgzip else len(line))
+
+                genotypes = self._parse_impute2_line(line, lazy=self._lazy)
+                self._fix_genotypes(
+                    genotypes,
+                    name=names[i],
+                    multiallelic=(None if multiallelic is None
+                                  else bool(multiallelic[i])),
+                    quality=None if qualities is None else qualities[i],
+                )
+                yield genotypes
+
+    def _iter_indices_blocks(self, indices, block_size=1000):
+        """Iterates on blocks of scattered markers (by line in the IMPUTE2
+        file).
+
+        Each line is read using the positional reads (or the thread's file
+        handle for bgzip files), instead of opening the file for each run of
+        consecutive lines (see 'iter_range'). Unindexed files are read once,
+        the other lines being skipped without being parsed.
 
+        """
+        if not self.has_index:
+            return _group_blocks(self._iter_selected_lines(indices),
+                                 block_size)
+        return _group_blocks(self._iter_lines(indices), block_size)
+
+    def _iter_selected_lines(self, indices):
+        """Reads the file once, parsing only some lines (by index)."""
+        stats = self._stats
+        qualities = self._get_variant_arrays()[2]
+        indices = iter(indices)
+        selected = next(indices, None)
+        with self._open() as f:
+            for i, line in enumerate(f):
+                if selected is None:
+                    return
+
+                if stats is not None and not self._bgzip:
+                    stats.count(bytes_read=len(line))
+                if i != selected:
+                    continue
+                selected = next(indices, None)
+
+                if stats is not None:
+                    stats.count(variants=1)
+                genotypes = self._parse_impute2_line(line, lazy=self._lazy)
+
+                if qualities is not None and i >= qualities.shape[0]:
+                    raise ValueError("Info file not synced with IMPUTE2 "
+                                     "file")
+                self._fix_genotypes(
+                    genotypes, name=None, multiallelic=None,
+                    quality=None if qualities is None else qualities[i],
+                )
+                yield genotypes
+
+    def _iter_lines(self, indices):
+        """Reads and parses lines of the IMPUTE2 file (by index)."""
+        stats = self._stats
+        seeks = self._impute2_index.seek.values
+        names, multiallelic, qualities = self._get_variant_arrays()
+        for i in indices:
+            if stats is not None:
+                stats.count(variants=1)
+
+            genotypes = self._parse_impute2_line(
+                self._read_line(int(seeks[i])), lazy=self._lazy,
+            )
+            self._fix_genotypes(
+                genotypes,
+                name=names[i],
+                multiallelic=(None if multiallelic is None
+                              else bool(multiallelic[i])),
+                quality=None if qualities is None else qualities[i],
+            )
             yield genotypes
 
+    def _get_loci(self):
+        if not self._index_has_location:
+            return super()._get_loci()
+
+        chrom = self._impute2_index.chrom.astype(str).map(
+            lambda c: Variant._encode_chr(CHROM_STR_ENCODE.get(c, c))
+        )
+        return chrom.values, self._impute2_index.pos.values
+
+    def _get_names(self):
+        if not self.has_index:
+            return super()._get_names()
+        return self._impute2_index.index.values
+
+    def _get_qualities(self):
+        if self._impute2_info is None:
+            return None
+        return self._impute2_info["info"].values
+
     def iter_variants(self):
         """Iterate over marker information."""
         if not self.has_index:
@@ -305,14 +549,16 @@ class Impute2Reader(GenotypesReader):
                                       "not indexed (see genipe)")
 
         for name, row in self._impute2_index.iterrows():
-            # Seeking to the right place in the file
-            f = self._impute2_file
-            f.seek(int(row.seek))
-            chrom, name, pos, a1, a2 = f.read(1024).split(" ")[:5]
+            # Reading the beginning of the line
+            head = self._read_head(int(row.seek))
+            chrom, name, pos, a1, a2 = head.split(" ")[:5]
             pos = int(pos)
 
-            yield Variant(name, CHROM_STR_ENCODE.get(chrom, chrom), pos,
-                          [a1, a2])
+            variant = Variant(name, CHROM_STR_ENCODE.get(chrom, chrom), pos,
+                              [a1, a2])
+            if self._impute2_info is not None:
+                variant = _imputed_variant(variant, row["info"])
+            yield variant
 
     def get_variants_in_region(self, chrom, start, end):
         """Iterate over variants in a region."""
@@ -325,11 +571,11 @@ class Impute2Reader(GenotypesReader):
                                       "have location information.")
 
         # Getting the required variants
-        required = self._impute2_index.loc[
+        required = self._find_variants(
             (self._impute2_index.chrom == CHROM_STR_TO_INT[chrom]) &
             (start <= self._impute2_index.pos) &
             (self._impute2_index.pos <= end)
-        ]
+        )
 
         for name, variant_info in required.iterrows():
             for genotypes in self.get_variant_by_name(name, variant_info):
@@ -360,6 +606,10 @@ class Impute2Reader(GenotypesReader):
 
         # Getting the seek position
         if variant_info is None:
+            stats = self._stats
+            if stats is not None:
+                start_time = perf_counter()
+
             try:
                 variant_info = self._impute2_index.loc[name, :]
 
@@ -377,30 +627,74 @@ class Impute2Reader(GenotypesReader):
                     logger.warning("Variant {} was not found".format(name))
                     return []
 
-        # Seeking to the right place in the file
-        self._impute2_file.seek(variant_info.seek)
+            if stats is not None:
+                stats.add_time("index", start_time)
 
-        # Parsing the file
-        genotypes = self._parse_impute2_line(self._impute2_file.readline())
+        # Reading and parsing the line
+        genotypes = self._read_genotypes(variant_info.seek)
 
         # Fixing the object
         self._fix_genotypes_object(genotypes, variant_info)
 
         return [genotypes]
 
+    def _get_variant_arrays(self):
+        """Gets the per line metadata used to fix the genotypes objects.
+
+        Returns:
+            tuple: The names, the multi-allelic status and the imputation
+            quality of each line (arrays, or None when unavailable).
+
+        Iterating over these arrays is much faster than accessing the rows of
+        the index (one pandas Series per line).
+
+        """
+        names = multiallelic = qualities = None
+        if self.has_index:
+            names = self._impute2_index.index.values
+            if self._index_has_location:
+                multiallelic = self._impute2_index.multiallelic.values
+
+        if self._impute2_info is not None:
+            qualities = self._impute2_info["info"].values
+
+        return names, multiallelic, qualities
+
     def _fix_genotypes_object(self, genotypes, variant_info):
         """Fixes a genotypes object (variant name, multi-allelic value."""
+        name = multiallelic = quality = None
+        if variant_info is not None:
+            if self.has_index:
+                name = variant_info.name
+                if self._index_has_location:
+                    multiallelic = variant_info.multiallelic
+
+            if self._impute2_info is not None:
+                quality = variant_info["info"]
+
+        self._fix_genotypes(genotypes, name, multiallelic, quality)
+
+    def _fix_genotypes(self, genotypes, name, multiallelic, quality):
+        """Fixes a genotypes object from the variant's metadata.
+
+        Args:
+            genotypes (Genotypes): The genotypes object (from the line).
+            name (str): The name of the variant in the index (or None).
+            multiallelic (bool): The multi-allelic status (or None).
+            quality (float): The imputation quality (or None).
+
+        """
         # Checking the name (if there were duplications)
-        if self.has_index and variant_info.name != genotypes.variant.name:
-            if not variant_info.name.startswith(genotypes.variant.name):
+        if name is not None and name != genotypes.variant.name:
+            if not name.startswith(genotypes.variant.name):
                 raise ValueError("Index file not synced with IMPUTE2 file")
-            genotypes.variant.name = variant_info.name
+            genotypes.variant.name = name
 
         # Trying to set multi-allelic information
-        if self.has_index and self._index_has_location:
+        if multiallelic is not None:
             # Location was in the index, so we can automatically set the
             # multi-allelic state of the genotypes
-            genotypes.multiallelic = variant_info.multiallelic
+            genotypes.multiallelic = multiallelic
 
         else:
             # Location was not in the index, so we check one marker before and
@@ -408,6 +702,10 @@ class Impute2Reader(GenotypesReader):
             logger.warning("Multiallelic variants are not detected on "
                            "unindexed files.")
 
+        # Setting the imputation quality
+        if quality is not None:
+            genotypes.variant = _imputed_variant(genotypes.variant, quality)
+
     def get_number_samples(self):
         """Returns the number of samples.
 
@@ -432,11 +730,15 @@ class Impute2Reader(GenotypesReader):
     def get_samples(self):
         return list(self.samples.index)
 
-    def _parse_impute2_line(self, line):
+    def _parse_impute2_line(self, line, lazy=False, cache_key=None):
         """Parses the current IMPUTE2 line (a single variant).
 
         Args:
             line (str): An IMPUTE2 line.
+            lazy (bool): Defer the parsing of the probabilities (returns a
+                         LazyGenotypes).
+            cache_key (hashable): The key of the dosage in the cache (lazy
+                                  parsing only).
 
         Returns:
             Genotypes: The genotype in dosage format.
@@ -446,11 +748,63 @@ class Impute2Reader(GenotypesReader):
             By default, the genotypes object has multiallelic set to False.
 
         """
-        # Splitting
-        row = line.rstrip("\r\n").split(" ")
+        # Splitting (the probabilities are kept as a single string)
+        row = line.rstrip("\r\n").split(" ", 5)
+        probabilities = row[5] if len(row) > 5 else ""
+
+        if lazy:
+            dosage = partial(self._parse_dosage, probabilities)
+            if cache_key is not None:
+                dosage = partial(self._cached, cache_key, dosage)
+        else:
+            dosage = self._parse_dosage(probabilities)
+
+        stats = self._stats
+        if stats is not None:
+            start_time = perf_counter()
+
+        # The line's values are normalized here, so that the objects are
+        # created without any check
+        reference = sys.intern(row[3].upper())
+        coded = sys.intern(row[4].upper())
+        genotypes_class = LazyGenotypes if lazy else Genotypes
+        genotypes = genotypes_class._trusted(
+            Variant._trusted(
+                row[1], _encode_chrom(row[0]), int(row[2]),
+                (reference, coded) if reference <= coded
+                else (coded, reference),
+            ),
+            dosage,
+            reference=reference,
+            coded=coded,
+            multiallelic=False,
+        )
+
+        if stats is not None:
+            stats.add_time("construct", start_time)
+            stats.count(lines_parsed=1)
+
+        return genotypes
+
+    def _parse_dosage(self, probabilities):
+        """Computes the dosage from the probabilities of an IMPUTE2 line.
+
+        Args:
+            probabilities (str): The genotype probabilities (space separated,
+                                 three per sample).
+
+        Returns:
+            numpy.ndarray: The dosage of each sample (NaN when the most
+            likely genotype is below the probability threshold).
+
+        """
+        stats = self._stats
+        if stats is not None:
+            start_time = perf_counter()
 
         # Constructing the probabilities
-        prob = np.array(row[5:], dtype=float)
+        prob = np.array(probabilities.split(" ") if probabilities else [],
+                        dtype=float)
         prob.shape = (prob.shape[0] // 3, 3)
 
         # Constructing the dosage
@@ -458,14 +812,234 @@ class Impute2Reader(GenotypesReader):
         if self.prob_t > 0:
             dosage[~np.any(prob >= self.prob_t, axis=1)] = np.nan
 
-        return Genotypes(
-            Variant(row[1], CHROM_STR_ENCODE.get(row[0], row[0]), int(row[2]),
-                    [row[3], row[4]]),
-            dosage,
-            reference=row[3],
-            coded=row[4],
-            multiallelic=False,
+        if stats is not None:
+            stats.add_time("parse", start_time)
+
+        return dosage
+
+
+class Impute2Writer(GenotypesWriter):
+    def __init__(self, filename, sample_filename, samples, decimals=3,
+                 compression_level=6, buffer_size=4 * 1024 ** 2):
+        """IMPUTE2 file writer.
+
+        Args:
+            filename (str): The name of the IMPUTE2 file (compressed using
+                            bgzip if it ends with '.gz').
+            sample_filename (str): The name of the SAMPLE file.
+            samples (list): The sample IDs.
+            decimals (int): The number of decimals of the probabilities.
+            compression_level (int): The bgzip compression level (lower
+                                     levels are much faster).
+            buffer_size (int): The size of the output buffer (in bytes).
+
+        The index of the IMPUTE2 file (compatible with genipe and
+        Impute2Reader) is written when the writer is closed.
+
+        Note
+        ====
+            The reference allele is written as a1 and the coded allele as a2.
+            Probabilities are computed from the dosage (assuming that at most
+            two genotypes have non-zero probabilities), and missing values are
+            written as null probabilities.
+
+        """
+        self.filename = filename
+        self.samples = list(samples)
+        self._bgzip = filename.endswith(".gz")
+        self._compression_level = compression_level
+
+        with open(sample_filename, "w") as f:
+            f.write("ID_1 ID_2 missing father mother sex plink_pheno\n"
+                    "0 0 0 D D D B\n")
+            for sample in self.samples:
+                f.write("{0} {0} 0 0 0 0 -9\n".format(sample))
+
+        # The probabilities of each dosage value (multiple of 10^-decimals)
+        self._scale = 10 ** decimals
+        self._probabilities = _probability_table(decimals)
+
+        self._f = open(filename, "wb", buffering=buffer_size)
+        self._offset = 0
+        self._index = []
+
+    def close(self):
+        if self._f.closed:
+            return
+
+        if self._bgzip:
+            self._f.write(BGZF_EOF)
+        self._f.close()
+
+        index = pd.concat(self._index) if self._index else pd.DataFrame(
+            columns=["chrom", "name", "pos", "seek"],
         )
+        write_index(get_index_fn(self.filename), index)
+
+    def encode_block(self, block):
+        """Encodes a block (compressed IMPUTE2 lines and their index).
+
+        Args:
+            block (GenotypesBlock): The block to encode.
+
+        Returns:
+            tuple: the data (bytes), and the index of the lines (the seek
+            values are relative to the start of the data).
+
+        """
+        codes = np.rint(np.clip(block.genotypes, 0, 2) * self._scale)
+        codes[np.isnan(codes)] = len(self._probabilities) - 1
+        codes = codes.astype(np.int64)
+
+        chroms = [CHROM_STR_DECODE.get(v.chrom, v.chrom)
+                  for v in block.variants]
+        names = [strip_dup_name(v.name) for v in block.variants]
+        lines = [
+            "{} {} {} {} {} ".format(
+                chrom, name, variant.pos, reference, coded,
+            ).encode() + b" ".join(self._probabilities[row].tolist()) + b"\n"
+            for chrom, name, variant, reference, coded, row in zip(
+                chroms, names, block.variants, block.reference, block.coded,
+                codes,
+            )
+        ]
+        data = b"".join(lines)
+
+        # The position of each line in the (uncompressed) data
+        seek = np.zeros(len(lines), dtype=np.int64)
+        np.cumsum([len(line) for line in lines[:-1]], out=seek[1:])
+
+        if self._bgzip:
+            blocks = bgzf_compress(data, self._compression_level)
+            block_offsets = np.zeros(len(blocks), dtype=np.int64)
+            np.cumsum([len(b) for b in blocks[:-1]], out=block_offsets[1:])
+
+            # The virtual offsets (compressed block offset and position in
+            # the uncompressed block)
+            seek = (
+                (block_offsets[seek // BGZF_BLOCK_SIZE] << 16) |
+                (seek % BGZF_BLOCK_SIZE)
+            )
+            data = b"".join(blocks)
+
+        index = pd.DataFrame({
+            "chrom": chroms,
+            "name": names,
+            "pos": [v.pos for v in block.variants],
+            "seek": seek,
+        })
+        return data, index
+
+    def write_encoded(self, encoded):
+        data, index = encoded
+        index["seek"] += self._offset << 16 if self._bgzip else self._offset
+        self._index.append(index)
+
+        self._f.write(data)
+        self._offset += len(data)
+
+
+def _probability_table(decimals):
+    """The IMPUTE2 probabilities for each dosage value.
+
+    Args:
+        decimals (int): The number of decimals of the probabilities.
+
+    Returns:
+        numpy.ndarray: The probabilities (bytes) for each multiple of
+        10^-decimals from 0 to 2, and for missing values (last element).
+
+    """
+    def _format(p):
+        return "{:.{}f}".format(p, decimals).rstrip("0").rstrip(".")
+
+    scale = 10 ** decimals
+    table = []
+    for i in range(2 * scale + 1):
+        if i <= scale:
+            probabilities = (scale - i, i, 0)
+        else:
+            probabilities = (0, 2 * scale - i, i - scale)
+        table.append(" ".join(
+            _format(p / scale) for p in probabilities
+        ).encode())
+    table.append(b"0 0 0")
+
+    return np.array(table, dtype=object)
+
+
+def read_info(info_filename):
+    """Reads an IMPUTE2 info file.
+
+    Args:
+        info_filename (str): The name of the info file.
+
+    Returns:
+        pandas.DataFrame: The 'info', 'certainty' and 'exp_freq' values
+        (float32) of each line of the IMPUTE2 file.
+
+    """
+    info = pd.read_csv(info_filename, sep=" ",
+                       usecols=["exp_freq_a1", "info", "certainty"],
+                       dtype=np.float32)
+    info = info.rename(columns={"exp_freq_a1": "exp_freq"})
+    return info[["info", "certainty", "exp_freq"]]
+
+
+def _imputed_variant(variant, info):
+    """Creates an ImputedVariant from a Variant and its INFO value."""
+    # IMPUTE2 sets the INFO to -1 when it cannot be computed (e.g. for
+    # monomorphic variants)
+    imputed_variant = ImputedVariant._trusted(
+        variant.name, variant.chrom, variant.pos, variant.alleles,
+    )
+
+    # The INFO values are stored as float32 in the index, and are rounded
+    # back to the precision of the info file (e.g. 0.95 and not 0.9499...)
+    imputed_variant.quality = min(max(round(float(info), 6), 0), 1)
+    return imputed_variant
+
+
+@lru_cache(maxsize=1024)
+def _encode_chrom(chrom):
+    """Encodes the chromosome of an IMPUTE2 line (see 'Variant')."""
+    return Variant._encode_chr(CHROM_STR_ENCODE.get(chrom, chrom))
+
+
+def read_samples(sample_filename):
+    """Reads an IMPUTE2 sample file.
+
+    Args:
+        sample_filename (str): The name of the SAMPLE file.
+
+    Returns:
+        pandas.DataFrame: The samples, indexed by individual ID (or by
+        family ID and individual ID, i.e. fid_iid, if the individual IDs are
+        not unique).
+
+    """
+    samples = pd.read_csv(sample_filename, sep=" ", skiprows=2,
+                          names=["fid", "iid", "missing", "father", "mother",
+                                 "sex", "plink_geno"],
+                          dtype=dict(fid=str, iid=str))
+
+    # We want to set the index for the samples
+    try:
+        samples = samples.set_index("iid", verify_integrity=True)
+
+    except ValueError:
+        logger.info(
+            "Setting the index as 'fid_iid' because the individual IDs "
+            "are not unique."
+        )
+
+        samples["fid_iid"] = [
+            "{fid}_{iid}".format(fid=fid, iid=iid)
+            for fid, iid in zip(samples.fid, samples.iid)
+        ]
+        samples = samples.set_index("fid_iid", verify_integrity=True)
+
+    return samples
 
 
 # This was copied from the 'genipe' module
@@ -478,6 +1052,146 @@ except ImportError:
     HAS_BIOPYTHON = False
 
 
+# The magic bytes at the start of every BGZF block header
+_BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+
+
+class _CountingFile(object):
+    def __init__(self, filename, reader):
+        """Binary file counting the reads and seeks of a BGZF file reader.
+
+        Args:
+            filename (str): The name of the file.
+            reader (GenotypesReader): The reader whose statistics are
+                                      updated (if enabled).
+
+        """
+        self._reader = reader
+        self._f = open(filename, "rb")
+
+        # The current block (as read from the headers)
+        self._block_start = 0
+        self._next_block = 0
+
+    def read(self, size=-1):
+        start = self._f.tell()
+        data = self._f.read(size)
+        stats = self._reader._stats
+        if stats is not None and data:
+            stats.count(
+                bytes_read=len(data),
+                bgzf_blocks=self._count_blocks(start, start + len(data)),
+            )
+        return data
+
+    def _count_blocks(self, start, end):
+        """Counts the block headers read between two positions."""
+        if not self._block_start <= start < self._next_block:
+            # Reading outside of the current block (e.g. after a seek, which
+            # is at the start of a block)
+            self._block_start = self._next_block = start
+
+        nb_blocks = 0
+        while self._next_block < end:
+            size = _bgzf_block_size(self._f.fileno(), self._next_block)
+            if size is None:
+                # Not a block header
+                break
+            self._block_start = self._next_block
+            self._next_block += size
+            nb_blocks += 1
+
+        return nb_blocks
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        stats = self._reader._stats
+        if stats is not None and (whence != io.SEEK_SET or
+                                  offset != self._f.tell()):
+            stats.count(seeks=1)
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+
+def _bgzf_block_size(fd, offset):
+    """Reads the size of the BGZF block at an offset.
+
+    Args:
+        fd (int): The file descriptor (see 'open_positional').
+        offset (int): The offset of the block.
+
+    Returns:
+        int: The size of the block (compressed), or None if there is no
+        block header at the offset.
+
+    """
+    header = pread(fd, 12, offset)
+    if len(header) < 12 or header[:4] != _BGZF_MAGIC:
+        return None
+
+    # The size is in the 'BC' extra subfield (see the SAM specification)
+    extra = pread(fd, struct.unpack_from("<H", header, 10)[0], offset + 12)
+    pos = 0
+    while pos + 4 <= len(extra):
+        subfield_size = struct.unpack_from("<H", extra, pos + 2)[0]
+        if extra[pos:pos + 2] == b"BC" and subfield_size == 2:
+            return struct.unpack_from("<H", extra, pos + 4)[0] + 1
+        pos += 4 + subfield_size
+
+    return None
+
+
+if HAS_BIOPYTHON:
+    class _InstrumentedBgzfReader(BgzfReader):
+        def __init__(self, filename, mode, reader):
+            """BGZF file reader counting the blocks it decompresses.
+
+            Args:
+                filename (str): The name of the file.
+                mode (str): The mode (e.g. 'r').
+                reader (GenotypesReader): The reader whose statistics are
+                                          updated (if enabled).
+
+            Note
+            ====
+                The blocks, bytes and seeks are counted on the underlying
+                (compressed) file, the blocks being found from their headers
+                (so that only the public API of 'BgzfReader' is used).
+
+            """
+            self._reader = reader
+            self._raw = _CountingFile(filename, reader)
+            super().__init__(mode=mode, fileobj=self._raw)
+
+        def _timed(self, method, *args):
+            """Times a read as decompression if it reads from the file."""
+            stats = self._reader._stats
+            if stats is None:
+                return method(*args)
+
+            position = self._raw.tell()
+            start_time = perf_counter()
+            result = method(*args)
+
+            # Cached blocks are not read from the file
+            if self._raw.tell() != position:
+                stats.add_time("decompress", start_time)
+            return result
+
+        def read(self, size=-1):
+            return self._timed(super().read, size)
+
+        def readline(self):
+            return self._timed(super().readline)
+
+        def seek(self, virtual_offset):
+            return self._timed(super().seek, virtual_offset)
+
+
 def _seek_generator(f):
     """Yields seek position for each line.
 
@@ -0,0 +1,629 @@
+"""
+The geneparse native (chunked columnar) genotype format.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import json
+import lzma
+import zlib
+import logging
+import threading
+
+import numpy as np
+
+from .core import (GenotypesReader, GenotypesWriter, Genotypes, GenotypesBlock,
+                   Variant)
+from .convert import rebatch_blocks
+from .utils import open_positional, pread, LocusIndex, index_names
+
+
+logger = logging.getLogger(__name__)
+
+
+FORMAT_NAME = "geneparse-native"
+FORMAT_VERSION = 1
+
+
+# The available compression methods (compression, decompression)
+_COMPRESSIONS = {
+    "none": (lambda data, level: data, lambda data: data),
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level),
+             lzma.decompress),
+}
+
+
+class NativeReader(GenotypesReader):
+    def __init__(self, path):
+        """Reader for the geneparse native (chunked) genotype format.
+
+        Args:
+            path (str): The directory containing the dataset (see 'convert').
+
+        The genotypes are stored as independently compressed chunks of
+        consecutive variants (variants x samples). The variant table is memory
+        mapped, and a sorted locus index allows point and region queries in
+        O(log n).
+
+        The genotypes vectors are read-only views on the decoded chunks.
+
+        Note
+        ====
+            Chunks are read using positional reads, hence a single instance
+            can be used concurrently by multiple threads.
+
+        """
+        self.path = path
+
+        with open(os.path.join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+
+        if self.metadata.get("format") != FORMAT_NAME:
+            raise ValueError("{}: not a geneparse native dataset".format(path))
+
+        if self.metadata["version"] > FORMAT_VERSION:
+            raise ValueError("{}: unsupported format version {}".format(
+                path, self.metadata["version"],
+            ))
+
+        self._n_samples = self.metadata["n_samples"]
+        self._n_variants = self.metadata["n_variants"]
+        self._chunk_size = self.metadata["chunk_size"]
+        self._dtype = np.dtype(self.metadata["dtype"])
+        self._chromosomes = self.metadata["chromosomes"]
+        self._decompress = _COMPRESSIONS[self.metadata["compression"]][1]
+
+        # The samples
+        with open(os.path.join(path, "samples.txt")) as f:
+            self.samples = [line.rstrip("\r\n") for line in f]
+
+        if len(self.samples) != self._n_samples:
+            raise ValueError("{}: invalid number of samples".format(path))
+
+        # The variant table (memory mapped)
+        self._chrom = self._memmap("variants.chrom", np.uint16)
+        self._pos = self._memmap("variants.pos", np.int64)
+        self._multiallelic = self._memmap("variants.multiallelic", np.bool_)
+        self._names = _StringColumn(path, "variants.name")
+        self._reference = _StringColumn(path, "variants.reference")
+        self._coded = _StringColumn(path, "variants.coded")
+
+        # The sorted locus index
+        self._locus_index = LocusIndex(
+            self._chromosomes,
+            keys=self._memmap("locus.keys", np.int64),
+            order=self._memmap("locus.order", np.int64),
+        )
+
+        # The name index (built when required)
+        self._name_index = None
+        self._name_index_lock = threading.Lock()
+
+        # The chunks
+        self._chunk_offsets = self._memmap("genotypes.offsets", np.int64)
+        self._genotypes_fd = open_positional(
+            os.path.join(path, "genotypes.bin")
+        )
+
+        # The last decoded chunk (per thread)
+        self._last_chunk = threading.local()
+
+    def _memmap(self, filename, dtype):
+        """Memory maps a column of the dataset."""
+        filename = os.path.join(self.path, filename)
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r")
+
+    def close(self):
+        if self._genotypes_fd is not None:
+            os.close(self._genotypes_fd)
+            self._genotypes_fd = None
+
+    def _read_chunk(self, chunk):
+        """Reads and decompresses a chunk.
+
+        Args:
+            chunk (int): The index of the chunk.
+
+        Returns:
+            numpy.ndarray: The (variants x samples) genotypes of the chunk.
+
+        """
+        last = getattr(self._last_chunk, "value", None)
+        if last is not None and last[0] == chunk:
+            return last[1]
+
+        start, end = self._chunk_offsets[chunk:chunk + 2]
+        data = self._decompress(
+            pread(self._genotypes_fd, int(end - start), int(start))
+        )
+        genotypes = np.frombuffer(data, dtype=self._dtype).reshape(
+            -1, self._n_samples,
+        )
+
+        self._last_chunk.value = (chunk, genotypes)
+        return genotypes
+
+    def _read_variant_genotypes(self, i):
+        """Reads the genotypes vector of a variant (cached)."""
+        return self._cached(
+            i,
+            lambda: self._read_chunk(i // self._chunk_size)[
+                i % self._chunk_size
+            ],
+        )
+
+    def _get_variant_alleles(self, i):
+        """Gets the (normalized) reference and coded alleles of a variant."""
+        return (sys.intern(self._reference[i].upper()),
+                sys.intern(self._coded[i].upper()))
+
+    def _get_variant(self, i, alleles=None):
+        """Creates the Variant instance for a given index.
+
+        The chromosomes of the dataset are already encoded (see the writer),
+        and the alleles are normalized, hence the variant is created without
+        any check.
+
+        """
+        if alleles is None:
+            alleles = self._get_variant_alleles(i)
+        reference, coded = alleles
+
+        return Variant._trusted(
+            self._names[i], self._chromosomes[self._chrom[i]],
+            int(self._pos[i]),
+            (reference, coded) if reference <= coded else (coded, reference),
+        )
+
+    def _get_genotypes(self, i, variant=None):
+        """Creates the Genotypes instance for a given index.
+
+        The (requested) variant must contain the alleles of the index.
+
+        """
+        alleles = self._get_variant_alleles(i)
+        if variant is None:
+            variant = self._get_variant(i, alleles)
+
+        return Genotypes._trusted(
+            variant,
+            self._read_variant_genotypes(i),
+            reference=alleles[0],
+            coded=alleles[1],
+            multiallelic=bool(self._multiallelic[i]),
+        )
+
+    def _get_name_index(self):
+        """Gets the mapping between names and variant indices."""
+        with self._name_index_lock:
+            if self._name_index is None:
+                self._name_index = index_names(self._names)
+
+        return self._name_index
+
+    def iter_genotypes(self):
+        """Iterates on available markers.
+
+        Returns:
+            Genotypes instances.
+
+        """
+        for block in self.iter_blocks(self._chunk_size):
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates on blocks of consecutive variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (blocks never span multiple chunks).
+
+        """
+        return self.iter_range_blocks(0, self._n_variants, block_size)
+
+    def iter_range(self, start, stop):
+        """Iterates on a range of variants (by index)."""
+        for block in self.iter_range_blocks(start, stop, self._chunk_size):
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterates on blocks of a range of variants.
+
+        Args:
+            start (int): The index of the first variant.
+            stop (int): The index after the last variant.
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (blocks never span multiple chunks).
+
+        """
+        start, stop = self._check_range(start, stop)
+        if start == stop:
+            return
+
+        for chunk in range(start // self._chunk_size,
+                           (stop - 1) // self._chunk_size + 1):
+            genotypes = self._read_chunk(chunk)
+            chunk_start = chunk * self._chunk_size
+
+            # The range of the chunk to read
+            first = max(start - chunk_start, 0)
+            last = min(stop - chunk_start, genotypes.shape[0])
+            for block_start in range(first, last, block_size):
+                block_end = min(block_start + block_size, last)
+                indices = range(chunk_start + block_start,
+                                chunk_start + block_end)
+                alleles = [self._get_variant_alleles(i) for i in indices]
+                yield GenotypesBlock._trusted(
+                    variants=[
+                        self._get_variant(i, variant_alleles)
+                        for i, variant_alleles in zip(indices, alleles)
+                    ],
+                    genotypes=genotypes[block_start:block_end],
+                    reference=[reference for reference, _ in alleles],
+                    coded=[coded for _, coded in alleles],
+                    multiallelic=self._multiallelic[
+                        chunk_start + block_start:chunk_start + block_end
+                    ].tolist(),
+                )
+
+    def _get_loci(self):
+        chromosomes = np.array(self._chromosomes, dtype=object)
+        return chromosomes[self._chrom], self._pos
+
+    def _get_names(self):
+        return np.array(list(self._names), dtype=object)
+
+    def iter_variants(self):
+        """Iterate over marker information."""
+        for i in range(self._n_variants):
+            yield self._get_variant(i)
+
+    def get_variant_genotypes(self, variant):
+        """Get the genotypes from a well formed variant instance.
+
+        Args:
+            marker (Variant): A Variant instance.
+
+        Returns:
+            A list of Genotypes instance containing a pointer to the variant as
+            well as a vector of encoded genotypes.
+
+        """
+        indices = self._locus_index.get_indices(variant.chrom, variant.pos,
+                                                variant.pos)
+
+        if len(indices) == 0:
+            return []
+
+        elif len(indices) == 1:
+            i = indices[0]
+            variant_alleles = variant._encode_alleles([
+                self._reference[i], self._coded[i],
+            ])
+            if variant_alleles != variant.alleles:
+                # Variant with requested alleles is unavailable.
+                return []
+            return [self._get_genotypes(i, variant)]
+
+        out = []
+        for i in indices:
+            if variant.alleles is not None:
+                # Find the requested alleles.
+                row_alleles = set(Variant._encode_alleles(
+                    (self._reference[i], self._coded[i]),
+                ))
+                if not row_alleles.issubset(variant.alleles_set):
+                    continue
+            out.append(self._get_genotypes(i, variant))
+
+        return out
+
+    def get_variant_by_name(self, name):
+        """Get the genotype of a marker using it's name.
+
+        Args:
+            name (str): The name of the marker.
+
+        Returns:
+            list: A list of Genotypes (one per variant with this name).
+
+        """
+        indices = self._get_name_index().get(name)
+        if indices is None:
+            logger.warning("Variant {} was not found".format(name))
+            return []
+
+        return [self._get_genotypes(i) for i in indices]
+
+    def get_variants_in_region(self, chrom, start, end):
+        """Iterate over variants in a region."""
+        for i in self._locus_index.get_indices(chrom, start, end):
+            yield self._get_genotypes(i)
+
+    def get_samples(self):
+        return list(self.samples)
+
+    def get_number_samples(self):
+        return self._n_samples
+
+    def get_number_variants(self):
+        return self._n_variants
+
+
+def convert(reader, path, chunk_size=1024, dtype="float32",
+            compression="zlib", compression_level=6):
+    """Converts genotypes to the geneparse native format.
+
+    Args:
+        reader (GenotypesReader): The reader (streamed using 'iter_blocks').
+        path (str): The directory where to write the dataset (created).
+        chunk_size (int): The number of variants per chunk.
+        dtype (str): The data type of the genotypes (floating point).
+        compression (str): The compression ('zlib', 'lzma' or 'none').
+        compression_level (int): The compression level.
+
+    Returns:
+        int: The number of variants.
+
+    """
+    with NativeWriter(path, reader.get_samples(), chunk_size=chunk_size,
+                      dtype=dtype, compression=compression,
+                      compression_level=compression_level) as writer:
+        blocks = rebatch_blocks(reader.iter_blocks(chunk_size), chunk_size)
+        for block in blocks:
+            writer.write_block(block)
+
+    return writer.nb_variants
+
+
+class NativeWriter(GenotypesWriter):
+    def __init__(self, path, samples, chunk_size=1024, dtype="float32",
+                 compression="zlib", compression_level=6):
+        """Writer for the geneparse native format.
+
+        Args:
+            path (str): The directory where to write the dataset (created).
+            samples (list): The sample IDs.
+            chunk_size (int): The number of variants per chunk.
+            dtype (str): The data type of the genotypes (floating point).
+            compression (str): The compression ('zlib', 'lzma' or 'none').
+            compression_level (int): The compression level.
+
+        Each block is compressed by chunks, hence all blocks must contain a
+        multiple of 'chunk_size' variants, except the last one (see
+        'convert.rebatch_blocks').
+
+        Note
+        ====
+            The metadata is written when the writer is closed (not when
+            exiting the context because of an exception), so that incomplete
+            datasets are invalid.
+
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != "f":
+            raise ValueError("the data type should be a floating point type")
+
+        if compression not in _COMPRESSIONS:
+            raise ValueError(
+                "invalid compression '{}' (choose from {})".format(
+                    compression, ", ".join(sorted(_COMPRESSIONS)),
+                )
+            )
+
+        self.path = path
+        self.samples = list(samples)
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_level = compression_level
+        self._compress = _COMPRESSIONS[compression][0]
+
+        os.makedirs(path)
+        with open(os.path.join(path, "samples.txt"), "w") as f:
+            for sample in self.samples:
+                f.write("{}\n".format(sample))
+
+        def _open(filename):
+            return open(os.path.join(path, filename), "wb")
+
+        self._genotypes_f = _open("genotypes.bin")
+        self._offsets_f = _open("genotypes.offsets")
+        self._chrom_f = _open("variants.chrom")
+        self._pos_f = _open("variants.pos")
+        self._multiallelic_f = _open("variants.multiallelic")
+        self._names_w = _StringColumnWriter(path, "variants.name")
+        self._reference_w = _StringColumnWriter(path, "variants.reference")
+        self._coded_w = _StringColumnWriter(path, "variants.coded")
+        self._closed = False
+
+        self._chromosomes = []
+        self._chrom_to_code = {}
+        self.nb_variants = 0
+        self._offset = 0
+        self._complete_chunks = True
+        self._offsets_f.write(np.array([0], dtype=np.int64).tobytes())
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self._close_files()
+        self.close()
+
+    def _close_files(self):
+        if self._closed:
+            return
+
+        for f in (self._genotypes_f, self._offsets_f, self._chrom_f,
+                  self._pos_f, self._multiallelic_f):
+            f.close()
+        for w in (self._names_w, self._reference_w, self._coded_w):
+            w.close()
+        self._closed = True
+
+    def close(self):
+        if self._closed:
+            return
+        self._close_files()
+
+        # The sorted locus index
+        path = self.path
+        chrom = np.fromfile(os.path.join(path, "variants.chrom"),
+                            dtype=np.uint16)
+        pos = np.fromfile(os.path.join(path, "variants.pos"), dtype=np.int64)
+        keys, order = LocusIndex.sort_keys(LocusIndex.make_keys(chrom, pos))
+        order.tofile(os.path.join(path, "locus.order"))
+        keys.tofile(os.path.join(path, "locus.keys"))
+
+        # The metadata (written last, so that incomplete datasets are invalid)
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump({
+                "format": FORMAT_NAME,
+                "version": FORMAT_VERSION,
+                "n_samples": len(self.samples),
+                "n_variants": self.nb_variants,
+                "chunk_size": self.chunk_size,
+                "dtype": self.dtype.str,
+                "compression": self.compression,
+                "chromosomes": self._chromosomes,
+            }, f, indent=2)
+
+    def encode_block(self, block):
+        """Compresses the chunks of a block.
+
+        Args:
+            block (GenotypesBlock): The block to encode.
+
+        Returns:
+            tuple: The block and its compressed chunks (bytes).
+
+        """
+        genotypes = np.asarray(block.genotypes, dtype=self.dtype)
+        return block, [
+            self._compress(
+                genotypes[start:start + self.chunk_size].tobytes(),
+                self.compression_level,
+            )
+            for start in range(0, len(block), self.chunk_size)
+        ]
+
+    def write_encoded(self, encoded):
+        block, chunks = encoded
+        if not self._complete_chunks:
+            raise ValueError("only the last block can contain an incomplete "
+                             "chunk")
+        self._complete_chunks = len(block) % self.chunk_size == 0
+
+        # The variant table
+        codes = []
+        for variant in block.variants:
+            code = self._chrom_to_code.get(variant.chrom)
+            if code is None:
+                code = len(self._chromosomes)
+                self._chromosomes.append(variant.chrom)
+                self._chrom_to_code[variant.chrom] = code
+            codes.append(code)
+
+        self._chrom_f.write(np.array(codes, dtype=np.uint16).tobytes())
+        self._pos_f.write(np.array(
+            [v.pos for v in block.variants], dtype=np.int64,
+        ).tobytes())
+        self._multiallelic_f.write(np.array(
+            block.multiallelic, dtype=np.bool_,
+        ).tobytes())
+        self._names_w.extend(v.name for v in block.variants)
+        self._reference_w.extend(block.reference)
+        self._coded_w.extend(block.coded)
+
+        # The genotypes
+        offsets = []
+        for data in chunks:
+            self._genotypes_f.write(data)
+            self._offset += len(data)
+            offsets.append(self._offset)
+        self._offsets_f.write(np.array(offsets, dtype=np.int64).tobytes())
+
+        self.nb_variants += len(block)
+
+
+class _StringColumn(object):
+    def __init__(self, path, name):
+        """Memory mapped column of strings (UTF-8 data and offsets)."""
+        data_fn = os.path.join(path, name + ".data")
+        self._data = np.zeros(0, dtype=np.uint8)
+        if os.path.getsize(data_fn) > 0:
+            self._data = np.memmap(data_fn, dtype=np.uint8, mode="r")
+        self._offsets = np.fromfile(os.path.join(path, name + ".offsets"),
+                                    dtype=np.int64)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i:i + 2]
+        return bytes(self._data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _StringColumnWriter(object):
+    def __init__(self, path, name):
+        """Writes a column of strings (UTF-8 data and offsets)."""
+        self._data = open(os.path.join(path, name + ".data"), "wb")
+        self._offsets = open(os.path.join(path, name + ".offsets"), "wb")
+        self._offset = 0
+        self._offsets.write(np.array([0], dtype=np.int64).tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._data.close()
+        self._offsets.close()
+
+    def extend(self, strings):
+        offsets = []
+        for s in strings:
+            data = s.encode("utf-8")
+            self._data.write(data)
+            self._offset += len(data)
+            offsets.append(self._offset)
+        self._offsets.write(np.array(offsets, dtype=np.int64).tobytes())
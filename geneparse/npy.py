@@ -0,0 +1,176 @@
+"""
+Memory mapped reader for genotype matrices (.npy, .npz or raw binary).
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .dataframe import DataFrameReader
+
+
+logger = logging.getLogger(__name__)
+
+
+# The columns of the variant table (a1 is the coded allele)
+VARIANT_COLUMNS = ["name", "chrom", "pos", "a1", "a2"]
+
+
+class NumpyReader(DataFrameReader):
+    def __init__(self, filename, variants=None, samples=None, dtype="f8",
+                 offset=0):
+        """Reads a (variants x samples) matrix of genotypes.
+
+        Args:
+            filename (str): The matrix (.npy, .npz or raw binary file).
+            variants (str): The variant table (defaults to the name of the
+                            matrix, with a '.variants' extension).
+            samples (str): The sample file (defaults to the name of the
+                           matrix, with a '.samples' extension).
+            dtype (str): The type of the values (raw binary files only).
+            offset (int): The size of the header (raw binary files only).
+
+        The variant table is a tab separated file with a header, containing
+        the columns name, chrom, pos, a1 (coded allele) and a2 (reference
+        allele), with one row per row of the matrix. The sample file contains
+        a sample ID per line, for each column of the matrix.
+
+        Row 'i' of the matrix is the coded allele dosage of variant 'i'
+        (missing values are NaN). The matrix is memory mapped (read-only),
+        and the genotypes of a variant (or of a block of variants) are views
+        on it. Hence, matrices larger than the available memory can be read.
+
+        Note
+        ====
+            The arrays of .npz archives cannot be memory mapped: the matrix
+            (the 'genotypes' array, or the archive's only array) is loaded in
+            memory.
+
+        """
+        self.filename = filename
+        prefix, extension = os.path.splitext(filename)
+        if variants is None:
+            variants = prefix + ".variants"
+        if samples is None:
+            samples = prefix + ".samples"
+
+        # The samples
+        with open(samples) as f:
+            self.samples = [line.rstrip("\r\n") for line in f]
+
+        # The variants
+        info = read_variants(variants)
+
+        shape = (info.shape[0], len(self.samples))
+        if extension == ".npy":
+            genotypes = np.load(filename, mmap_mode="r")
+        elif extension == ".npz":
+            genotypes = _load_npz(filename)
+        else:
+            genotypes = _memmap(filename, np.dtype(dtype), shape, offset)
+
+        if genotypes.shape != shape:
+            raise ValueError(
+                "{}: invalid shape {} (expected {} variants x {} "
+                "samples)".format(filename, genotypes.shape, *shape)
+            )
+
+        if not genotypes.flags.c_contiguous:
+            logger.warning("{}: the matrix is not stored by variant, reading "
+                           "genotypes will be slow".format(filename))
+        self._genotypes = genotypes
+
+        self._index_variants(info.name.values, info.chrom.values,
+                             info.pos.values, info.a1.values, info.a2.values)
+
+    def close(self):
+        # Releasing the memory map (the views already returned keep it open)
+        self._genotypes = None
+
+    def get_samples(self):
+        return list(self.samples)
+
+    def get_number_samples(self):
+        return len(self.samples)
+
+    def get_number_variants(self):
+        return len(self._names)
+
+
+def read_variants(filename):
+    """Reads a variant table (see 'NumpyReader').
+
+    Args:
+        filename (str): The name of the file.
+
+    Returns:
+        pandas.DataFrame: The variant table.
+
+    """
+    info = pd.read_csv(filename, sep="\t", dtype=str, na_filter=False)
+
+    missing = set(VARIANT_COLUMNS) - set(info.columns)
+    if missing:
+        raise ValueError("{}: missing columns: {}".format(
+            filename, ", ".join(sorted(missing)),
+        ))
+
+    info["pos"] = info.pos.astype(np.int64)
+    return info
+
+
+def _load_npz(filename):
+    """Loads the matrix of a .npz archive."""
+    with np.load(filename) as archive:
+        if "genotypes" in archive.files:
+            return archive["genotypes"]
+
+        if len(archive.files) != 1:
+            raise ValueError("{}: no 'genotypes' array".format(filename))
+        return archive[archive.files[0]]
+
+
+def _memmap(filename, dtype, shape, offset):
+    """Memory maps a raw binary matrix (checking its size)."""
+    size = os.path.getsize(filename)
+    expected = offset + shape[0] * shape[1] * dtype.itemsize
+    if size != expected:
+        raise ValueError(
+            "{}: invalid size {:,d} bytes (expected {:,d} bytes for {} "
+            "variants x {} samples of type {})".format(
+                filename, size, expected, shape[0], shape[1], dtype,
+            )
+        )
+
+    if shape[0] * shape[1] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset,
+                     shape=shape)
@@ -0,0 +1,262 @@
+"""
+Parallel (multiprocess) processing of genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import logging
+from collections import deque
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .core import GenotypesReader, GenotypesBlock
+
+
+logger = logging.getLogger(__name__)
+
+
+def map_blocks(reader, func, n_jobs=None, reduce=None, initial=None,
+               block_size=1000, nb_shards=None, max_pending=None,
+               progress=None):
+    """Applies a function to all blocks of genotypes using processes.
+
+    Args:
+        reader: Either a GenotypesReader, or a picklable callable (without
+                argument) creating one (e.g. 'functools.partial(
+                geneparse.parsers["plink"], "prefix")').
+        func (callable): The (picklable) function applied to each
+                         GenotypesBlock.
+        n_jobs (int): The number of processes (defaults to the number of
+                      CPUs).
+        reduce (callable): The function combining the results (called as
+                           'reduce(accumulator, result)', in order).
+        initial: The initial value of the accumulator (the first result is
+                 used if None).
+        block_size (int): The (maximal) number of variants per block.
+        nb_shards (int): The number of shards (when workers open their own
+                         reader). Defaults to 4 shards per process.
+        max_pending (int): The maximal number of blocks in shared memory
+                           (when blocks are sent to the workers). Defaults to
+                           twice the number of processes.
+        progress (callable): Called as 'progress(nb_variants, total)' each
+                             time results are received (total might be
+                             None).
+
+    Returns:
+        The list of the results (in the order of the blocks), or the reduced
+        value if 'reduce' is set.
+
+    When 'reader' is a callable, each worker opens its own reader and
+    processes shards of the variants (see 'GenotypesReader.shard_range').
+    Otherwise (or if the reader can't be sharded, e.g. without an index),
+    the blocks are read in this process and sent to the workers through
+    shared memory. In both cases, no genotype array is pickled.
+
+    Exceptions raised by 'func' (or by the readers in the workers) are raised
+    again in this process.
+
+    """
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        if isinstance(reader, GenotypesReader) or not callable(reader):
+            results = _map_shared_blocks(
+                executor, reader, func, block_size,
+                max_pending or 2 * n_jobs, progress,
+            )
+        else:
+            results = _map_shards(executor, reader, func, block_size,
+                                  nb_shards or 4 * n_jobs,
+                                  max_pending or 2 * n_jobs, progress)
+
+        if reduce is None:
+            return list(results)
+
+        accumulator = initial
+        for result in results:
+            if accumulator is None:
+                accumulator = result
+            else:
+                accumulator = reduce(accumulator, result)
+        return accumulator
+
+
+def _map_shards(executor, open_reader, func, block_size, nb_shards,
+                max_pending, progress):
+    """Processes shards of variants in workers (opening their own reader)."""
+    with open_reader() as reader:
+        try:
+            total = reader.get_number_variants()
+            ranges = [reader.shard_range(k, nb_shards)
+                      for k in range(nb_shards)]
+
+        except NotImplementedError:
+            # The variants can't be located without reading the whole file,
+            # so the blocks are read once, and sent to the workers
+            logger.info("Can't shard {!r}, sending the blocks to the "
+                        "workers".format(reader.__class__.__name__))
+            for result in _map_shared_blocks(executor, reader, func,
+                                             block_size, max_pending,
+                                             progress):
+                yield result
+            return
+
+    futures = [
+        executor.submit(_process_range, open_reader, func, start, stop,
+                        block_size)
+        for start, stop in ranges if stop > start
+    ]
+
+    try:
+        done = 0
+        for future in futures:
+            nb_variants, results = future.result()
+            done += nb_variants
+            if progress is not None:
+                progress(done, total)
+
+            for result in results:
+                yield result
+
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _process_range(open_reader, func, start, stop, block_size):
+    """Applies a function to the blocks of a range of variants (worker)."""
+    results = []
+    nb_variants = 0
+    with open_reader() as reader:
+        for block in reader.iter_range_blocks(start, stop, block_size):
+            results.append(func(block))
+            nb_variants += len(block)
+
+    return nb_variants, results
+
+
+def _map_shared_blocks(executor, reader, func, block_size, max_pending,
+                       progress):
+    """Processes blocks sent to the workers through shared memory."""
+    try:
+        total = reader.get_number_variants()
+    except NotImplementedError:
+        total = None
+    pending = deque()
+    done = 0
+
+    try:
+        for block in reader.iter_blocks(block_size):
+            while len(pending) >= max_pending:
+                result, nb_variants = _next_result(pending)
+                done += nb_variants
+                if progress is not None:
+                    progress(done, total)
+                yield result
+
+            genotypes = np.ascontiguousarray(block.genotypes)
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=max(genotypes.nbytes, 1))
+            try:
+                np.ndarray(genotypes.shape, dtype=genotypes.dtype,
+                           buffer=shm.buf)[...] = genotypes
+
+                # Only the (small) variant information is pickled
+                empty_block = GenotypesBlock(
+                    block.variants, None, block.reference, block.coded,
+                    block.multiallelic,
+                )
+                future = executor.submit(
+                    _process_shared_block, func, empty_block, shm.name,
+                    genotypes.shape, genotypes.dtype.str,
+                )
+
+            except BaseException:
+                _release(shm)
+                raise
+
+            pending.append((future, shm, len(block)))
+
+        while pending:
+            result, nb_variants = _next_result(pending)
+            done += nb_variants
+            if progress is not None:
+                progress(done, total)
+            yield result
+
+    finally:
+        for future, shm, _ in pending:
+            future.cancel()
+        for future, shm, _ in pending:
+            if not future.cancelled():
+                future.exception()
+            _release(shm)
+
+
+def _next_result(pending):
+    """Waits for the next result, releasing its shared memory."""
+    future, shm, nb_variants = pending.popleft()
+    try:
+        return future.result(), nb_variants
+    finally:
+        _release(shm)
+
+
+def _release(shm):
+    shm.close()
+    shm.unlink()
+
+
+def _process_shared_block(func, block, name, shape, dtype):
+    """Applies a function to a block in shared memory (worker)."""
+    # The segment is unlinked by the parent process (the resource tracker is
+    # shared with the parent, hence attaching does not register it twice)
+    shm = shared_memory.SharedMemory(name=name)
+
+    genotypes = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    block.genotypes = genotypes
+    try:
+        result = func(block)
+        if (isinstance(result, np.ndarray) and
+                np.may_share_memory(result, genotypes)):
+            result = result.copy()
+
+    finally:
+        block.genotypes = None
+        del genotypes
+
+    try:
+        shm.close()
+    except BufferError:
+        raise ValueError("the results should not reference the genotypes of "
+                         "the block (use a copy)")
+
+    return result
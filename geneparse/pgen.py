@@ -0,0 +1,747 @@
+"""
+PLINK 2 binary file (PGEN) reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import struct
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesReader, Variant, Genotypes, GenotypesBlock
+from .impute2 import CHROM_STR_ENCODE
+from .utils import open_positional, pread, LocusIndex, index_names
+
+
+logger = logging.getLogger(__name__)
+
+
+# The storage modes (third byte of the PGEN file)
+_MODE_PLINK1 = 0x01
+_MODE_FIXED_HARDCALLS = 0x02
+_MODE_FIXED_DOSAGES = 0x03
+_MODE_FIXED_PHASED_DOSAGES = 0x04
+_MODE_VARIABLE = 0x10
+_MODE_VARIABLE_EXTENSIONS = 0x11
+
+
+# The number of variants per block of variable-width records
+_VBLOCK_SIZE = 65536
+
+
+# The (fixed) record type used for PLINK 1 BED records
+_VRTYPE_PLINK1 = 256
+
+
+# The 2-bit codes for every possible byte, the PLINK 2 codes of the PLINK 1
+# (BED) codes, and the number of alternative alleles of each PLINK 2 code.
+_BYTE_CODES = np.array(
+    [[(i >> j) & 3 for j in range(0, 8, 2)] for i in range(256)],
+    dtype=np.uint8,
+)
+_PLINK1_CODES = np.array([2, 3, 1, 0], dtype=np.uint8)
+_CODE_VALUES = np.array([0, 1, 2, np.nan])
+
+
+# The missing dosage value, and the dosage value of one alternative allele
+_DOSAGE_MISSING = 65535
+_DOSAGE_UNIT = 16384
+
+
+class PgenReader(GenotypesReader):
+    def __init__(self, prefix, dtype="float64"):
+        """PLINK 2 binary file reader (PGEN, PVAR and PSAM files).
+
+        Args:
+            prefix (str): The prefix of the PLINK 2 files.
+            dtype (str): The type of the genotype vectors.
+
+        Hard calls and dosages are decoded for the fixed-width storage modes
+        (including PLINK 1 BED files renamed as PGEN) and for the standard
+        variable-width mode (all the hard call encodings, hard call phasing
+        and dosages). The genotypes are the number of alternative (coded)
+        alleles; dosages take precedence over hard calls when available.
+
+        Only bi-allelic variants are supported (variants with more than one
+        alternative allele are ignored, with a warning).
+
+        Note
+        ====
+            The PGEN file is read using positional reads, hence a single
+            instance can be used concurrently by multiple threads.
+
+        """
+        self.prefix = prefix
+        self.dtype = np.dtype(dtype)
+
+        self.samples = _read_psam(prefix + ".psam")
+        self._nb_samples = len(self.samples)
+
+        variants = _read_pvar(prefix + ".pvar")
+        self._nb_records = variants.shape[0]
+
+        self._pgen_fd = open_positional(prefix + ".pgen")
+        self._parse_header()
+
+        # Ignoring the variants with more than two alleles
+        multi_alt = variants.alt.str.contains(",").values
+        if np.any(multi_alt):
+            logger.warning("{}: ignoring {:,d} variants with more than one "
+                           "alternative allele".format(prefix,
+                                                       np.sum(multi_alt)))
+            variants = variants.loc[~multi_alt, :].reset_index(drop=True)
+
+        variants["multiallelic"] = variants.duplicated(["chrom", "pos"],
+                                                       keep=False)
+        self._variants = variants
+
+        # The locus and name indices
+        self._locus_index = LocusIndex.from_loci(variants.chrom.values,
+                                                 variants.pos.values)
+        self._name_index = index_names(variants.id.values)
+
+    def close(self):
+        if self._pgen_fd is not None:
+            os.close(self._pgen_fd)
+            self._pgen_fd = None
+
+    def _read(self, offset, size):
+        """Reads bytes from the PGEN file."""
+        data = pread(self._pgen_fd, size, offset)
+        if len(data) != size:
+            raise ValueError("{}.pgen: unexpected end of file".format(
+                self.prefix,
+            ))
+        return data
+
+    def _parse_header(self):
+        """Parses the header, and computes the offset of each record."""
+        magic = self._read(0, 3)
+        if magic[:2] != b"l\x1b":
+            raise ValueError("{}.pgen: not a PGEN file".format(self.prefix))
+
+        mode = magic[2]
+        nb_genotype_bytes = (self._nb_samples + 3) // 4
+
+        if mode == _MODE_PLINK1:
+            # A PLINK 1 (variant-major) BED file
+            self._set_fixed_width(_VRTYPE_PLINK1, 3, nb_genotype_bytes)
+            return
+
+        nb_variants, nb_samples, ctrl = struct.unpack("<IIB",
+                                                      self._read(3, 9))
+        if nb_variants != self._nb_records:
+            raise ValueError("{}: the number of variants differs from the "
+                             "PVAR file".format(self.prefix))
+        if nb_samples != self._nb_samples:
+            raise ValueError("{}: the number of samples differs from the "
+                             "PSAM file".format(self.prefix))
+
+        if mode in {_MODE_FIXED_HARDCALLS, _MODE_FIXED_DOSAGES,
+                    _MODE_FIXED_PHASED_DOSAGES}:
+            # Skipping the non-reference flags (if explicitly stored)
+            offset = 12
+            if ctrl >> 6 == 3:
+                offset += (nb_variants + 7) // 8
+
+            vrtype, width = 0, nb_genotype_bytes
+            if mode == _MODE_FIXED_DOSAGES:
+                vrtype, width = 0x40, width + 2 * nb_samples
+            elif mode == _MODE_FIXED_PHASED_DOSAGES:
+                vrtype, width = 0xc0, width + 4 * nb_samples
+
+            self._set_fixed_width(vrtype, offset, width)
+            return
+
+        if mode not in {_MODE_VARIABLE, _MODE_VARIABLE_EXTENSIONS}:
+            raise ValueError("{}.pgen: unsupported storage mode "
+                             "0x{:02x}".format(self.prefix, mode))
+
+        if ctrl & 8:
+            raise ValueError("{}.pgen: unsupported (single-sample) record "
+                             "type encoding".format(self.prefix))
+
+        nb_vblocks = (nb_variants + _VBLOCK_SIZE - 1) // _VBLOCK_SIZE
+        first_record = struct.unpack("<Q", self._read(12, 8))[0]
+
+        vrtypes_8bit = ctrl & 4
+        nb_length_bytes = (ctrl & 3) + 1
+        nb_allele_count_bytes = (ctrl >> 4) & 3
+        nonref_stored = ctrl >> 6 == 3
+
+        # Reading the record types and lengths of every block of variants
+        vrtypes = []
+        lengths = []
+        offset = 12 + 8 * nb_vblocks
+        for start in range(0, nb_variants, _VBLOCK_SIZE):
+            n = min(_VBLOCK_SIZE, nb_variants - start)
+
+            # The record types (4 bits, low bits first, or 8 bits)
+            if vrtypes_8bit:
+                data = self._read(offset, n)
+                vrtypes.append(np.frombuffer(data, dtype=np.uint8))
+            else:
+                data = np.frombuffer(self._read(offset, (n + 1) // 2),
+                                     dtype=np.uint8)
+                vrtypes.append(
+                    np.column_stack((data & 15, data >> 4)).ravel()[:n]
+                )
+            offset += len(data)
+
+            # The record lengths (little endian, 1 to 4 bytes)
+            data = np.frombuffer(self._read(offset, n * nb_length_bytes),
+                                 dtype=np.uint8)
+            data = data.reshape(n, nb_length_bytes).astype(np.int64)
+            lengths.append(
+                data.dot(np.left_shift(1, 8 * np.arange(nb_length_bytes)))
+            )
+            offset += n * nb_length_bytes
+
+            # Skipping the allele counts and the non-reference flags
+            offset += n * nb_allele_count_bytes
+            if nonref_stored:
+                offset += (n + 7) // 8
+
+        self._vrtypes = np.concatenate(vrtypes).astype(np.int64)
+        lengths = np.concatenate(lengths)
+        self._offsets = first_record + np.concatenate(([0],
+                                                       np.cumsum(lengths)))
+        self._fixed_width = False
+
+        # The base record of each LD compressed record (the last record which
+        # is not LD compressed)
+        self._ld_base = np.maximum.accumulate(np.where(
+            _is_ld_compressed(self._vrtypes), -1, np.arange(nb_variants),
+        ))
+
+    def _set_fixed_width(self, vrtype, offset, width):
+        """Sets the record information of fixed-width storage modes."""
+        nb_variants = self._nb_records
+        self._vrtypes = np.full(nb_variants, vrtype, dtype=np.int64)
+        self._offsets = offset + width * np.arange(nb_variants + 1,
+                                                   dtype=np.int64)
+        self._ld_base = np.arange(nb_variants)
+        self._fixed_width = True
+
+    def _read_records(self, start, end):
+        """Reads consecutive records (from 'start' to 'end', excluded)."""
+        first = int(self._offsets[start])
+        return self._read(first, int(self._offsets[end]) - first), first
+
+    def _decode_hardcalls(self, i, data, pos, ld_base=None):
+        """Decodes the hard calls of a record.
+
+        Args:
+            i (int): The index of the record.
+            data (bytes): The data containing the record.
+            pos (int): The position of the record in the data.
+            ld_base (numpy.ndarray): The hard calls of the base record (for LD
+                                     compressed records, read if required).
+
+        Returns:
+            tuple: The hard calls (PLINK 2 codes) and the position of the rest
+            of the record.
+
+        """
+        vrtype = self._vrtypes[i]
+        nb_samples = self._nb_samples
+
+        if vrtype == _VRTYPE_PLINK1:
+            codes, pos = _unpack_codes(data, pos, nb_samples)
+            return _PLINK1_CODES[codes], pos
+
+        main_track = vrtype & 7
+        if main_track == 0:
+            return _unpack_codes(data, pos, nb_samples)
+
+        if main_track == 1:
+            # Two common codes (1 bit per sample), and a difflist
+            unset = data[pos] >> 2
+            bits = np.unpackbits(
+                np.frombuffer(data, dtype=np.uint8, offset=pos + 1,
+                              count=(nb_samples + 7) // 8),
+                count=nb_samples, bitorder="little",
+            )
+            codes = unset + bits * (data[pos] & 3)
+            return _apply_difflist(codes, data,
+                                   pos + 1 + (nb_samples + 7) // 8)
+
+        if main_track == 5:
+            # All samples are homozygous for the reference allele
+            return np.zeros(nb_samples, dtype=np.uint8), pos
+
+        if main_track in {4, 6, 7}:
+            # A single common code, and a difflist
+            codes = np.full(nb_samples, main_track & 3, dtype=np.uint8)
+            return _apply_difflist(codes, data, pos)
+
+        # LD compressed: the differences from the base record
+        if ld_base is None:
+            base = int(self._ld_base[i])
+            base_data, _ = self._read_records(base, base + 1)
+            ld_base, _ = self._decode_hardcalls(base, base_data, 0)
+
+        codes, pos = _apply_difflist(ld_base.copy(), data, pos)
+        if main_track == 3:
+            # Inverted (the reference and alternative alleles are swapped)
+            codes = np.where(codes == 3, 3, 2 - codes).astype(np.uint8)
+        return codes, pos
+
+    def _decode(self, i, data, pos=0, ld_base=None):
+        """Decodes the genotypes of a record.
+
+        Args:
+            i (int): The index of the record.
+            data (bytes): The data containing the record.
+            pos (int): The position of the record in the data.
+            ld_base (numpy.ndarray): The hard calls of the base record (for LD
+                                     compressed records).
+
+        Returns:
+            tuple: The genotypes (number of alternative alleles) and the hard
+            calls.
+
+        """
+        codes, pos = self._decode_hardcalls(i, data, pos, ld_base)
+        genotypes = _CODE_VALUES.astype(self.dtype)[codes]
+
+        vrtype = self._vrtypes[i]
+        dosage_type = (vrtype >> 5) & 3
+        if vrtype == _VRTYPE_PLINK1 or dosage_type == 0:
+            return genotypes, codes
+
+        if vrtype & 16:
+            # Skipping the hard call phase information
+            pos = _skip_phase(data, pos, int(np.sum(codes == 1)))
+
+        nb_samples = self._nb_samples
+        if dosage_type == 1:
+            # A list of samples with dosage
+            samples, pos = _read_difflist(data, pos, nb_samples)
+        elif dosage_type == 2:
+            # All samples have a dosage
+            samples = slice(None)
+        else:
+            # A bit array of samples with dosage
+            samples = np.flatnonzero(np.unpackbits(
+                np.frombuffer(data, dtype=np.uint8, offset=pos,
+                              count=(nb_samples + 7) // 8),
+                count=nb_samples, bitorder="little",
+            ))
+            pos += (nb_samples + 7) // 8
+
+        nb_dosages = nb_samples if dosage_type == 2 else len(samples)
+        dosages = np.frombuffer(data, dtype="<u2", offset=pos,
+                                count=nb_dosages)
+        values = dosages / _DOSAGE_UNIT
+        values[dosages == _DOSAGE_MISSING] = np.nan
+        genotypes[samples] = values
+
+        return genotypes, codes
+
+    def _read_variant_genotypes(self, i):
+        """Reads and decodes the genotypes of a record (cached)."""
+        def decode():
+            data, _ = self._read_records(i, i + 1)
+            return self._decode(i, data)[0]
+
+        return self._cached(i, decode)
+
+    def _get_variant(self, info):
+        return Variant(info.id, info.chrom, info.pos, [info.ref, info.alt])
+
+    def _get_genotypes(self, row, variant=None):
+        info = self._variants.iloc[row, :]
+        if variant is None:
+            variant = self._get_variant(info)
+
+        return Genotypes(
+            variant,
+            self._read_variant_genotypes(int(info.i)),
+            reference=info.ref,
+            coded=info.alt,
+            multiallelic=bool(info.multiallelic),
+        )
+
+    def iter_genotypes(self):
+        """Iterates on available markers.
+
+        Returns:
+            Genotypes instances.
+
+        """
+        for block in self.iter_blocks():
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_range(self, start, stop):
+        """Iterates on a range of variants (by index)."""
+        for block in self.iter_range_blocks(start, stop):
+            for genotypes in block.iter_genotypes():
+                yield genotypes
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates on blocks of consecutive variants.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the records of a block are read at once).
+
+        """
+        return self.iter_range_blocks(0, self.get_number_variants(),
+                                      block_size)
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterates on blocks of a range of variants.
+
+        Args:
+            start (int): The index of the first variant.
+            stop (int): The index after the last variant.
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances (the records of a block are read at once).
+
+        """
+        start, stop = self._check_range(start, stop)
+        ld_base = None
+        for block_start in range(start, stop, block_size):
+            info = self._variants.iloc[
+                block_start:min(block_start + block_size, stop), :
+            ]
+            records = info.i.values
+
+            data, first = self._read_records(records[0], records[-1] + 1)
+            if self._fixed_width and self._vrtypes[0] in {0, _VRTYPE_PLINK1}:
+                # Hard calls only, decoded at once
+                genotypes = self._decode_fixed_width(data,
+                                                     records - records[0])
+
+            else:
+                genotypes = np.empty((len(records), self._nb_samples),
+                                     dtype=self.dtype)
+                for j, i in enumerate(records):
+                    # The base of LD compressed records is the last record
+                    # decoded (if it was not skipped)
+                    base = ld_base
+                    if ld_base is None or ld_base_i != self._ld_base[i]:
+                        base = None
+
+                    genotypes[j], codes = self._decode(
+                        i, data, int(self._offsets[i]) - first, base,
+                    )
+                    if not _is_ld_compressed(self._vrtypes[i]):
+                        ld_base, ld_base_i = codes, i
+
+            yield GenotypesBlock(
+                variants=[self._get_variant(row) for row in
+                          info.itertuples(index=False)],
+                genotypes=genotypes,
+                reference=info.ref.tolist(),
+                coded=info.alt.tolist(),
+                multiallelic=info.multiallelic.tolist(),
+            )
+
+    def _decode_fixed_width(self, data, records):
+        """Decodes fixed-width hard call records (read at once)."""
+        width = int(self._offsets[1] - self._offsets[0])
+        data = np.frombuffer(data, dtype=np.uint8).reshape(-1, width)
+        codes = _BYTE_CODES[data[records]].reshape(len(records), -1)
+        codes = codes[:, :self._nb_samples]
+        if self._vrtypes[0] == _VRTYPE_PLINK1:
+            codes = _PLINK1_CODES[codes]
+        return _CODE_VALUES.astype(self.dtype)[codes]
+
+    def _get_loci(self):
+        return self._variants.chrom.values, self._variants.pos.values
+
+    def _get_names(self):
+        return self._variants.id.values
+
+    def iter_variants(self):
+        """Iterate over marker information."""
+        for info in self._variants.itertuples(index=False):
+            yield self._get_variant(info)
+
+    def get_variant_genotypes(self, variant):
+        """Get the genotypes from a well formed variant instance.
+
+        Args:
+            marker (Variant): A Variant instance.
+
+        Returns:
+            A list of Genotypes instance containing a pointer to the variant as
+            well as a vector of encoded genotypes.
+
+        """
+        rows = self._locus_index.get_indices(variant.chrom, variant.pos,
+                                             variant.pos)
+
+        if len(rows) == 0:
+            return []
+
+        elif len(rows) == 1:
+            info = self._variants.iloc[rows[0], :]
+            variant_alleles = variant._encode_alleles([info.ref, info.alt])
+            if variant_alleles != variant.alleles:
+                # Variant with requested alleles is unavailable.
+                return []
+            return [self._get_genotypes(rows[0], variant)]
+
+        out = []
+        for row in rows:
+            if variant.alleles is not None:
+                # Find the requested alleles.
+                info = self._variants.iloc[row, :]
+                row_alleles = set(Variant._encode_alleles((info.ref,
+                                                           info.alt)))
+                if not row_alleles.issubset(variant.alleles_set):
+                    continue
+            out.append(self._get_genotypes(row, variant))
+
+        return out
+
+    def get_variant_by_name(self, name):
+        """Get the genotype of a marker using it's name.
+
+        Args:
+            name (str): The name of the marker.
+
+        Returns:
+            list: A list of Genotypes (one per variant with this name).
+
+        """
+        rows = self._name_index.get(name)
+        if rows is None:
+            logger.warning("Variant {} was not found".format(name))
+            return []
+
+        return [self._get_genotypes(row) for row in rows]
+
+    def get_variants_in_region(self, chrom, start, end):
+        """Iterate over variants in a region."""
+        for row in self._locus_index.get_indices(chrom, start, end):
+            yield self._get_genotypes(row)
+
+    def get_samples(self):
+        return list(self.samples)
+
+    def get_number_samples(self):
+        return self._nb_samples
+
+    def get_number_variants(self):
+        return self._variants.shape[0]
+
+
+def _is_ld_compressed(vrtypes):
+    """Checks if records are LD compressed (main track type 2 or 3)."""
+    return ((vrtypes & 6) == 2) & (vrtypes != _VRTYPE_PLINK1)
+
+
+def _unpack_codes(data, pos, nb_samples):
+    """Unpacks 2-bit codes (low bits first)."""
+    nb_bytes = (nb_samples + 3) // 4
+    codes = _BYTE_CODES[np.frombuffer(data, dtype=np.uint8, offset=pos,
+                                      count=nb_bytes)]
+    return codes.ravel()[:nb_samples], pos + nb_bytes
+
+
+def _read_vints(data, pos, count):
+    """Reads variable-length integers (7 bits per byte, low bits first).
+
+    Returns:
+        tuple: The integers, and the position after the last one.
+
+    """
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), pos
+
+    values = np.frombuffer(data, dtype=np.uint8, offset=pos)
+    ends = np.flatnonzero(values < 128)[:count]
+    if len(ends) < count:
+        raise ValueError("invalid PGEN record")
+    values = values[:ends[-1] + 1].astype(np.int64)
+
+    # The index of each byte's integer, and its position in the integer
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    integer = np.repeat(np.arange(count), ends - starts + 1)
+    shift = 7 * (np.arange(len(values)) - starts[integer])
+
+    out = np.zeros(count, dtype=np.int64)
+    np.add.at(out, integer, (values & 127) << shift)
+    return out, pos + len(values)
+
+
+def _read_difflist(data, pos, nb_samples, with_codes=False):
+    """Reads a difflist (a sorted list of samples, with optional codes).
+
+    Args:
+        data (bytes): The data containing the list.
+        pos (int): The position of the list in the data.
+        nb_samples (int): The number of samples.
+        with_codes (bool): Whether the list contains 2-bit codes.
+
+    Returns:
+        tuple: The samples, the codes (if required) and the position after the
+        list.
+
+    """
+    length, pos = _read_vints(data, pos, 1)
+    length = int(length[0])
+    if length == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return (empty, empty.astype(np.uint8), pos) if with_codes else \
+            (empty, pos)
+
+    # The first sample of each group of 64 samples (the sizes of the delta
+    # segments are only useful to skip groups)
+    nb_groups = (length + 63) // 64
+    id_size = 1 + (nb_samples.bit_length() - 1) // 8
+    starts = np.frombuffer(data, dtype=np.uint8, offset=pos,
+                           count=nb_groups * id_size).reshape(nb_groups,
+                                                              id_size)
+    starts = starts.astype(np.int64).dot(
+        np.left_shift(1, 8 * np.arange(id_size)),
+    )
+    pos += nb_groups * id_size + nb_groups - 1
+
+    codes = None
+    if with_codes:
+        codes, pos = _unpack_codes(data, pos, length)
+
+    # The differences between consecutive samples of each group
+    deltas, pos = _read_vints(data, pos, length - nb_groups)
+    increments = np.empty(length, dtype=np.int64)
+    group_starts = np.arange(0, length, 64)
+    increments[np.setdiff1d(np.arange(length), group_starts)] = deltas
+    increments[group_starts] = starts
+    increments[group_starts[1:]] -= np.add.reduceat(increments,
+                                                    group_starts)[:-1]
+    samples = np.cumsum(increments)
+
+    if np.any(samples >= nb_samples):
+        raise ValueError("invalid PGEN record")
+
+    return (samples, codes, pos) if with_codes else (samples, pos)
+
+
+def _apply_difflist(codes, data, pos):
+    """Applies a difflist to hard calls."""
+    samples, diff_codes, pos = _read_difflist(data, pos, len(codes),
+                                              with_codes=True)
+    codes[samples] = diff_codes
+    return codes, pos
+
+
+def _skip_phase(data, pos, nb_heterozygous):
+    """Skips the hard call phase information of a record."""
+    nb_bytes = 1 + nb_heterozygous // 8
+    if not data[pos] & 1:
+        # Phase information for all heterozygous samples
+        return pos + nb_bytes
+
+    # The samples with phase information (the first bit is the flag)
+    phased = np.unpackbits(
+        np.frombuffer(data, dtype=np.uint8, offset=pos, count=nb_bytes),
+        bitorder="little",
+    )[1:nb_heterozygous + 1]
+    return pos + nb_bytes + (int(phased.sum()) + 7) // 8
+
+
+def _read_pvar(filename):
+    """Reads a PVAR file (or a BIM file).
+
+    Returns:
+        pandas.DataFrame: The variants (chrom, pos, id, ref, alt and the
+        index of the record in the PGEN file).
+
+    """
+    # Skipping the meta-information lines
+    nb_meta = 0
+    header = None
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith("##"):
+                nb_meta += 1
+                continue
+            if line.startswith("#"):
+                header = line[1:].rstrip("\r\n").split("\t")
+            break
+
+    if header is None:
+        # A BIM file (chrom, name, cm, pos, alt and ref)
+        variants = pd.read_csv(
+            filename, sep=r"\s+", header=None, dtype=str,
+            names=["CHROM", "ID", "CM", "POS", "ALT", "REF"],
+        )
+    else:
+        variants = pd.read_csv(filename, sep="\t", skiprows=nb_meta + 1,
+                               header=None, names=header, dtype=str)
+
+    variants = pd.DataFrame({
+        "chrom": variants.CHROM.map(Variant._encode_chr)
+                                .replace(CHROM_STR_ENCODE),
+        "pos": variants.POS.astype(np.int64),
+        "id": variants.ID,
+        "ref": variants.REF,
+        "alt": variants.ALT,
+        "i": np.arange(variants.shape[0]),
+    })
+    return variants
+
+
+def _read_psam(filename):
+    """Reads a PSAM file (or a FAM file).
+
+    Returns:
+        list: The sample identifiers ('iid', or 'fid_iid' if the individual
+        identifiers are not unique).
+
+    """
+    with open(filename, "r") as f:
+        header = f.readline()
+
+    if header.startswith("#"):
+        samples = pd.read_csv(filename, sep="\t", dtype=str)
+        samples.columns = [c.lstrip("#") for c in samples.columns]
+    else:
+        # A FAM file (fid, iid, father, mother, sex and status)
+        samples = pd.read_csv(filename, sep=r"\s+", header=None, dtype=str,
+                              usecols=[0, 1], names=["FID", "IID"])
+
+    if samples.IID.is_unique or "FID" not in samples.columns:
+        return samples.IID.tolist()
+
+    logger.info("Using 'fid_iid' as sample identifiers because the "
+                "individual IDs are not unique.")
+    return ["{}_{}".format(fid, iid)
+            for fid, iid in zip(samples.FID, samples.IID)]
@@ -1,5 +1,5 @@
 """
-Plink file reader based on PyPlink.
+Plink file reader based on PyPlink, and Plink file writer.
 """
 
 # This file is part of geneparse.
@@ -27,12 +27,18 @@ Plink file reader based on PyPlink.
 # THE SOFTWARE.
 
 
+import os
 import logging
+from time import perf_counter
+from functools import partial
 
 from pyplink import PyPlink
 import numpy as np
 
-from .core import GenotypesReader, Variant, Genotypes
+from .core import (GenotypesReader, GenotypesWriter, Variant, Genotypes,
+                   LazyGenotypes, GenotypesBlock)
+from .utils import (open_positional, pread, strip_dup_name,
+                    normalize_alleles)
 
 
 logger = logging.getLogger(__name__)
@@ -49,17 +55,62 @@ CHROM_STR_TO_INT["Unknown"] = 0  # TODO What is plink chromosome 0?
 CHROM_INT_TO_STR = {v: k for k, v in CHROM_STR_TO_INT.items()}
 
 
+# The encoded chromosome of each plink chromosome (see 'Variant._encode_chr')
+_CHROM_INT_TO_VARIANT = {
+    k: Variant._encode_chr(v) for k, v in CHROM_INT_TO_STR.items()
+}
+
+
+# The number of coded (a1) alleles for each of the four values of the 2-bit
+# BED encoding (00: homozygous a1, 01: missing, 10: heterozygous, 11:
+# homozygous a2), and the corresponding table for every possible byte.
+_BED_VALUES = np.array([2, np.nan, 1, 0], dtype=float)
+_BED_BYTE_VALUES = np.array(
+    [[_BED_VALUES[(i >> j) & 3] for j in range(0, 8, 2)] for i in range(256)],
+    dtype=float,
+)
+
+
+# The 2-bit BED code for each number of coded (a1) alleles (0, 1 and 2), and
+# for missing values.
+_BED_CODES = np.array([3, 2, 0, 1], dtype=np.uint8)
+
+
+# The maximal number of markers read at once when iterating over the BED
+# file, and the (approximate) memory used by their decoded genotypes.
+_ITER_CHUNK_SIZE = 1024
+_ITER_CHUNK_BYTES = 32 * 1024 ** 2
+
+# The size of the chunks whose decoded genotypes are shared by their markers
+# (the genotypes of larger chunks are copied for each marker).
+_ITER_SHARED_CHUNK_BYTES = 1024 ** 2
+
+
 class PlinkReader(GenotypesReader):
     def __init__(self, prefix):
         """Binary plink file reader.
         Args:
             prefix (str): the prefix of the Plink binary files.
 
+        Note
+        ====
+            Genotypes are read using positional reads on the BED file (no
+            shared file position). Hence, a single instance can be used
+            concurrently by multiple threads.
+
         """
         self.bed = PyPlink(prefix)
         self.bim = self.bed.get_bim()
         self.fam = self.bed.get_fam()
 
+        # The index of each marker in the BED file
+        self.bim["i"] = np.arange(self.bim.shape[0])
+
+        # The BED file is read using positional reads (thread-safe)
+        self._bed_fd = open_positional(self.bed.bed_filename)
+        self._nb_samples = self.bed.get_nb_samples()
+        self._nb_bytes = (self._nb_samples + 3) // 4
+
         # Identify all multi-allelics.
         self.bim["multiallelic"] = False
         self.bim.loc[
@@ -67,6 +118,11 @@ class PlinkReader(GenotypesReader):
             "multiallelic"
         ] = True
 
+        # The alleles are normalized once, so that the variants are created
+        # without any check
+        self.bim["a1"] = normalize_alleles(self.bim.a1.values)
+        self.bim["a2"] = normalize_alleles(self.bim.a2.values)
+
         # We want to set the index for the FAM file
         try:
             self.fam = self.fam.set_index("iid", verify_integrity=True)
@@ -84,6 +140,80 @@ class PlinkReader(GenotypesReader):
 
     def close(self):
         self.bed.close()
+        if self._bed_fd is not None:
+            os.close(self._bed_fd)
+            self._bed_fd = None
+
+    def _read_markers(self, start, n, seek=False):
+        """Reads and decodes consecutive markers from the BED file.
+
+        Args:
+            start (int): The index of the first marker.
+            n (int): The number of markers to read.
+            seek (bool): Whether the read is a random access (statistics).
+
+        Returns:
+            numpy.ndarray: A (n x samples) array of additive genotypes (number
+            of a1 alleles), with NaN for missing values.
+
+        """
+        return self._decode_markers(self._read_raw_markers(start, n, seek))
+
+    def _read_raw_markers(self, start, n, seek=False):
+        """Reads consecutive markers from the BED file (without decoding).
+
+        Returns:
+            numpy.ndarray: A (n x bytes per marker) array of BED bytes.
+
+        """
+        data = pread(
+            self._bed_fd, n * self._nb_bytes, 3 + start * self._nb_bytes,
+        )
+        if self._stats is not None:
+            self._stats.count(bytes_read=len(data), seeks=int(seek))
+
+        return np.frombuffer(data, dtype=np.uint8).reshape(n, self._nb_bytes)
+
+    def _decode_markers(self, data):
+        """Decodes the BED bytes of markers (see '_read_raw_markers')."""
+        stats = self._stats
+        if stats is not None:
+            start_time = perf_counter()
+
+        genotypes = _BED_BYTE_VALUES[data].reshape(data.shape[0], -1)[
+            :, :self._nb_samples
+        ]
+
+        if stats is not None:
+            stats.add_time("decode", start_time)
+
+        return genotypes
+
+    def _read_marker(self, i):
+        """Reads and decodes a single marker from the BED file (cached)."""
+        if self._stats is not None:
+            self._stats.count(variants=1)
+        return self._cached(i, lambda: self._read_markers(i, 1, seek=True)[0])
+
+    def _make_genotypes(self, variant, i, reference, coded, multiallelic):
+        """Creates the Genotypes of a marker (lazy if required)."""
+        if self._lazy:
+            return LazyGenotypes(variant, partial(self._read_marker, i),
+                                 reference, coded, multiallelic)
+
+        return Genotypes(variant, self._read_marker(i), reference, coded,
+                         multiallelic)
+
+    def _find_markers(self, mask):
+        """Selects markers from the BIM file (timing the index lookup)."""
+        stats = self._stats
+        if stats is None:
+            return self.bim.loc[mask, :]
+
+        start_time = perf_counter()
+        info = self.bim.loc[mask, :]
+        stats.add_time("index", start_time)
+        return info
 
     def get_variant_genotypes(self, variant):
         """Get the genotypes from a well formed variant instance.
@@ -103,10 +233,9 @@ class PlinkReader(GenotypesReader):
         """
         # Find the variant in the bim.
         plink_chrom = CHROM_STR_TO_INT[variant.chrom]
-        info = self.bim.loc[
-            (self.bim.chrom == plink_chrom) &
-            (self.bim.pos == variant.pos), :
-        ]
+        info = self._find_markers(
+            (self.bim.chrom == plink_chrom) & (self.bim.pos == variant.pos)
+        )
 
         if info.shape[0] == 0:
             return []
@@ -125,8 +254,8 @@ class PlinkReader(GenotypesReader):
             # Variant with requested alleles is unavailable.
             return []
 
-        geno = self._normalize_missing(self.bed.get_geno_marker(info.name))
-        return [Genotypes(variant, geno, info.a2, info.a1, False)]
+        return [self._make_genotypes(variant, info.i, info.a2, info.a1,
+                                     False)]
 
     def _get_multialleic_variant(self, variant, info):
         # Check if alleles are specified.
@@ -135,10 +264,8 @@ class PlinkReader(GenotypesReader):
             # If no alleles are specified, we return all the possible
             # bi-allelic variats.
             for name, row in info.iterrows():
-                geno = self.bed.get_geno_marker(name)
-                geno = self._normalize_missing(geno)
-                out.append(Genotypes(
-                    variant, geno, row.a2, row.a1, True
+                out.append(self._make_genotypes(
+                    variant, row.i, row.a2, row.a1, True
                 ))
 
         else:
@@ -166,41 +293,182 @@ class PlinkReader(GenotypesReader):
             sample family ID and individual ID (i.e. fid_iid).
 
         """
-        # Iterating over all markers
-        for i, (_, genotypes) in enumerate(self.bed.iter_geno()):
-            info = self.bim.iloc[i, :]
+        return self.iter_range(0, self.get_number_variants())
 
-            yield Genotypes(
-                Variant(info.name, CHROM_INT_TO_STR[info.chrom],
-                        info.pos, [info.a1, info.a2]),
-                self._normalize_missing(genotypes),
-                reference=info.a2,
-                coded=info.a1,
-                multiallelic=info.multiallelic
+    def iter_blocks(self, block_size=1000):
+        """Iterates on blocks of consecutive markers.
+
+        Args:
+            block_size (int): The (maximal) number of markers per block.
+
+        Returns:
+            GenotypesBlock instances (each block is read and decoded at once).
+
+        """
+        return self.iter_range_blocks(0, self.get_number_variants(),
+                                      block_size)
+
+    def iter_range(self, start, stop):
+        """Iterates on a range of markers (by index in the BIM file)."""
+        if self._lazy:
+            for genotypes in self._iter_range_lazy(start, stop):
+                yield genotypes
+            return
+
+        # Reading and decoding chunks of markers at once, the genotypes of
+        # each marker being copied for large chunks, so that keeping them
+        # does not keep the whole chunk in memory
+        start, stop = self._check_range(start, stop)
+        stats = self._stats
+        chunk_size = self._iter_chunk_size()
+        for chunk_start in range(start, stop, chunk_size):
+            n = min(chunk_size, stop - chunk_start)
+            genotypes = self._read_markers(chunk_start, n,
+                                           seek=chunk_start == start)
+
+            if stats is not None:
+                start_time = perf_counter()
+
+            if genotypes.nbytes > _ITER_SHARED_CHUNK_BYTES:
+                genotypes = [row.copy() for row in genotypes]
+
+            info = self.bim.iloc[chunk_start:chunk_start + n, :]
+            chunk = [
+                Genotypes._trusted(variant, row, reference, coded,
+                                   multiallelic)
+                for variant, row, reference, coded, multiallelic in zip(
+                    self._iter_variants(info), genotypes, info.a2.values,
+                    info.a1.values, info.multiallelic.tolist(),
+                )
+            ]
+
+            if stats is not None:
+                stats.add_time("construct", start_time)
+                stats.count(variants=n)
+
+            for genotypes in chunk:
+                yield genotypes
+
+    def _iter_chunk_size(self):
+        """The number of markers read at once when iterating.
+
+        The chunks are limited to '_ITER_CHUNK_BYTES' of decoded genotypes
+        (e.g. 41 markers for 100,000 samples).
+
+        """
+        return max(1, min(_ITER_CHUNK_SIZE,
+                          _ITER_CHUNK_BYTES // (8 * max(1, self._nb_samples))))
+
+    def _iter_range_lazy(self, start, stop):
+        """Iterates on a range of markers (LazyGenotypes).
+
+        The markers are read by chunks, but each one is decoded only when its
+        genotypes are accessed.
+
+        """
+        start, stop = self._check_range(start, stop)
+        stats = self._stats
+        chunk_size = self._iter_chunk_size()
+        for chunk_start in range(start, stop, chunk_size):
+            n = min(chunk_size, stop - chunk_start)
+            data = self._read_raw_markers(chunk_start, n,
+                                          seek=chunk_start == start)
+            if stats is not None:
+                stats.count(variants=n)
+
+            info = self.bim.iloc[chunk_start:chunk_start + n, :]
+            for variant, row, reference, coded, multiallelic in zip(
+                self._iter_variants(info), data, info.a2.values,
+                info.a1.values, info.multiallelic.values,
+            ):
+                yield LazyGenotypes._trusted(
+                    variant, partial(self._decode_marker, row), reference,
+                    coded, bool(multiallelic),
+                )
+
+    def _decode_marker(self, data):
+        """Decodes the BED bytes of a single marker."""
+        return self._decode_markers(data[np.newaxis])[0]
+
+    def iter_range_blocks(self, start, stop, block_size=1000):
+        """Iterates on blocks of a range of markers.
+
+        Args:
+            start (int): The index of the first marker.
+            stop (int): The index after the last marker.
+            block_size (int): The (maximal) number of markers per block.
+
+        Returns:
+            GenotypesBlock instances (each block is read and decoded at once).
+
+        """
+        start, stop = self._check_range(start, stop)
+        stats = self._stats
+        for block_start in range(start, stop, block_size):
+            n = min(block_size, stop - block_start)
+            genotypes = self._read_markers(block_start, n,
+                                           seek=block_start == start)
+
+            if stats is not None:
+                start_time = perf_counter()
+
+            info = self.bim.iloc[block_start:block_start + n, :]
+            block = GenotypesBlock._trusted(
+                variants=list(self._iter_variants(info)),
+                genotypes=genotypes,
+                reference=info.a2.tolist(),
+                coded=info.a1.tolist(),
+                multiallelic=info.multiallelic.tolist(),
             )
 
+            if stats is not None:
+                stats.add_time("construct", start_time)
+                stats.count(variants=n)
+
+            yield block
+
+    def _get_loci(self):
+        return self.bim.chrom.map(CHROM_INT_TO_STR).values, self.bim.pos.values
+
+    def _get_names(self):
+        return self.bim.index.values
+
+    def _get_alleles(self):
+        return self.bim.a2.values, self.bim.a1.values
+
     def iter_variants(self):
         """Iterate over marker information."""
-        for idx, row in self.bim.iterrows():
-            yield Variant(
-                row.name, CHROM_INT_TO_STR[row.chrom], row.pos,
-                [row.a1, row.a2]
+        return self._iter_variants(self.bim)
+
+    @staticmethod
+    def _iter_variants(info):
+        """Creates the variants of (a slice of) the BIM file.
+
+        The alleles being normalized when the file is opened, the variants are
+        created without any check.
+
+        """
+        for name, chrom, pos, a1, a2 in zip(info.index.values,
+                                            info.chrom.values,
+                                            info.pos.values, info.a1.values,
+                                            info.a2.values):
+            yield Variant._trusted(
+                name, _CHROM_INT_TO_VARIANT[chrom], int(pos),
+                (a1, a2) if a1 <= a2 else (a2, a1),
             )
 
     def get_variants_in_region(self, chrom, start, end):
         """Iterate over variants in a region."""
-        bim = self.bim.loc[
+        bim = self._find_markers(
             (self.bim["chrom"] == CHROM_STR_TO_INT[chrom]) &
             (start <= self.bim["pos"]) &
             (self.bim["pos"] <= end)
-        ]
-        for i, g in enumerate(self.bed.iter_geno_marker(bim.index)):
-            info = bim.iloc[i, :]
-            name, geno = g
-            yield Genotypes(
+        )
+        for _, info in bim.iterrows():
+            yield self._make_genotypes(
                 Variant(info.name, CHROM_INT_TO_STR[info.chrom],
                         info.pos, [info.a1, info.a2]),
-                self._normalize_missing(geno),
+                info.i,
                 reference=info.a2,
                 coded=info.a1,
                 multiallelic=info.multiallelic
@@ -225,9 +493,9 @@ class PlinkReader(GenotypesReader):
         # From 1.3.2 onwards, PyPlink sets unique names.
         # Getting the genotypes
         try:
-            geno, i = self.bed.get_geno_marker(name, return_index=True)
+            info = self.bim.loc[name, :]
 
-        except ValueError:
+        except KeyError:
             if name in self.bed.get_duplicated_markers():
                 # The variant is a duplicated one, so we go through all the
                 # variants with the same name and the :dupx suffix
@@ -243,11 +511,10 @@ class PlinkReader(GenotypesReader):
                 return []
 
         else:
-            info = self.bim.iloc[i, :]
-            return [Genotypes(
+            return [self._make_genotypes(
                 Variant(info.name, CHROM_INT_TO_STR[info.chrom], info.pos,
                         [info.a1, info.a2]),
-                self._normalize_missing(geno),
+                info.i,
                 reference=info.a2,
                 coded=info.a1,
                 multiallelic=info.multiallelic,
@@ -270,9 +537,91 @@ class PlinkReader(GenotypesReader):
     def get_samples(self):
         return list(self.fam.index)
 
-    @staticmethod
-    def _normalize_missing(g):
-        """Normalize a plink genotype vector."""
-        g = g.astype(float)
-        g[g == -1.0] = np.nan
-        return g
+
+class PlinkWriter(GenotypesWriter):
+    def __init__(self, prefix, samples, buffer_size=4 * 1024 ** 2):
+        """Binary plink file writer.
+
+        Args:
+            prefix (str): the prefix of the Plink binary files.
+            samples (list): the sample IDs.
+            buffer_size (int): the size of the output buffers (in bytes).
+
+        Note
+        ====
+            The coded allele is written as a1 (and the reference allele as
+            a2), and dosage values are rounded to the nearest genotype.
+            Families and phenotypes are unknown (the FID is the IID).
+
+        """
+        self.prefix = prefix
+        self.samples = list(samples)
+        self._nb_samples = len(self.samples)
+
+        with open(prefix + ".fam", "w") as f:
+            for sample in self.samples:
+                f.write("{0} {0} 0 0 0 -9\n".format(sample))
+
+        self._bim = open(prefix + ".bim", "w", buffering=buffer_size)
+        self._bed = open(prefix + ".bed", "wb", buffering=buffer_size)
+        self._bed.write(b"\x6c\x1b\x01")
+
+    def close(self):
+        for f in (self._bim, self._bed):
+            if not f.closed:
+                f.close()
+
+    def encode_block(self, block):
+        """Encodes a block (BIM lines and BED bytes).
+
+        Args:
+            block (GenotypesBlock): the block to encode.
+
+        Returns:
+            tuple: the BIM lines (str) and the BED data (bytes).
+
+        """
+        bim = "".join(
+            "{}\t{}\t0\t{}\t{}\t{}\n".format(
+                CHROM_STR_TO_INT.get(variant.chrom, variant.chrom),
+                strip_dup_name(variant.name), variant.pos, coded, reference,
+            )
+            for variant, reference, coded in zip(
+                block.variants, block.reference, block.coded,
+            )
+        )
+
+        return bim, _pack_bed(block.genotypes, self._nb_samples)
+
+    def write_encoded(self, encoded):
+        bim, bed = encoded
+        self._bim.write(bim)
+        self._bed.write(bed)
+
+
+def _pack_bed(genotypes, nb_samples):
+    """Packs a (variants x samples) genotypes array in the BED format.
+
+    Args:
+        genotypes (numpy.ndarray): the number of coded (a1) alleles (dosage
+                                   values are rounded, NaN are missing).
+        nb_samples (int): the number of samples.
+
+    Returns:
+        bytes: the BED data (without the magic number).
+
+    """
+    genotypes = np.asarray(genotypes, dtype=float).reshape(-1, nb_samples)
+    n = genotypes.shape[0]
+
+    # The 2-bit codes, padded to a multiple of 4 samples (with zeros)
+    codes = np.zeros((n, (nb_samples + 3) // 4 * 4), dtype=np.uint8)
+    values = np.rint(genotypes)
+    values[np.isnan(values) | (values < 0) | (values > 2)] = 3
+    codes[:, :nb_samples] = _BED_CODES[values.astype(np.uint8)]
+
+    codes = codes.reshape(n, -1, 4)
+    return (
+        codes[:, :, 0] | (codes[:, :, 1] << 2) | (codes[:, :, 2] << 4) |
+        (codes[:, :, 3] << 6)
+    ).tobytes()
@@ -0,0 +1,227 @@
+"""
+Background read-ahead (prefetching) for sequential scans.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import queue
+import logging
+import threading
+
+from .core import GenotypesReader
+
+
+logger = logging.getLogger(__name__)
+
+
+# Marker for the end of the iteration.
+_DONE = object()
+
+
+class PrefetchingReader(GenotypesReader):
+    def __init__(self, reader, max_prefetch=64):
+        """Reader decoding the next variants in a background thread.
+
+        Args:
+            reader (GenotypesReader): The reader to wrap.
+            max_prefetch (int): The maximal number of Genotypes (or blocks when
+                                using 'iter_blocks') decoded in advance.
+
+        While the caller works on the current variant (or block), the next
+        ones are read and decoded by a background thread. At most
+        'max_prefetch' items are kept in memory. Exceptions raised while
+        decoding are raised again in the consumer, and closing the reader (or
+        the iterator) stops the background thread.
+
+        The other methods (e.g. 'get_variant_by_name') are forwarded to the
+        wrapped reader.
+
+        Note
+        ====
+            The wrapped reader must support being used from a thread other
+            than the one where it was created (which is the case for the
+            readers of geneparse).
+
+        """
+        if max_prefetch < 1:
+            raise ValueError("'max_prefetch' should be a positive integer")
+
+        self.reader = reader
+        self.max_prefetch = max_prefetch
+
+        # The active background threads (and their stop event)
+        self._producers = set()
+        self._producers_lock = threading.Lock()
+
+    def close(self):
+        with self._producers_lock:
+            producers = list(self._producers)
+
+        for producer in producers:
+            producer.stop()
+
+        self.reader.close()
+
+    def _prefetch(self, iterable):
+        """Iterates over an iterable consumed by a background thread."""
+        producer = _Producer(iterable, self.max_prefetch)
+        with self._producers_lock:
+            self._producers.add(producer)
+
+        try:
+            producer.start()
+            while True:
+                item = producer.get()
+                if item is _DONE:
+                    return
+                yield item
+
+        finally:
+            producer.stop()
+            with self._producers_lock:
+                self._producers.discard(producer)
+
+    def iter_genotypes(self):
+        """Iterates over genotypes, decoding the next ones in advance.
+
+        Returns:
+            Genotypes instances.
+
+        """
+        return self._prefetch(self.reader.iter_genotypes())
+
+    def iter_blocks(self, block_size=1000):
+        """Iterates over blocks, decoding the next ones in advance.
+
+        Args:
+            block_size (int): The (maximal) number of variants per block.
+
+        Returns:
+            GenotypesBlock instances.
+
+        """
+        return self._prefetch(self.reader.iter_blocks(block_size))
+
+    def iter_variants(self):
+        return self.reader.iter_variants()
+
+    def get_variant_genotypes(self, variant):
+        return self.reader.get_variant_genotypes(variant)
+
+    def get_variant_by_name(self, name):
+        return self.reader.get_variant_by_name(name)
+
+    def get_variants_in_region(self, chrom, start, end):
+        return self.reader.get_variants_in_region(chrom, start, end)
+
+    def get_samples(self):
+        return self.reader.get_samples()
+
+    def get_number_samples(self):
+        return self.reader.get_number_samples()
+
+    def get_number_variants(self):
+        return self.reader.get_number_variants()
+
+
+class _Producer(object):
+    def __init__(self, iterable, max_items):
+        """Consumes an iterable in a background thread (bounded queue)."""
+        self._iterable = iterable
+        self._queue = queue.Queue(maxsize=max_items)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _put(self, item):
+        """Puts an item in the queue, unless the producer was stopped."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for item in self._iterable:
+                if not self._put(item):
+                    return
+            self._put(_DONE)
+
+        except BaseException as e:
+            self._put(_Error(e))
+
+        finally:
+            # Closing the generator (if any), so that its resources are freed
+            # in this thread
+            close = getattr(self._iterable, "close", None)
+            if close is not None:
+                close()
+
+    def _drain(self):
+        """Removes all the items from the queue."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def get(self):
+        """Gets the next item (raising the producer's exception, if any)."""
+        item = self._queue.get()
+        if isinstance(item, _Error):
+            raise item.exception
+        return item
+
+    def stop(self):
+        """Stops the background thread and frees the prefetched items."""
+        self._stop.set()
+
+        # Emptying the queue (the producer might be waiting for space)
+        self._drain()
+        if self._thread.is_alive() and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        self._drain()
+
+        # Waking up a consumer that might be waiting for the next item
+        try:
+            self._queue.put_nowait(_DONE)
+        except queue.Full:
+            pass
+
+
+class _Error(object):
+    __slots__ = ("exception", )
+
+    def __init__(self, exception):
+        """Exception raised by the producer, to be raised by the consumer."""
+        self.exception = exception
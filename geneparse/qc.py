@@ -0,0 +1,309 @@
+"""
+Streaming quality control statistics of genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesReader
+
+
+logger = logging.getLogger(__name__)
+
+
+# The maximal number of values computed at once by the exact HWE test
+_HWE_MAX_VALUES = 2 ** 22
+
+
+class QCAccumulator(object):
+    def __init__(self, nb_samples):
+        """Accumulates QC statistics over blocks of genotypes.
+
+        Args:
+            nb_samples (int): The number of samples.
+
+        The per-variant statistics (coded allele frequency, missing rate,
+        genotype counts and HWE exact test p-value) and the per-sample
+        statistics (call rate and heterozygosity) are computed in a single
+        pass (see 'update'). Accumulators of consecutive parts of a dataset
+        (e.g. shards or chromosomes) can be combined (see 'merge').
+
+        Note
+        ====
+            Dosage values are rounded to the nearest genotype for the
+            genotype counts, the heterozygosity and the HWE test. The allele
+            frequency is computed using the dosage values.
+
+        """
+        self.nb_samples = nb_samples
+        self.samples = None
+
+        # The per-sample counts
+        self.nb_variants = 0
+        self.nb_called = np.zeros(nb_samples, dtype=np.int64)
+        self.nb_het = np.zeros(nb_samples, dtype=np.int64)
+
+        # The per-variant statistics (one dict of arrays per block)
+        self._variant_stats = []
+
+    def __repr__(self):
+        return "<QCAccumulator {:,d} samples; {:,d} variants>".format(
+            self.nb_samples, self.nb_variants,
+        )
+
+    def update(self, block):
+        """Adds the statistics of a block of genotypes.
+
+        Args:
+            block (GenotypesBlock): The block.
+
+        """
+        genotypes = block.genotypes
+        if genotypes.shape[1] != self.nb_samples:
+            raise ValueError("expected {:,d} samples, got {:,d}".format(
+                self.nb_samples, genotypes.shape[1],
+            ))
+
+        called = ~np.isnan(genotypes)
+        calls = np.rint(np.where(called, genotypes, -1))
+        het = calls == 1
+
+        # The per-sample counts
+        self.nb_variants += genotypes.shape[0]
+        self.nb_called += called.sum(axis=0)
+        self.nb_het += het.sum(axis=0)
+
+        # The per-variant statistics
+        nb_called = called.sum(axis=1)
+        n_het = het.sum(axis=1)
+        n_hom_coded = (calls == 2).sum(axis=1)
+        n_hom_ref = (calls == 0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            coded_freq = (np.where(called, genotypes, 0).sum(axis=1) /
+                          (2 * nb_called))
+
+        self._variant_stats.append({
+            "name": np.array([v.name for v in block.variants], dtype=object),
+            "chrom": np.array([v.chrom for v in block.variants],
+                              dtype=object),
+            "pos": np.array([v.pos for v in block.variants], dtype=np.int64),
+            "reference": np.array(block.reference, dtype=object),
+            "coded": np.array(block.coded, dtype=object),
+            "coded_freq": coded_freq,
+            "missing_rate": 1 - nb_called / max(self.nb_samples, 1),
+            "n_hom_ref": n_hom_ref,
+            "n_het": n_het,
+            "n_hom_coded": n_hom_coded,
+            "hwe_p": hwe_exact(n_het, n_hom_ref, n_hom_coded),
+        })
+
+    def merge(self, other):
+        """Adds the statistics of the following part of the dataset.
+
+        Args:
+            other (QCAccumulator): The accumulator of the following variants
+                                   (same samples).
+
+        Returns:
+            QCAccumulator: This accumulator.
+
+        """
+        if other.nb_samples != self.nb_samples:
+            raise ValueError("cannot merge accumulators of different samples")
+
+        self.nb_variants += other.nb_variants
+        self.nb_called += other.nb_called
+        self.nb_het += other.nb_het
+        self._variant_stats.extend(other._variant_stats)
+        return self
+
+    def variant_stats(self):
+        """Returns the per-variant statistics.
+
+        Returns:
+            pandas.DataFrame: The statistics of each variant (in order).
+
+        """
+        columns = ["name", "chrom", "pos", "reference", "coded", "coded_freq",
+                   "missing_rate", "n_hom_ref", "n_het", "n_hom_coded",
+                   "hwe_p"]
+        if not self._variant_stats:
+            return pd.DataFrame(columns=columns)
+
+        return pd.DataFrame({
+            column: np.concatenate([s[column] for s in self._variant_stats])
+            for column in columns
+        }, columns=columns)
+
+    def sample_stats(self):
+        """Returns the per-sample statistics.
+
+        Returns:
+            pandas.DataFrame: The number of called genotypes, the call rate
+            and the heterozygosity (proportion of heterozygous genotypes among
+            the called ones) of each sample (indexed by sample if known).
+
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "nb_called": self.nb_called,
+                "call_rate": self.nb_called / self.nb_variants,
+                "heterozygosity": self.nb_het / self.nb_called,
+            }, index=self.samples)
+
+
+def compute_qc(reader, n_jobs=1, block_size=1000, **kwargs):
+    """Computes the QC statistics of a dataset.
+
+    Args:
+        reader: Either a GenotypesReader, or a picklable callable creating
+                one (see 'parallel.map_blocks').
+        n_jobs (int): The number of processes (the blocks are processed in
+                      this process if 1).
+        block_size (int): The (maximal) number of variants per block.
+        kwargs: Other arguments of 'parallel.map_blocks' (e.g. 'progress').
+
+    Returns:
+        QCAccumulator: The statistics.
+
+    With multiple processes, each block (or shard, e.g. of a dataset split
+    by chromosome, if 'reader' is a callable) is processed independently, and
+    the partial statistics are merged in order.
+
+    """
+    if isinstance(reader, GenotypesReader) or not callable(reader):
+        samples = reader.get_samples()
+    else:
+        with reader() as opened:
+            samples = opened.get_samples()
+
+    if n_jobs == 1 and (isinstance(reader, GenotypesReader) or
+                        not callable(reader)):
+        qc = QCAccumulator(len(samples))
+        for block in reader.iter_blocks(block_size):
+            qc.update(block)
+
+    else:
+        from .parallel import map_blocks
+        qc = map_blocks(reader, _block_qc, n_jobs=n_jobs, reduce=_merge,
+                        initial=QCAccumulator(len(samples)),
+                        block_size=block_size, **kwargs)
+
+    qc.samples = list(samples)
+    return qc
+
+
+def _block_qc(block):
+    """Computes the QC statistics of a single block (worker)."""
+    qc = QCAccumulator(block.genotypes.shape[1])
+    qc.update(block)
+    return qc
+
+
+def _merge(a, b):
+    return a.merge(b)
+
+
+def hwe_exact(n_het, n_hom1, n_hom2):
+    """Hardy-Weinberg equilibrium exact test (Wigginton et al., 2005).
+
+    Args:
+        n_het (numpy.ndarray): The number of heterozygotes.
+        n_hom1 (numpy.ndarray): The number of homozygotes (first allele).
+        n_hom2 (numpy.ndarray): The number of homozygotes (second allele).
+
+    Returns:
+        numpy.ndarray: The p-values (NaN for variants without genotype).
+
+    The probabilities of all the possible numbers of heterozygotes are
+    computed at once (using log factorials) for groups of variants with a
+    similar number of copies of the rare allele.
+
+    """
+    n_het = np.asarray(n_het, dtype=np.int64)
+    rare_hom = np.minimum(n_hom1, n_hom2).astype(np.int64)
+    n = n_het + np.maximum(n_hom1, n_hom2) + rare_hom
+    n_rare = n_het + 2 * rare_hom
+
+    p_values = np.full(len(n), np.nan)
+    if len(n) == 0:
+        return p_values
+
+    # log(k!) for k from 0 to 2N
+    log_fact = np.concatenate([
+        [0], np.cumsum(np.log(np.arange(1, 2 * n.max() + 1))),
+    ])
+
+    order = np.argsort(n_rare, kind="stable")
+    order = order[n[order] > 0]
+    start = 0
+    while start < len(order):
+        # The number of variants such that the grid is small enough
+        width = n_rare[order[start]] // 2 + 1
+        stop = start + 1
+        while stop < len(order):
+            next_width = n_rare[order[stop]] // 2 + 1
+            if (stop - start + 1) * next_width > _HWE_MAX_VALUES:
+                break
+            width = next_width
+            stop += 1
+
+        idx = order[start:stop]
+        p_values[idx] = _hwe_exact_group(
+            n[idx, None], n_rare[idx, None], rare_hom[idx], width, log_fact,
+        )
+        start = stop
+
+    return p_values
+
+
+def _hwe_exact_group(n, n_rare, obs_rare_hom, width, log_fact):
+    """Computes the HWE exact test for a group of variants (columns)."""
+    # Every possible number of rare homozygotes
+    rare_hom = np.arange(width)[None, :]
+    het = n_rare - 2 * rare_hom
+    common_hom = n - het - rare_hom
+    valid = (het >= 0) & (common_hom >= 0)
+
+    het = np.where(valid, het, 0)
+    common_hom = np.where(valid, common_hom, 0)
+    log_p = (
+        log_fact[n] - log_fact[rare_hom] - log_fact[het] -
+        log_fact[common_hom] + het * np.log(2) + log_fact[n_rare] +
+        log_fact[2 * n - n_rare] - log_fact[2 * n]
+    )
+    log_p[~valid] = -np.inf
+
+    # Summing the probabilities of the configurations as likely (or less)
+    # than the observed one
+    log_p_obs = log_p[np.arange(len(obs_rare_hom)), obs_rare_hom][:, None]
+    p = np.where(log_p <= log_p_obs + 1e-7, np.exp(log_p), 0).sum(axis=1)
+    return np.minimum(p, 1)
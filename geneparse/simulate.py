@@ -0,0 +1,271 @@
+"""
+Generation of random (but consistent) genotype datasets.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import logging
+from contextlib import ExitStack
+
+import numpy as np
+
+from . import writers as _writers
+from .core import GenotypesBlock, Variant
+
+
+logger = logging.getLogger(__name__)
+
+
+FORMATS = ["plink", "impute2", "impute2-bgzip", "vcf"]
+
+# The maximal number of genotypes generated at once (when the block size is
+# not set)
+_MAX_BLOCK_VALUES = 2 ** 24
+
+_NUCLEOTIDES = np.array(list("ACGT"))
+
+
+def simulate_blocks(nb_samples, nb_variants, seed=42, block_size=None,
+                    chromosomes=None, multiallelic_rate=0.01,
+                    duplicated_rate=0.001, missing_rate=0.01):
+    """Generates random blocks of genotypes.
+
+    Args:
+        nb_samples (int): The number of samples.
+        nb_variants (int): The number of variants (i.e. of biallelic
+                           Genotypes, a multiallelic locus counting twice).
+        seed (int): The random seed.
+        block_size (int): The number of variants per block (the default
+                          bounds the size of the blocks to about 16 million
+                          genotypes).
+        chromosomes (list): The chromosomes (the variants are evenly split
+                            between them). Defaults to the autosomes.
+        multiallelic_rate (float): The proportion of triallelic loci (written
+                                   as two consecutive variants).
+        duplicated_rate (float): The proportion of loci named as the
+                                 previous locus.
+        missing_rate (float): The proportion of missing genotypes.
+
+    Returns:
+        generator: The GenotypesBlock instances.
+
+    The genotypes are drawn in Hardy-Weinberg equilibrium, from allele
+    frequencies drawn uniformly between 1% and 50%. The same arguments always
+    generate the same dataset.
+
+    """
+    if chromosomes is None:
+        chromosomes = [str(chrom) for chrom in range(1, 23)]
+    if block_size is None:
+        block_size = max(1, _MAX_BLOCK_VALUES // max(nb_samples, 1))
+
+    random = np.random.RandomState(seed)
+
+    # The number of variants on each chromosome
+    bounds = np.linspace(0, nb_variants, len(chromosomes) + 1).astype(int)
+
+    nb_loci = 0
+    for chrom, nb_chrom_variants in zip(chromosomes, np.diff(bounds)):
+        pos = 0
+        remaining = nb_chrom_variants
+        while remaining > 0:
+            size = min(block_size, remaining)
+
+            # The loci of the block (triallelic ones taking two variants)
+            nb_alleles = np.where(
+                random.random_sample(size) < multiallelic_rate, 3, 2,
+            )
+            nb_alleles = nb_alleles[np.cumsum(nb_alleles - 1) <= size]
+            if (nb_alleles - 1).sum() < size:
+                nb_alleles = np.append(nb_alleles, 2)
+            positions = pos + np.cumsum(
+                random.randint(1, 2000, size=len(nb_alleles))
+            )
+            pos = positions[-1]
+
+            block = _simulate_block(
+                random, chrom, positions, nb_alleles, nb_samples, nb_loci,
+                duplicated_rate, missing_rate,
+            )
+            nb_loci += len(nb_alleles)
+            remaining -= size
+            yield block
+
+
+def _simulate_block(random, chrom, positions, nb_alleles, nb_samples,
+                    first_locus, duplicated_rate, missing_rate):
+    """Generates the genotypes of a block of loci."""
+    size = (nb_alleles - 1).sum()
+    genotypes = np.empty((size, nb_samples))
+    variants = []
+    reference = []
+    coded = []
+    multiallelic = []
+
+    # The biallelic loci (at once)
+    rows = np.cumsum(nb_alleles - 1) - (nb_alleles - 1)
+    biallelic = rows[nb_alleles == 2]
+    freq = random.uniform(0.01, 0.5, size=(len(biallelic), 1))
+    genotypes[biallelic] = random.binomial(
+        2, freq, size=(len(biallelic), nb_samples),
+    )
+
+    # The triallelic loci (from the alleles of each haplotype)
+    for row in rows[nb_alleles == 3]:
+        freq = random.uniform(0.01, 0.45, size=2)
+        haplotypes = np.searchsorted(
+            np.cumsum([1 - freq.sum(), freq[0]]),
+            random.random_sample((2, nb_samples)), side="right",
+        )
+        genotypes[row] = (haplotypes == 1).sum(axis=0)
+        genotypes[row + 1] = (haplotypes == 2).sum(axis=0)
+
+    genotypes[random.random_sample(genotypes.shape) < missing_rate] = np.nan
+
+    # The variants
+    duplicated = random.random_sample(len(positions)) < duplicated_rate
+    name = "rs{}".format(first_locus)
+    for i, (pos, n) in enumerate(zip(positions, nb_alleles)):
+        if first_locus + i == 0 or not duplicated[i]:
+            name = "rs{}".format(first_locus + i + 1)
+
+        alleles = _NUCLEOTIDES[random.permutation(4)[:n]].tolist()
+        for alt in alleles[1:]:
+            variants.append(Variant(name, chrom, int(pos), [alleles[0], alt]))
+            reference.append(alleles[0])
+            coded.append(alt)
+            multiallelic.append(bool(n > 2))
+
+    return GenotypesBlock(variants, genotypes, reference, coded, multiallelic)
+
+
+def simulate(prefix, nb_samples, nb_variants, formats=("plink", "vcf"),
+             compression_level=6, info=True, **kwargs):
+    """Writes a random dataset in multiple formats.
+
+    Args:
+        prefix (str): The prefix of the files.
+        nb_samples (int): The number of samples.
+        nb_variants (int): The number of variants.
+        formats (list): The output formats (see 'FORMATS').
+        compression_level (int): The bgzip compression level.
+        info (bool): Also write an IMPUTE2 info file (with random INFO
+                     values) when writing IMPUTE2 files.
+        kwargs: The other arguments of 'simulate_blocks' (e.g. 'seed').
+
+    Returns:
+        dict: The number of samples and variants, and the names of the
+        files.
+
+    The files are written as the blocks are generated (hence using bounded
+    memory): '.bed', '.bim' and '.fam' for PLINK, '.impute2' or '.impute2.gz'
+    (with its index), '.sample' and '.impute2_info' for IMPUTE2, and
+    '.vcf.gz' for VCF.
+
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError("invalid formats: {}".format(", ".join(unknown)))
+
+    samples = ["sample_{}".format(i + 1) for i in range(nb_samples)]
+    files = []
+    with ExitStack() as stack:
+        writers = []
+        if "plink" in formats:
+            writers.append(_writers["plink"](prefix, samples))
+            files.extend(prefix + ext for ext in (".bed", ".bim", ".fam"))
+
+        for fmt, ext in (("impute2", ".impute2"),
+                         ("impute2-bgzip", ".impute2.gz")):
+            if fmt in formats:
+                writers.append(_writers["impute2"](
+                    prefix + ext, prefix + ".sample", samples,
+                    compression_level=compression_level,
+                ))
+                files.extend([prefix + ext, prefix + ext + ".idx",
+                              prefix + ".sample"])
+
+        if "vcf" in formats:
+            writers.append(_writers["vcf"](
+                prefix + ".vcf.gz", samples,
+                compression_level=compression_level,
+            ))
+            files.append(prefix + ".vcf.gz")
+
+        for writer in writers:
+            stack.enter_context(writer)
+
+        info_writer = None
+        if info and ("impute2" in formats or "impute2-bgzip" in formats):
+            info_writer = stack.enter_context(
+                _InfoWriter(prefix + ".impute2_info", kwargs.get("seed", 42))
+            )
+            files.append(prefix + ".impute2_info")
+
+        nb_written = 0
+        for block in simulate_blocks(nb_samples, nb_variants, **kwargs):
+            for writer in writers:
+                writer.write_block(block)
+            if info_writer is not None:
+                info_writer.write_block(block)
+            nb_written += len(block)
+            logger.debug("Simulated %d/%d variants", nb_written, nb_variants)
+
+    return {
+        "nb_samples": nb_samples,
+        "nb_variants": nb_written,
+        "files": sorted(set(files)),
+    }
+
+
+class _InfoWriter(object):
+    def __init__(self, filename, seed):
+        """Writes an IMPUTE2 info file with random INFO values."""
+        self._random = np.random.RandomState(seed)
+        self._f = open(filename, "w")
+        self._f.write("snp_id rs_id position a0 a1 exp_freq_a1 info "
+                      "certainty type info_type0 concord_type0 r2_type0\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._f.close()
+
+    def write_block(self, block):
+        with np.errstate(invalid="ignore"):
+            freq = np.nanmean(block.genotypes, axis=1) / 2
+        info = self._random.uniform(0.3, 1, size=len(block))
+        certainty = self._random.uniform(0.8, 1, size=len(block))
+        self._f.writelines(
+            "--- {} {} {} {} {:.3f} {:.3f} {:.3f} 0 -1 -1 -1\n".format(
+                v.name, v.pos, reference, coded, f, i, c,
+            ) for v, reference, coded, f, i, c in zip(
+                block.variants, block.reference, block.coded, freq, info,
+                certainty,
+            )
+        )
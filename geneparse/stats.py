@@ -0,0 +1,139 @@
+"""
+Instrumentation of the readers (I/O and decoding counters).
+"""
+
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import threading
+from time import perf_counter
+
+
+# The counters (see 'ReaderStats')
+COUNTERS = ["bytes_read", "seeks", "bgzf_blocks", "lines_parsed", "variants"]
+
+# The timed phases (see 'ReaderStats')
+PHASES = ["decompress", "decode", "parse", "index", "construct"]
+
+
+class ReaderStats(object):
+    def __init__(self, callback=None):
+        """I/O and decoding counters of a reader.
+
+        Args:
+            callback (callable): A function called on every update (see
+                                 'add_callback').
+
+        The counters are:
+
+        - 'bytes_read': the number of bytes read from the files (compressed
+          bytes for bgzip files).
+        - 'seeks': the number of random accesses (reads at a new position).
+        - 'bgzf_blocks': the number of BGZF blocks decompressed.
+        - 'lines_parsed': the number of text lines parsed.
+        - 'variants': the number of variants (Genotypes) returned.
+
+        The time spent in each phase is also accumulated (in seconds, as
+        '<phase>_seconds'): 'decompress' (BGZF blocks), 'decode' (binary
+        genotypes), 'parse' (text lines), 'index' (lookups in the index) and
+        'construct' (creation of the Variant and Genotypes instances).
+
+        The statistics can be updated concurrently by multiple threads.
+
+        """
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._values = {}
+        self.reset()
+
+        if callback is not None:
+            self.add_callback(callback)
+
+    def __repr__(self):
+        return "<ReaderStats {:,d} variants; {:,d} bytes read>".format(
+            self._values["variants"], self._values["bytes_read"],
+        )
+
+    def add_callback(self, callback):
+        """Adds a function called on every update.
+
+        Args:
+            callback (callable): A function called with the name of the
+                                 counter (e.g. 'bytes_read' or
+                                 'parse_seconds') and the increment.
+
+        The callbacks are called in the thread reading the file, so they
+        should be fast (e.g. incrementing the counters of a metrics system).
+
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """Removes a function added using 'add_callback'."""
+        self._callbacks.remove(callback)
+
+    def count(self, **counters):
+        """Increments counters (e.g. 'count(seeks=1, bytes_read=1024)')."""
+        with self._lock:
+            for name, value in counters.items():
+                self._values[name] += value
+
+        for callback in self._callbacks:
+            for name, value in counters.items():
+                callback(name, value)
+
+    def add_time(self, phase, start):
+        """Adds the time elapsed since 'start' to a phase.
+
+        Args:
+            phase (str): The phase (see 'PHASES').
+            start (float): The start of the phase (from 'time.perf_counter').
+
+        Returns:
+            float: The current time (i.e. the start of the next phase).
+
+        """
+        now = perf_counter()
+        name = phase + "_seconds"
+        with self._lock:
+            self._values[name] += now - start
+
+        for callback in self._callbacks:
+            callback(name, now - start)
+
+        return now
+
+    def snapshot(self):
+        """Returns the current values of the counters and timers (dict)."""
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        """Sets every counter and timer to zero."""
+        with self._lock:
+            self._values = dict.fromkeys(COUNTERS, 0)
+            self._values.update(
+                (phase + "_seconds", 0.0) for phase in PHASES
+            )
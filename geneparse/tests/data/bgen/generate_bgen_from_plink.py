@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+
+import re
+import zlib
+import struct
+import sqlite3
+
+import numpy as np
+import zstandard
+from pyplink import PyPlink
+
+
+CHROM_STR = {1: "01", 2: "02", 22: "22", 23: "X"}
+
+
+def create_probs_from_genotypes(genotype, phased):
+    """Creates probabilities from an additive genotype (coded allele count).
+
+    The coded allele is the second allele. Unphased data contain the first two
+    genotype probabilities (P(AA), P(AB)), while phased data contain the
+    probability of the first allele for each haplotype.
+
+    """
+    if phased:
+        return {0: (1, 1), 1: (1, 0), 2: (0, 0), -1: (0, 0)}[genotype]
+    return {0: (1, 0), 1: (0, 1), 2: (0, 0), -1: (0, 0)}[genotype]
+
+
+def pack_values(values, nbits):
+    """Packs probabilities using 'nbits' bits per value (little endian)."""
+    values = np.round(np.array(values) * (2 ** nbits - 1)).astype(np.uint64)
+    bits = ((values[:, None] >> np.arange(nbits, dtype=np.uint64)) & 1)
+    return np.packbits(bits.astype(np.uint8).ravel(), bitorder="little")\
+        .tobytes()
+
+
+def compress(data, compression):
+    if compression == 1:
+        return zlib.compress(data)
+    if compression == 2:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def variant_block(layout, compression, nbits, phased, name, chrom, pos, a1,
+                  a2, genotypes):
+    n = len(genotypes)
+
+    # The variant identifying data
+    block = b""
+    if layout == 1:
+        block += struct.pack("<I", n)
+    for s in (name, name, chrom):
+        block += struct.pack("<H", len(s)) + s.encode()
+    block += struct.pack("<I", pos)
+    if layout == 2:
+        block += struct.pack("<H", 2)
+    for allele in (a1, a2):
+        block += struct.pack("<I", len(allele)) + allele.encode()
+
+    # The genotype data
+    if layout == 1:
+        probs = [
+            {0: (1, 0, 0), 1: (0, 1, 0), 2: (0, 0, 1), -1: (0, 0, 0)}[g]
+            for g in genotypes
+        ]
+        data = np.array(probs, dtype="<u2").ravel() * 32768
+        data = data.astype("<u2").tobytes()
+        if compression:
+            data = compress(data, compression)
+            return block + struct.pack("<I", len(data)) + data
+        return block + data
+
+    ploidy = bytes([0x82 if g == -1 else 0x02 for g in genotypes])
+    values = [v for g in genotypes
+              for v in create_probs_from_genotypes(g, phased)]
+    data = (struct.pack("<IHBB", n, 2, 2, 2) + ploidy +
+            struct.pack("<BB", int(phased), nbits) +
+            pack_values(values, nbits))
+
+    if compression:
+        compressed = compress(data, compression)
+        return (block + struct.pack("<II", len(compressed) + 4, len(data)) +
+                compressed)
+    return block + struct.pack("<I", len(data)) + data
+
+
+def write_bgen(fn, bed, layout, compression, nbits=8, phased=False,
+               sample_ids=True, bgi=False):
+    fam = bed.get_fam()
+    bim = bed.get_bim()
+
+    # The sample identifier block
+    sample_block = b""
+    if sample_ids:
+        for iid in fam.iid:
+            sample_block += struct.pack("<H", len(iid)) + iid.encode()
+        sample_block = struct.pack("<II", len(sample_block) + 8,
+                                   len(fam)) + sample_block
+
+    # The header block
+    flags = compression | (layout << 2) | (int(sample_ids) << 31)
+    header = struct.pack("<IIII", 20, bim.shape[0], fam.shape[0], 0)
+    header = header[:12] + b"bgen" + struct.pack("<I", flags)
+
+    index = []
+    with open(fn, "wb") as f:
+        f.write(struct.pack("<I", len(header) + len(sample_block)))
+        f.write(header)
+        f.write(sample_block)
+
+        for v, genotypes in bed.iter_geno():
+            info = bim.loc[v, :]
+            r = re.search(r"(:dup[0-9]+)$", v)
+            if r:
+                v = v.replace(r.group(1), "")
+
+            start = f.tell()
+            f.write(variant_block(
+                layout, compression, nbits, phased, v, CHROM_STR[info.chrom],
+                info.pos, info.a2, info.a1, genotypes,
+            ))
+            index.append((CHROM_STR[info.chrom], int(info.pos), v, 2,
+                          info.a2, info.a1, start, f.tell() - start))
+
+    if bgi:
+        with sqlite3.connect(fn + ".bgi") as conn:
+            conn.execute(
+                "CREATE TABLE Variant (chromosome TEXT NOT NULL, position INT "
+                "NOT NULL, rsid TEXT NOT NULL, number_of_alleles INT NOT NULL, "
+                "allele1 TEXT NOT NULL, allele2 TEXT NULL, file_start_position "
+                "INT NOT NULL, size_in_bytes INT NOT NULL, PRIMARY KEY "
+                "(chromosome, position, rsid, allele1, allele2, "
+                "file_start_position)) WITHOUT ROWID"
+            )
+            conn.executemany(
+                "INSERT INTO Variant VALUES (?, ?, ?, ?, ?, ?, ?, ?)", index,
+            )
+
+
+with PyPlink("../plink/btest") as bed:
+    write_bgen("bgen_test.bgen", bed, layout=2, compression=1, bgi=True)
+    write_bgen("bgen_test_zstd.bgen", bed, layout=2, compression=2, nbits=10,
+               sample_ids=False)
+    write_bgen("bgen_test_phased.bgen", bed, layout=2, compression=0,
+               nbits=16, phased=True)
+    write_bgen("bgen_test_layout1.bgen", bed, layout=1, compression=1)
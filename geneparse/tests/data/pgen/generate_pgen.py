@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+
+import re
+import struct
+import shutil
+
+import numpy as np
+import pgenlib
+from pyplink import PyPlink
+
+
+CHROM_STR = {1: "1", 2: "2", 22: "22", 23: "X"}
+
+
+def write_pvar(fn, variants):
+    with open(fn, "w") as f:
+        f.write("##fileformat=PVARv1.0\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\n")
+        for chrom, pos, name, ref, alt in variants:
+            f.write("{}\t{}\t{}\t{}\t{}\n".format(chrom, pos, name, ref, alt))
+
+
+def write_psam(fn, samples):
+    with open(fn, "w") as f:
+        f.write("#IID\tSEX\n")
+        for sample in samples:
+            f.write("{}\tNA\n".format(sample))
+
+
+def pack_codes(genotypes):
+    """Packs hard calls using the PLINK 2 codes (3 is missing)."""
+    codes = np.where(genotypes < 0, 3, genotypes).astype(np.uint8)
+    codes = np.concatenate((codes, np.zeros(-len(codes) % 4, np.uint8)))
+    codes = codes.reshape(-1, 4)
+    return (codes[:, 0] | codes[:, 1] << 2 | codes[:, 2] << 4 |
+            codes[:, 3] << 6).astype(np.uint8).tobytes()
+
+
+def write_fixed_width(fn, genotypes, dosages=False):
+    """Writes a fixed-width PGEN file (mode 0x02 or 0x03)."""
+    nb_variants, nb_samples = genotypes.shape
+    with open(fn, "wb") as f:
+        f.write(b"l\x1b" + bytes([0x03 if dosages else 0x02]))
+        f.write(struct.pack("<IIB", nb_variants, nb_samples, 0))
+        for g in genotypes:
+            f.write(pack_codes(g))
+            if dosages:
+                values = np.where(g < 0, 65535, g * 16384).astype("<u2")
+                f.write(values.tobytes())
+
+
+def write_btest(bed):
+    bim = bed.get_bim()
+    fam = bed.get_fam()
+
+    variants = []
+    genotypes = []
+    for name, geno in bed.iter_geno():
+        info = bim.loc[name, :]
+        variants.append((CHROM_STR[info.chrom], info.pos,
+                         re.sub(r":dup[0-9]+$", "", name), info.a2, info.a1))
+        genotypes.append(geno)
+    genotypes = np.array(genotypes, dtype=np.int8)
+
+    for prefix in ("pgen_test", "pgen_test_fixed", "pgen_test_dosage",
+                   "pgen_test_bed"):
+        write_pvar(prefix + ".pvar", variants)
+        write_psam(prefix + ".psam", fam.iid)
+
+    # The variable-width mode
+    with pgenlib.PgenWriter(b"pgen_test.pgen", len(fam),
+                            variant_ct=len(variants),
+                            nonref_flags=False) as writer:
+        for g in genotypes:
+            writer.append_biallelic(np.where(g < 0, -9, g).astype(np.int8))
+
+    # The fixed-width modes
+    write_fixed_width("pgen_test_fixed.pgen", genotypes)
+    write_fixed_width("pgen_test_dosage.pgen", genotypes, dosages=True)
+
+    # A PLINK 1 BED file
+    shutil.copyfile(bed.bed_filename, "pgen_test_bed.pgen")
+
+
+def write_synthetic(nb_samples=1000, seed=42):
+    """Writes variants using the different record types (and dosages).
+
+    The expected genotypes (read using pgenlib) are saved along the files.
+
+    """
+    rng = np.random.RandomState(seed)
+
+    def hardcalls(maf, missing=0.0):
+        g = rng.binomial(2, maf, nb_samples).astype(np.int8)
+        g[rng.rand(nb_samples) < missing] = -9
+        return g
+
+    def mutate(g, n):
+        g = g.copy()
+        g[rng.choice(nb_samples, n, replace=False)] = rng.randint(0, 3, n)
+        return g
+
+    common = hardcalls(0.3, missing=0.01)
+    records = [
+        ("hardcalls", common),
+        ("hardcalls", mutate(common, 10)),                  # LD compressed
+        ("hardcalls", np.where(common < 0, -9, 2 - mutate(common, 5))),
+        ("hardcalls", hardcalls(0.005)),                    # difflist (0)
+        ("hardcalls", np.where(rng.rand(nb_samples) < 0.99, -9,
+                               1).astype(np.int8)),         # difflist (3)
+        ("hardcalls", np.where(rng.rand(nb_samples) < 0.99, 2,
+                               0).astype(np.int8)),         # difflist (2)
+        ("hardcalls", np.zeros(nb_samples, dtype=np.int8)),
+        ("hardcalls", rng.binomial(1, 0.4, nb_samples).astype(np.int8)),
+        ("hardcalls", hardcalls(0.45, missing=0.1)),
+        ("phased", 0.2),
+        ("phased", 0.4),
+        ("partially_phased", 0.3),
+        ("dosages", 1.0),                                   # all samples
+        ("dosages", 0.3),                                   # bit array
+        ("dosages", 0.01),                                  # dosage list
+        ("hardcalls", mutate(common, 100)),                 # 2 groups
+        ("hardcalls", hardcalls(0.04)),                     # 2 groups
+    ]
+
+    variants = []
+    with pgenlib.PgenWriter(b"pgen_synthetic.pgen", nb_samples,
+                            variant_ct=len(records), nonref_flags=False,
+                            hardcall_phase_present=True,
+                            dosage_present=True) as writer:
+        for i, (kind, value) in enumerate(records):
+            variants.append(("1", 10000 + 10 * i, "syn{}".format(i), "A", "G"))
+
+            if kind == "hardcalls":
+                writer.append_biallelic(value)
+
+            elif kind in {"phased", "partially_phased"}:
+                alleles = rng.binomial(1, value, 2 * nb_samples)
+                alleles = alleles.astype(np.int32)
+                alleles[:20] = -9
+                if kind == "phased":
+                    writer.append_alleles(alleles, all_phased=True)
+                else:
+                    phasepresent = rng.binomial(1, 0.5, nb_samples)
+                    writer.append_partially_phased(
+                        alleles, phasepresent.astype(np.uint8),
+                    )
+
+            else:
+                dosages = rng.binomial(2, 0.3, nb_samples).astype(np.float32)
+                fractional = rng.rand(nb_samples) < value
+                dosages[fractional] = rng.uniform(0, 2, fractional.sum())
+                dosages[rng.rand(nb_samples) < 0.02] = -9
+                writer.append_dosages(dosages)
+
+    write_pvar("pgen_synthetic.pvar", variants)
+    write_psam("pgen_synthetic.psam",
+               ["sample_{}".format(i + 1) for i in range(nb_samples)])
+
+    # The expected genotypes
+    reader = pgenlib.PgenReader(b"pgen_synthetic.pgen")
+    expected = np.empty((len(records), nb_samples), dtype=np.float32)
+    for i in range(len(records)):
+        reader.read_dosages(i, expected[i])
+    reader.close()
+    expected[expected == -9] = np.nan
+    np.savez_compressed("pgen_synthetic.expected.npz", genotypes=expected)
+
+
+with PyPlink("../plink/btest") as bed:
+    write_btest(bed)
+
+write_synthetic()
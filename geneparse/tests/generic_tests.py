@@ -27,7 +27,52 @@ Abstract tests for container implementations.
 # THE SOFTWARE.
 
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pkg_resources import resource_filename
+
 from . import truth
+from ..filters import VariantFilter
+from ..utils import strip_dup_name
+
+
+# The PLINK and IMPUTE2 test files (see 'truth')
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+IMPUTE2_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.impute2.gz"),
+)
+IMPUTE2_SAMPLE_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.sample"),
+)
+
+
+def reader_factory(reader_class, *args, setup=None):
+    """Creates the function opening a reader (see 'TestContainer').
+
+    Args:
+        reader_class (type): The GenotypesReader class.
+        args: The arguments of the reader.
+        setup (callable): Called on the new reader (e.g. to enable the cache
+                          or the statistics).
+
+    Returns:
+        callable: The function returning a new reader (set as '.reader_f').
+
+    """
+    def reader_f(*_):
+        reader = reader_class(*args)
+        if setup is not None:
+            setup(reader)
+        return reader
+
+    return reader_f
 
 
 class TestContainer(object):
@@ -68,6 +113,131 @@ class TestContainer(object):
                 expected = truth.genotypes[truth.variant_to_key[g.variant]]
                 self.assertEqual(expected, g)
 
+    def test_iter_blocks(self):
+        """Test that the genotypes are read correctly by blocks"""
+        with self.reader_f() as f:
+            blocks = list(f.iter_blocks(block_size=2))
+            for block in blocks:
+                self.assertLessEqual(len(block), 2)
+                self.assertEqual(block.genotypes.shape[0], len(block))
+                for g in block.iter_genotypes():
+                    expected = truth.genotypes[truth.variant_to_key[g.variant]]
+                    self.assertEqual(expected, g)
+
+            self.assertEqual(
+                sum(len(block) for block in blocks),
+                len(list(f.iter_genotypes())),
+            )
+
+    def test_iter_range(self):
+        """Test iterating over a range of variants."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+            for start, stop in ((0, 5), (1, 4), (3, 3), (4, 10)):
+                observed = list(f.iter_range(start, stop))
+                self.assertEqual(observed, expected[start:stop])
+
+                blocks = list(f.iter_range_blocks(start, stop, 2))
+                self.assertEqual(
+                    [g for block in blocks for g in block.iter_genotypes()],
+                    expected[start:stop],
+                )
+
+    def test_shard(self):
+        """Test that shards cover all variants, without overlap."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+            nb_multiallelic = sum(g.variant.pos == 16615065 for g in expected)
+            for n in range(1, 7):
+                shards = [f.shard(k, n) for k in range(n)]
+                observed = []
+                for shard in shards:
+                    genotypes = list(shard.iter_genotypes())
+                    self.assertEqual(len(genotypes),
+                                     shard.get_number_variants())
+
+                    # The multiallelic variants are never split
+                    self.assertIn(
+                        sum(g.variant.pos == 16615065 for g in genotypes),
+                        (0, nb_multiallelic),
+                    )
+                    observed.extend(genotypes)
+
+                self.assertEqual(observed, expected)
+
+    def test_invalid_shard(self):
+        """Test asking for a shard that does not exist."""
+        with self.reader_f() as f:
+            for k, n in ((2, 2), (-1, 2), (0, 0)):
+                with self.assertRaises(ValueError):
+                    f.shard_range(k, n)
+
+    def test_filter_variant_information(self):
+        """Test filtering variants using the index (regions and names)."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+
+            variant_filter = VariantFilter(
+                regions=[("chr22", 1, 20000000), ("X", 1, 89932529)],
+            )
+            filtered = f.filter(variant_filter)
+            self.assertEqual(
+                list(filtered.iter_genotypes()),
+                [g for g in expected if g.variant.chrom in ("22", "X")],
+            )
+            self.assertEqual(
+                [b for block in filtered.iter_blocks(2)
+                 for b in block.iter_genotypes()],
+                [g for g in expected if g.variant.chrom in ("22", "X")],
+            )
+
+            names = {"rs785467", "rs9628434"}
+            filtered = f.filter(VariantFilter(names=names))
+            observed = list(filtered.iter_genotypes())
+            self.assertEqual(
+                observed,
+                [g for g in expected
+                 if strip_dup_name(g.variant.name) in names],
+            )
+            self.assertEqual(len(observed), filtered.get_number_variants())
+
+            filtered = f.filter(VariantFilter(names=[], regions=[]))
+            self.assertEqual([], list(filtered.iter_genotypes()))
+
+    def test_filter_genotypes(self):
+        """Test filtering variants using the genotypes (MAF, missing)."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+
+            filtered = f.filter(VariantFilter(min_maf=0.3))
+            self.assertEqual(
+                list(filtered.iter_genotypes()),
+                [g for g in expected if g.maf() >= 0.3],
+            )
+
+            filtered = f.filter(VariantFilter(max_missing=0))
+            self.assertEqual(
+                list(filtered.iter_genotypes()),
+                [g for g in expected if not np.isnan(g.genotypes).any()],
+            )
+
+    def test_get_sample_genotypes(self):
+        """Test getting the genotypes of some samples."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+            samples = list(f.get_samples())
+
+            block = f.get_sample_genotypes([samples[3], samples[0]])
+            self.assertEqual(block.genotypes.shape, (len(expected), 2))
+            for g, e in zip(block.iter_genotypes(), expected):
+                self.assertEqual(g.variant, e.variant)
+                self.assertEqual((g.reference, g.coded),
+                                 (e.reference, e.coded))
+                np.testing.assert_array_equal(g.genotypes, e.genotypes[[3, 0]])
+
+            with self.assertRaises(ValueError):
+                f.get_sample_genotypes(["unknown_sample"])
+
     def test_multiallelic_identifier(self):
         """Test that the multiallelic flag gets set when iterating"""
         with self.reader_f() as f:
@@ -189,3 +359,14 @@ class TestContainer(object):
 
             for g, e in zip(r, (expected_1, expected_2)):
                 self.assertEqual(e, g)
+
+    def test_concurrent_get_variant_by_name(self):
+        """Test getting variants by name from multiple threads."""
+        names = ["rs785467", "rs146589823", "rs140543381"] * 50
+        with self.reader_f() as f:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(f.get_variant_by_name, names))
+
+        for name, g in zip(names, results):
+            self.assertEqual(len(g), 1)
+            self.assertEqual(g[0], truth.genotypes[name])
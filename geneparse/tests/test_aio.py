@@ -0,0 +1,168 @@
+"""
+Tests for the asyncio reader facade.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import time
+import asyncio
+import unittest
+import logging
+
+from pkg_resources import resource_filename
+
+from . import truth
+from .. import plink
+from ..aio import AsyncGenotypesReader
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class _CountingReader(plink.PlinkReader):
+    """Counts the number of (synchronous) lookups by name."""
+    def __init__(self, prefix):
+        super().__init__(prefix)
+        self.nb_lookups = 0
+
+    def get_variant_by_name(self, name):
+        self.nb_lookups += 1
+        return super().get_variant_by_name(name)
+
+
+class _SlowReader(plink.PlinkReader):
+    """Records the end of the (slow) lookups and the closing of the reader."""
+    def __init__(self, prefix):
+        super().__init__(prefix)
+        self.events = []
+
+    def get_variant_by_name(self, name):
+        time.sleep(0.1)
+        genotypes = super().get_variant_by_name(name)
+        self.events.append("lookup")
+        return genotypes
+
+    def close(self):
+        self.events.append("close")
+        super().close()
+
+
+class TestAsyncReader(unittest.TestCase):
+    def setUp(self):
+        self.reader = AsyncGenotypesReader(
+            plink.PlinkReader(PLINK_PREFIX), max_workers=2,
+        )
+
+    def tearDown(self):
+        asyncio.run(self.reader.close())
+
+    def test_get_variant_by_name(self):
+        """Test getting a variant by name asynchronously."""
+        g = asyncio.run(self.reader.get_variant_by_name("rs146589823"))
+        self.assertEqual(len(g), 1)
+        self.assertEqual(g[0], truth.genotypes["rs146589823"])
+
+    def test_get_variant_genotypes(self):
+        """Test getting a variant asynchronously."""
+        g = asyncio.run(self.reader.get_variant_genotypes(
+            truth.variants["rs785467"]
+        ))
+        self.assertEqual(len(g), 1)
+        self.assertEqual(g[0], truth.genotypes["rs785467"])
+
+    def test_get_variants_in_region(self):
+        """Test getting a region asynchronously."""
+        g = asyncio.run(self.reader.get_variants_in_region(
+            "1", 46521558, 46521560,
+        ))
+        self.assertEqual(len(g), 1)
+        self.assertEqual(g[0], truth.genotypes["rs785467"])
+
+    def test_async_iteration(self):
+        """Test iterating over genotypes using 'async for'."""
+        async def collect():
+            return [g async for g in self.reader]
+
+        genotypes = asyncio.run(collect())
+        self.assertEqual(len(genotypes), 5)
+        for g in genotypes:
+            expected = truth.genotypes[truth.variant_to_key[g.variant]]
+            self.assertEqual(expected, g)
+
+    def test_samples(self):
+        """Test getting the samples asynchronously."""
+        self.assertEqual(truth.samples, asyncio.run(self.reader.get_samples()))
+        self.assertEqual(5, asyncio.run(self.reader.get_number_samples()))
+        self.assertEqual(5, asyncio.run(self.reader.get_number_variants()))
+
+
+class TestAsyncReaderCoalescing(unittest.TestCase):
+    def test_coalesce_duplicate_requests(self):
+        """Test that identical concurrent requests are coalesced."""
+        reader = _CountingReader(PLINK_PREFIX)
+
+        async def query():
+            async with AsyncGenotypesReader(reader) as async_reader:
+                return await asyncio.gather(*[
+                    async_reader.get_variant_by_name("rs785467")
+                    for _ in range(20)
+                ])
+
+        results = asyncio.run(query())
+        self.assertEqual(reader.nb_lookups, 1)
+        self.assertEqual(len(results), 20)
+
+        # Every caller gets its own copy
+        results[0][0].flip()
+        for g in results[1:]:
+            self.assertEqual(g[0].coded, "T")
+            self.assertEqual(g[0], truth.genotypes["rs785467"])
+
+
+class TestAsyncReaderClose(unittest.TestCase):
+    def test_close_waits_for_queries(self):
+        """Test that the reader is closed after the running queries."""
+        reader = _SlowReader(PLINK_PREFIX)
+
+        async def query():
+            async_reader = AsyncGenotypesReader(reader)
+            task = asyncio.ensure_future(
+                async_reader.get_variant_by_name("rs785467"),
+            )
+            await asyncio.sleep(0.01)
+            await async_reader.close()
+            return await task
+
+        self.assertEqual(len(asyncio.run(query())), 1)
+        self.assertEqual(reader.events, ["lookup", "close"])
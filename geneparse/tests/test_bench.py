@@ -0,0 +1,91 @@
+"""
+Tests for the benchmark runner.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+from .. import bench
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestBench(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_main(self):
+        """Test running the benchmarks and comparing the results."""
+        output = os.path.join(self.tmp_dir.name, "bench.json")
+        data_dir = os.path.join(self.tmp_dir.name, "data")
+        bench.main([
+            "--scales", "tiny", "--formats", "plink", "impute2-bgzip",
+            "dataframe", "--repeats", "1", "--nb-queries", "5",
+            "--data-dir", data_dir, "-o", output,
+        ])
+
+        with open(output) as f:
+            report = json.load(f)
+
+        results = {(r["format"], r["benchmark"]): r
+                   for r in report["results"]}
+        self.assertEqual(len(results), len(report["results"]))
+
+        # Every benchmark is run (the index is only built for IMPUTE2)
+        self.assertEqual(
+            {benchmark for fmt, benchmark in results if fmt == "plink"},
+            set(bench.BENCHMARKS) - {"index_build"},
+        )
+        self.assertIn(("impute2-bgzip", "index_build"), results)
+
+        # The import time of geneparse
+        self.assertEqual(results["geneparse", "import"]["scale"], "-")
+
+        result = results["plink", "iter_genotypes"]
+        self.assertEqual(result["nb_variants"], bench.SCALES["tiny"][1])
+        self.assertEqual(result["nb_operations"], bench.SCALES["tiny"][1])
+        self.assertGreater(result["seconds"], 0)
+
+        # The dataset is reused
+        self.assertTrue(os.path.isfile(
+            os.path.join(data_dir, "tiny_seed42", "COMPLETE")
+        ))
+
+        # Comparing with itself
+        table = bench.compare(report, report)
+        self.assertEqual(table.shape[0],
+                         sum("seconds" in r for r in report["results"]))
+        self.assertTrue((table.ratio == 1).all())
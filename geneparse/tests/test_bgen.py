@@ -0,0 +1,147 @@
+"""
+Tests for the BGEN reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import shutil
+import struct
+import sqlite3
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from . import truth
+from .generic_tests import TestContainer
+from .. import bgen, parsers
+
+
+logging.disable(logging.CRITICAL)
+
+
+def _get_bgen(filename):
+    return resource_filename(__name__, os.path.join("data", "bgen", filename))
+
+
+BGEN_FILE = _get_bgen("bgen_test.bgen")
+SAMPLE_FILE = _get_bgen("bgen_test.sample")
+
+
+class TestBgen(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: bgen.BgenReader(BGEN_FILE)
+
+    def test_registered(self):
+        """Test that the reader is registered in the parsers."""
+        self.assertIs(parsers["bgen"], bgen.BgenReader)
+
+    def test_sample_file(self):
+        """Test that the sample file takes precedence."""
+        with bgen.BgenReader(BGEN_FILE, sample_filename=SAMPLE_FILE) as f:
+            self.assertEqual(f.get_samples(), truth.samples)
+
+    def test_probability_threshold(self):
+        """Test that no value is set to missing without a threshold."""
+        with bgen.BgenReader(BGEN_FILE, probability_threshold=0) as f:
+            for g in f.iter_genotypes():
+                expected = truth.genotypes[truth.variant_to_key[g.variant]]
+                np.testing.assert_array_equal(expected.genotypes, g.genotypes)
+
+    def test_index_without_rsid(self):
+        """Test that the index falls back to the variant ID without rsid."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            filename = os.path.join(tmp_dir, "bgen_test.bgen")
+            shutil.copyfile(BGEN_FILE, filename)
+            shutil.copyfile(BGEN_FILE + ".bgi", filename + ".bgi")
+
+            conn = sqlite3.connect(filename + ".bgi")
+            with conn:
+                conn.execute("UPDATE Variant SET rsid = '.' "
+                             "WHERE file_start_position = 77")
+            conn.close()
+
+            with bgen.BgenReader(filename) as f:
+                variants = f.get_variant_by_name("rs785467")
+                self.assertEqual(1, len(variants))
+                self.assertEqual(truth.variants["rs785467"],
+                                 variants[0].variant)
+
+    def test_multiallelic_dosage(self):
+        """Test that the dosage of a multi-allelic variant is not computed."""
+        data = struct.pack("<IHBB", 1, 3, 2, 2)
+        with self.assertRaises(ValueError):
+            bgen._layout_2_dosage(data, 0)
+
+
+class TestBgenNoIndex(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Copying the BGEN file without its index (the file is scanned)
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.filename = os.path.join(cls.tmp_dir.name, "bgen_test.bgen")
+        shutil.copyfile(BGEN_FILE, cls.filename)
+
+        cls.reader_f = lambda x: bgen.BgenReader(cls.filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_no_sample(self):
+        """Test a BGEN file without sample identifiers nor sample file."""
+        with self.assertRaises(ValueError):
+            bgen.BgenReader(_get_bgen("bgen_test_zstd.bgen"))
+
+
+@unittest.skipIf(not bgen.HAS_ZSTD, "requires zstandard")
+class TestBgenZstd(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: bgen.BgenReader(
+            _get_bgen("bgen_test_zstd.bgen"), sample_filename=SAMPLE_FILE,
+        )
+
+
+class TestBgenPhased(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: bgen.BgenReader(
+            _get_bgen("bgen_test_phased.bgen"), sample_filename=SAMPLE_FILE,
+        )
+
+
+class TestBgenLayout1(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: bgen.BgenReader(
+            _get_bgen("bgen_test_layout1.bgen"), sample_filename=SAMPLE_FILE,
+        )
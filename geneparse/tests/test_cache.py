@@ -0,0 +1,159 @@
+"""
+Tests for the cache of decoded genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import unittest
+import logging
+
+import numpy as np
+
+from . import truth
+from .generic_tests import (TestContainer, reader_factory, PLINK_PREFIX,
+                            IMPUTE2_FN, IMPUTE2_SAMPLE_FN)
+from .. import plink, impute2
+from ..cache import GenotypesCache
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestCachedPlink(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            plink.PlinkReader, PLINK_PREFIX,
+            setup=lambda reader: reader.enable_cache(max_bytes=1024 ** 2),
+        )
+
+    def test_repeated_lookups(self):
+        """Test that repeated lookups are decoded once."""
+        with self.reader_f() as f:
+            for _ in range(3):
+                g = f.get_variant_by_name("rs785467")[0]
+                self.assertEqual(g, truth.genotypes["rs785467"])
+
+            stats = f.get_cache_stats()
+            self.assertEqual(stats["misses"], 1)
+            self.assertEqual(stats["hits"], 2)
+
+            # Same variant, queried by locus
+            f.get_variant_genotypes(truth.variants["rs785467"])
+            self.assertEqual(f.get_cache_stats()["hits"], 3)
+
+    def test_flip_cached(self):
+        """Test that flipping does not change the cached genotypes."""
+        with self.reader_f() as f:
+            g = f.get_variant_by_name("rs785467")[0]
+            g.flip()
+            with self.assertRaises(ValueError):
+                f.get_variant_by_name("rs785467")[0].genotypes[0] = 1
+
+            g = f.get_variant_by_name("rs785467")[0]
+            self.assertEqual(g.coded, "T")
+            self.assertEqual(g, truth.genotypes["rs785467"])
+
+    def test_disable_cache(self):
+        """Test disabling the cache."""
+        with self.reader_f() as f:
+            f.disable_cache()
+            self.assertIsNone(f.get_cache_stats())
+            g = f.get_variant_by_name("rs785467")[0]
+            self.assertTrue(g.genotypes.flags.writeable)
+
+
+class TestCachedImpute2(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            impute2.Impute2Reader, IMPUTE2_FN, IMPUTE2_SAMPLE_FN,
+            setup=lambda reader: reader.enable_cache(max_bytes=1024 ** 2),
+        )
+
+    def test_repeated_lookups(self):
+        """Test that repeated lookups are parsed once."""
+        with self.reader_f() as f:
+            for _ in range(3):
+                r = f.get_variant_by_name("rs9628434")
+                self.assertEqual(len(r), 2)
+
+            stats = f.get_cache_stats()
+            self.assertEqual(stats["misses"], 2)
+            self.assertEqual(stats["hits"], 4)
+
+            # The duplicated names are restored for every copy
+            names = {g.variant.name for g in r}
+            self.assertEqual(names, {"rs9628434:dup1", "rs9628434:dup2"})
+
+
+class TestGenotypesCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        """Test that the least recently used entries are evicted."""
+        a = np.zeros(100)
+        cache = GenotypesCache(max_bytes=3 * (a.nbytes + 256))
+        for key in range(3):
+            cache.put(key, a)
+
+        # Using the first entry, and adding a new one
+        self.assertIsNotNone(cache.get(0))
+        cache.put(3, a)
+
+        self.assertIsNone(cache.get(1))
+        for key in (0, 2, 3):
+            self.assertIsNotNone(cache.get(key))
+
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 3)
+        self.assertLessEqual(stats["nbytes"], stats["max_bytes"])
+
+    def test_too_large(self):
+        """Test that values larger than the budget are not cached."""
+        cache = GenotypesCache(max_bytes=100)
+        value = cache.put("key", np.zeros(100))
+        self.assertEqual(value.shape, (100, ))
+        self.assertEqual(len(cache), 0)
+
+    def test_read_only(self):
+        """Test that cached values are read-only."""
+        cache = GenotypesCache(max_bytes=1024 ** 2)
+        g = cache.get_or_decode(
+            "key", lambda: truth.genotypes["rs785467"].copy(),
+        )
+        with self.assertRaises(ValueError):
+            g.genotypes[0] = 2
+
+        # Changing the alleles of the copy does not affect the cache
+        g.flip()
+        self.assertEqual(cache.get("key").coded, "T")
+        self.assertTrue(truth.genotypes["rs785467"].genotypes.flags.writeable)
+
+    def test_invalid_budget(self):
+        """Test that the budget should be positive."""
+        with self.assertRaises(ValueError):
+            GenotypesCache(max_bytes=0)
@@ -0,0 +1,188 @@
+"""
+Tests for the streaming conversion.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import gzip
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .generic_tests import TestContainer
+from ..core import GenotypesBlock, Variant
+from .. import convert, native, plink, vcf
+from ..__main__ import main
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class TestConvertNative(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.path = os.path.join(cls.tmp_dir.name, "native")
+
+        # Blocks are rebatched to the chunk size of the native format
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            cls.stats = convert.convert(
+                reader,
+                lambda samples, chrom: native.NativeWriter(
+                    cls.path, samples, chunk_size=2,
+                ),
+                block_size=2, threads=3, max_pending=1,
+            )
+
+        cls.reader_f = lambda x: native.NativeReader(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_stats(self):
+        """Test the conversion statistics."""
+        self.assertEqual(self.stats["nb_variants"], 5)
+        self.assertEqual(self.stats["nb_samples"], 5)
+        self.assertEqual(self.stats["nb_blocks"], 3)
+
+
+class TestConvert(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_split_chromosomes(self):
+        """Test writing one dataset per chromosome, with a sample subset."""
+        samples = ["SAMPLE3", "SAMPLE1"]
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            expected = [
+                (g.variant.chrom, g.genotypes[[2, 0]])
+                for g in reader.iter_genotypes()
+            ]
+            self.assertEqual(reader.get_samples()[2], "SAMPLE3")
+
+            convert.convert(
+                reader,
+                lambda samples, chrom: plink.PlinkWriter(
+                    self._path("chr" + chrom), samples,
+                ),
+                block_size=3, threads=2, read_ahead=0, samples=samples,
+                split_chromosomes=True,
+            )
+
+        observed = []
+        for chrom in ("1", "2", "22", "X"):
+            with plink.PlinkReader(self._path("chr" + chrom)) as reader:
+                self.assertEqual(reader.get_samples(), samples)
+                observed.extend(
+                    (g.variant.chrom, g.genotypes)
+                    for g in reader.iter_genotypes()
+                )
+
+        self.assertEqual(len(observed), len(expected))
+        for (chrom, genotypes), (exp_chrom, exp_genotypes) in zip(observed,
+                                                                  expected):
+            self.assertEqual(chrom, exp_chrom)
+            np.testing.assert_array_equal(genotypes, exp_genotypes)
+
+    def test_unknown_samples(self):
+        """Test keeping samples which are not in the dataset."""
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            with self.assertRaises(ValueError):
+                convert.convert(reader, None, samples=["SAMPLE1", "x"])
+
+    def test_encoding_error(self):
+        """Test that errors raised by the encoding threads are propagated."""
+        class Writer(vcf.VCFWriter):
+            def encode_block(self, block):
+                raise ZeroDivisionError()
+
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            with self.assertRaises(ZeroDivisionError):
+                convert.convert(
+                    reader,
+                    lambda samples, chrom: Writer(self._path("x.vcf"),
+                                                  samples),
+                    block_size=1, threads=2,
+                )
+
+    def test_rebatch_blocks(self):
+        """Test regrouping blocks in blocks of a fixed size."""
+        def _block(start, n):
+            return GenotypesBlock(
+                [Variant("rs{}".format(i), "1", i + 1, ["A", "C"])
+                 for i in range(start, start + n)],
+                np.arange(start, start + n, dtype=float)[:, np.newaxis],
+                ["A"] * n, ["C"] * n, [False] * n,
+            )
+
+        blocks = list(convert.rebatch_blocks(
+            [_block(0, 3), _block(3, 1), _block(4, 5)], 2,
+        ))
+        self.assertEqual([len(block) for block in blocks], [2, 2, 2, 2, 1])
+        np.testing.assert_array_equal(
+            np.vstack([block.genotypes for block in blocks])[:, 0],
+            np.arange(9),
+        )
+        self.assertEqual(blocks[1].variants[1].name, "rs3")
+
+    def test_main(self):
+        """Test the command line interface."""
+        main(["convert", "plink", "prefix=" + PLINK_PREFIX, "-t", "vcf",
+              "-o", self._path("out"), "--threads", "2", "--block-size",
+              "2"])
+
+        with gzip.open(self._path("out.vcf.gz"), "rt") as f:
+            lines = [line for line in f if not line.startswith("#")]
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0].split("\t")[:5],
+                         ["1", "46521559", "rs785467", "A", "T"])
+
+    def test_main_existing_chromosome(self):
+        """Test that an existing native output of a chromosome is kept."""
+        os.makedirs(self._path("out_1"))
+        with self.assertRaises(ValueError) as cm:
+            main(["convert", "plink", "prefix=" + PLINK_PREFIX, "-t",
+                  "native", "-o", self._path("out_{chrom}")])
+        self.assertIn("out_1: already exists", str(cm.exception))
+        self.assertEqual(os.listdir(self._path("out_1")), [])
@@ -25,3 +25,403 @@ Tests for the core data structures.
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
+
+
+import os
+import gzip
+import shutil
+import sys
+import pickle
+import unittest
+import logging
+import subprocess
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+from pkg_resources import resource_filename
+
+from .. import parsers, writers, plink, impute2, convert, _LazyRegistry
+from ..core import (Variant, ImputedVariant, Genotypes, GenotypesBlock,
+                    MergedSamplesReader)
+from ..dataframe import DataFrameReader
+
+
+logging.disable(logging.CRITICAL)
+
+
+IMPUTE2_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.impute2.gz"),
+)
+IMPUTE2_SAMPLE_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.sample"),
+)
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class TestImputedVariant(unittest.TestCase):
+    def test_quality(self):
+        """Test the quality of imputed variants."""
+        for quality in (0, 0.5, 1):
+            v = ImputedVariant("rs1", 1, 123, "AC", quality)
+            self.assertEqual(v.quality, quality)
+
+        for quality in (-0.1, 1.1, float("nan")):
+            with self.assertRaises(ValueError):
+                ImputedVariant("rs1", 1, 123, "AC", quality)
+
+    def test_copy(self):
+        """Test that copies keep the type and the additional fields."""
+        v = ImputedVariant("rs1", "chr1", 123, "AC", 0.8)
+        copy = v.copy()
+        self.assertIsNot(copy, v)
+        self.assertIsInstance(copy, ImputedVariant)
+        self.assertEqual(copy, v)
+        self.assertEqual(copy.name, "rs1")
+        self.assertEqual(copy.quality, 0.8)
+
+        copy = Variant("rs1", 1, 123, "AC").copy()
+        self.assertIs(type(copy), Variant)
+
+
+class TestTrustedConstructors(unittest.TestCase):
+    @staticmethod
+    def _variant_fields(v):
+        return (type(v), v.name, v.chrom, v.pos, v.alleles)
+
+    def test_variant(self):
+        """Test that trusted variants are identical to the checked ones."""
+        expected = Variant("rs1", "chr1", 123, ["c", "A"])
+        v = Variant._trusted("rs1", "1", 123, ("A", "C"))
+        self.assertEqual(self._variant_fields(v),
+                         self._variant_fields(expected))
+
+        v = ImputedVariant._trusted("rs1", "1", 123, ("A", "C"))
+        self.assertIsInstance(v, ImputedVariant)
+
+    def test_genotypes(self):
+        """Test that trusted genotypes are identical to the checked ones."""
+        variant = Variant("rs1", 1, 123, "AC")
+        expected = Genotypes(variant, np.zeros(3), "c", "a", False)
+        g = Genotypes._trusted(variant, expected.genotypes, "C", "A", False)
+        for slot in ("variant", "reference", "coded", "multiallelic"):
+            self.assertEqual(getattr(g, slot), getattr(expected, slot))
+
+        # Copies are trusted, and the public constructor still checks
+        self.assertEqual(g.copy(), g)
+        with self.assertRaises(ValueError):
+            Genotypes(variant, np.zeros(3), "C", "G", False)
+
+    def test_normalized_block(self):
+        """Test that the normalized status is kept by derived blocks."""
+        variants = [Variant("rs{}".format(i), 1, i + 1, "AC")
+                    for i in range(4)]
+        genotypes = np.arange(12, dtype=float).reshape(4, 3)
+        args = (variants, genotypes, ["A"] * 4, ["C"] * 4, [False] * 4)
+
+        block = GenotypesBlock._trusted(*args)
+        derived = [block[1:], block.select(np.array([1, 0, 1, 0], bool)),
+                   block.subset_samples([0, 2]),
+                   GenotypesBlock.concatenate([block[:2], block[2:]])]
+        for b in derived:
+            self.assertTrue(b._normalized)
+
+        self.assertFalse(GenotypesBlock(*args)._normalized)
+        self.assertFalse(
+            GenotypesBlock.concatenate([block, GenotypesBlock(*args)])
+            ._normalized
+        )
+
+        # Same Genotypes as the public constructor
+        expected = list(GenotypesBlock(*args).iter_genotypes())
+        for g, e in zip(block.iter_genotypes(), expected):
+            self.assertEqual(g, e)
+            self.assertEqual((g.reference, g.coded, g.multiallelic),
+                             (e.reference, e.coded, e.multiallelic))
+
+    def test_plink_variants(self):
+        """Test the variants created from the (normalized) BIM file."""
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            expected = [
+                Variant(name, plink.CHROM_INT_TO_STR[chrom], pos, [a1, a2])
+                for name, chrom, pos, a1, a2 in zip(
+                    reader.bim.index, reader.bim.chrom, reader.bim.pos,
+                    reader.bim.a1, reader.bim.a2,
+                )
+            ]
+            observed = [g.variant for g in reader.iter_genotypes()]
+
+            self.assertEqual(
+                [self._variant_fields(v) for v in reader.iter_variants()],
+                [self._variant_fields(v) for v in expected],
+            )
+            self.assertEqual(
+                [self._variant_fields(v) for v in observed],
+                [self._variant_fields(v) for v in expected],
+            )
+
+
+class TestSplitChromosomeReader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.pattern = os.path.join(cls.tmp_dir.name, "chr{chrom}")
+
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            cls.expected = list(reader.iter_genotypes())
+            convert.convert(
+                reader,
+                lambda samples, chrom: plink.PlinkWriter(
+                    cls.pattern.replace("{chrom}", chrom), samples,
+                ),
+                split_chromosomes=True,
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_iter_range(self):
+        """Test iterating over a range of variants across chromosomes."""
+        reader = parsers["chrom-split-plink"](self.pattern)
+        self.assertEqual(reader.get_number_variants(), 5)
+        self.assertEqual(list(reader.iter_range(1, 4)), self.expected[1:4])
+        self.assertEqual(
+            [g for block in reader.iter_range_blocks(0, 5, 3)
+             for g in block.iter_genotypes()],
+            self.expected,
+        )
+
+    def test_shard(self):
+        """Test that shards are balanced across chromosomes."""
+        reader = parsers["chrom-split-plink"](self.pattern)
+        self.assertEqual(
+            [reader.shard_range(k, 2) for k in range(2)],
+            [(0, 2), (2, 5)],
+        )
+
+        # The multiallelic variants (3rd and 4th) are never split
+        self.assertEqual(
+            [reader.shard_range(k, 3) for k in range(3)],
+            [(0, 1), (1, 4), (4, 5)],
+        )
+
+        observed = []
+        for k in range(3):
+            observed.extend(reader.shard(k, 3).iter_genotypes())
+        self.assertEqual(observed, self.expected)
+
+
+class TestMergedSamplesReader(unittest.TestCase):
+    def setUp(self):
+        # A second batch of samples, with the alleles of rs146589823 swapped,
+        # and a variant which is not in the first batch
+        self.genotypes = pd.DataFrame(
+            {"rs785467": [2, 1],
+             "rs146589823": [0, 2],
+             "rs9628434:dup1": [np.nan, 1],
+             "rs9628434:dup2": [0, 1],
+             "rs1234": [1, 1],
+             "rs140543381": [0, 1]},
+            index=["SAMPLE6", "SAMPLE7"],
+        )
+        self.map_info = pd.DataFrame(
+            {"chrom": ["1", "2", "22", "22", "22", "X"],
+             "pos": [46521559, 74601606, 16615065, 16615065, 20000000,
+                     89932529],
+             "a1": ["T", "CAGG", "A", "T", "C", "T"],
+             "a2": ["A", "C", "G", "G", "G", "A"]},
+            index=self.genotypes.columns,
+        )
+
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            self.expected = list(reader.iter_genotypes())
+        self.expected_batch = {
+            "rs785467": [2, 1],
+            "rs146589823": [2, 0],
+            "rs9628434:dup1": [np.nan, 1],
+            "rs9628434:dup2": [0, 1],
+            "rs140543381": [0, 1],
+        }
+
+    def _reader(self, **kwargs):
+        return MergedSamplesReader(
+            [plink.PlinkReader(PLINK_PREFIX),
+             DataFrameReader(self.genotypes, self.map_info)],
+            **kwargs
+        )
+
+    def _check(self, observed, expected):
+        """Checks merged genotypes (alleles included)."""
+        self.assertEqual(len(observed), len(expected))
+        for obs, exp in zip(observed, expected):
+            self.assertEqual(obs.variant.name, exp.variant.name)
+            self.assertEqual(
+                (obs.reference, obs.coded, obs.multiallelic),
+                (exp.reference, exp.coded, exp.multiallelic),
+            )
+            np.testing.assert_array_equal(
+                obs.genotypes,
+                np.concatenate([exp.genotypes,
+                                self.expected_batch[exp.variant.name]]),
+            )
+
+    def test_samples(self):
+        """Test that the samples of the sub-readers are concatenated."""
+        with self._reader() as reader:
+            self.assertEqual(
+                reader.get_samples(),
+                ["SAMPLE{}".format(i + 1) for i in range(7)],
+            )
+            self.assertEqual(reader.get_number_samples(), 7)
+
+    def test_duplicated_samples(self):
+        """Test that the samples must be unique."""
+        with self.assertRaises(ValueError):
+            MergedSamplesReader([plink.PlinkReader(PLINK_PREFIX),
+                                 plink.PlinkReader(PLINK_PREFIX)])
+
+    def test_iter_genotypes(self):
+        """Test the merge (the extra variant is skipped)."""
+        with self._reader() as reader:
+            self._check(list(reader.iter_genotypes()), self.expected)
+
+    def test_iter_blocks(self):
+        """Test that the blocks are filled with the merged genotypes."""
+        for parallel in (False, True):
+            with self._reader(parallel=parallel) as reader:
+                blocks = list(reader.iter_blocks(2))
+                self.assertEqual([len(block) for block in blocks], [2, 2, 1])
+                self._check(
+                    [g for block in blocks for g in block.iter_genotypes()],
+                    self.expected,
+                )
+
+    def test_missing_variant(self):
+        """Test that a variant missing from a sub-reader is skipped."""
+        self.genotypes = self.genotypes.drop(columns="rs785467")
+        self.map_info = self.map_info.drop(index="rs785467")
+        with self._reader() as reader:
+            self._check(list(reader.iter_genotypes()), self.expected[1:])
+            self.assertEqual(
+                [v.name for v in reader.iter_variants()],
+                [g.variant.name for g in self.expected[1:]],
+            )
+
+    def test_queries(self):
+        """Test the point and region queries."""
+        with self._reader() as reader:
+            self._check(
+                reader.get_variant_genotypes(self.expected[1].variant),
+                self.expected[1:2],
+            )
+            self._check(
+                reader.get_variant_by_name("rs146589823"),
+                self.expected[1:2],
+            )
+            self._check(
+                list(reader.get_variants_in_region("22", 1, 30000000)),
+                self.expected[2:4],
+            )
+
+    def test_unsorted(self):
+        """Test that the variants of the sub-readers must be sorted."""
+        columns = list(reversed(self.genotypes.columns))
+        self.genotypes = self.genotypes[columns]
+        self.map_info = self.map_info.loc[columns]
+        with self._reader() as reader:
+            with self.assertRaises(ValueError):
+                list(reader.iter_genotypes())
+
+    def test_reader_api(self):
+        """Test the generic reader methods on the merged reader."""
+        with self._reader() as reader:
+            self.assertEqual(reader.get_number_variants(), 5)
+            self.assertEqual(reader._get_loci()[0].tolist(),
+                             ["1", "2", "22", "22", "X"])
+            self._check(list(reader.shard(1, 2).iter_genotypes()),
+                        self.expected[2:])
+            self._check(list(reader.iter_range(1, 3)), self.expected[1:3])
+
+    def test_unindexed(self):
+        """Test merging readers without an index (e.g. IMPUTE2)."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            filename = os.path.join(tmp_dir, "test.impute2")
+            with gzip.open(IMPUTE2_FN, "rb") as i_file, \
+                    open(filename, "wb") as o_file:
+                shutil.copyfileobj(i_file, o_file)
+
+            sample_filename = os.path.join(tmp_dir, "test.sample")
+            with open(IMPUTE2_SAMPLE_FN) as i_file, \
+                    open(sample_filename, "w") as o_file:
+                o_file.write(i_file.read().replace("SAMPLE", "OTHER"))
+
+            batches = [impute2.Impute2Reader(IMPUTE2_FN, IMPUTE2_SAMPLE_FN),
+                       impute2.Impute2Reader(filename, sample_filename)]
+            self.assertFalse(batches[1].has_index)
+            with MergedSamplesReader(batches) as reader:
+                self.assertEqual(reader.get_number_samples(), 10)
+                observed = list(reader.iter_genotypes())
+
+            with impute2.Impute2Reader(IMPUTE2_FN, IMPUTE2_SAMPLE_FN) as f:
+                expected = list(f.iter_genotypes())
+
+        self.assertEqual(len(observed), len(expected))
+        for obs, exp in zip(observed, expected):
+            np.testing.assert_array_equal(
+                obs.genotypes, np.tile(exp.genotypes, 2),
+            )
+
+
+class TestLazyRegistry(unittest.TestCase):
+    def test_import_is_lazy(self):
+        """Test that importing geneparse does not import the backends."""
+        code = (
+            "import sys, geneparse\n"
+            "modules = ['pandas', 'pyplink', 'Bio', 'cyvcf2', "
+            "'geneparse.plink', 'geneparse.impute2', 'geneparse.vcf']\n"
+            "print(','.join(m for m in modules if m in sys.modules))\n"
+            "geneparse.parsers['plink']\n"
+            "print('pyplink' in sys.modules)\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        ).stdout.decode().splitlines()
+        self.assertEqual(output, ["", "True"])
+
+    def test_registry(self):
+        """Test that the entries are imported when requested."""
+        registry = _LazyRegistry({"plink": ".plink:PlinkReader"})
+        self.assertEqual(list(registry), ["plink"])
+        self.assertIs(registry["plink"], plink.PlinkReader)
+
+        registry.register("writer", plink.PlinkWriter)
+        self.assertEqual(len(registry), 2)
+        self.assertIs(registry["writer"], plink.PlinkWriter)
+
+        registry.register("missing", ".missing_backend:Reader")
+        self.assertIn("missing", registry)
+        with self.assertRaises(ImportError):
+            registry["missing"]
+
+        with self.assertRaises(KeyError):
+            registry["unknown"]
+
+    def test_parsers(self):
+        """Test the default readers and writers."""
+        self.assertIs(parsers["plink"], plink.PlinkReader)
+        self.assertIs(writers["plink"], plink.PlinkWriter)
+        self.assertIn("vcf", parsers)
+        self.assertIn("chrom-split-impute2", parsers)
+
+        # The split chromosome factories can be sent to other processes
+        factory = pickle.loads(pickle.dumps(parsers["chrom-split-plink"]))
+        with self.assertRaises(ValueError):
+            factory("no_placeholder")
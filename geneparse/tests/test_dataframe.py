@@ -46,78 +46,52 @@ class TestDataFrame(TestContainer, unittest.TestCase):
         genotypes = pd.DataFrame(
             {"rs785467": [0, 1, 2, 0, 0],
              "rs146589823": [2, 1, 0, 0, 0],
-             "rs9628434": [1, 0, np.nan, 1, 0],
+             "rs9628434:dup1": [1, 0, np.nan, 1, 0],
+             "rs9628434:dup2": [1, 1, np.nan, 0, 0],
              "rs140543381": [1, 2, 0, 0, 1]},
             index=["SAMPLE{}".format(_+1) for _ in range(5)],
         )
 
         mapping_info = pd.DataFrame(
-            {"chrom": ["1", "2", "22", "X"],
-             "pos": [46521559, 74601606, 16615065, 89932529],
-             "a1": ["T", "C", "A", "T"],
-             "a2": ["A", "CAGG", "G", "A"]},
-            index=["rs785467", "rs146589823", "rs9628434", "rs140543381"],
+            {"chrom": ["1", "2", "22", "22", "X"],
+             "pos": [46521559, 74601606, 16615065, 16615065, 89932529],
+             "a1": ["T", "C", "A", "T", "T"],
+             "a2": ["A", "CAGG", "G", "G", "A"]},
+            index=["rs785467", "rs146589823", "rs9628434:dup1",
+                   "rs9628434:dup2", "rs140543381"],
         )
 
+        cls.genotypes = genotypes
         cls.reader_f = lambda x: dataframe.DataFrameReader(
             dataframe=genotypes,
             map_info=mapping_info,
         )
 
-    @unittest.skip("Not implemented")
-    def test_iter_variants(self):
-        """Test that all variants are iterated over"""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_multiallelic_identifier(self):
-        """Test that the multiallelic flag gets set when iterating"""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_biallelic_variant(self):
-        """Test simplest possible case of variant accession."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_na_biallelic_variant(self):
-        """Test asking for an unavailable biallelic variant."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_multiallelic_variant_by_locus(self):
-        """Test getting a multiallelic variant using a locus."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_multiallelic_variant_by_specific(self):
-        """Find a biallelic variant at a multiallelic locus."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_multiallelic_variant_by_unavailable(self):
-        """Test asking for an unavailable biallelic variant at a multiallelic
-        locus.
-
-        """
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_multiallelic_variant_by_multiallelic(self):
-        """Test asking for a multiallelic variant."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_variant_in_region(self):
-        """Test getting a variant by region."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_variant_in_empty_region(self):
-        """Test getting an empty region."""
-        pass
-
-    @unittest.skip("Not implemented")
-    def test_get_multiallelic_variant_by_name(self):
-        """Find a biallelic variant at a multiallelic locus by name."""
-        pass
+    def test_zero_copy(self):
+        """Test that the genotypes are views on the variant-major array."""
+        with self.reader_f() as f:
+            self.assertTrue(f._genotypes.flags.c_contiguous)
+            blocks = list(f.iter_blocks(2))
+            for g in f.iter_genotypes():
+                self.assertTrue(np.shares_memory(g.genotypes, f._genotypes))
+            for block in blocks:
+                self.assertTrue(
+                    np.shares_memory(block.genotypes, f._genotypes)
+                )
+
+            # A dataframe stored by column shares its memory with the reader
+            values = np.arange(10, dtype=float).reshape(2, 5)
+            df = pd.DataFrame(values.T, index=self.genotypes.index,
+                              columns=["rs785467", "rs146589823"])
+            reader = dataframe.DataFrameReader(df, f.map_info)
+            self.assertTrue(np.shares_memory(reader._genotypes, df.values))
+            np.testing.assert_array_equal(reader._genotypes, values)
+
+    def test_map_info_order(self):
+        """Test that the mapping information is aligned on the columns."""
+        with self.reader_f() as f:
+            expected = list(f.iter_genotypes())
+            reader = dataframe.DataFrameReader(
+                f.df, f.map_info.iloc[::-1, :],
+            )
+            self.assertEqual(list(reader.iter_genotypes()), expected)
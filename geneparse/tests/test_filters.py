@@ -0,0 +1,237 @@
+"""
+Tests for the variant filters.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .. import parsers, filters
+from ..core import GenotypesBlock, GenotypesReader, Variant
+from ..filters import VariantFilter, FilteredReader, _runs
+
+
+def _data(*path):
+    return resource_filename(__name__, os.path.join("data", *path))
+
+
+class _QualityVariant(Variant):
+    __slots__ = ("quality", )
+
+
+def _block(genotypes, qualities=None):
+    """Creates a block with one variant per row of genotypes."""
+    variants = []
+    for i in range(len(genotypes)):
+        if qualities is None:
+            variants.append(Variant("v{}".format(i), 1, i + 1, "AC"))
+        else:
+            variants.append(_QualityVariant("v{}".format(i), 1, i + 1, "AC"))
+            variants[-1].quality = qualities[i]
+    return GenotypesBlock(variants, np.array(genotypes, dtype=float),
+                          ["A"] * len(variants), ["C"] * len(variants),
+                          [False] * len(variants))
+
+
+class TestVariantFilter(unittest.TestCase):
+    def test_block_mask(self):
+        """Test the predicates on the genotypes."""
+        block = _block([
+            [0, 0, 0, 1],           # MAF 0.125
+            [2, 2, 1, 1],           # MAF 0.25
+            [np.nan, 1, 1, 1],      # MAF 0.5, 25% missing
+            [np.nan] * 4,           # No called genotype
+        ])
+
+        self.assertEqual(
+            VariantFilter(min_maf=0.2).block_mask(block).tolist(),
+            [False, True, True, False],
+        )
+        self.assertEqual(
+            VariantFilter(max_missing=0.25).block_mask(block).tolist(),
+            [True, True, True, False],
+        )
+        self.assertEqual(
+            VariantFilter(min_maf=0.2, max_missing=0.1)
+            .block_mask(block).tolist(),
+            [False, True, False, False],
+        )
+        self.assertEqual(VariantFilter().block_mask(block).tolist(),
+                         [True] * 4)
+
+    def test_block_mask_quality(self):
+        """Test the quality predicate evaluated on the variants."""
+        block = _block([[0, 1], [1, 1], [2, 1]], qualities=[0.2, 0.8, 0.9])
+        self.assertEqual(
+            VariantFilter(min_quality=0.8).block_mask(block).tolist(),
+            [False, True, True],
+        )
+
+        # Already evaluated using the index
+        self.assertEqual(
+            VariantFilter(min_quality=0.8)
+            .block_mask(block, quality_checked=True).tolist(),
+            [True, True, True],
+        )
+
+        # Not available
+        with self.assertRaises(ValueError):
+            VariantFilter(min_quality=0.8).block_mask(_block([[0, 1]]))
+
+    def test_runs(self):
+        """Test splitting indices into ranges."""
+        self.assertEqual(_runs(np.array([], dtype=int)), [])
+        self.assertEqual(_runs(np.array([3])), [(3, 4)])
+        self.assertEqual(_runs(np.array([0, 1, 2, 5, 7, 8])),
+                         [(0, 3), (5, 6), (7, 9)])
+
+
+class TestFilteredReader(unittest.TestCase):
+    def setUp(self):
+        self.reader = parsers["plink"](_data("plink", "btest"))
+
+    def tearDown(self):
+        self.reader.close()
+
+    def test_index_only(self):
+        """Test that only the selected ranges are read."""
+        variant_filter = VariantFilter(regions=[("1", 1, 50000000),
+                                                ("X", 1, 90000000)])
+        with mock.patch.object(self.reader, "iter_range_blocks",
+                               wraps=self.reader.iter_range_blocks) as m:
+            filtered = self.reader.filter(variant_filter)
+            observed = list(filtered.iter_genotypes())
+
+        self.assertEqual([g.variant.chrom for g in observed], ["1", "X"])
+        self.assertEqual([c[0][:2] for c in m.call_args_list],
+                         [(0, 1), (4, 5)])
+
+        self.assertEqual(filtered.get_number_variants(), 2)
+        self.assertEqual([v.chrom for v in filtered.iter_variants()],
+                         ["1", "X"])
+        self.assertEqual(filtered._get_loci()[1].tolist(),
+                         [46521559, 89932529])
+
+    def test_sequential_reader(self):
+        """Test a reader without random access, which is read once."""
+        class SequentialReader(GenotypesReader):
+            def __init__(self, reader):
+                self.reader = reader
+                self.nb_reads = 0
+
+            def iter_genotypes(self):
+                self.nb_reads += 1
+                return self.reader.iter_genotypes()
+
+            def iter_variants(self):
+                return self.reader.iter_variants()
+
+            def get_samples(self):
+                return self.reader.get_samples()
+
+        reader = SequentialReader(self.reader)
+        variant_filter = VariantFilter(regions=[("1", 1, 50000000),
+                                                ("X", 1, 90000000)])
+        observed = list(reader.filter(variant_filter).iter_genotypes())
+
+        self.assertEqual([g.variant.chrom for g in observed], ["1", "X"])
+        self.assertEqual(reader.nb_reads, 1)
+
+    def test_scattered_variants(self):
+        """Test that short runs are read using the reader's file handle."""
+        reader = parsers["impute2"](
+            _data("impute2", "impute2_test.impute2.gz"),
+            _data("impute2", "impute2_test.sample"),
+        )
+        variant_filter = VariantFilter(
+            names=["rs785467", "rs9628434", "rs140543381"],
+        )
+        expected = [g for g in reader.iter_genotypes()
+                    if g.variant.name != "rs146589823"]
+
+        with mock.patch.object(reader, "_open", wraps=reader._open) as m:
+            # Only the (thread's) file handle of the reader is opened
+            observed = list(reader.filter(variant_filter).iter_genotypes())
+            list(reader.filter(variant_filter).iter_genotypes())
+            self.assertEqual(m.call_count, 1)
+
+            # The long runs are read as ranges (opening the file)
+            with mock.patch.object(filters, "_MIN_RANGE_READ", 2):
+                self.assertEqual(
+                    list(reader.filter(variant_filter).iter_genotypes()),
+                    expected,
+                )
+            self.assertEqual(m.call_count, 2)
+
+        reader.close()
+        self.assertEqual(observed, expected)
+        self.assertEqual([g.variant.name for g in observed],
+                         [g.variant.name for g in expected])
+
+    def test_quality_from_index(self):
+        """Test the quality predicate evaluated using the index."""
+        with mock.patch.object(self.reader, "_get_qualities",
+                               return_value=np.array([0.9, 0.1, 1, 1, 0.5])):
+            filtered = FilteredReader(self.reader,
+                                      VariantFilter(min_quality=0.8))
+            observed = list(filtered.iter_genotypes())
+
+        self.assertEqual([g.variant.pos for g in observed],
+                         [46521559, 16615065, 16615065])
+
+    def test_names(self):
+        """Test the name predicate (including renamed duplicates)."""
+        names = ["rs785467", "rs146589823", "rs9628434:dup1", "rs9628434:dup2",
+                 "rs140543381"]
+        with mock.patch.object(self.reader, "_get_names",
+                               return_value=np.array(names, dtype=object)):
+            variant_filter = VariantFilter(names=["rs9628434", "rs785467"])
+            mask = variant_filter.variant_mask(self.reader)
+
+        self.assertEqual(mask.tolist(), [True, False, True, True, False])
+
+    def test_quality_not_available(self):
+        """Test the quality predicate without imputation quality."""
+        filtered = self.reader.filter(VariantFilter(min_quality=0.8))
+        with self.assertRaises(ValueError):
+            list(filtered.iter_genotypes())
+
+    def test_no_index_predicate(self):
+        """Test that the index is not needed without index predicates."""
+        with mock.patch.object(self.reader, "_get_loci",
+                               side_effect=NotImplementedError) as m:
+            filtered = self.reader.filter(VariantFilter(min_maf=0.3))
+            observed = list(filtered.iter_genotypes())
+
+        m.assert_not_called()
+        self.assertEqual([g.variant.name for g in observed],
+                         ["rs785467", "rs146589823", "rs140543381"])
@@ -0,0 +1,178 @@
+"""
+Tests for the harmonization of alleles.
+"""
+
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import unittest
+import logging
+
+import numpy as np
+import pandas as pd
+from pkg_resources import resource_filename
+
+from . import truth
+from .. import harmonize
+from ..core import GenotypesBlock
+from ..plink import PlinkReader
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+# The reference panel for the PLINK test file (rs785467 is ambiguous, the
+# alleles of rs146589823 are swapped, the first rs9628434 is on the other
+# strand, the second one is swapped and rs140543381 is missing)
+PANEL = pd.DataFrame({
+    "chrom": ["chr1", "2", "22", "22"],
+    "pos": [46521559, 74601606, 16615065, 16615065],
+    "reference": ["A", "C", "C", "T"],
+    "coded": ["T", "CAGG", "T", "G"],
+})
+
+
+class TestHarmonize(unittest.TestCase):
+    def setUp(self):
+        self.reader = PlinkReader(PLINK_PREFIX)
+
+    def tearDown(self):
+        self.reader.close()
+
+    def test_variant_table(self):
+        """Test the variant table of a reader."""
+        table = harmonize.variant_table(self.reader)
+        self.assertEqual(table.name.tolist(), [
+            "rs785467", "rs146589823", "rs9628434:dup1", "rs9628434:dup2",
+            "rs140543381",
+        ])
+        self.assertEqual(table.chrom.tolist(), ["1", "2", "22", "22", "X"])
+        self.assertEqual(table.reference.tolist(),
+                         ["A", "CAGG", "G", "G", "A"])
+        self.assertEqual(table.coded.tolist(), ["T", "C", "A", "T", "T"])
+
+        # Without the alleles in the index (reading the blocks)
+        self.reader._get_alleles = lambda: None
+        pd.testing.assert_frame_equal(
+            harmonize.variant_table(self.reader, block_size=2), table,
+        )
+
+    def test_decisions(self):
+        """Test the decision for each variant."""
+        result = harmonize.harmonize(self.reader, PANEL)
+        self.assertEqual(result.table().action.tolist(), [
+            "ambiguous", "swap", "strand_flip", "swap", "missing",
+        ])
+        self.assertEqual(result.reference_index.tolist(), [0, 1, 2, 3, -1])
+        self.assertEqual(result.reference.tolist(),
+                         [None, "C", "C", "T", None])
+        self.assertEqual(result.coded.tolist(),
+                         [None, "CAGG", "T", "G", None])
+        self.assertEqual(result.counts(), {
+            "keep": 0, "swap": 2, "strand_flip": 1, "strand_flip_swap": 0,
+            "ambiguous": 1, "mismatch": 0, "missing": 1,
+        })
+
+        # Keeping the ambiguous variants, without strand flips
+        result = harmonize.harmonize(self.reader, PANEL,
+                                     drop_ambiguous=False,
+                                     strand_flips=False)
+        self.assertEqual(result.table().action.tolist(), [
+            "keep", "swap", "mismatch", "swap", "missing",
+        ])
+
+    def test_apply(self):
+        """Test harmonizing the blocks of genotypes."""
+        result = harmonize.harmonize(self.reader, PANEL)
+        blocks = list(result.iter_blocks(self.reader, block_size=2))
+        block = GenotypesBlock.concatenate(blocks)
+        self.assertEqual(len(block), 3)
+
+        expected = truth.genotypes["rs146589823"].copy()
+        expected.flip()
+        genotypes = list(block.iter_genotypes())
+        self.assertEqual(genotypes[0], expected)
+        self.assertEqual((genotypes[0].reference, genotypes[0].coded),
+                         ("C", "CAGG"))
+
+        # Strand flip (same genotypes, complemented alleles)
+        self.assertEqual((genotypes[1].reference, genotypes[1].coded),
+                         ("C", "T"))
+        self.assertEqual(genotypes[1].variant.alleles, ("C", "T"))
+        np.testing.assert_array_equal(
+            genotypes[1].genotypes,
+            truth.genotypes["subal_3_rs9628434"].genotypes,
+        )
+
+        expected = truth.genotypes["subal_2_rs9628434"].copy()
+        expected.flip()
+        self.assertEqual(genotypes[2], expected)
+        self.assertEqual((genotypes[2].reference, genotypes[2].coded),
+                         ("T", "G"))
+
+        # The reader's genotypes are not modified
+        original = next(self.reader.iter_blocks(5))
+        np.testing.assert_array_equal(original.genotypes[1],
+                                      [2, 1, 0, 0, 0])
+
+    def test_apply_not_synced(self):
+        """Test that a block of other variants raises an error."""
+        result = harmonize.harmonize(self.reader, PANEL)
+        block = next(self.reader.iter_blocks(2))
+        with self.assertRaises(ValueError):
+            result.apply(block, 1)
+        with self.assertRaises(ValueError):
+            result.apply(block, 4)
+
+    def test_strand_flip_swap(self):
+        """Test alleles both on the other strand and swapped."""
+        target = pd.DataFrame({
+            "chrom": ["1", "1", "1"], "pos": [1, 2, 3],
+            "reference": ["A", "ac", "A"], "coded": ["G", "T", None],
+        })
+        panel = pd.DataFrame({
+            "chrom": ["1", "1", "1"], "pos": [1, 2, 3],
+            "reference": ["C", "A", "A"], "coded": ["T", "GT", "G"],
+        })
+        result = harmonize.harmonize(target, panel)
+        self.assertEqual(result.table().action.tolist(),
+                         ["strand_flip_swap", "strand_flip_swap", "mismatch"])
+
+
+class TestIsAmbiguous(unittest.TestCase):
+    def test_is_ambiguous(self):
+        """Test finding the ambiguous variants."""
+        np.testing.assert_array_equal(
+            harmonize.is_ambiguous(["A", "c", "A", "AT", "A", None, "-"],
+                                   ["T", "G", "C", "AT", "TT", "T", "-"]),
+            [True, True, False, True, False, False, False],
+        )
@@ -28,13 +28,21 @@ Tests for the plink implementation.
 
 
 import os
+import gzip
+import shutil
 import unittest
 import logging
+from tempfile import TemporaryDirectory
 
+from unittest import mock
+
+import numpy as np
 from pkg_resources import resource_filename
 
 from .generic_tests import TestContainer
 from .. import impute2
+from ..core import ImputedVariant
+from ..filters import VariantFilter
 
 
 logging.disable(logging.CRITICAL)
@@ -48,6 +56,10 @@ IMPUTE2_SAMPLE_FN = resource_filename(
     __name__,
     os.path.join("data", "impute2", "impute2_test.sample"),
 )
+IMPUTE2_INFO_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.impute2_info"),
+)
 
 
 # TODO: Add tests for actual dosage value (not just 100% probability)
@@ -58,3 +70,193 @@ class TestImpute2(TestContainer, unittest.TestCase):
             filename=IMPUTE2_FN,
             sample_filename=IMPUTE2_SAMPLE_FN,
         )
+
+
+class TestImpute2Info(TestContainer, unittest.TestCase):
+    # The (clipped) INFO values in the info file
+    qualities = [0.95, 0.42, 0.88, 0.88, 0]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: impute2.Impute2Reader(
+            filename=IMPUTE2_FN,
+            sample_filename=IMPUTE2_SAMPLE_FN,
+            info_filename=IMPUTE2_INFO_FN,
+        )
+
+    def test_index_columns(self):
+        """Test that the info values are added to the index."""
+        with self.reader_f() as f:
+            index = f._impute2_index
+            self.assertEqual(index["info"].dtype, np.float32)
+            np.testing.assert_allclose(
+                index["info"].values, [0.95, 0.42, 0.88, 0.88, -1],
+                rtol=1e-6,
+            )
+            np.testing.assert_allclose(
+                index["certainty"].values,
+                [0.981, 0.803, 0.962, 0.962, 1], rtol=1e-6,
+            )
+            np.testing.assert_allclose(
+                index["exp_freq"].values, [0.2, 0.5, 0.4, 0.3, 0], rtol=1e-6,
+            )
+
+    def test_imputed_variants(self):
+        """Test that the variants have the imputation quality."""
+        with self.reader_f() as f:
+            for variants in ([g.variant for g in f.iter_genotypes()],
+                             list(f.iter_variants()),
+                             [g.variant for g in f.iter_range(0, 5)]):
+                self.assertTrue(all(isinstance(v, ImputedVariant)
+                                    for v in variants))
+                self.assertEqual([v.quality for v in variants],
+                                 self.qualities)
+
+            g, = f.get_variant_by_name("rs785467")
+            self.assertEqual(g.variant.quality, 0.95)
+
+            g, = f.get_variant_genotypes(g.variant)
+            self.assertEqual(g.variant.quality, 0.95)
+
+    def test_quality_filter(self):
+        """Test that low quality lines are never parsed."""
+        with self.reader_f() as f:
+            filtered = f.filter(VariantFilter(min_quality=0.9))
+            with mock.patch.object(f, "_parse_impute2_line",
+                                   wraps=f._parse_impute2_line) as parse:
+                observed = list(filtered.iter_genotypes())
+
+            self.assertEqual([g.variant.name for g in observed], ["rs785467"])
+            self.assertEqual(parse.call_count, 1)
+            self.assertEqual(filtered.get_number_variants(), 1)
+
+    def test_quality_filter_scattered(self):
+        """Test that the selected lines are read using the reader's handle."""
+        with self.reader_f() as f:
+            filtered = f.filter(VariantFilter(min_quality=0.8))
+            with mock.patch.object(f, "_open", wraps=f._open) as m:
+                for _ in range(2):
+                    self.assertEqual(
+                        [g.variant.pos for g in filtered.iter_genotypes()],
+                        [46521559, 16615065, 16615065],
+                    )
+
+            # Only the thread's file handle is opened
+            self.assertEqual(m.call_count, 1)
+
+    def test_without_index(self):
+        """Test reading the info file of an unindexed IMPUTE2 file."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            filename = os.path.join(tmp_dir, "test.impute2.gz")
+            shutil.copyfile(IMPUTE2_FN, filename)
+
+            with impute2.Impute2Reader(filename, IMPUTE2_SAMPLE_FN,
+                                       info_filename=IMPUTE2_INFO_FN) as f:
+                self.assertFalse(f.has_index)
+                variants = [g.variant for g in f.iter_genotypes()]
+                np.testing.assert_allclose(
+                    [v.quality for v in variants], self.qualities, rtol=1e-6,
+                )
+
+                observed = f.filter(VariantFilter(min_quality=0.8))
+                with mock.patch.object(f, "_parse_impute2_line",
+                                       wraps=f._parse_impute2_line) as parse:
+                    self.assertEqual(
+                        [g.variant.pos for g in observed.iter_genotypes()],
+                        [46521559, 16615065, 16615065],
+                    )
+
+                # The file is read once, parsing only the selected lines
+                self.assertEqual(parse.call_count, 3)
+                np.testing.assert_allclose(
+                    [g.variant.quality for g in observed.iter_genotypes()],
+                    [0.95, 0.88, 0.88], rtol=1e-6,
+                )
+
+    def test_not_synced(self):
+        """Test an info file with a different number of lines."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            info_fn = os.path.join(tmp_dir, "test.impute2_info")
+            with open(IMPUTE2_INFO_FN) as i_file, open(info_fn, "w") as o_file:
+                o_file.writelines(i_file.readlines()[:-1])
+
+            with self.assertRaises(ValueError):
+                impute2.Impute2Reader(IMPUTE2_FN, IMPUTE2_SAMPLE_FN,
+                                      info_filename=info_fn)
+
+
+class TestImpute2Uncompressed(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.impute2_fn = os.path.join(cls.tmp_dir.name, "test.impute2")
+        with gzip.open(IMPUTE2_FN, "rb") as i_file, \
+                open(cls.impute2_fn, "wb") as o_file:
+            shutil.copyfileobj(i_file, o_file)
+
+        # Generating the index
+        impute2.get_index(cls.impute2_fn, cols=[0, 1, 2],
+                          names=["chrom", "name", "pos"], sep=" ")
+
+        cls.reader_f = lambda x: impute2.Impute2Reader(
+            filename=cls.impute2_fn,
+            sample_filename=IMPUTE2_SAMPLE_FN,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+
+class TestImpute2Writer(TestContainer, unittest.TestCase):
+    filename = "test.impute2.gz"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.impute2_fn = os.path.join(cls.tmp_dir.name, cls.filename)
+        cls.sample_fn = os.path.join(cls.tmp_dir.name, "test.sample")
+
+        # Small blocks, so that there are multiple blocks
+        with impute2.Impute2Reader(IMPUTE2_FN, IMPUTE2_SAMPLE_FN) as reader, \
+                impute2.Impute2Writer(cls.impute2_fn, cls.sample_fn,
+                                      reader.get_samples()) as writer:
+            for block in reader.iter_blocks(2):
+                writer.write_block(block)
+
+        cls.reader_f = lambda x: impute2.Impute2Reader(
+            filename=cls.impute2_fn,
+            sample_filename=cls.sample_fn,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_index(self):
+        """Test that the index is identical to a generated one."""
+        index = impute2.read_index(impute2.get_index_fn(self.impute2_fn))
+        os.remove(impute2.get_index_fn(self.impute2_fn))
+        try:
+            generated = impute2.get_index(self.impute2_fn, cols=[0, 1, 2],
+                                          names=["chrom", "name", "pos"],
+                                          sep=" ")
+            self.assertEqual(index.values.tolist(),
+                             generated.values.tolist())
+
+        finally:
+            impute2.write_index(impute2.get_index_fn(self.impute2_fn), index)
+
+    def test_probabilities(self):
+        """Test the probabilities computed from dosage values."""
+        table = impute2._probability_table(3)
+        self.assertEqual(len(table), 2002)
+        self.assertEqual(table[0], b"1 0 0")
+        self.assertEqual(table[250], b"0.75 0.25 0")
+        self.assertEqual(table[1000], b"0 1 0")
+        self.assertEqual(table[1999], b"0 0.001 0.999")
+        self.assertEqual(table[-1], b"0 0 0")
+
+
+class TestImpute2WriterUncompressed(TestImpute2Writer):
+    filename = "test.impute2"
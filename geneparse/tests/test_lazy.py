@@ -0,0 +1,210 @@
+"""
+Tests for the lazy decoding of the genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import pickle
+import unittest
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import truth
+from .generic_tests import (TestContainer, reader_factory, PLINK_PREFIX,
+                            IMPUTE2_FN, IMPUTE2_SAMPLE_FN)
+from .. import plink, impute2
+from ..core import Variant, Genotypes, LazyGenotypes
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestLazyGenotypes(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.variant = Variant("rs1", 1, 123, "AC")
+
+    def _decode(self):
+        self.calls += 1
+        return np.array([0, 1, 2, np.nan])
+
+    def _lazy_genotypes(self):
+        return LazyGenotypes(self.variant, self._decode, "a", "c", False)
+
+    def test_decoded_once(self):
+        """Test that the genotypes are decoded once, when accessed."""
+        g = self._lazy_genotypes()
+        self.assertEqual((g.reference, g.coded), ("A", "C"))
+        self.assertFalse(g.decoded)
+        self.assertEqual(self.calls, 0)
+
+        np.testing.assert_array_equal(g.genotypes, [0, 1, 2, np.nan])
+        self.assertIs(g.genotypes, g.genotypes)
+        self.assertTrue(g.decoded)
+        self.assertEqual(self.calls, 1)
+
+        # Setting the genotypes
+        g = self._lazy_genotypes()
+        g.genotypes = np.zeros(4)
+        self.assertTrue(g.decoded)
+        np.testing.assert_array_equal(g.genotypes, np.zeros(4))
+        self.assertEqual(self.calls, 1)
+
+    def test_checks(self):
+        """Test that the public constructor checks the alleles."""
+        with self.assertRaises(ValueError):
+            LazyGenotypes(self.variant, self._decode, "G", "C", False)
+
+    def test_flip(self):
+        """Test flipping genotypes before and after decoding."""
+        g = self._lazy_genotypes()
+        g.flip()
+        self.assertFalse(g.decoded)
+        self.assertEqual((g.reference, g.coded), ("C", "A"))
+        np.testing.assert_array_equal(g.genotypes, [2, 1, 0, np.nan])
+
+        g.flip()
+        self.assertEqual((g.reference, g.coded), ("A", "C"))
+        np.testing.assert_array_equal(g.genotypes, [0, 1, 2, np.nan])
+
+    def test_maf(self):
+        """Test the allele frequencies."""
+        g = self._lazy_genotypes()
+        self.assertAlmostEqual(g.coded_freq(), 0.5)
+        self.assertAlmostEqual(g.maf(), 0.5)
+
+    def test_copy(self):
+        """Test copies of lazy genotypes."""
+        g = self._lazy_genotypes()
+        copy = g.copy()
+        self.assertIsInstance(copy, LazyGenotypes)
+        self.assertFalse(copy.decoded)
+        self.assertEqual(copy, g)
+
+        # Decoded instances are copied as regular genotypes
+        copy = g.copy()
+        self.assertIs(type(copy), Genotypes)
+        self.assertIs(copy.genotypes, g.genotypes)
+
+    def test_pickle(self):
+        """Test that lazy genotypes are pickled decoded."""
+        g = LazyGenotypes(self.variant, np.zeros(3).copy, "A", "C", False)
+        unpickled = pickle.loads(pickle.dumps(g))
+        self.assertIs(type(unpickled), Genotypes)
+        self.assertEqual(unpickled, g)
+
+
+class TestLazyPlink(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            plink.PlinkReader, PLINK_PREFIX,
+            setup=lambda reader: reader.enable_lazy_decoding(),
+        )
+
+    def test_concurrent_get_variant_by_name(self):
+        """Test getting variants by name from multiple threads."""
+        # The genotypes are decoded while the reader is open
+        names = ["rs785467", "rs146589823", "rs140543381"] * 50
+        with self.reader_f() as f:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(f.get_variant_by_name, names))
+
+            for name, g in zip(names, results):
+                self.assertEqual(len(g), 1)
+                self.assertEqual(g[0], truth.genotypes[name])
+
+    def test_lazy_iteration(self):
+        """Test that iterated markers are decoded on access only."""
+        with self.reader_f() as f:
+            f.enable_stats()
+            genotypes = list(f.iter_genotypes())
+            self.assertTrue(all(isinstance(g, LazyGenotypes)
+                                for g in genotypes))
+            self.assertTrue(not any(g.decoded for g in genotypes))
+            self.assertEqual(f.stats()["decode_seconds"], 0)
+
+            expected = truth.genotypes["rs785467"]
+            self.assertEqual(genotypes[0], expected)
+            self.assertTrue(genotypes[0].decoded)
+            self.assertFalse(genotypes[1].decoded)
+
+    def test_lazy_lookups(self):
+        """Test that point lookups read the markers on access only."""
+        with self.reader_f() as f:
+            f.enable_stats()
+            g, = f.get_variant_by_name("rs785467")
+            self.assertFalse(g.decoded)
+            self.assertEqual(f.stats()["bytes_read"], 0)
+
+            self.assertEqual(g, truth.genotypes["rs785467"])
+            self.assertEqual(f.stats()["bytes_read"], 2)
+
+    def test_disable_lazy_decoding(self):
+        """Test disabling the lazy decoding."""
+        with self.reader_f() as f:
+            f.disable_lazy_decoding()
+            self.assertIs(type(next(f.iter_genotypes())), Genotypes)
+
+
+class TestLazyImpute2(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            impute2.Impute2Reader, IMPUTE2_FN, IMPUTE2_SAMPLE_FN,
+            setup=lambda reader: reader.enable_lazy_decoding(),
+        )
+
+    def test_lazy_iteration(self):
+        """Test that the probabilities are parsed on access only."""
+        with self.reader_f() as f:
+            f.enable_stats()
+            genotypes = list(f.iter_genotypes())
+            self.assertTrue(all(isinstance(g, LazyGenotypes)
+                                for g in genotypes))
+            self.assertEqual(f.stats()["parse_seconds"], 0)
+
+            # The metadata are available (and fixed) before decoding
+            self.assertEqual(
+                [g.variant.name for g in genotypes],
+                list(f._get_names()),
+            )
+            self.assertTrue(not any(g.decoded for g in genotypes))
+
+            genotypes[0].genotypes
+            self.assertGreater(f.stats()["parse_seconds"], 0)
+
+    def test_lazy_cache(self):
+        """Test that the dosage of lazy lookups is cached."""
+        with self.reader_f() as f:
+            cache = f.enable_cache()
+            for _ in range(2):
+                g, = f.get_variant_by_name("rs785467")
+                self.assertEqual(g, truth.genotypes["rs785467"])
+            self.assertEqual((cache.misses, cache.hits), (1, 1))
@@ -0,0 +1,112 @@
+"""
+Tests for the geneparse native format.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from . import truth
+from .generic_tests import TestContainer
+from .. import native, plink
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class TestNative(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.path = os.path.join(cls.tmp_dir.name, "native")
+
+        # Small chunks, so that there are multiple chunks
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            native.convert(reader, cls.path, chunk_size=2)
+
+        cls.reader_f = lambda x: native.NativeReader(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_metadata(self):
+        """Test the metadata of the converted dataset."""
+        with self.reader_f() as f:
+            self.assertEqual(f.get_number_variants(), 5)
+            self.assertEqual(f.get_number_samples(), 5)
+            self.assertEqual(f.metadata["chunk_size"], 2)
+
+        offsets = np.fromfile(os.path.join(self.path, "genotypes.offsets"),
+                              dtype=np.int64)
+        self.assertEqual(len(offsets), 4)
+
+    def test_compressions(self):
+        """Test the different compression methods."""
+        for compression in ("none", "lzma"):
+            path = os.path.join(self.tmp_dir.name, compression)
+            with plink.PlinkReader(PLINK_PREFIX) as reader:
+                native.convert(reader, path, chunk_size=3,
+                               compression=compression, dtype="float64")
+
+            with native.NativeReader(path) as f:
+                for g in f.iter_genotypes():
+                    self.assertEqual(g.genotypes.dtype, np.float64)
+                    expected = truth.genotypes[
+                        truth.variant_to_key[g.variant]
+                    ]
+                    self.assertEqual(expected, g)
+
+    def test_invalid_compression(self):
+        """Test that unknown compression methods are rejected."""
+        with plink.PlinkReader(PLINK_PREFIX) as reader:
+            with self.assertRaises(ValueError):
+                native.convert(reader, os.path.join(self.tmp_dir.name, "x"),
+                               compression="unknown")
+
+    def test_invalid_dataset(self):
+        """Test opening a directory which is not a native dataset."""
+        path = os.path.join(self.tmp_dir.name, "invalid")
+        os.makedirs(path)
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump({"format": "unknown"}, f)
+
+        with self.assertRaises(ValueError):
+            native.NativeReader(path)
@@ -0,0 +1,153 @@
+"""
+Tests for the memory mapped matrix reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+from pkg_resources import resource_filename
+
+from .generic_tests import TestContainer
+from .. import npy, plink, parsers
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+def _write_matrix(prefix):
+    """Writes the test dataset as a matrix and its tables."""
+    with plink.PlinkReader(PLINK_PREFIX) as reader:
+        genotypes = list(reader.iter_genotypes())
+        samples = reader.get_samples()
+
+    pd.DataFrame({
+        "name": [g.variant.name for g in genotypes],
+        "chrom": [g.variant.chrom for g in genotypes],
+        "pos": [g.variant.pos for g in genotypes],
+        "a1": [g.coded for g in genotypes],
+        "a2": [g.reference for g in genotypes],
+    }).to_csv(prefix + ".variants", sep="\t", index=False)
+
+    with open(prefix + ".samples", "w") as f:
+        f.write("".join(sample + "\n" for sample in samples))
+
+    return np.vstack([g.genotypes for g in genotypes])
+
+
+class TestNumpy(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.prefix = os.path.join(cls.tmp_dir.name, "matrix")
+        cls.matrix = _write_matrix(cls.prefix)
+        np.save(cls.prefix + ".npy", cls.matrix)
+
+        cls.reader_f = lambda x: npy.NumpyReader(cls.prefix + ".npy")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_memory_mapped(self):
+        """Test that the genotypes are views on the memory mapped matrix."""
+        with self.reader_f() as f:
+            self.assertIsInstance(f._genotypes, np.memmap)
+            for g in f.iter_genotypes():
+                self.assertTrue(np.shares_memory(g.genotypes, f._genotypes))
+                self.assertFalse(g.genotypes.flags.writeable)
+
+    def test_parsers(self):
+        """Test that the reader is registered."""
+        with parsers["npy"](self.prefix + ".npy") as f:
+            self.assertEqual(f.get_number_variants(), 5)
+
+    def test_invalid_shape(self):
+        """Test a matrix which does not match the tables."""
+        filename = os.path.join(self.tmp_dir.name, "invalid.npy")
+        np.save(filename, self.matrix[:, :4])
+        with self.assertRaises(ValueError):
+            npy.NumpyReader(filename, variants=self.prefix + ".variants",
+                            samples=self.prefix + ".samples")
+
+    def test_missing_columns(self):
+        """Test a variant table without the alleles."""
+        filename = os.path.join(self.tmp_dir.name, "invalid.variants")
+        npy.read_variants(self.prefix + ".variants").drop(
+            columns=["a1", "a2"],
+        ).to_csv(filename, sep="\t", index=False)
+
+        with self.assertRaises(ValueError) as cm:
+            npy.NumpyReader(self.prefix + ".npy", variants=filename)
+        self.assertIn("missing columns: a1, a2", str(cm.exception))
+
+
+class TestNumpyRaw(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.prefix = os.path.join(cls.tmp_dir.name, "matrix")
+        cls.matrix = _write_matrix(cls.prefix)
+        cls.matrix.astype(np.float32).tofile(cls.prefix + ".bin")
+
+        cls.reader_f = lambda x: npy.NumpyReader(cls.prefix + ".bin",
+                                                 dtype="f4")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_invalid_size(self):
+        """Test a raw matrix of the wrong type."""
+        with self.assertRaises(ValueError):
+            npy.NumpyReader(self.prefix + ".bin", dtype="f8")
+
+
+class TestNumpyArchive(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.prefix = os.path.join(cls.tmp_dir.name, "matrix")
+        cls.matrix = _write_matrix(cls.prefix)
+        np.savez_compressed(cls.prefix + ".npz", genotypes=cls.matrix)
+
+        cls.reader_f = lambda x: npy.NumpyReader(cls.prefix + ".npz")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
@@ -0,0 +1,176 @@
+"""
+Tests for the parallel processing of genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import gzip
+import shutil
+import unittest
+import logging
+import functools
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .. import parsers, parallel, plink, native, convert
+
+
+logging.disable(logging.CRITICAL)
+
+
+def _data(*path):
+    return resource_filename(__name__, os.path.join("data", *path))
+
+
+# The readers tested (format and arguments), the native and split datasets
+# being added by the test case
+READERS = [
+    ("plink", dict(prefix=_data("plink", "btest"))),
+    ("impute2", dict(filename=_data("impute2", "impute2_test.impute2.gz"),
+                     sample_filename=_data("impute2", "impute2_test.sample"))),
+    ("bgen", dict(filename=_data("bgen", "bgen_test.bgen"))),
+    ("pgen", dict(prefix=_data("pgen", "pgen_synthetic"))),
+]
+
+
+def _summarize(block):
+    """Computes the name and the sum of the genotypes of each variant."""
+    return [(v.name, np.nansum(g))
+            for v, g in zip(block.variants, block.genotypes)]
+
+
+def _fail(block):
+    raise ZeroDivisionError("failed on {}".format(block.variants[0].name))
+
+
+def _concatenate(a, b):
+    return a + b
+
+
+class TestMapBlocks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The native and split datasets are converted from the plink files
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        pattern = os.path.join(cls.tmp_dir.name, "chr{chrom}")
+        path = os.path.join(cls.tmp_dir.name, "native")
+        with plink.PlinkReader(_data("plink", "btest")) as reader:
+            native.convert(reader, path, chunk_size=2)
+            convert.convert(
+                reader,
+                lambda samples, chrom: plink.PlinkWriter(
+                    pattern.replace("{chrom}", chrom), samples,
+                ),
+                split_chromosomes=True,
+            )
+
+        cls.readers = [(name, kwargs) for name, kwargs in READERS
+                       if kwargs is not None]
+        cls.readers.append(("native", dict(path=path)))
+        cls.readers.append(("chrom-split-plink", dict(pattern=pattern)))
+
+        # An IMPUTE2 file without index (which can't be sharded)
+        filename = os.path.join(cls.tmp_dir.name, "unindexed.impute2")
+        with gzip.open(_data("impute2", "impute2_test.impute2.gz"),
+                       "rb") as i_file, open(filename, "wb") as o_file:
+            shutil.copyfileobj(i_file, o_file)
+        cls.readers.append((
+            "impute2",
+            dict(filename=filename,
+                 sample_filename=_data("impute2", "impute2_test.sample")),
+        ))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def _expected(self, reader):
+        return [(g.variant.name, np.nansum(g.genotypes))
+                for g in reader.iter_genotypes()]
+
+    def test_shared_memory(self):
+        """Test sending blocks to the workers through shared memory."""
+        for name, kwargs in self.readers:
+            with parsers[name](**kwargs) as reader:
+                results = parallel.map_blocks(reader, _summarize, n_jobs=2,
+                                              block_size=2)
+                self.assertEqual(
+                    [r for result in results for r in result],
+                    self._expected(reader),
+                    msg=name,
+                )
+
+    def test_shards(self):
+        """Test workers opening their own reader."""
+        for name, kwargs in self.readers:
+            open_reader = functools.partial(parsers[name], **kwargs)
+            progress = []
+            results = parallel.map_blocks(
+                open_reader, _summarize, n_jobs=2, block_size=2,
+                reduce=_concatenate, progress=lambda *a: progress.append(a),
+            )
+
+            with open_reader() as reader:
+                expected = self._expected(reader)
+                total = reader.get_number_variants()
+
+            self.assertEqual(results, expected, msg=name)
+            self.assertEqual(progress[-1], (len(expected), total))
+
+    def test_progress(self):
+        """Test the progress callback (shared memory)."""
+        progress = []
+        with parsers["plink"](**READERS[0][1]) as reader:
+            parallel.map_blocks(reader, _summarize, n_jobs=2, block_size=2,
+                                progress=lambda *a: progress.append(a))
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+
+    def test_errors(self):
+        """Test that the errors raised in the workers are propagated."""
+        with parsers["plink"](**READERS[0][1]) as reader:
+            with self.assertRaises(ZeroDivisionError):
+                parallel.map_blocks(reader, _fail, n_jobs=2, block_size=2)
+
+        open_reader = functools.partial(parsers["plink"], **READERS[0][1])
+        with self.assertRaises(ZeroDivisionError):
+            parallel.map_blocks(open_reader, _fail, n_jobs=2)
+
+    def test_views_are_copied(self):
+        """Test that arrays sharing the block's memory are copied."""
+        with parsers["plink"](**READERS[0][1]) as reader:
+            results = parallel.map_blocks(reader, _first_row, n_jobs=1,
+                                          block_size=5)
+            np.testing.assert_array_equal(
+                results[0], next(reader.iter_genotypes()).genotypes,
+            )
+
+
+def _first_row(block):
+    return block.genotypes[0]
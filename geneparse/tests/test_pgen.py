@@ -0,0 +1,120 @@
+"""
+Tests for the PLINK 2 (PGEN) reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import unittest
+import logging
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .generic_tests import TestContainer
+from .. import pgen, parsers
+
+
+logging.disable(logging.CRITICAL)
+
+
+def _get_prefix(prefix):
+    return resource_filename(__name__, os.path.join("data", "pgen", prefix))
+
+
+class TestPgen(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: pgen.PgenReader(_get_prefix("pgen_test"))
+
+    def test_registered(self):
+        """Test that the reader is registered in the parsers."""
+        self.assertIs(parsers["pgen"], pgen.PgenReader)
+
+
+class TestPgenFixedWidth(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: pgen.PgenReader(
+            _get_prefix("pgen_test_fixed"),
+        )
+
+
+class TestPgenFixedWidthDosage(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: pgen.PgenReader(
+            _get_prefix("pgen_test_dosage"),
+        )
+
+
+class TestPgenPlink1(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: pgen.PgenReader(_get_prefix("pgen_test_bed"))
+
+
+class TestPgenRecordTypes(unittest.TestCase):
+    """Tests the different record types (compared to pgenlib)."""
+    @classmethod
+    def setUpClass(cls):
+        cls.prefix = _get_prefix("pgen_synthetic")
+        cls.expected = np.load(cls.prefix + ".expected.npz")["genotypes"]
+
+    def assert_genotypes_equal(self, expected, observed):
+        np.testing.assert_allclose(expected, observed, atol=1e-6)
+
+    def test_iter_genotypes(self):
+        """Test iterating over all the record types."""
+        with pgen.PgenReader(self.prefix) as f:
+            self.assertEqual(f.get_number_variants(), len(self.expected))
+            self.assertEqual(f.get_number_samples(), 1000)
+
+            for expected, g in zip(self.expected, f.iter_genotypes()):
+                self.assert_genotypes_equal(expected, g.genotypes)
+
+    def test_iter_blocks(self):
+        """Test iterating using blocks which split LD compressed records."""
+        with pgen.PgenReader(self.prefix) as f:
+            blocks = list(f.iter_blocks(block_size=2))
+            genotypes = np.vstack([block.genotypes for block in blocks])
+            self.assert_genotypes_equal(self.expected, genotypes)
+
+    def test_get_variant_by_name(self):
+        """Test the random access to every record."""
+        with pgen.PgenReader(self.prefix) as f:
+            for i in reversed(range(len(self.expected))):
+                g = f.get_variant_by_name("syn{}".format(i))
+                self.assertEqual(len(g), 1)
+                self.assert_genotypes_equal(self.expected[i], g[0].genotypes)
+
+    def test_dtype(self):
+        """Test the type of the genotypes."""
+        with pgen.PgenReader(self.prefix, dtype="float32") as f:
+            for expected, g in zip(self.expected, f.iter_genotypes()):
+                self.assertEqual(g.genotypes.dtype, np.float32)
+                self.assert_genotypes_equal(expected, g.genotypes)
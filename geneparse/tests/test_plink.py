@@ -29,8 +29,11 @@ Tests for the plink implementation.
 
 import os
 import unittest
+from unittest import mock
 import logging
+from tempfile import TemporaryDirectory
 
+import numpy as np
 from pkg_resources import resource_filename
 
 from .generic_tests import TestContainer
@@ -50,3 +53,50 @@ class TestPlink(TestContainer, unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.reader_f = lambda x: plink.PlinkReader(PLINK_PREFIX)
+
+    def test_iter_chunks(self):
+        """Test that only the markers of large chunks are copied."""
+        with self.reader_f() as f:
+            first, second = list(f.iter_genotypes())[:2]
+            self.assertIsNotNone(first.genotypes.base)
+            self.assertIs(first.genotypes.base, second.genotypes.base)
+
+            with mock.patch.object(plink, "_ITER_SHARED_CHUNK_BYTES", 0):
+                first, second = list(f.iter_genotypes())[:2]
+            self.assertIsNone(first.genotypes.base)
+            self.assertIsNone(second.genotypes.base)
+
+
+class TestPlinkWriter(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        cls.prefix = os.path.join(cls.tmp_dir.name, "btest")
+
+        # Small blocks, so that there are multiple blocks
+        with plink.PlinkReader(PLINK_PREFIX) as reader, \
+                plink.PlinkWriter(cls.prefix, reader.get_samples()) as writer:
+            for block in reader.iter_blocks(2):
+                writer.write_block(block)
+
+        cls.reader_f = lambda x: plink.PlinkReader(cls.prefix)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_identical_bed(self):
+        """Test that the written BED file is identical to the original."""
+        with open(PLINK_PREFIX + ".bed", "rb") as f:
+            expected = f.read()
+        with open(self.prefix + ".bed", "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_pack_bed(self):
+        """Test the packing of (dosage) values, with padding."""
+        genotypes = np.array([[0, 1, 2, np.nan, 0.4, 1.6],
+                              [2, 2, 2, 2, 2, 2]])
+        self.assertEqual(
+            plink._pack_bed(genotypes, 6),
+            bytes([0b01001011, 0b0011, 0, 0]),
+        )
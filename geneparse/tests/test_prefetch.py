@@ -0,0 +1,109 @@
+"""
+Tests for the prefetching reader.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import time
+import unittest
+import logging
+import threading
+
+from pkg_resources import resource_filename
+
+from . import truth
+from .generic_tests import TestContainer
+from .. import plink
+from ..prefetch import PrefetchingReader
+
+
+logging.disable(logging.CRITICAL)
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class _FailingReader(plink.PlinkReader):
+    """Raises an exception after the second variant."""
+    def iter_genotypes(self):
+        for i, g in enumerate(super().iter_genotypes()):
+            if i == 2:
+                raise RuntimeError("decoding failed")
+            yield g
+
+
+class TestPrefetching(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = lambda x: PrefetchingReader(
+            plink.PlinkReader(PLINK_PREFIX), max_prefetch=2,
+        )
+
+    def test_exception_propagation(self):
+        """Test that decoding errors are raised in the consumer."""
+        reader = PrefetchingReader(_FailingReader(PLINK_PREFIX))
+        with reader:
+            iterator = reader.iter_genotypes()
+            next(iterator)
+            next(iterator)
+            with self.assertRaises(RuntimeError):
+                next(iterator)
+
+    def test_early_close(self):
+        """Test that closing the reader stops the background threads."""
+        nb_threads = threading.active_count()
+        with self.reader_f() as f:
+            iterator = f.iter_genotypes()
+            g = next(iterator)
+            self.assertEqual(truth.genotypes[truth.variant_to_key[g.variant]],
+                             g)
+
+            # Giving time to the producer to fill the queue
+            time.sleep(0.05)
+
+        self.assertEqual(list(iterator), [])
+        self.assertEqual(threading.active_count(), nb_threads)
+
+    def test_early_stop_iteration(self):
+        """Test that closing the iterator stops the background thread."""
+        nb_threads = threading.active_count()
+        with self.reader_f() as f:
+            for block in f.iter_blocks(block_size=1):
+                break
+            del block
+
+            # The iterator is closed when garbage collected
+            self.assertEqual(threading.active_count(), nb_threads)
+
+    def test_invalid_max_prefetch(self):
+        """Test that the number of prefetched items should be positive."""
+        with self.assertRaises(ValueError):
+            PrefetchingReader(plink.PlinkReader(PLINK_PREFIX), max_prefetch=0)
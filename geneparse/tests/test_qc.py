@@ -0,0 +1,185 @@
+"""
+Tests for the quality control statistics.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import unittest
+import functools
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .. import parsers, qc
+
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+def _snphwe(obs_hets, obs_hom1, obs_hom2):
+    """Reference implementation of the HWE exact test (Wigginton et al.)."""
+    obs_homc = max(obs_hom1, obs_hom2)
+    obs_homr = min(obs_hom1, obs_hom2)
+    rare = 2 * obs_homr + obs_hets
+    genotypes = obs_hets + obs_homc + obs_homr
+
+    probs = [0.0] * (rare + 1)
+    mid = rare * (2 * genotypes - rare) // (2 * genotypes)
+    if mid % 2 != rare % 2:
+        mid += 1
+    probs[mid] = 1.0
+    total = 1.0
+
+    curr_homr = (rare - mid) // 2
+    curr_homc = genotypes - mid - curr_homr
+    h = mid
+    while h >= 2:
+        probs[h - 2] = (probs[h] * h * (h - 1) /
+                        (4.0 * (curr_homr + 1) * (curr_homc + 1)))
+        total += probs[h - 2]
+        h -= 2
+        curr_homr += 1
+        curr_homc += 1
+
+    curr_homr = (rare - mid) // 2
+    curr_homc = genotypes - mid - curr_homr
+    h = mid
+    while h <= rare - 2:
+        probs[h + 2] = (probs[h] * 4.0 * curr_homr * curr_homc /
+                        ((h + 2) * (h + 1)))
+        total += probs[h + 2]
+        h += 2
+        curr_homr -= 1
+        curr_homc -= 1
+
+    probs = [p / total for p in probs]
+    return min(1.0, sum(p for p in probs
+                        if p <= probs[obs_hets] * (1 + 1e-7)))
+
+
+class TestHWE(unittest.TestCase):
+    def test_hwe_exact(self):
+        """Test the HWE exact test against the reference implementation."""
+        random = np.random.RandomState(42)
+        counts = np.vstack([
+            [[57, 14, 50], [0, 0, 10], [10, 0, 0], [1, 0, 0], [100, 300, 600],
+             [0, 50, 50]],
+            random.randint(0, 60, size=(200, 3)),
+        ])
+        observed = qc.hwe_exact(counts[:, 0], counts[:, 1], counts[:, 2])
+        expected = [_snphwe(*map(int, c)) for c in counts]
+        np.testing.assert_allclose(observed, expected, rtol=1e-9,
+                                   atol=1e-300)
+        self.assertAlmostEqual(observed[0], 0.842279757, places=8)
+
+    def test_hwe_exact_groups(self):
+        """Test the HWE exact test with many groups of variants."""
+        counts = np.array([[1, 2, 3], [40, 20, 500], [3, 0, 1], [5, 5, 5]])
+        expected = qc.hwe_exact(counts[:, 0], counts[:, 1], counts[:, 2])
+        original = qc._HWE_MAX_VALUES
+        try:
+            qc._HWE_MAX_VALUES = 2
+            observed = qc.hwe_exact(counts[:, 0], counts[:, 1], counts[:, 2])
+        finally:
+            qc._HWE_MAX_VALUES = original
+        np.testing.assert_allclose(observed, expected)
+
+    def test_hwe_exact_no_genotype(self):
+        """Test the HWE exact test without genotype."""
+        self.assertTrue(np.isnan(qc.hwe_exact([0], [0], [0])[0]))
+        self.assertEqual(len(qc.hwe_exact([], [], [])), 0)
+
+
+class TestQC(unittest.TestCase):
+    def setUp(self):
+        self.reader = parsers["plink"](PLINK_PREFIX)
+        self.expected = list(self.reader.iter_genotypes())
+
+    def tearDown(self):
+        self.reader.close()
+
+    def _check(self, results):
+        variants = results.variant_stats()
+        self.assertEqual(variants.name.tolist(),
+                         [g.variant.name for g in self.expected])
+        self.assertEqual(variants.pos.tolist(),
+                         [g.variant.pos for g in self.expected])
+
+        genotypes = np.vstack([g.genotypes for g in self.expected])
+        called = ~np.isnan(genotypes)
+        np.testing.assert_allclose(
+            variants.coded_freq, [g.coded_freq() for g in self.expected],
+        )
+        np.testing.assert_allclose(variants.missing_rate,
+                                   1 - called.mean(axis=1))
+        for value, column in enumerate(("n_hom_ref", "n_het", "n_hom_coded")):
+            np.testing.assert_array_equal(variants[column],
+                                          (genotypes == value).sum(axis=1))
+        np.testing.assert_allclose(variants.hwe_p, [
+            _snphwe(*map(int, c)) for c in
+            variants[["n_het", "n_hom_ref", "n_hom_coded"]].values
+        ])
+
+        samples = results.sample_stats()
+        self.assertEqual(samples.index.tolist(), self.reader.get_samples())
+        np.testing.assert_allclose(samples.call_rate, called.mean(axis=0))
+        np.testing.assert_allclose(
+            samples.heterozygosity,
+            (genotypes == 1).sum(axis=0) / called.sum(axis=0),
+        )
+
+    def test_compute_qc(self):
+        """Test the statistics computed in a single pass."""
+        self._check(qc.compute_qc(self.reader, block_size=2))
+
+    def test_merge(self):
+        """Test merging the statistics of shards."""
+        accumulators = []
+        for k in range(3):
+            accumulator = qc.QCAccumulator(self.reader.get_number_samples())
+            for block in self.reader.shard(k, 3).iter_blocks(1):
+                accumulator.update(block)
+            accumulators.append(accumulator)
+
+        results = functools.reduce(qc._merge, accumulators)
+        results.samples = self.reader.get_samples()
+        self._check(results)
+
+        with self.assertRaises(ValueError):
+            results.merge(qc.QCAccumulator(2))
+
+    def test_compute_qc_parallel(self):
+        """Test the statistics computed by multiple processes."""
+        self._check(qc.compute_qc(
+            functools.partial(parsers["plink"], PLINK_PREFIX), n_jobs=2,
+            block_size=2, nb_shards=3,
+        ))
+        self._check(qc.compute_qc(self.reader, n_jobs=2, block_size=2))
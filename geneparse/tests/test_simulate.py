@@ -0,0 +1,162 @@
+"""
+Tests for the synthetic dataset generator.
+"""
+
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from .. import simulate
+from ..plink import PlinkReader
+from ..impute2 import Impute2Reader
+from ..__main__ import main
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestSimulateBlocks(unittest.TestCase):
+    def test_reproducible(self):
+        """Test that the same seed generates the same dataset."""
+        def generate(seed):
+            return list(simulate.simulate_blocks(20, 500, seed=seed,
+                                                 block_size=64))
+
+        first, second, other = generate(1), generate(1), generate(2)
+        for a, b in zip(first, second):
+            self.assertEqual(a.variants, b.variants)
+            np.testing.assert_array_equal(a.genotypes, b.genotypes)
+            self.assertEqual(a.coded, b.coded)
+
+        self.assertFalse(all(
+            np.array_equal(a.genotypes, b.genotypes, equal_nan=True)
+            for a, b in zip(first, other)
+        ))
+
+    def test_blocks(self):
+        """Test the size and content of the blocks."""
+        blocks = list(simulate.simulate_blocks(
+            10, 1000, block_size=64, chromosomes=["1", "2"],
+            multiallelic_rate=0.1, duplicated_rate=0.05, missing_rate=0.1,
+        ))
+        self.assertEqual(sum(len(block) for block in blocks), 1000)
+        self.assertTrue(all(len(block) <= 64 for block in blocks))
+        self.assertTrue(all(block.genotypes.shape[1] == 10
+                            for block in blocks))
+
+        variants = [v for block in blocks for v in block.variants]
+        self.assertEqual({v.chrom for v in variants}, {"1", "2"})
+        for chrom in ("1", "2"):
+            positions = [v.pos for v in variants if v.chrom == chrom]
+            self.assertEqual(positions, sorted(positions))
+
+        # Triallelic loci are two consecutive variants (same locus, same
+        # reference allele)
+        multiallelic = np.concatenate([b.multiallelic for b in blocks])
+        self.assertGreater(multiallelic.sum(), 0)
+        reference = [r for block in blocks for r in block.reference]
+        coded = [c for block in blocks for c in block.coded]
+        for i in np.flatnonzero(multiallelic)[::2]:
+            self.assertTrue(multiallelic[i + 1])
+            self.assertEqual((variants[i].chrom, variants[i].pos),
+                             (variants[i + 1].chrom, variants[i + 1].pos))
+            self.assertEqual(reference[i], reference[i + 1])
+            self.assertNotEqual(coded[i], coded[i + 1])
+
+        # Duplicated loci share the name of the previous locus
+        names = [v.name for i, v in enumerate(variants)
+                 if not multiallelic[i] or i == 0 or not multiallelic[i - 1]]
+        self.assertLess(len(set(names)), len(names))
+
+        genotypes = np.vstack([block.genotypes for block in blocks])
+        self.assertTrue(np.isnan(genotypes).any())
+        values = genotypes[~np.isnan(genotypes)]
+        self.assertEqual(set(np.unique(values)), {0, 1, 2})
+
+
+class TestSimulate(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        self.prefix = os.path.join(self.tmp_dir.name, "sim")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_formats(self):
+        """Test that every format contains the same genotypes."""
+        result = simulate.simulate(
+            self.prefix, 15, 300, formats=["plink", "impute2-bgzip"],
+            multiallelic_rate=0.05, block_size=50,
+        )
+        self.assertEqual(result["nb_samples"], 15)
+        self.assertEqual(result["nb_variants"], 300)
+        for filename in result["files"]:
+            self.assertTrue(os.path.isfile(filename), filename)
+        self.assertIn(self.prefix + ".impute2_info", result["files"])
+
+        impute2 = Impute2Reader(self.prefix + ".impute2.gz",
+                                self.prefix + ".sample",
+                                info_filename=self.prefix + ".impute2_info")
+        with PlinkReader(self.prefix) as plink, impute2:
+            self.assertEqual(list(plink.get_samples()),
+                             list(impute2.get_samples()))
+            self.assertEqual(impute2.get_number_variants(), 300)
+
+            nb_multiallelic = 0
+            for expected, observed in zip(plink.iter_genotypes(),
+                                          impute2.iter_genotypes()):
+                self.assertEqual(expected.variant.name,
+                                 observed.variant.name)
+                self.assertEqual(expected.variant.pos, observed.variant.pos)
+                self.assertEqual(expected.variant.chrom,
+                                 observed.variant.chrom)
+                self.assertEqual(expected.coded, observed.coded)
+                self.assertEqual(expected.reference, observed.reference)
+                np.testing.assert_array_equal(expected.genotypes,
+                                              observed.genotypes)
+                self.assertTrue(0 <= observed.variant.quality <= 1)
+                nb_multiallelic += expected.multiallelic
+            self.assertGreater(nb_multiallelic, 0)
+
+    def test_invalid_formats(self):
+        """Test that invalid formats raise an error."""
+        with self.assertRaises(ValueError) as cm:
+            simulate.simulate(self.prefix, 10, 10, formats=["plink", "bgen"])
+        self.assertEqual("invalid formats: bgen", str(cm.exception))
+        self.assertFalse(os.listdir(self.tmp_dir.name))
+
+    def test_command_line(self):
+        """Test the 'simulate' command."""
+        main(["simulate", self.prefix, "--samples", "5", "--variants", "40",
+              "--formats", "plink", "--seed", "3"])
+        with PlinkReader(self.prefix) as reader:
+            self.assertEqual(reader.get_number_samples(), 5)
+            self.assertEqual(reader.get_number_variants(), 40)
@@ -0,0 +1,233 @@
+"""
+Tests for the instrumentation of the readers.
+"""
+
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import gzip
+import shutil
+import unittest
+from unittest import mock
+import logging
+from tempfile import TemporaryDirectory
+
+from Bio import bgzf
+
+from . import truth
+from .generic_tests import (TestContainer, reader_factory, PLINK_PREFIX,
+                            IMPUTE2_FN, IMPUTE2_SAMPLE_FN)
+from .. import plink, impute2
+from ..stats import ReaderStats, COUNTERS, PHASES
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestInstrumentedPlink(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            plink.PlinkReader, PLINK_PREFIX,
+            setup=lambda reader: reader.enable_stats(),
+        )
+
+    def test_stats_iteration(self):
+        """Test the statistics of a sequential scan."""
+        with self.reader_f() as f:
+            nb_variants = sum(1 for _ in f.iter_genotypes())
+            stats = f.stats()
+
+            self.assertEqual(stats["variants"], nb_variants)
+            self.assertEqual(stats["seeks"], 1)
+            self.assertEqual(stats["bytes_read"], nb_variants * 2)
+            self.assertEqual(stats["lines_parsed"], 0)
+            self.assertGreater(stats["decode_seconds"], 0)
+            self.assertGreater(stats["construct_seconds"], 0)
+
+    def test_stats_lookups(self):
+        """Test the statistics of point lookups."""
+        with self.reader_f() as f:
+            f.get_variant_by_name("rs785467")
+            f.get_variant_genotypes(truth.variants["rs146589823"])
+            stats = f.stats()
+
+            self.assertEqual(stats["variants"], 2)
+            self.assertEqual(stats["seeks"], 2)
+            self.assertEqual(stats["bytes_read"], 4)
+            self.assertGreater(stats["index_seconds"], 0)
+
+    def test_disable_stats(self):
+        """Test disabling the statistics."""
+        with self.reader_f() as f:
+            f.disable_stats()
+            self.assertIsNone(f.stats())
+            f.get_variant_by_name("rs785467")
+            self.assertIsNone(f.stats())
+
+
+class TestInstrumentedImpute2(TestContainer, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reader_f = reader_factory(
+            impute2.Impute2Reader, IMPUTE2_FN, IMPUTE2_SAMPLE_FN,
+            setup=lambda reader: reader.enable_stats(),
+        )
+
+    def test_stats_iteration(self):
+        """Test the statistics of a sequential scan (bgzip file)."""
+        with self.reader_f() as f:
+            nb_variants = sum(1 for _ in f.iter_genotypes())
+            stats = f.stats()
+
+            self.assertEqual(stats["variants"], nb_variants)
+            self.assertEqual(stats["lines_parsed"], nb_variants)
+
+            # All the blocks are read once (including the empty EOF block)
+            with open(IMPUTE2_FN, "rb") as f_in:
+                nb_blocks = sum(1 for _ in bgzf.BgzfBlocks(f_in))
+            self.assertEqual(stats["bgzf_blocks"], nb_blocks)
+            self.assertEqual(stats["bytes_read"],
+                             os.path.getsize(IMPUTE2_FN))
+            self.assertEqual(stats["seeks"], 0)
+            self.assertGreater(stats["parse_seconds"], 0)
+            self.assertGreater(stats["decompress_seconds"], 0)
+
+
+    def test_bgzf_blocks(self):
+        """Test counting the blocks of a file with multiple blocks."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            filename = os.path.join(tmp_dir, "test.gz")
+            with bgzf.BgzfWriter(filename, "wb") as f:
+                for i in range(20000):
+                    f.write("line {}\n".format(i).encode())
+            with open(filename, "rb") as f:
+                nb_blocks = sum(1 for _ in bgzf.BgzfBlocks(f))
+            self.assertGreater(nb_blocks, 3)
+
+            reader = mock.Mock(_stats=ReaderStats())
+            with impute2._InstrumentedBgzfReader(filename, "r", reader) as f:
+                offsets = []
+                for line in iter(f.readline, ""):
+                    offsets.append(f.tell())
+                stats = reader._stats.snapshot()
+                self.assertEqual(stats["bgzf_blocks"], nb_blocks)
+                self.assertEqual(stats["bytes_read"],
+                                 os.path.getsize(filename))
+                self.assertEqual(stats["seeks"], 0)
+
+
+            # Going to a line in another block (after opening the file)
+            with impute2._InstrumentedBgzfReader(filename, "r", reader) as f:
+                reader._stats.reset()
+                f.seek(offsets[14999])
+                self.assertEqual(f.readline(), "line 15000\n")
+                stats = reader._stats.snapshot()
+                self.assertEqual(stats["bgzf_blocks"], 1)
+                self.assertEqual(stats["seeks"], 1)
+    def test_stats_uncompressed(self):
+        """Test the statistics on an uncompressed file."""
+        with TemporaryDirectory(prefix="geneparse_test_") as tmp_dir:
+            filename = os.path.join(tmp_dir, "test.impute2")
+            with gzip.open(IMPUTE2_FN, "rb") as f_in, \
+                    open(filename, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            impute2.generate_index(filename, cols=[0, 1, 2],
+                                   names=["chrom", "name", "pos"])
+
+            with impute2.Impute2Reader(filename, IMPUTE2_SAMPLE_FN) as f:
+                reader_stats = f.enable_stats()
+                nb_variants = sum(1 for _ in f.iter_genotypes())
+                stats = f.stats()
+                self.assertEqual(stats["lines_parsed"], nb_variants)
+                self.assertEqual(stats["bytes_read"],
+                                 os.path.getsize(filename))
+                self.assertEqual(stats["bgzf_blocks"], 0)
+                self.assertEqual(stats["seeks"], 0)
+
+                reader_stats.reset()
+                f.get_variant_by_name("rs785467")
+                stats = f.stats()
+                self.assertEqual(stats["seeks"], 1)
+                self.assertEqual(stats["variants"], 1)
+                self.assertEqual(stats["lines_parsed"], 1)
+                self.assertGreater(stats["index_seconds"], 0)
+
+    def test_callback(self):
+        """Test that the callbacks receive every update."""
+        events = []
+        with self.reader_f() as f:
+            f.enable_stats(callback=lambda name, value: events.append(
+                (name, value)
+            ))
+            f.get_variant_by_name("rs785467")
+            stats = f.stats()
+
+        totals = dict.fromkeys(stats, 0)
+        for name, value in events:
+            totals[name] += value
+        self.assertEqual(totals, stats)
+        self.assertIn(("variants", 1), events)
+
+
+class TestReaderStats(unittest.TestCase):
+    def test_snapshot(self):
+        """Test the counters and timers."""
+        stats = ReaderStats()
+        self.assertEqual(
+            set(stats.snapshot()),
+            set(COUNTERS) | {phase + "_seconds" for phase in PHASES},
+        )
+
+        stats.count(seeks=1, bytes_read=10)
+        stats.count(bytes_read=5)
+        start = stats.add_time("parse", 0)
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["seeks"], 1)
+        self.assertEqual(snapshot["bytes_read"], 15)
+        self.assertEqual(snapshot["parse_seconds"], start)
+
+        # The snapshot is a copy
+        stats.count(seeks=1)
+        self.assertEqual(snapshot["seeks"], 1)
+
+        stats.reset()
+        self.assertEqual(stats.snapshot()["seeks"], 0)
+
+    def test_unknown_counter(self):
+        """Test that unknown counters raise an error."""
+        stats = ReaderStats()
+        with self.assertRaises(KeyError):
+            stats.count(unknown=1)
+
+    def test_remove_callback(self):
+        """Test removing a callback."""
+        events = []
+        stats = ReaderStats(callback=events.append)
+        stats.remove_callback(events.append)
+        stats.count(seeks=1)
+        self.assertEqual(events, [])
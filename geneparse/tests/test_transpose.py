@@ -0,0 +1,149 @@
+"""
+Tests for the sample-major (transposed) cache.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import gzip
+import shutil
+import unittest
+from unittest import mock
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from pkg_resources import resource_filename
+
+from .. import parsers, transpose
+
+
+IMPUTE2_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.impute2.gz"),
+)
+IMPUTE2_SAMPLE_FN = resource_filename(
+    __name__,
+    os.path.join("data", "impute2", "impute2_test.sample"),
+)
+
+PLINK_PREFIX = resource_filename(
+    __name__,
+    os.path.join("data", "plink", "btest"),
+)
+
+
+class TestTransposedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+        self.path = os.path.join(self.tmp_dir.name, "transposed")
+        self.reader = parsers["plink"](PLINK_PREFIX)
+
+    def tearDown(self):
+        self.reader.close()
+        self.tmp_dir.cleanup()
+
+    def test_get_sample_genotypes(self):
+        """Test that the cache gives the same genotypes as the reader."""
+        samples = ["SAMPLE5", "SAMPLE2", "SAMPLE3"]
+        expected = self.reader.get_sample_genotypes(samples)
+
+        cache = self.reader.enable_transposed_cache(self.path)
+        self.assertEqual(cache.get_number_samples(), 5)
+        self.assertEqual(cache.get_number_variants(), 5)
+
+        observed = self.reader.get_sample_genotypes(samples)
+        self.assertEqual(observed.variants, expected.variants)
+        self.assertEqual([v.name for v in observed.variants],
+                         [v.name for v in expected.variants])
+        self.assertEqual(observed.reference, expected.reference)
+        self.assertEqual(observed.coded, expected.coded)
+        self.assertEqual(observed.multiallelic, expected.multiallelic)
+        np.testing.assert_array_equal(observed.genotypes, expected.genotypes)
+
+        with self.assertRaises(ValueError):
+            self.reader.get_sample_genotypes(["SAMPLE6"])
+
+        # Disabling the cache
+        self.reader.disable_transposed_cache()
+        with mock.patch.object(transpose.TransposedCache,
+                               "get_sample_genotypes") as m:
+            self.reader.get_sample_genotypes(samples)
+            m.assert_not_called()
+
+    def test_reuse(self):
+        """Test that an existing cache is used (unless outdated)."""
+        self.reader.enable_transposed_cache(self.path)
+
+        with mock.patch.object(transpose, "build",
+                               wraps=transpose.build) as m:
+            self.reader.enable_transposed_cache(self.path)
+            m.assert_not_called()
+
+            self.reader.enable_transposed_cache(self.path, rebuild=True)
+            self.assertEqual(m.call_count, 1)
+
+            # Different samples
+            with open(os.path.join(self.path, "samples.txt"), "a") as f:
+                f.write("SAMPLE6\n")
+            with self.assertRaises(ValueError):
+                transpose.TransposedCache(self.path)
+
+    def test_outdated(self):
+        """Test that a cache of another dataset is rebuilt."""
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, "samples.txt"), "w") as f:
+            f.write("SAMPLE1\n")
+        np.save(os.path.join(self.path, "genotypes.npy"),
+                np.zeros((1, 5), dtype=np.float32))
+        with open(os.path.join(self.path, "metadata.json"), "w") as f:
+            f.write('{"format": "geneparse-transposed", "version": 1, '
+                    '"n_samples": 1, "n_variants": 5, "dtype": "<f4"}')
+
+        cache = self.reader.enable_transposed_cache(self.path)
+        self.assertEqual(cache.get_samples(), self.reader.get_samples())
+
+    def test_unindexed(self):
+        """Test building the cache from a reader without an index."""
+        filename = os.path.join(self.tmp_dir.name, "test.impute2")
+        with gzip.open(IMPUTE2_FN, "rb") as i_file, \
+                open(filename, "wb") as o_file:
+            shutil.copyfileobj(i_file, o_file)
+
+        with parsers["impute2"](filename, IMPUTE2_SAMPLE_FN) as reader:
+            self.assertIsNone(reader.get_number_variants())
+            cache = reader.enable_transposed_cache(self.path)
+
+        self.assertEqual(cache.get_number_variants(), 5)
+        self.assertEqual(cache.metadata["source"],
+                         {"reader": "Impute2Reader", "filename": filename})
+
+    def test_transpose_tiles(self):
+        """Test the transposition using many small tiles."""
+        a = np.arange(3000 * 7, dtype=np.float32).reshape(3000, 7)
+        out = np.empty((7, 3000), dtype=np.float32)
+        transpose._transpose(a, out, max_memory=4096)
+        np.testing.assert_array_equal(out, a.T)
@@ -0,0 +1,112 @@
+"""
+Tests for the VCF writer.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import gzip
+import unittest
+import logging
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from ..core import Variant, GenotypesBlock
+from .. import vcf
+
+
+logging.disable(logging.CRITICAL)
+
+
+def _make_block():
+    return GenotypesBlock(
+        variants=[Variant("rs1", "1", 100, ["A", "T"]),
+                  Variant("rs2", "X", 200, ["G", "C"])],
+        genotypes=np.array([[0, 1, 2, np.nan], [0.2, 1.25, 1.8, 2]]),
+        reference=["A", "G"],
+        coded=["T", "C"],
+        multiallelic=[False, False],
+    )
+
+
+class TestVCFWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory(prefix="geneparse_test_")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, filename, **kwargs):
+        filename = os.path.join(self.tmp_dir.name, filename)
+        samples = ["s1", "s2", "s3", "s4"]
+        with vcf.VCFWriter(filename, samples, **kwargs) as writer:
+            writer.write_block(_make_block())
+
+        open_func = gzip.open if filename.endswith(".gz") else open
+        with open_func(filename, "rt") as f:
+            return f.read().splitlines()
+
+    def test_genotypes(self):
+        """Test writing hard calls."""
+        lines = self._write("test.vcf")
+        self.assertEqual(lines[0], "##fileformat=VCFv4.2")
+        self.assertEqual(
+            lines[-3],
+            "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"
+            "s1\ts2\ts3\ts4",
+        )
+        self.assertEqual(
+            lines[-2], "1\t100\trs1\tA\tT\t.\t.\t.\tGT\t0/0\t0/1\t1/1\t./.",
+        )
+        self.assertEqual(
+            lines[-1], "X\t200\trs2\tG\tC\t.\t.\t.\tGT\t0/0\t0/1\t1/1\t1/1",
+        )
+
+    def test_dosage(self):
+        """Test writing hard calls and dosage (bgzip compressed)."""
+        lines = self._write("test.vcf.gz", dosage=True)
+        self.assertIn("##FORMAT=<ID=DS", lines[3])
+        self.assertEqual(
+            lines[-2].split("\t")[8:],
+            ["GT:DS", "0/0:0", "0/1:1", "1/1:2", "./.:."],
+        )
+        self.assertEqual(
+            lines[-1].split("\t")[8:],
+            ["GT:DS", "0/0:0.2", "0/1:1.25", "1/1:1.8", "1/1:2"],
+        )
+
+    def test_write_genotypes(self):
+        """Test writing a single variant."""
+        filename = os.path.join(self.tmp_dir.name, "test.vcf")
+        with vcf.VCFWriter(filename, ["s1", "s2", "s3", "s4"]) as writer:
+            for genotypes in _make_block().iter_genotypes():
+                writer.write_genotypes(genotypes)
+
+        with open(filename) as f:
+            self.assertEqual(f.read().splitlines()[-2:],
+                             self._write("expected.vcf")[-2:])
@@ -0,0 +1,106 @@
+"""
+Compare the latency and throughput of synchronous and asynchronous lookups.
+
+Usage:
+
+    python -m geneparse.tools.benchmark_aio plink prefix=path/to/prefix
+
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .. import parsers
+from ..aio import AsyncGenotypesReader
+
+
+def benchmark_sync(reader, names):
+    """Looks up variants by name, one after the other."""
+    latencies = []
+    start = time.perf_counter()
+    for name in names:
+        t = time.perf_counter()
+        reader.get_variant_by_name(name)
+        latencies.append(time.perf_counter() - t)
+
+    return time.perf_counter() - start, latencies
+
+
+async def _benchmark_async(async_reader, names, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(name):
+        async with semaphore:
+            t = time.perf_counter()
+            await async_reader.get_variant_by_name(name)
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[lookup(name) for name in names])
+    return time.perf_counter() - start, latencies
+
+
+def benchmark_async(reader, names, concurrency, max_workers):
+    """Looks up variants by name, with at most 'concurrency' requests."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        async_reader = AsyncGenotypesReader(reader, executor=executor)
+        return asyncio.run(_benchmark_async(async_reader, names, concurrency))
+
+
+def summarize(label, elapsed, latencies):
+    latencies = np.array(latencies) * 1000
+    print("{:<24} {:>10,.1f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+        label,
+        len(latencies) / elapsed,
+        np.mean(latencies),
+        np.percentile(latencies, 50),
+        np.percentile(latencies, 99),
+    ))
+
+
+def main():
+    args = parse_args()
+
+    reader_kwargs = dict(arg.split("=", 1) for arg in args.reader_args)
+    with parsers[args.format](**reader_kwargs) as reader:
+        names = [v.name for v in reader.iter_variants()]
+        random.seed(args.seed)
+        names = [random.choice(names) for _ in range(args.nb_lookups)]
+
+        print("{:<24} {:>10} {:>10} {:>10} {:>10}".format(
+            "mode", "lookups/s", "mean (ms)", "p50 (ms)", "p99 (ms)",
+        ))
+        summarize("sync", *benchmark_sync(reader, names))
+        for concurrency in args.concurrency:
+            summarize(
+                "async (concurrency={})".format(concurrency),
+                *benchmark_async(reader, names, concurrency, args.workers)
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("format", choices=sorted(parsers.keys()),
+                        help="The format of the genotype file.")
+    parser.add_argument("reader_args", nargs="+", metavar="KEY=VALUE",
+                        help="The arguments used to create the reader.")
+    parser.add_argument("--nb-lookups", type=int, default=1000,
+                        help="The number of lookups. [%(default)d]")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8, 32],
+                        help="The number of concurrent requests. [1 8 32]")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="The number of worker threads. [%(default)d]")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="The random seed. [%(default)d]")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
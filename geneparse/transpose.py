@@ -0,0 +1,283 @@
+"""
+Sample-major (transposed) cache of the genotypes.
+"""
+
+
+# This file is part of geneparse.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2017 Pharmacogenomics Centre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import json
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .core import GenotypesBlock, Variant, _sample_indices
+
+
+logger = logging.getLogger(__name__)
+
+
+FORMAT_NAME = "geneparse-transposed"
+FORMAT_VERSION = 1
+
+
+class TransposedCache(object):
+    def __init__(self, path):
+        """Sample-major copy of the genotypes (see 'build').
+
+        Args:
+            path (str): The directory containing the cache.
+
+        The genotypes are stored as an uncompressed (samples x variants)
+        array, which is memory mapped. Reading all the genotypes of a sample
+        is hence a single contiguous read.
+
+        Note
+        ====
+            The cache is not updated when the original files change (see
+            'GenotypesReader.enable_transposed_cache').
+
+        """
+        self.path = path
+
+        with open(os.path.join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+
+        if self.metadata.get("format") != FORMAT_NAME:
+            raise ValueError("{}: not a transposed cache".format(path))
+
+        if self.metadata["version"] > FORMAT_VERSION:
+            raise ValueError("{}: unsupported format version {}".format(
+                path, self.metadata["version"],
+            ))
+
+        with open(os.path.join(path, "samples.txt")) as f:
+            self.samples = [line.rstrip("\r\n") for line in f]
+
+        if len(self.samples) != self.metadata["n_samples"]:
+            raise ValueError("{}: invalid number of samples".format(path))
+
+        self._genotypes = np.load(os.path.join(path, "genotypes.npy"),
+                                  mmap_mode="r")
+        if self._genotypes.shape != (self.metadata["n_samples"],
+                                     self.metadata["n_variants"]):
+            raise ValueError("{}: invalid genotypes shape".format(path))
+
+        # The variants (created when required)
+        self._variants = None
+        self._variants_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<TransposedCache {:,d} samples; {:,d} variants>".format(
+            self.get_number_samples(), self.get_number_variants(),
+        )
+
+    def close(self):
+        self._genotypes = None
+
+    @staticmethod
+    def exists(path):
+        """Checks if a (complete) cache exists in a directory."""
+        return os.path.isfile(os.path.join(path, "metadata.json"))
+
+    def matches(self, reader):
+        """Checks if the cache has the samples and variants of a reader."""
+        if list(map(str, reader.get_samples())) != self.samples:
+            return False
+
+        try:
+            nb_variants = reader.get_number_variants()
+        except NotImplementedError:
+            nb_variants = None
+        return nb_variants is None or nb_variants == self.get_number_variants()
+
+    def get_samples(self):
+        return self.samples
+
+    def get_number_samples(self):
+        return self.metadata["n_samples"]
+
+    def get_number_variants(self):
+        return self.metadata["n_variants"]
+
+    def _get_variants(self):
+        """Reads the variant table (once)."""
+        with self._variants_lock:
+            if self._variants is None:
+                table = pd.read_csv(
+                    os.path.join(self.path, "variants.txt"), sep="\t",
+                    dtype=dict(name=str, chrom=str, reference=str, coded=str),
+                    keep_default_na=False,
+                )
+                self._variants = (
+                    [Variant(*row) for row in zip(
+                        table.name, table.chrom, table.pos,
+                        zip(table.reference, table.coded),
+                    )],
+                    table.reference.tolist(),
+                    table.coded.tolist(),
+                    table.multiallelic.astype(bool).tolist(),
+                )
+            return self._variants
+
+    def get_sample_genotypes(self, sample_ids):
+        """Get the genotypes of some samples (see
+        'GenotypesReader.get_sample_genotypes').
+        """
+        indices = _sample_indices(self.samples, list(map(str, sample_ids)))
+
+        # Reading the rows in file order (one contiguous read per sample)
+        order = np.argsort(indices, kind="stable")
+        genotypes = np.empty((len(indices), self.get_number_variants()),
+                             dtype=self._genotypes.dtype)
+        genotypes[order] = self._genotypes[indices[order]]
+
+        variants, reference, coded, multiallelic = self._get_variants()
+        return GenotypesBlock(list(variants), genotypes.T, list(reference),
+                              list(coded), list(multiallelic))
+
+
+def build(reader, path, block_size=1000, dtype="float32",
+          max_memory=256 * 1024 ** 2):
+    """Builds the transposed cache of a reader.
+
+    Args:
+        reader (GenotypesReader): The reader.
+        path (str): The directory of the cache (created if required).
+        block_size (int): The number of variants read at once.
+        dtype (str): The data type of the genotypes (floating point).
+        max_memory (int): The (approximate) memory used by the transposition.
+
+    The genotypes are first written variant-major (as they are read), and
+    then transposed by tiles of at most 'max_memory' bytes, so that the
+    dataset never has to fit in memory.
+
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind != "f":
+        raise ValueError("'dtype' should be a floating point type")
+
+    os.makedirs(path, exist_ok=True)
+
+    # Removing the metadata first, so that an interrupted build is not used
+    metadata_fn = os.path.join(path, "metadata.json")
+    if os.path.isfile(metadata_fn):
+        os.remove(metadata_fn)
+
+    samples = [str(sample) for sample in reader.get_samples()]
+    with open(os.path.join(path, "samples.txt"), "w") as f:
+        for sample in samples:
+            f.write(sample + "\n")
+
+    # Writing the genotypes as they are read (variants x samples)
+    tmp_fn = os.path.join(path, "genotypes.tmp")
+    nb_variants = 0
+    with open(tmp_fn, "wb") as genotypes_f, \
+            open(os.path.join(path, "variants.txt"), "w") as variants_f:
+        variants_f.write("name\tchrom\tpos\treference\tcoded\tmultiallelic\n")
+        for block in reader.iter_blocks(block_size):
+            genotypes_f.write(
+                np.ascontiguousarray(block.genotypes, dtype=dtype).tobytes()
+            )
+            variants_f.writelines(
+                "{}\t{}\t{}\t{}\t{}\t{:d}\n".format(
+                    v.name, v.chrom, v.pos, reference, coded, multiallelic,
+                ) for v, reference, coded, multiallelic in zip(
+                    block.variants, block.reference, block.coded,
+                    block.multiallelic,
+                )
+            )
+            nb_variants += len(block)
+
+    # Transposing by tiles
+    out = np.lib.format.open_memmap(
+        os.path.join(path, "genotypes.npy"), mode="w+", dtype=dtype,
+        shape=(len(samples), nb_variants),
+    )
+    if nb_variants > 0 and len(samples) > 0:
+        genotypes = np.memmap(tmp_fn, dtype=dtype, mode="r",
+                              shape=(nb_variants, len(samples)))
+        _transpose(genotypes, out, max_memory)
+        del genotypes
+    out.flush()
+    del out
+    os.remove(tmp_fn)
+
+    with open(metadata_fn, "w") as f:
+        json.dump({
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "n_samples": len(samples),
+            "n_variants": nb_variants,
+            "dtype": dtype.str,
+            "source": _source(reader),
+        }, f, indent=2)
+
+    logger.info("Transposed {:,d} variants of {:,d} samples to {}".format(
+        nb_variants, len(samples), path,
+    ))
+
+
+def _source(reader):
+    """Describes the reader a cache is built from (for information only).
+
+    The reader's representation is not used, since it needs the number of
+    variants (which some readers only know after reading the whole file).
+
+    """
+    source = {"reader": reader.__class__.__name__}
+    for attribute in ("filename", "_filename", "prefix"):
+        filename = getattr(reader, attribute, None)
+        if isinstance(filename, str):
+            source["filename"] = filename
+            break
+    return source
+
+
+def _transpose(a, out, max_memory):
+    """Transposes an array into another one, by tiles."""
+    nb_rows, nb_cols = a.shape
+
+    # At least 1024 rows per tile, so that each written row segment spans a
+    # whole page (for 32 bits values)
+    tile_rows = min(nb_rows, 1024)
+    tile_cols = max(1, max_memory // (tile_rows * a.dtype.itemsize))
+    tile_rows = min(nb_rows, max(tile_rows,
+                                 max_memory // (tile_cols * a.dtype.itemsize)))
+
+    for row in range(0, nb_rows, tile_rows):
+        for col in range(0, nb_cols, tile_cols):
+            out[col:col + tile_cols, row:row + tile_rows] = (
+                a[row:row + tile_rows, col:col + tile_cols].T
+            )
@@ -27,9 +27,16 @@ Utilities
 # THE SOFTWARE.
 
 
+import os
+import re
+import sys
+import zlib
+import struct
 import urllib
 import json
 import logging
+import threading
+from collections import defaultdict
 
 import numpy as np
 
@@ -39,6 +46,29 @@ from .core import Variant
 logger = logging.getLogger(__name__)
 
 
+# Positional reads are atomic where 'os.pread' is available. Elsewhere, we
+# fall back to a seek and a read guarded by a lock.
+_HAS_PREAD = hasattr(os, "pread")
+_PREAD_LOCK = threading.Lock()
+
+
+# The suffix of markers renamed because of duplicated names (see PyPlink).
+_DUP_NAME_RE = re.compile(r":dup[0-9]+$")
+
+
+# The number of bits used for the position in a locus key (the chromosome
+# code uses the upper bits).
+_LOCUS_POS_BITS = 40
+
+
+# The maximal number of uncompressed bytes in a BGZF block (as in htslib, so
+# that incompressible data still fits in a block), and the empty block marking
+# the end of a BGZF file.
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = (b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43"
+            b"\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+
 def flip_alleles(genotypes):
     """Flip the alleles of an Genotypes instance."""
     genotypes.reference, genotypes.coded = (genotypes.coded,
@@ -122,3 +152,256 @@ def rsids_to_variants(li):
             )
 
     return out
+
+
+def open_positional(fn):
+    """Opens a file for positional (thread-safe) reads.
+
+    Args:
+        fn (str): the name of the file.
+
+    Returns:
+        int: the file descriptor, to be used with :py:func:`pread`.
+
+    """
+    return os.open(fn, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+
+
+def pread(fd, size, offset):
+    """Reads bytes at a given offset without moving the file position.
+
+    Args:
+        fd (int): the file descriptor (see :py:func:`open_positional`).
+        size (int): the number of bytes to read.
+        offset (int): the position of the first byte to read.
+
+    Returns:
+        bytes: the data (shorter than 'size' at the end of the file).
+
+    Concurrent calls on the same file descriptor are safe, since no shared
+    file position is involved.
+
+    """
+    if _HAS_PREAD:
+        return os.pread(fd, size, offset)
+
+    with _PREAD_LOCK:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+def pread_line(fd, offset, chunk_size=65536):
+    """Reads a single line starting at a given offset.
+
+    Args:
+        fd (int): the file descriptor (see :py:func:`open_positional`).
+        offset (int): the position of the first byte of the line.
+        chunk_size (int): the number of bytes to read at once.
+
+    Returns:
+        bytes: the line (including the trailing new line, if any).
+
+    """
+    chunks = []
+    while True:
+        chunk = pread(fd, chunk_size, offset)
+        if not chunk:
+            break
+
+        end = chunk.find(b"\n")
+        if end >= 0:
+            chunks.append(chunk[:end + 1])
+            break
+
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    return b"".join(chunks)
+
+
+class LocusIndex(object):
+    def __init__(self, chromosomes, keys, order):
+        """Sorted index of variant loci.
+
+        Args:
+            chromosomes (list): The chromosome names (the index of a name is
+                                its code).
+            keys (numpy.ndarray): The sorted locus keys (see 'make_keys').
+            order (numpy.ndarray): The variant index of each sorted key.
+
+        Point and region queries are performed using a binary search (i.e. in
+        O(log n)). The arrays can be memory mapped.
+
+        """
+        self.chromosomes = list(chromosomes)
+        self._chrom_to_code = {c: i for i, c in enumerate(self.chromosomes)}
+        self.keys = keys
+        self.order = order
+
+    @classmethod
+    def from_loci(cls, chrom, pos):
+        """Creates the index from the chromosome and position of variants.
+
+        Args:
+            chrom (list): The chromosome of each variant (as str).
+            pos (list): The position of each variant.
+
+        """
+        chromosomes = []
+        chrom_to_code = {}
+        codes = np.empty(len(chrom), dtype=np.int64)
+        for i, c in enumerate(chrom):
+            code = chrom_to_code.get(c)
+            if code is None:
+                code = len(chromosomes)
+                chromosomes.append(c)
+                chrom_to_code[c] = code
+            codes[i] = code
+
+        keys, order = cls.sort_keys(cls.make_keys(codes, pos))
+        return cls(chromosomes, keys, order)
+
+    @staticmethod
+    def make_keys(codes, pos):
+        """Combines chromosome codes and positions into sortable keys."""
+        return (
+            (np.asarray(codes, dtype=np.int64) << _LOCUS_POS_BITS) +
+            np.asarray(pos, dtype=np.int64)
+        )
+
+    @staticmethod
+    def sort_keys(keys):
+        """Sorts locus keys (stable, so that the file order is kept).
+
+        Returns:
+            tuple: The sorted keys and the variant index of each sorted key.
+
+        """
+        order = np.argsort(keys, kind="mergesort").astype(np.int64)
+        return keys[order], order
+
+    def get_indices(self, chrom, start, end):
+        """Gets the variants in a region.
+
+        Args:
+            chrom (str): The chromosome.
+            start (int): The start position of the region (inclusive).
+            end (int): The end position of the region (inclusive).
+
+        Returns:
+            numpy.ndarray: The sorted indices of the variants in the region.
+
+        """
+        code = self._chrom_to_code.get(chrom)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+
+        left = np.searchsorted(self.keys, self.make_keys(code, start),
+                               side="left")
+        right = np.searchsorted(self.keys, self.make_keys(code, end),
+                                side="right")
+        return np.sort(self.order[left:right])
+
+
+def strip_dup_name(name):
+    """Removes the ':dupX' suffix of markers renamed because of duplicates.
+
+    Args:
+        name (str): The name of the marker.
+
+    Returns:
+        str: The original name of the marker (see PyPlink and Impute2Reader).
+
+    """
+    r = _DUP_NAME_RE.search(name)
+    if r is None:
+        return name
+    return name[:r.start()]
+
+
+def normalize_alleles(alleles):
+    """Normalizes a column of alleles (upper case, interned strings).
+
+    Args:
+        alleles (numpy.ndarray): The alleles of each variant.
+
+    Returns:
+        numpy.ndarray: The normalized alleles (object array), where equal
+        alleles share the same string instance. Missing values are None.
+
+    Each distinct allele is normalized once, so that the readers can create
+    their Variant and Genotypes instances without any check (see
+    'Variant._trusted').
+
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(np.asarray(alleles, dtype=object))
+    normalized = np.array(
+        [sys.intern(str(allele).upper()) for allele in uniques] + [None],
+        dtype=object,
+    )
+    return normalized[codes]
+
+
+def index_names(names):
+    """Maps variant names to their indices.
+
+    Args:
+        names (iterable): The name of each variant.
+
+    Returns:
+        dict: The indices (list) of the variants for each name.
+
+    Markers renamed because of duplicated names (i.e. with a ':dupX' suffix,
+    see PyPlink and Impute2Reader) can also be retrieved using their original
+    name.
+
+    """
+    name_index = defaultdict(list)
+    dup_index = defaultdict(list)
+    for i, name in enumerate(names):
+        name_index[name].append(i)
+
+        r = _DUP_NAME_RE.search(name)
+        if r is not None:
+            dup_index[name[:r.start()]].append(i)
+
+    for name, indices in dup_index.items():
+        if name not in name_index:
+            name_index[name] = indices
+
+    return dict(name_index)
+
+
+def bgzf_compress(data, level=6):
+    """Compresses data into BGZF blocks.
+
+    Args:
+        data (bytes): The data to compress.
+        level (int): The compression level.
+
+    Returns:
+        list: The compressed BGZF blocks (bytes), each containing (at most)
+        'BGZF_BLOCK_SIZE' bytes of data.
+
+    The blocks are independent, hence chunks of a file can be compressed
+    concurrently and concatenated (the 'BGZF_EOF' marker should end the
+    file).
+
+    """
+    blocks = []
+    for start in range(0, len(data), BGZF_BLOCK_SIZE):
+        chunk = data[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(chunk) + compressor.flush()
+
+        blocks.append(b"".join([
+            # The gzip header with the 'BC' extra field (block size - 1)
+            struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67,
+                        2, len(compressed) + 25),
+            compressed,
+            struct.pack("<II", zlib.crc32(chunk), len(chunk)),
+        ]))
+
+    return blocks
@@ -1,5 +1,5 @@
 """
-Reader for VCF files.
+Reader and writer for VCF files.
 """
 
 # This file is part of geneparse.
@@ -27,14 +27,24 @@ Reader for VCF files.
 # THE SOFTWARE.
 
 
-from .core import Variant, ImputedVariant, Genotypes, GenotypesReader
-
-from cyvcf2 import VCF
 import numpy as np
 
+from .core import (Variant, ImputedVariant, Genotypes, GenotypesReader,
+                   GenotypesWriter)
+from .utils import bgzf_compress, BGZF_EOF
+
+try:
+    from cyvcf2 import VCF
+    HAS_CYVCF2 = True
+except ImportError:
+    HAS_CYVCF2 = False
+
 
 class VCFReader(GenotypesReader):
     def __init__(self, filename, quality_field=None):
+        if not HAS_CYVCF2:
+            raise ValueError("needs cyvcf2 to read VCF files")
+
         self.get_vcf = lambda: VCF(filename)
         self.quality_field = quality_field
 
@@ -113,3 +123,129 @@ class VCFReader(GenotypesReader):
 
     def get_number_variants(self):
         raise NotImplementedError("Don't know how to do this using cyvcf2.")
+
+
+class VCFWriter(GenotypesWriter):
+    def __init__(self, filename, samples, dosage=False, decimals=3,
+                 compression_level=6, buffer_size=4 * 1024 ** 2):
+        """VCF file writer.
+
+        Args:
+            filename (str): The name of the VCF file (compressed using bgzip if
+                            it ends with '.gz').
+            samples (list): The sample IDs.
+            dosage (bool): Write the dosage (DS field) along with the
+                           genotypes (GT field).
+            decimals (int): The number of decimals of the dosage.
+            compression_level (int): The bgzip compression level (lower
+                                     levels are much faster).
+            buffer_size (int): The size of the output buffer (in bytes).
+
+        Note
+        ====
+            The reference allele is written as REF and the coded allele as ALT
+            (one line per Genotypes, even for multiallelic variants). The
+            genotypes are the rounded dosage values (unphased).
+
+        """
+        self.filename = filename
+        self.samples = list(samples)
+        self._bgzip = filename.endswith(".gz")
+        self._compression_level = compression_level
+
+        # The FORMAT values for each (scaled) genotype value, the last one
+        # being for missing values
+        if dosage:
+            self._scale = 10 ** decimals
+            self._format = "GT:DS"
+        else:
+            self._scale = 1
+            self._format = "GT"
+        self._values = _format_table(self._scale, dosage, decimals)
+
+        self._f = open(filename, "wb", buffering=buffer_size)
+
+        header = [
+            "##fileformat=VCFv4.2",
+            "##source=geneparse",
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+        ]
+        if dosage:
+            header.append(
+                '##FORMAT=<ID=DS,Number=1,Type=Float,Description="Alternative '
+                'allele dosage">'
+            )
+        header.append("\t".join(
+            ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO",
+             "FORMAT"] + [str(sample) for sample in self.samples]
+        ))
+        self.write_encoded(self._compress(
+            "\n".join(header).encode() + b"\n"
+        ))
+
+    def close(self):
+        if self._f.closed:
+            return
+
+        if self._bgzip:
+            self._f.write(BGZF_EOF)
+        self._f.close()
+
+    def _compress(self, data):
+        if self._bgzip:
+            return b"".join(bgzf_compress(data, self._compression_level))
+        return data
+
+    def encode_block(self, block):
+        """Encodes a block (compressed VCF lines).
+
+        Args:
+            block (GenotypesBlock): The block to encode.
+
+        Returns:
+            bytes: The data.
+
+        """
+        codes = np.rint(np.clip(block.genotypes, 0, 2) * self._scale)
+        codes[np.isnan(codes)] = len(self._values) - 1
+        codes = codes.astype(np.int64)
+
+        return self._compress(b"".join([
+            "{}\t{}\t{}\t{}\t{}\t.\t.\t.\t{}\t".format(
+                variant.chrom, variant.pos, variant.name, reference, coded,
+                self._format,
+            ).encode() + b"\t".join(self._values[row].tolist()) + b"\n"
+            for variant, reference, coded, row in zip(
+                block.variants, block.reference, block.coded, codes,
+            )
+        ]))
+
+    def write_encoded(self, encoded):
+        self._f.write(encoded)
+
+
+def _format_table(scale, dosage, decimals):
+    """The VCF FORMAT values for each genotype value.
+
+    Args:
+        scale (int): The number of values per allele.
+        dosage (bool): Include the dosage (DS field).
+        decimals (int): The number of decimals of the dosage.
+
+    Returns:
+        numpy.ndarray: The values (bytes) for each multiple of 1/scale from 0
+        to 2, and for missing values (last element).
+
+    """
+    genotypes = ["0/0", "0/1", "1/1"]
+    table = []
+    for i in range(2 * scale + 1):
+        value = genotypes[int(np.rint(i / scale))]
+        if dosage:
+            value += ":" + "{:.{}f}".format(
+                i / scale, decimals,
+            ).rstrip("0").rstrip(".")
+        table.append(value.encode())
+    table.append(b"./.:." if dosage else b"./.")
+
+    return np.array(table, dtype=object)
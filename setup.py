@@ -20,12 +20,12 @@ VERSION = "{0}.{1}.{2}".format(MAJOR, MINOR, MICRO)
 
 
 def check_python_version():
-    """Checks the python version, exits if < 3.3."""
+    """Checks the python version, exits if < 3.8."""
     python_major, python_minor = sys.version_info[:2]
 
-    if python_major != 3 or python_minor < 3:
+    if python_major != 3 or python_minor < 8:
         sys.stderr.write("geneparse requires python 3 "
-                         "(version 3.3 or higher)\n")
+                         "(version 3.8 or higher)\n")
         sys.exit(1)
 
 
@@ -61,7 +61,8 @@ def setup_package():
         license="MIT",
         test_suite="geneparse.tests.test_suite",
         zip_safe=False,
-        install_requires=["numpy >= 1.12.0", "pandas >= 0.19.0",
+        python_requires=">=3.8",
+        install_requires=["numpy >= 1.17.0", "pandas >= 0.19.0",
                           "pyplink >= 1.3.4", "setuptools >= 26.1.0",
                           "pysam >= 0.9.0", "biopython >= 1.68"],
         packages=find_packages(),
@@ -74,9 +75,10 @@ def setup_package():
                      "Operating System :: MacOS :: MacOS X",
                      "Operating System :: Microsoft",
                      "Programming Language :: Python",
-                     "Programming Language :: Python :: 3.3",
-                     "Programming Language :: Python :: 3.4",
-                     "Programming Language :: Python :: 3.5",
+                     "Programming Language :: Python :: 3.8",
+                     "Programming Language :: Python :: 3.9",
+                     "Programming Language :: Python :: 3.10",
+                     "Programming Language :: Python :: 3.11",
                      "Topic :: Scientific/Engineering :: Bio-Informatics"],
         keywords="bioinformatics genetics statistics",
     )